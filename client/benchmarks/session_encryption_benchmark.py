@@ -0,0 +1,80 @@
+"""Compare loopback throughput of per-message RSA encryption against the AEAD session cipher.
+
+Run from the client directory with ``python -m benchmarks.session_encryption_benchmark``.
+"""
+import asyncio
+import os
+import struct
+import time
+
+from client.utils.encryption_manager import EncryptionManager
+from client.utils.session_cipher import SessionCipher, CLIENT_TO_SERVER, SERVER_TO_CLIENT
+
+PAYLOAD_SIZE = 64 * 1024
+PAYLOAD_COUNT = 16
+# PKCS#1 v1.5 padding takes 11 bytes of a 512-bit key's 64 byte block.
+RSA_CHUNK_SIZE = 53
+
+_LENGTH = struct.Struct(">I")
+
+
+async def _run_loopback(seal, open_) -> float:
+    received = asyncio.Event()
+    received_bytes = 0
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        nonlocal received_bytes
+        while received_bytes < PAYLOAD_SIZE * PAYLOAD_COUNT:
+            (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+            received_bytes += len(open_(await reader.readexactly(length)))
+        writer.close()
+        received.set()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    _, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    payload = os.urandom(PAYLOAD_SIZE)
+    start = time.perf_counter()
+    for _ in range(PAYLOAD_COUNT):
+        for sealed in seal(payload):
+            writer.write(_LENGTH.pack(len(sealed)) + sealed)
+        await writer.drain()
+    await received.wait()
+    elapsed = time.perf_counter() - start
+
+    writer.close()
+    server.close()
+    await server.wait_closed()
+    return elapsed
+
+
+async def main():
+    encryption_manager = EncryptionManager()
+    public_key, private_key = encryption_manager.generate_key_pair()
+
+    def rsa_seal(payload: bytes):
+        for offset in range(0, len(payload), RSA_CHUNK_SIZE):
+            yield encryption_manager.encrypt(payload[offset:offset + RSA_CHUNK_SIZE], public_key)
+
+    def rsa_open(sealed: bytes) -> bytes:
+        return encryption_manager.decrypt(sealed, private_key)
+
+    session_key = SessionCipher.generate_session_key()
+    sending_cipher = SessionCipher(session_key, CLIENT_TO_SERVER, SERVER_TO_CLIENT)
+    receiving_cipher = SessionCipher(session_key, SERVER_TO_CLIENT, CLIENT_TO_SERVER)
+
+    def aead_seal(payload: bytes):
+        yield sending_cipher.seal(payload)
+
+    total_kb = PAYLOAD_SIZE * PAYLOAD_COUNT / 1024
+    for name, seal, open_ in (
+            ("RSA per 53 bytes", rsa_seal, rsa_open),
+            ("ChaCha20-Poly1305 session", aead_seal, receiving_cipher.open)
+    ):
+        elapsed = await _run_loopback(seal, open_)
+        print(f"{name:<28} {total_kb / elapsed:>12.1f} KB/s  {elapsed / total_kb * 1e6:>10.1f} us/KB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
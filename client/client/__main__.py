@@ -1,12 +1,24 @@
 import asyncio
 import logging
+from functools import partial
+from uuid import UUID
 
+from client.applications.application_supervisor import ApplicationSupervisor
+from client.artifacts.artifact_fetcher import ArtifactFetcher
+from client.artifacts.artifact_store import ArtifactStore
+from client.artifacts.artifact_swarm import ArtifactSwarm
+from client.commands.command_runner import CommandRunner
 from client.config.config_loader import ClientConfigLoader
 from client.network.client_connection_manager import ClientConnectionManager
 from client.network.client_encryption_manager import ClientEncryptionManager
 from client.network.client_tcp_server import ClientTCPServer
+from client.network.compression import CompressionOptions, load_dictionaries
+from client.network.discovery_beacon import DiscoveryBeacon, get_key_fingerprint
+from client.network.peer_exchange import PeerExchange
+from client.network.session_ticket_cache import SessionTicketCache
 from client.network.udp_broadcaster import UDPBroadcaster
-from client.network.client_authentication_manager import ClientAuthenticationManager
+from client.telemetry.telemetry_sampler import TelemetrySampler
+from client.utils.crypto_executor import CryptoExecutor
 from client.utils.encryption_manager import EncryptionManager
 
 
@@ -17,15 +29,80 @@ async def main():
 
     logging.basicConfig(encoding='utf-8', level=config.log_level)
 
-    client_encryption_manager = ClientEncryptionManager(config.private_key, config.public_key, config.server_public_key,
-                                                        encryption_manager)
-    client_authentication_manager = ClientAuthenticationManager(client_encryption_manager)
-    tcp_server = ClientTCPServer(client_authentication_manager, client_encryption_manager, config.tcp_server_port)
-    udp_broadcaster = UDPBroadcaster(config.udp_broadcast_port, f'{{"port": {config.tcp_server_port}}}'.encode("utf-8"))
-    connection_manager = ClientConnectionManager(udp_broadcaster, tcp_server)
+    # The client only verifies a handful of handshakes, a single worker thread keeps them off the event loop.
+    crypto_executor = CryptoExecutor(encryption_manager, workers=1)
+    session_ticket_cache = SessionTicketCache()
+    # Every server session gets its own encryption manager, they only share the keys and cached session tickets.
+    client_encryption_manager_factory = partial(
+        ClientEncryptionManager,
+        config.private_key,
+        config.public_key,
+        config.server_public_key,
+        crypto_executor,
+        session_ticket_cache
+    )
+    tcp_server = ClientTCPServer(
+        client_encryption_manager_factory,
+        config.tcp_server_port,
+        max_sessions=config.max_server_sessions,
+        compression_options=CompressionOptions(
+            enabled=config.compression_enabled,
+            dictionaries=load_dictionaries(config.compression_dictionary_path)
+        )
+    )
+    beacon = DiscoveryBeacon(
+        tcp_port=config.tcp_server_port,
+        client_id=UUID(config.client_id),
+        key_fingerprint=get_key_fingerprint(config.public_key)
+    )
+    udp_broadcaster = UDPBroadcaster(
+        config.udp_broadcast_port,
+        beacon.encode(),
+        initial_delay=config.beacon_initial_delay,
+        max_delay=config.beacon_max_delay,
+        multicast_group=config.multicast_group,
+        multicast_ttl=config.multicast_ttl
+    )
+    artifact_store = ArtifactStore(config.artifact_store_path)
+    artifact_fetcher = ArtifactFetcher(artifact_store, crypto_executor)
+    peer_exchange = PeerExchange(
+        artifact_store,
+        udp_port=config.peer_udp_port,
+        tcp_port=config.peer_tcp_port,
+        max_uploads=config.max_peer_uploads
+    )
+    # Artifacts are fetched through the swarm, so hosts on one network share them.
+    artifact_swarm = ArtifactSwarm(artifact_store, artifact_fetcher, peer_exchange)
+    application_supervisor = ApplicationSupervisor(
+        artifact_store,
+        artifact_swarm,
+        config.applications_path,
+        health_check_interval=config.health_check_interval,
+        health_check_timeout=config.health_check_timeout,
+        max_concurrent_health_checks=config.max_concurrent_health_checks,
+        health_report_interval=config.health_report_interval
+    )
+    telemetry_sampler = TelemetrySampler(
+        disk_path=config.telemetry_disk_path,
+        report_interval=config.telemetry_report_interval,
+        max_report_interval=config.telemetry_max_report_interval
+    )
+    connection_manager = ClientConnectionManager(
+        udp_broadcaster,
+        tcp_server,
+        CommandRunner(config.max_concurrent_commands),
+        artifact_fetcher,
+        application_supervisor,
+        telemetry_sampler
+    )
+    await peer_exchange.start()
+    await application_supervisor.start()
+    await telemetry_sampler.start()
     await connection_manager.start()
-    loop = asyncio.get_event_loop()
-    await loop.create_future()
+    await connection_manager.wait_closed()
+    await telemetry_sampler.stop()
+    await application_supervisor.stop()
+    await peer_exchange.stop()
 
 
 asyncio.run(main())
@@ -0,0 +1,379 @@
+import asyncio
+import itertools
+import logging
+import os
+import random
+import signal
+import time
+import urllib.parse
+import urllib.request
+from asyncio.subprocess import DEVNULL, STDOUT, Process
+from pathlib import Path
+from uuid import UUID
+
+from client.artifacts.artifact_store import ArtifactStore
+from client.artifacts.artifact_swarm import ArtifactSwarm
+from client.commands.command_runner import CommandRunner
+from client.network.application_messages import APPLICATION_CHANNEL, APPLICATION_CHANNEL_PRIORITY, \
+    MAX_DETAIL_LENGTH, FETCHING, INSTALLING, RUNNING, RESTARTING, FAILED, STOPPED, ApplicationSpec, \
+    ApplicationDeployment, ApplicationHealth, ApplicationHealthReport, InvalidApplicationMessageError, \
+    decode_application_message
+from client.network.client_session import ClientSession, NoServerConnectedError
+from client.network.command_messages import CommandRequest, CommandResult
+from client.utils.service import Service
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+DEFAULT_HEALTH_CHECK_TIMEOUT = 10.0
+DEFAULT_MAX_CONCURRENT_HEALTH_CHECKS = 4
+DEFAULT_HEALTH_REPORT_INTERVAL = 10.0
+DEFAULT_INSTALL_TIMEOUT = 600.0
+# Every health check interval is stretched or shrunk by up to this fraction, so checks don't line up over time.
+HEALTH_CHECK_JITTER = 0.2
+RESTART_INITIAL_DELAY = 1.0
+RESTART_MAX_DELAY = 300.0
+# An application that ran for this long before it exited is restarted as quickly as one that never failed.
+STABLE_RUNTIME = 60.0
+# How long an application gets to exit once asked to stop, before it is killed.
+STOP_TIMEOUT = 10.0
+# Output of an application is appended to a log in its directory, which is rotated once it grows beyond this size.
+MAX_LOG_SIZE = 10 * 1024 * 1024
+DOWNLOAD_TIMEOUT = 60.0
+_DOWNLOAD_READ_SIZE = 256 * 1024
+
+
+class ApplicationError(Exception):
+    """Error to raise if an application can't be fetched, installed or started."""
+
+
+def _describe_exit(name: str, result: CommandResult) -> str:
+    description = f"{name} exited with code {result.exit_code}"
+    # The end of the output is where the reason a command failed usually is.
+    if output := (result.stderr or result.stdout).strip():
+        description += f": {output[-MAX_DETAIL_LENGTH:]}"
+    return description
+
+
+class _Instance:
+    def __init__(self, spec: ApplicationSpec, directory: Path):
+        self.spec = spec
+        self.directory = directory
+        self.state = FETCHING
+        self.healthy: bool | None = None
+        self.restarts = 0
+        self.detail: str | None = None
+        self.environment: dict[str, str] = {}
+        # Artifacts of versions the host ran before, the new one can most likely be patched from them.
+        self.basis_digests: list[str] = []
+        self.task: asyncio.Task | None = None
+        self.health_check_task: asyncio.Task | None = None
+
+
+class ApplicationSupervisor(Service):
+    """Runs the application instances the server deploys to the host, and keeps them running.
+
+    Every instance gets a directory of its own. Its artifact is fetched and the post download command is run in there,
+    then the run command is started and restarted with an exponential backoff whenever it exits. Each process is the
+    leader of a process group, so stopping an instance stops whatever it started too.
+
+    Health checks of every running instance are run on a jittered interval, at most ``max_concurrent_health_checks`` at
+    once. The results are not sent as they come in. The latest health of every instance that was checked or changed is
+    sent in one report per ``health_report_interval``, however many instances the host runs.
+    """
+
+    def __init__(self,
+                 artifact_store: ArtifactStore,
+                 artifact_swarm: ArtifactSwarm,
+                 root: Path,
+                 health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+                 health_check_timeout: float = DEFAULT_HEALTH_CHECK_TIMEOUT,
+                 max_concurrent_health_checks: int = DEFAULT_MAX_CONCURRENT_HEALTH_CHECKS,
+                 health_report_interval: float = DEFAULT_HEALTH_REPORT_INTERVAL,
+                 install_timeout: float = DEFAULT_INSTALL_TIMEOUT
+                 ):
+        super().__init__()
+        self._artifact_store = artifact_store
+        self._artifact_swarm = artifact_swarm
+        self._root = root
+        self._health_check_interval = health_check_interval
+        self._health_check_timeout = health_check_timeout
+        self._health_report_interval = health_report_interval
+        self._install_timeout = install_timeout
+        self._install_runner = CommandRunner()
+        self._health_check_runner = CommandRunner(max_concurrent_health_checks)
+        self._command_ids = itertools.count()
+        self._instances: dict[str, _Instance] = {}
+        # Instances being stopped, after they were removed or replaced.
+        self._stopping: set[asyncio.Task] = set()
+        # Server the host reports to, the one that deployed last or else the last one to connect.
+        self._session: ClientSession | None = None
+        self._pending_health: dict[str, ApplicationHealth] = {}
+        self._report_task: asyncio.Task | None = None
+
+    async def _start(self):
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._report_task = asyncio.get_running_loop().create_task(self._report_health_periodically())
+
+    async def _stop(self):
+        self._report_task.cancel()
+        instances = list(self._instances.values())
+        self._instances.clear()
+        for instance in instances:
+            instance.task.cancel()
+        await asyncio.gather(*(instance.task for instance in instances), *self._stopping, return_exceptions=True)
+
+    def set_session(self, session: ClientSession) -> None:
+        self._session = session
+        # A server that just connected knows nothing about the host's applications yet.
+        for instance in self._instances.values():
+            self._queue_health(instance)
+
+    def handle_disconnect(self, session: ClientSession) -> None:
+        if self._session is session:
+            self._session = None
+
+    def handle_message(self, session: ClientSession, payload: bytes) -> None:
+        try:
+            message = decode_application_message(payload)
+        except InvalidApplicationMessageError as e:
+            LOGGER.warning(f"Dropping invalid application message in session {session.get_session_id()}: {e}")
+            return
+        if not isinstance(message, ApplicationDeployment):
+            LOGGER.warning(f"Dropping unexpected {type(message).__name__} in session {session.get_session_id()}.")
+            return
+        self._session = session
+        self.deploy(message)
+
+    def deploy(self, deployment: ApplicationDeployment) -> None:
+        """Run the deployed application instances, instances that changed are replaced and missing ones stopped."""
+        if not self.is_running():
+            return
+        specs = {}
+        for spec in deployment.applications:
+            try:
+                UUID(spec.instance_id)
+            except ValueError:
+                LOGGER.warning(f"Ignoring application instance with invalid id {spec.instance_id!r}.")
+                continue
+            specs[spec.instance_id] = spec
+
+        replaced: dict[str, _Instance] = {}
+        for instance_id, instance in list(self._instances.items()):
+            if specs.get(instance_id) == instance.spec:
+                continue
+            del self._instances[instance_id]
+            instance.task.cancel()
+            if instance_id in specs:
+                replaced[instance_id] = instance
+            else:
+                LOGGER.info(f"Stopping application instance {instance_id}.")
+                stopping = asyncio.get_running_loop().create_task(self._report_stopped(instance))
+                self._stopping.add(stopping)
+                stopping.add_done_callback(self._stopping.discard)
+
+        for instance_id, spec in specs.items():
+            if instance_id in self._instances:
+                continue
+            LOGGER.info(f"Starting version {spec.version} of application {spec.application_id} as {instance_id}.")
+            instance = _Instance(spec, self._root / str(UUID(instance_id)))
+            instance.basis_digests = [
+                other.spec.artifact_digest for other in [*self._instances.values(), *replaced.values()]
+                if other.spec.application_id == spec.application_id and other.spec.artifact_digest
+            ]
+            instance.task = asyncio.get_running_loop().create_task(
+                self._supervise(instance, replaced.get(instance_id))
+            )
+            self._instances[instance_id] = instance
+            self._queue_health(instance)
+
+    async def _report_stopped(self, instance: _Instance):
+        await asyncio.wait([instance.task])
+        self._set_state(instance, STOPPED)
+
+    async def _supervise(self, instance: _Instance, replaced: _Instance | None):
+        # The instance it replaces has to be gone first, both use the same directory and likely the same ports.
+        if replaced:
+            await asyncio.wait([replaced.task])
+        delay = RESTART_INITIAL_DELAY
+        while True:
+            try:
+                self._set_state(instance, FETCHING)
+                artifact_path = await self._fetch_artifact(instance)
+                self._set_state(instance, INSTALLING)
+                await self._install(instance, artifact_path)
+                break
+            except Exception as e:
+                LOGGER.warning(f"Failed to install application instance {instance.spec.instance_id}: {e}")
+                self._set_state(instance, FAILED, str(e))
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, RESTART_MAX_DELAY)
+
+        if instance.spec.healthcheck_command:
+            instance.health_check_task = asyncio.get_running_loop().create_task(
+                self._check_health_periodically(instance)
+            )
+        try:
+            await self._run(instance)
+        finally:
+            if instance.health_check_task:
+                instance.health_check_task.cancel()
+
+    async def _fetch_artifact(self, instance: _Instance) -> Path:
+        if not instance.spec.artifact_digest:
+            return await asyncio.get_running_loop().run_in_executor(None, self._download, instance.spec.link)
+        if not (session := self._session):
+            raise ApplicationError("No server connected to fetch the artifact from")
+        return await self._artifact_swarm.fetch(session, instance.spec.artifact_digest, instance.basis_digests)
+
+    def _download(self, link: str) -> Path:
+        if urllib.parse.urlparse(link).scheme not in ("http", "https"):
+            raise ApplicationError(f"Can't download artifact from {link}")
+        writer = self._artifact_store.create_writer()
+        try:
+            with urllib.request.urlopen(link, timeout=DOWNLOAD_TIMEOUT) as response:
+                while data := response.read(_DOWNLOAD_READ_SIZE):
+                    writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        return self._artifact_store.get_object_path(writer.commit())
+
+    async def _install(self, instance: _Instance, artifact_path: Path):
+        instance.directory.mkdir(exist_ok=True)
+        instance.environment = os.environ | instance.spec.environment | {
+            "PYOT_ARTIFACT": str(artifact_path.absolute()),
+            "PYOT_INSTANCE_ID": instance.spec.instance_id
+        }
+        if not instance.spec.post_download_command:
+            return
+        result = await self._install_runner.run(
+            CommandRequest(next(self._command_ids), instance.spec.post_download_command, self._install_timeout),
+            instance.directory,
+            instance.environment
+        )
+        if result.error:
+            raise ApplicationError(f"Post download command failed: {result.error}")
+        if result.timed_out:
+            raise ApplicationError("Post download command timed out")
+        if result.exit_code != 0:
+            raise ApplicationError(_describe_exit("Post download command", result))
+
+    async def _run(self, instance: _Instance):
+        loop = asyncio.get_running_loop()
+        delay = RESTART_INITIAL_DELAY
+        while True:
+            started = loop.time()
+            try:
+                process = await self._start_process(instance)
+            except (OSError, ValueError) as e:
+                detail = f"Failed to start: {e}"
+            else:
+                self._set_state(instance, RUNNING)
+                try:
+                    await process.wait()
+                finally:
+                    if process.returncode is None:
+                        await self._terminate(process)
+                detail = f"Exited with code {process.returncode}"
+
+            if loop.time() - started >= STABLE_RUNTIME:
+                delay = RESTART_INITIAL_DELAY
+            instance.restarts += 1
+            LOGGER.info(f"Application instance {instance.spec.instance_id} stopped: {detail}. Restarting...")
+            self._set_state(instance, RESTARTING, detail)
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, RESTART_MAX_DELAY)
+
+    async def _start_process(self, instance: _Instance) -> Process:
+        if not instance.spec.run_command:
+            raise ValueError("Run command is empty")
+        log_path = instance.directory / "output.log"
+        if log_path.exists() and log_path.stat().st_size > MAX_LOG_SIZE:
+            os.replace(log_path, log_path.with_suffix(".log.1"))
+        with open(log_path, "ab") as log:
+            return await asyncio.create_subprocess_exec(
+                *instance.spec.run_command,
+                cwd=instance.directory,
+                env=instance.environment,
+                stdin=DEVNULL,
+                stdout=log,
+                stderr=STDOUT,
+                start_new_session=True
+            )
+
+    @staticmethod
+    async def _terminate(process: Process):
+        """Ask the process group to exit, and kill it if it doesn't in time."""
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+            return
+        except ProcessLookupError:
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    async def _check_health_periodically(self, instance: _Instance):
+        # The first check falls anywhere in the first interval, so instances that started together spread out.
+        delay = random.uniform(0, self._health_check_interval)
+        while True:
+            await asyncio.sleep(delay)
+            delay = self._health_check_interval * random.uniform(1 - HEALTH_CHECK_JITTER, 1 + HEALTH_CHECK_JITTER)
+            if instance.state != RUNNING:
+                continue
+            result = await self._health_check_runner.run(
+                CommandRequest(next(self._command_ids), instance.spec.healthcheck_command, self._health_check_timeout),
+                instance.directory,
+                instance.environment
+            )
+            # The instance may have exited while it was checked.
+            if instance.state != RUNNING:
+                continue
+            if result.error:
+                instance.healthy, instance.detail = False, f"Health check failed: {result.error}"
+            elif result.timed_out:
+                instance.healthy, instance.detail = False, "Health check timed out"
+            elif result.exit_code != 0:
+                instance.healthy, instance.detail = False, _describe_exit("Health check", result)
+            else:
+                instance.healthy, instance.detail = True, None
+            self._queue_health(instance)
+
+    def _set_state(self, instance: _Instance, state: str, detail: str | None = None):
+        instance.state = state
+        instance.detail = detail
+        # Health is only known for a running instance, and only once it was checked since it started.
+        instance.healthy = None
+        self._queue_health(instance)
+
+    def _queue_health(self, instance: _Instance):
+        self._pending_health[instance.spec.instance_id] = ApplicationHealth(
+            instance_id=instance.spec.instance_id,
+            state=instance.state,
+            healthy=instance.healthy,
+            restarts=instance.restarts,
+            timestamp=time.time(),
+            detail=instance.detail[:MAX_DETAIL_LENGTH] if instance.detail else None
+        )
+
+    async def _report_health_periodically(self):
+        while True:
+            await asyncio.sleep(self._health_report_interval)
+            self._report_health()
+
+    def _report_health(self):
+        if not self._pending_health or not (session := self._session):
+            return
+        try:
+            session.open_channel(APPLICATION_CHANNEL, APPLICATION_CHANNEL_PRIORITY)
+            session.write(ApplicationHealthReport(list(self._pending_health.values())).encode(), APPLICATION_CHANNEL)
+        except NoServerConnectedError:
+            # Kept for whichever server connects next.
+            return
+        self._pending_health.clear()
@@ -0,0 +1,231 @@
+import asyncio
+import itertools
+import logging
+from pathlib import Path
+from typing import Iterable, BinaryIO, Callable
+
+from client.artifacts.artifact_manifest import ArtifactManifest, InvalidManifestError
+from client.artifacts.artifact_store import ArtifactStore, ArtifactWriter, ArtifactCorruptedError, check_digest, \
+    write_file
+from client.artifacts.delta import DeltaApplier, InvalidDeltaError
+from client.network.artifact_messages import ARTIFACT_CHANNEL, ArtifactFetchRequest, ArtifactTransferStart, \
+    ArtifactTransferData, ArtifactTransferEnd, ArtifactManifestRequest, ArtifactManifestResponse, \
+    InvalidArtifactMessageError, decode_artifact_message
+from client.network.client_session import ClientSession
+from client.utils.crypto_executor import CryptoExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_FETCH_TIMEOUT = 600.0
+
+
+class ArtifactFetchError(Exception):
+    """Error to raise if an artifact could not be fetched from the server."""
+
+
+class _Transfer:
+    def __init__(self, session: ClientSession, digest: str, result: asyncio.Future):
+        self.session = session
+        self.digest = digest
+        self.result = result
+        self.size = 0
+        self.writer: ArtifactWriter | None = None
+        # Single chunks are kept in memory until they are verified, instead of going to a writer.
+        self.chunk: bytearray | None = None
+        self.basis: BinaryIO | None = None
+        self.delta_applier: DeltaApplier | None = None
+
+    def fail(self, error: Exception):
+        if not self.result.done():
+            self.result.set_exception(error)
+
+    def close(self):
+        if self.basis:
+            self.basis.close()
+        # The writer is handed off once committed, anything still written to is dropped.
+        if self.writer:
+            self.writer.abort()
+            self.writer = None
+
+
+class ArtifactFetcher:
+    """Fetches artifacts from a server into the local artifact store.
+
+    Artifacts the host already holds, e.g. the version being upgraded from, are offered to the server as a basis, so
+    it can send only the blocks that changed. Whatever arrives is only stored if it matches the digest asked for, and a
+    delta that doesn't add up is retried as a whole artifact once.
+
+    Single chunks of an artifact can be fetched as well, checked against its manifest, which only counts if the server
+    signed it.
+    """
+
+    def __init__(self,
+                 artifact_store: ArtifactStore,
+                 crypto_executor: CryptoExecutor,
+                 timeout: float = DEFAULT_FETCH_TIMEOUT
+                 ):
+        self._artifact_store = artifact_store
+        self._crypto_executor = crypto_executor
+        self._timeout = timeout
+        self._transfers: dict[int, _Transfer] = {}
+        self._transfer_ids = itertools.count()
+        # Fetches of the same artifact share a single transfer.
+        self._fetches: dict[str, asyncio.Task] = {}
+
+    async def fetch(self, session: ClientSession, digest: str, basis_digests: Iterable[str] = ()) -> Path:
+        """Get the path of an artifact, fetching it from the server of the session unless it is stored already."""
+        if path := self._artifact_store.get_path(check_digest(digest)):
+            return path
+        if not (fetch := self._fetches.get(digest)):
+            fetch = asyncio.get_running_loop().create_task(self._fetch(session, digest, list(basis_digests)))
+            self._fetches[digest] = fetch
+            fetch.add_done_callback(lambda _: self._fetches.pop(digest, None))
+        return await asyncio.shield(fetch)
+
+    async def fetch_manifest(self, session: ClientSession, digest: str) -> ArtifactManifest:
+        """Get the manifest of an artifact, fetching it from the server of the session unless it is stored already."""
+        manifest_path = self._artifact_store.get_manifest_path(check_digest(digest))
+        if manifest_path.exists():
+            return ArtifactManifest.decode(manifest_path.read_bytes())
+
+        response = await self._request(
+            session, digest, lambda transfer_id: ArtifactManifestRequest(transfer_id, digest)
+        )
+        if response.error:
+            raise ArtifactFetchError(f"Server could not send manifest of artifact {digest}: {response.error}")
+        if response.manifest is None or response.signature is None:
+            raise ArtifactFetchError(f"Server sent a malformed manifest of artifact {digest}")
+        manifest_data, signature = response.manifest, response.signature
+        if not (server_public_key := session.get_server_public_key()) or \
+                not await self._crypto_executor.verify(manifest_data, signature, server_public_key):
+            raise ArtifactFetchError(f"Manifest of artifact {digest} is not signed by the server")
+        try:
+            manifest = ArtifactManifest.decode(manifest_data)
+        except InvalidManifestError as e:
+            raise ArtifactFetchError(f"Server sent an invalid manifest of artifact {digest}") from e
+        if manifest.digest != digest:
+            raise ArtifactFetchError(f"Server sent the manifest of artifact {manifest.digest} instead of {digest}")
+        # Only verified manifests are stored, so they are trusted from then on.
+        write_file(manifest_path, manifest_data)
+        return manifest
+
+    async def fetch_chunk(self, session: ClientSession, manifest: ArtifactManifest, index: int) -> bytes:
+        """Fetch a single chunk of an artifact from the server of the session, verified against its manifest."""
+
+        def create_request(transfer_id: int) -> ArtifactFetchRequest:
+            return ArtifactFetchRequest(transfer_id, manifest.digest, [], index, manifest.chunk_size)
+
+        chunk = await self._request(session, manifest.digest, create_request, bytearray())
+        if not manifest.verify_chunk(index, chunk):
+            raise ArtifactCorruptedError(f"Chunk {index} of artifact {manifest.digest} doesn't match its manifest")
+        return bytes(chunk)
+
+    def handle_message(self, session: ClientSession, payload: bytes) -> None:
+        try:
+            message = decode_artifact_message(payload)
+        except InvalidArtifactMessageError as e:
+            LOGGER.warning(f"Dropping invalid artifact message in session {session.get_session_id()}: {e}")
+            return
+        transfer = self._transfers.get(message.transfer_id)
+        if not transfer or transfer.session is not session or transfer.result.done():
+            return
+
+        # The data is small enough per message and written to the page cache, it is handled on the event loop to keep
+        # it in order.
+        try:
+            if isinstance(message, ArtifactTransferStart):
+                self._start_transfer(transfer, message)
+            elif isinstance(message, ArtifactTransferData):
+                self._receive_data(transfer, message)
+            elif isinstance(message, ArtifactTransferEnd):
+                self._end_transfer(transfer, message)
+            elif isinstance(message, ArtifactManifestResponse):
+                transfer.result.set_result(message)
+        except (ArtifactFetchError, ArtifactCorruptedError, InvalidDeltaError, OSError) as e:
+            transfer.fail(e)
+
+    def handle_disconnect(self, session: ClientSession) -> None:
+        for transfer in self._transfers.values():
+            if transfer.session is session:
+                transfer.fail(ArtifactFetchError("Server disconnected during transfer"))
+
+    async def _fetch(self, session: ClientSession, digest: str, basis_digests: list[str]) -> Path:
+        basis_digests = [basis_digest for basis_digest in basis_digests if self._artifact_store.has(basis_digest)]
+        try:
+            return await self._transfer(session, digest, basis_digests)
+        except (ArtifactCorruptedError, InvalidDeltaError) as e:
+            if not basis_digests:
+                raise ArtifactFetchError(f"Artifact {digest} arrived corrupted") from e
+            LOGGER.warning(f"Delta transfer of artifact {digest} failed: {e}. Fetching the whole artifact...")
+            return await self._transfer(session, digest, [])
+
+    async def _transfer(self, session: ClientSession, digest: str, basis_digests: list[str]) -> Path:
+        await self._request(
+            session, digest, lambda transfer_id: ArtifactFetchRequest(transfer_id, digest, basis_digests)
+        )
+        return self._artifact_store.get_object_path(digest)
+
+    async def _request(self,
+                       session: ClientSession,
+                       digest: str,
+                       create_request: Callable[[int], ArtifactFetchRequest | ArtifactManifestRequest],
+                       chunk: bytearray | None = None
+                       ):
+        """Send a request under a new transfer id and wait for whatever the transfer results in."""
+        transfer_id = next(self._transfer_ids)
+        transfer = _Transfer(session, digest, asyncio.get_running_loop().create_future())
+        transfer.chunk = chunk
+        self._transfers[transfer_id] = transfer
+        try:
+            session.write(create_request(transfer_id).encode(), ARTIFACT_CHANNEL)
+            return await asyncio.wait_for(transfer.result, self._timeout)
+        except asyncio.TimeoutError as e:
+            raise ArtifactFetchError(f"Timed out fetching artifact {digest}") from e
+        finally:
+            del self._transfers[transfer_id]
+            transfer.close()
+
+    def _start_transfer(self, transfer: _Transfer, transfer_start: ArtifactTransferStart):
+        if transfer.writer or transfer.size:
+            raise ArtifactFetchError("Transfer started twice")
+        transfer.size = transfer_start.size
+        if transfer.chunk is not None:
+            return
+        transfer.writer = self._artifact_store.create_writer()
+        if transfer_start.basis_digest is None:
+            return
+        if not (basis_path := self._artifact_store.get_path(transfer_start.basis_digest)) or \
+                not transfer_start.block_size:
+            raise ArtifactFetchError(f"Server sent a delta from unknown artifact {transfer_start.basis_digest}")
+        transfer.basis = open(basis_path, "rb")
+        transfer.delta_applier = DeltaApplier(transfer.basis, transfer.writer.write, transfer_start.block_size)
+
+    def _receive_data(self, transfer: _Transfer, transfer_data: ArtifactTransferData):
+        if transfer.chunk is not None:
+            transfer.chunk += transfer_data.data
+            if len(transfer.chunk) > transfer.size:
+                raise ArtifactCorruptedError(f"Chunk exceeds its size of {transfer.size} bytes")
+            return
+        if not transfer.writer:
+            raise ArtifactFetchError("Transfer data arrived before the transfer started")
+        if transfer.delta_applier:
+            transfer.delta_applier.feed(transfer_data.data)
+        else:
+            transfer.writer.write(transfer_data.data)
+        if transfer.writer.get_size() > transfer.size:
+            raise ArtifactCorruptedError(f"Artifact exceeds its size of {transfer.size} bytes")
+
+    def _end_transfer(self, transfer: _Transfer, transfer_end: ArtifactTransferEnd):
+        if transfer_end.error:
+            raise ArtifactFetchError(f"Server could not send artifact {transfer.digest}: {transfer_end.error}")
+        if transfer.chunk is not None:
+            transfer.result.set_result(transfer.chunk)
+            return
+        if not transfer.writer:
+            raise ArtifactFetchError("Transfer ended before it started")
+        if transfer.delta_applier:
+            transfer.delta_applier.close()
+        writer = transfer.writer
+        transfer.writer = None
+        writer.commit(transfer.digest)
+        transfer.result.set_result(None)
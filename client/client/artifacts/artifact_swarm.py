@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import random
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+from client.artifacts.artifact_fetcher import ArtifactFetcher, ArtifactFetchError
+from client.artifacts.artifact_manifest import ArtifactManifest
+from client.artifacts.artifact_store import ArtifactStore, ArtifactCorruptedError, check_digest, write_file
+from client.network.client_session import ClientSession
+from client.network.peer_exchange import PeerExchange, Peer, PeerChunkError
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_PEER_FETCHES = 4
+# Chunks fetched from the server between asking peers again, while no peer takes part in the artifact.
+MAX_SERVER_BATCH = 16
+
+
+class ArtifactSwarm:
+    """Fetches artifacts chunk by chunk, from peers on the same network wherever they have them.
+
+    A chunk nobody nearby has is fetched from the server. Hosts pick those chunks in random order, so hosts fetching the
+    same artifact at once rarely pick the same one and then take the rest from each other, which gets every chunk from
+    the server about once per network. A host that finds no peers at all takes ever more chunks from the server before
+    it asks again. Upgrades from an artifact the host holds are fetched as a delta from the server instead, which is
+    smaller than any of the chunks would be.
+    """
+
+    def __init__(self,
+                 artifact_store: ArtifactStore,
+                 artifact_fetcher: ArtifactFetcher,
+                 peer_exchange: PeerExchange,
+                 max_peer_fetches: int = DEFAULT_MAX_PEER_FETCHES
+                 ):
+        self._artifact_store = artifact_store
+        self._artifact_fetcher = artifact_fetcher
+        self._peer_exchange = peer_exchange
+        self._max_peer_fetches = max_peer_fetches
+        # Fetches of the same artifact share a single swarm.
+        self._fetches: dict[str, asyncio.Task] = {}
+
+    async def fetch(self, session: ClientSession, digest: str, basis_digests: Iterable[str] = ()) -> Path:
+        """Get the path of an artifact, fetching it from peers and the server of the session unless it is stored."""
+        if path := self._artifact_store.get_path(check_digest(digest)):
+            return path
+        if basis_digests := [basis_digest for basis_digest in basis_digests if self._artifact_store.has(basis_digest)]:
+            return await self._artifact_fetcher.fetch(session, digest, basis_digests)
+        if not (fetch := self._fetches.get(digest)):
+            fetch = asyncio.get_running_loop().create_task(self._fetch(session, digest))
+            self._fetches[digest] = fetch
+            fetch.add_done_callback(lambda _: self._fetches.pop(digest, None))
+        return await asyncio.shield(fetch)
+
+    async def _fetch(self, session: ClientSession, digest: str) -> Path:
+        try:
+            manifest = await self._artifact_fetcher.fetch_manifest(session, digest)
+        except ArtifactFetchError as e:
+            LOGGER.warning(f"No manifest of artifact {digest}: {e}. Fetching it from the server...")
+            return await self._artifact_fetcher.fetch(session, digest)
+
+        self._artifact_store.get_chunk_path(digest, 0).parent.mkdir(exist_ok=True)
+        missing = set(range(manifest.get_chunk_count())) - self._artifact_store.get_chunk_indexes(digest)
+        # Peers that sent something broken or failed are not asked again.
+        failed_peers: set[Peer] = set()
+        server_batch = 1
+        while missing:
+            peers = [peer for peer in await self._peer_exchange.find_peers(manifest) if peer not in failed_peers]
+            if any(peer.chunk_indexes & missing for peer in peers):
+                await self._fetch_from_peers(manifest, peers, missing, failed_peers)
+                continue
+
+            # Peers without any of the missing chunks yet are fetching them as well, they get theirs one at a time.
+            server_batch = 1 if peers else min(server_batch * 2, MAX_SERVER_BATCH)
+            indexes = random.sample(sorted(missing), min(server_batch, len(missing)))
+            chunks = await asyncio.gather(
+                *(self._artifact_fetcher.fetch_chunk(session, manifest, index) for index in indexes),
+                return_exceptions=True
+            )
+            # Whatever did arrive is kept, a fetch of the artifact that is tried again picks up from there.
+            for index, chunk in zip(indexes, chunks):
+                if not isinstance(chunk, BaseException):
+                    await self._store_chunk(manifest, index, chunk)
+                    missing.discard(index)
+            if errors := [chunk for chunk in chunks if isinstance(chunk, BaseException)]:
+                raise errors[0]
+            LOGGER.debug(f"Fetched {len(indexes)} chunks of artifact {digest} from the server.")
+
+        return await self._assemble(manifest)
+
+    async def _fetch_from_peers(self,
+                                manifest: ArtifactManifest,
+                                peers: list[Peer],
+                                missing: set[int],
+                                failed_peers: set[Peer]
+                                ):
+        fetch_slots = asyncio.Semaphore(self._max_peer_fetches)
+        # Chunks are spread over the peers that have them, the least busy one gets the next.
+        peer_loads = Counter()
+
+        async def fetch_chunk(index: int):
+            async with fetch_slots:
+                holders = [peer for peer in peers if index in peer.chunk_indexes and peer not in failed_peers]
+                if not holders:
+                    return
+                peer = min(random.sample(holders, len(holders)), key=peer_loads.__getitem__)
+                peer_loads[peer] += 1
+                try:
+                    chunk = await self._peer_exchange.fetch_chunk(peer, manifest, index)
+                except PeerChunkError as e:
+                    LOGGER.info(f"Dropping peer {peer.address}:{peer.tcp_port}: {e}")
+                    failed_peers.add(peer)
+                    return
+                finally:
+                    peer_loads[peer] -= 1
+                await self._store_chunk(manifest, index, chunk)
+                missing.discard(index)
+
+        indexes = [index for index in missing if any(index in peer.chunk_indexes for peer in peers)]
+        random.shuffle(indexes)
+        await asyncio.gather(*(fetch_chunk(index) for index in indexes))
+        LOGGER.debug(f"Fetched chunks of artifact {manifest.digest} from {len(peers)} peers, {len(missing)} missing.")
+
+    async def _store_chunk(self, manifest: ArtifactManifest, index: int, chunk: bytes):
+        await asyncio.get_running_loop().run_in_executor(
+            None, write_file, self._artifact_store.get_chunk_path(manifest.digest, index), chunk
+        )
+
+    async def _assemble(self, manifest: ArtifactManifest) -> Path:
+        await asyncio.get_running_loop().run_in_executor(None, self._write_artifact, manifest)
+        LOGGER.info(f"Fetched artifact {manifest.digest} of {manifest.get_chunk_count()} chunks.")
+        return self._artifact_store.get_object_path(manifest.digest)
+
+    def _write_artifact(self, manifest: ArtifactManifest):
+        writer = self._artifact_store.create_writer()
+        try:
+            for index in range(manifest.get_chunk_count()):
+                writer.write(self._artifact_store.get_chunk_path(manifest.digest, index).read_bytes())
+        except OSError:
+            writer.abort()
+            raise
+        try:
+            writer.commit(manifest.digest)
+        except ArtifactCorruptedError as e:
+            raise ArtifactFetchError(f"Chunks of artifact {manifest.digest} don't add up to it") from e
+        finally:
+            # Peers are served from the artifact itself from now on.
+            self._artifact_store.remove_chunks(manifest.digest)
@@ -0,0 +1,158 @@
+import hashlib
+import mmap
+import struct
+import zlib
+from typing import BinaryIO, Callable
+
+DEFAULT_BLOCK_SIZE = 16 * 1024
+# Literal data is split into operations of at most this size, so applying a delta never holds much in memory.
+MAX_LITERAL_SIZE = 1024 * 1024
+
+COPY = 1
+LITERAL = 2
+
+# Copy a run of blocks of the basis: operation, index of the first block and number of blocks.
+_COPY = struct.Struct(">BII")
+# Data the basis doesn't have: operation and length, followed by the data.
+_LITERAL = struct.Struct(">BI")
+
+_ADLER_MODULUS = 65521
+
+
+class InvalidDeltaError(Exception):
+    """Error to raise if a delta is malformed or refers to blocks the basis doesn't have."""
+
+
+def _strong_checksum(block) -> bytes:
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def compute_signatures(basis: BinaryIO, block_size: int = DEFAULT_BLOCK_SIZE) -> dict[int, dict[bytes, int]]:
+    """Checksum every full block of the basis, mapping weak checksums to strong checksums to block indexes."""
+    signatures: dict[int, dict[bytes, int]] = {}
+    index = 0
+    while len(block := basis.read(block_size)) == block_size:
+        signatures.setdefault(zlib.adler32(block), {}).setdefault(_strong_checksum(block), index)
+        index += 1
+    return signatures
+
+
+def compute_delta(signatures: dict[int, dict[bytes, int]],
+                  target: BinaryIO,
+                  write: Callable[[bytes], object],
+                  block_size: int = DEFAULT_BLOCK_SIZE
+                  ) -> None:
+    """Write the operations that turn the basis the signatures were computed on into the target.
+
+    A block sized window slides over the target. Its weak Adler-32 checksum is rolled along one byte at a time, which
+    finds blocks of the basis wherever they moved to, and a strong checksum confirms a candidate before it is copied.
+    After a match the window jumps a whole block ahead, so unchanged stretches cost a checksum per block.
+    """
+    size = target.seek(0, 2)
+    if size == 0:
+        return
+    with mmap.mmap(target.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        copy_start = copy_count = 0
+        literal_start = position = 0
+        while position + block_size <= size:
+            index = _find_block(signatures, data[position:position + block_size])
+            if index is None:
+                position = _roll(signatures, data, position, size, block_size)
+                if position + block_size > size:
+                    break
+                index = _find_block(signatures, data[position:position + block_size])
+
+            if literal_start < position:
+                if copy_count:
+                    write(_COPY.pack(COPY, copy_start, copy_count))
+                    copy_count = 0
+                _write_literal(data, literal_start, position, write)
+            if copy_count and index == copy_start + copy_count:
+                copy_count += 1
+            else:
+                if copy_count:
+                    write(_COPY.pack(COPY, copy_start, copy_count))
+                copy_start, copy_count = index, 1
+            position += block_size
+            literal_start = position
+
+        if copy_count:
+            write(_COPY.pack(COPY, copy_start, copy_count))
+        _write_literal(data, literal_start, size, write)
+
+
+def _find_block(signatures: dict[int, dict[bytes, int]], block) -> int | None:
+    if candidates := signatures.get(zlib.adler32(block)):
+        return candidates.get(_strong_checksum(block))
+    return None
+
+
+def _roll(signatures: dict[int, dict[bytes, int]], data, position: int, size: int, block_size: int) -> int:
+    """Slide the window a byte at a time until it holds a block of the basis, returns where it does or ``size``."""
+    weak = zlib.adler32(data[position:position + block_size])
+    a = weak & 0xFFFF
+    b = weak >> 16
+    end = size - block_size
+    while position < end:
+        # Drop the first byte of the window and take in the one after it.
+        outgoing = data[position]
+        a = (a - outgoing + data[position + block_size]) % _ADLER_MODULUS
+        b = (b - block_size * outgoing + a - 1) % _ADLER_MODULUS
+        position += 1
+        if (candidates := signatures.get((b << 16) | a)) is not None and \
+                _strong_checksum(data[position:position + block_size]) in candidates:
+            return position
+    return size
+
+
+def _write_literal(data, start: int, end: int, write: Callable[[bytes], object]):
+    for offset in range(start, end, MAX_LITERAL_SIZE):
+        literal = data[offset:min(offset + MAX_LITERAL_SIZE, end)]
+        write(_LITERAL.pack(LITERAL, len(literal)) + literal)
+
+
+class DeltaApplier:
+    """Rebuilds the target from the basis and a delta that is fed in pieces, as it arrives."""
+
+    def __init__(self, basis: BinaryIO, write: Callable[[bytes], object], block_size: int = DEFAULT_BLOCK_SIZE):
+        self._basis = basis
+        self._write = write
+        self._block_size = block_size
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+        offset = 0
+        while len(self._buffer) - offset >= _LITERAL.size:
+            operation = self._buffer[offset]
+            if operation == COPY:
+                if len(self._buffer) - offset < _COPY.size:
+                    break
+                _, index, count = _COPY.unpack_from(self._buffer, offset)
+                self._copy(index, count)
+                offset += _COPY.size
+            elif operation == LITERAL:
+                _, length = _LITERAL.unpack_from(self._buffer, offset)
+                if length > MAX_LITERAL_SIZE:
+                    raise InvalidDeltaError(f"Literal of {length} bytes exceeds the maximum of {MAX_LITERAL_SIZE}")
+                if len(self._buffer) - offset < _LITERAL.size + length:
+                    break
+                self._write(bytes(self._buffer[offset + _LITERAL.size:offset + _LITERAL.size + length]))
+                offset += _LITERAL.size + length
+            else:
+                raise InvalidDeltaError(f"Unknown delta operation {operation}")
+        del self._buffer[:offset]
+
+    def close(self) -> None:
+        if self._buffer:
+            raise InvalidDeltaError("Delta ends in the middle of an operation")
+
+    def _copy(self, index: int, count: int):
+        self._basis.seek(index * self._block_size)
+        remaining = count * self._block_size
+        while remaining:
+            block = self._basis.read(min(remaining, MAX_LITERAL_SIZE))
+            if not block:
+                raise InvalidDeltaError(f"Delta copies blocks {index} to {index + count - 1} the basis doesn't have")
+            self._write(block)
+            remaining -= len(block)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from asyncio.subprocess import PIPE, DEVNULL
+from pathlib import Path
+from typing import Callable
+
+from client.network.command_messages import CommandRequest, CommandResult, MAX_COMMAND_OUTPUT_SIZE
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 16
+# How long to wait for the output of a killed command, its children may still hold the pipes open.
+OUTPUT_DRAIN_TIMEOUT = 1.0
+_READ_SIZE = 64 * 1024
+
+
+async def _read_limited(stream: asyncio.StreamReader, output: bytearray, limit: int) -> None:
+    """Read a stream to its end, keeping only the first ``limit`` bytes."""
+    while chunk := await stream.read(_READ_SIZE):
+        if len(output) < limit:
+            output += chunk[:limit - len(output)]
+
+
+class CommandRunner:
+    """Runs commands sent by the server as subprocesses, at most ``max_concurrent`` at once."""
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def run(self,
+                  request: CommandRequest,
+                  cwd: Path | None = None,
+                  env: dict[str, str] | None = None,
+                  on_started: Callable[[], None] | None = None
+                  ) -> CommandResult:
+        """Run a command once fewer than ``max_concurrent`` others are running, calling ``on_started`` as it starts."""
+        async with self._semaphore:
+            if on_started:
+                on_started()
+            return await self._run(request, cwd, env)
+
+    async def _run(self, request: CommandRequest, cwd: Path | None, env: dict[str, str] | None) -> CommandResult:
+        if not request.command:
+            return CommandResult(request.command_id, None, "", "", error="Command is empty")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *request.command, stdin=DEVNULL, stdout=PIPE, stderr=PIPE, cwd=cwd, env=env
+            )
+        except (OSError, ValueError) as e:
+            return CommandResult(request.command_id, None, "", "", error=str(e))
+
+        stdout, stderr = bytearray(), bytearray()
+        readers = [
+            asyncio.create_task(_read_limited(process.stdout, stdout, MAX_COMMAND_OUTPUT_SIZE)),
+            asyncio.create_task(_read_limited(process.stderr, stderr, MAX_COMMAND_OUTPUT_SIZE))
+        ]
+        timed_out = False
+        try:
+            await asyncio.wait_for(process.wait(), request.timeout)
+        except asyncio.TimeoutError:
+            LOGGER.debug(f"Command {request.command_id} timed out. Killing...")
+            timed_out = True
+            process.kill()
+            await process.wait()
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        finally:
+            _, still_reading = await asyncio.wait(readers, timeout=OUTPUT_DRAIN_TIMEOUT)
+            for reader in still_reading:
+                reader.cancel()
+
+        return CommandResult(
+            request.command_id,
+            process.returncode,
+            stdout.decode("UTF-8", errors="replace"),
+            stderr.decode("UTF-8", errors="replace"),
+            timed_out=timed_out
+        )
@@ -1,8 +1,9 @@
 import logging
 from configparser import ConfigParser
 from dataclasses import dataclass
+from ipaddress import ip_address
 from pathlib import Path
-from uuid import uuid4
+from uuid import uuid4, UUID
 
 from rsa import PublicKey, PrivateKey
 
@@ -20,6 +21,26 @@ class ClientConfig:
     public_key: PublicKey
     udp_broadcast_port: int
     tcp_server_port: int
+    max_server_sessions: int
+    beacon_initial_delay: float
+    beacon_max_delay: float
+    multicast_group: str | None
+    multicast_ttl: int
+    peer_udp_port: int
+    peer_tcp_port: int
+    max_peer_uploads: int
+    max_concurrent_commands: int
+    compression_enabled: bool
+    compression_dictionary_path: Path | None
+    artifact_store_path: Path
+    applications_path: Path
+    health_check_interval: float
+    health_check_timeout: float
+    max_concurrent_health_checks: int
+    health_report_interval: float
+    telemetry_disk_path: Path
+    telemetry_report_interval: float
+    telemetry_max_report_interval: float
 
 
 class ClientConfigError(Exception):
@@ -29,6 +50,24 @@ class ClientConfigError(Exception):
 class ClientConfigLoader:
     DEFAULT_UDP_PORT = 53179
     DEFAULT_TCP_PORT = 52179
+    DEFAULT_MAX_SERVER_SESSIONS = 1
+    DEFAULT_BEACON_INITIAL_DELAY = 1.0
+    DEFAULT_BEACON_MAX_DELAY = 60.0
+    DEFAULT_MULTICAST_TTL = 1
+    DEFAULT_PEER_UDP_PORT = 53180
+    DEFAULT_PEER_TCP_PORT = 52180
+    DEFAULT_MAX_PEER_UPLOADS = 8
+    DEFAULT_MAX_CONCURRENT_COMMANDS = 16
+    DEFAULT_COMPRESSION = "deflate"
+    DEFAULT_ARTIFACT_STORE_PATH = "artifacts"
+    DEFAULT_APPLICATIONS_PATH = "applications"
+    DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+    DEFAULT_HEALTH_CHECK_TIMEOUT = 10.0
+    DEFAULT_MAX_CONCURRENT_HEALTH_CHECKS = 4
+    DEFAULT_HEALTH_REPORT_INTERVAL = 10.0
+    DEFAULT_TELEMETRY_DISK_PATH = "/"
+    DEFAULT_TELEMETRY_REPORT_INTERVAL = 10.0
+    DEFAULT_TELEMETRY_MAX_REPORT_INTERVAL = 60.0
 
     def __init__(self, encryption_manager: EncryptionManager, path: Path = Path("./config.cfg")):
         self._encryption_manager = encryption_manager
@@ -42,6 +81,10 @@ class ClientConfigLoader:
 
         if not (client_id := self._config.get("APPLICATION", "ClientId", fallback=None)):
             client_id = str(uuid4())
+        try:
+            UUID(client_id)
+        except ValueError as e:
+            raise ClientConfigError("Client id must be a valid UUID") from e
 
         if not (server_public_key := self._config.get("SECURITY", "ServerPublicKey", fallback=None)):
             LOGGER.warning(
@@ -66,6 +109,119 @@ class ClientConfigLoader:
         except ValueError as e:
             raise ClientConfigError("Ports must be valid integers") from e
 
+        try:
+            max_server_sessions = self._config.get("NETWORK", "MaxServerSessions",
+                                                   fallback=None) or self.DEFAULT_MAX_SERVER_SESSIONS
+            max_server_sessions = int(max_server_sessions)
+        except ValueError as e:
+            raise ClientConfigError("Max server sessions must be a valid integer") from e
+        if max_server_sessions < 1:
+            raise ClientConfigError("Max server sessions must be at least 1")
+
+        try:
+            beacon_initial_delay = self._config.get("NETWORK", "BeaconInitialDelay",
+                                                    fallback=None) or self.DEFAULT_BEACON_INITIAL_DELAY
+            beacon_initial_delay = float(beacon_initial_delay)
+            beacon_max_delay = self._config.get("NETWORK", "BeaconMaxDelay",
+                                                fallback=None) or self.DEFAULT_BEACON_MAX_DELAY
+            beacon_max_delay = float(beacon_max_delay)
+        except ValueError as e:
+            raise ClientConfigError("Beacon delays must be valid numbers") from e
+        if not 0 < beacon_initial_delay <= beacon_max_delay:
+            raise ClientConfigError("Beacon initial delay must be positive and not exceed the max delay")
+
+        multicast_group = self._config.get("NETWORK", "MulticastGroup", fallback=None) or None
+        if multicast_group:
+            try:
+                is_multicast = ip_address(multicast_group).is_multicast
+            except ValueError as e:
+                raise ClientConfigError("Multicast group must be a valid IP address") from e
+            if not is_multicast:
+                raise ClientConfigError("Multicast group must be a multicast address")
+        try:
+            multicast_ttl = self._config.get("NETWORK", "MulticastTTL", fallback=None) or self.DEFAULT_MULTICAST_TTL
+            multicast_ttl = int(multicast_ttl)
+        except ValueError as e:
+            raise ClientConfigError("Multicast TTL must be a valid integer") from e
+
+        try:
+            peer_udp_port = self._config.get("NETWORK", "PeerUDPPort", fallback=None) or self.DEFAULT_PEER_UDP_PORT
+            peer_udp_port = int(peer_udp_port)
+            peer_tcp_port = self._config.get("NETWORK", "PeerTCPPort", fallback=None) or self.DEFAULT_PEER_TCP_PORT
+            peer_tcp_port = int(peer_tcp_port)
+        except ValueError as e:
+            raise ClientConfigError("Peer ports must be valid integers") from e
+        try:
+            max_peer_uploads = self._config.get("NETWORK", "MaxPeerUploads",
+                                                fallback=None) or self.DEFAULT_MAX_PEER_UPLOADS
+            max_peer_uploads = int(max_peer_uploads)
+        except ValueError as e:
+            raise ClientConfigError("Max peer uploads must be a valid integer") from e
+        if max_peer_uploads < 1:
+            raise ClientConfigError("Max peer uploads must be at least 1")
+        try:
+            max_concurrent_commands = self._config.get("NETWORK", "MaxConcurrentCommands",
+                                                       fallback=None) or self.DEFAULT_MAX_CONCURRENT_COMMANDS
+            max_concurrent_commands = int(max_concurrent_commands)
+        except ValueError as e:
+            raise ClientConfigError("Max concurrent commands must be a valid integer") from e
+        if max_concurrent_commands < 1:
+            raise ClientConfigError("Max concurrent commands must be at least 1")
+
+        compression = self._config.get("NETWORK", "Compression", fallback=None) or self.DEFAULT_COMPRESSION
+        if compression not in ("deflate", "none"):
+            raise ClientConfigError("Compression must be either 'deflate' or 'none'")
+        compression_dictionary_path = self._config.get("NETWORK", "CompressionDictionaryPath", fallback=None)
+        compression_dictionary_path = Path(compression_dictionary_path) if compression_dictionary_path else None
+
+        artifact_store_path = Path(
+            self._config.get("ARTIFACTS", "StorePath", fallback=None) or self.DEFAULT_ARTIFACT_STORE_PATH
+        )
+
+        applications_path = Path(
+            self._config.get("APPLICATIONS", "Path", fallback=None) or self.DEFAULT_APPLICATIONS_PATH
+        )
+        try:
+            health_check_interval = self._config.get("APPLICATIONS", "HealthCheckInterval",
+                                                     fallback=None) or self.DEFAULT_HEALTH_CHECK_INTERVAL
+            health_check_interval = float(health_check_interval)
+            health_check_timeout = self._config.get("APPLICATIONS", "HealthCheckTimeout",
+                                                    fallback=None) or self.DEFAULT_HEALTH_CHECK_TIMEOUT
+            health_check_timeout = float(health_check_timeout)
+            health_report_interval = self._config.get("APPLICATIONS", "HealthReportInterval",
+                                                      fallback=None) or self.DEFAULT_HEALTH_REPORT_INTERVAL
+            health_report_interval = float(health_report_interval)
+        except ValueError as e:
+            raise ClientConfigError("Health check intervals and timeout must be valid numbers") from e
+        if health_check_interval <= 0 or health_check_timeout <= 0 or health_report_interval <= 0:
+            raise ClientConfigError("Health check intervals and timeout must be positive")
+        try:
+            max_concurrent_health_checks = self._config.get("APPLICATIONS", "MaxConcurrentHealthChecks",
+                                                            fallback=None) or self.DEFAULT_MAX_CONCURRENT_HEALTH_CHECKS
+            max_concurrent_health_checks = int(max_concurrent_health_checks)
+        except ValueError as e:
+            raise ClientConfigError("Max concurrent health checks must be a valid integer") from e
+        if max_concurrent_health_checks < 1:
+            raise ClientConfigError("Max concurrent health checks must be at least 1")
+
+        telemetry_disk_path = Path(
+            self._config.get("TELEMETRY", "DiskPath", fallback=None) or self.DEFAULT_TELEMETRY_DISK_PATH
+        )
+        try:
+            telemetry_report_interval = self._config.get("TELEMETRY", "ReportInterval",
+                                                         fallback=None) or self.DEFAULT_TELEMETRY_REPORT_INTERVAL
+            telemetry_report_interval = float(telemetry_report_interval)
+            telemetry_max_report_interval = self._config.get(
+                "TELEMETRY", "MaxReportInterval", fallback=None
+            ) or self.DEFAULT_TELEMETRY_MAX_REPORT_INTERVAL
+            telemetry_max_report_interval = float(telemetry_max_report_interval)
+        except ValueError as e:
+            raise ClientConfigError("Telemetry report intervals must be valid numbers") from e
+        if telemetry_report_interval <= 0:
+            raise ClientConfigError("Telemetry report interval must be positive")
+        if telemetry_max_report_interval < telemetry_report_interval:
+            raise ClientConfigError("Max telemetry report interval can't be shorter than the report interval")
+
         config = ClientConfig(
             client_id=client_id,
             log_level=log_level,
@@ -73,7 +229,27 @@ class ClientConfigLoader:
             private_key=private_key,
             public_key=public_key,
             udp_broadcast_port=udp_broadcast_port,
-            tcp_server_port=tcp_server_port
+            tcp_server_port=tcp_server_port,
+            max_server_sessions=max_server_sessions,
+            beacon_initial_delay=beacon_initial_delay,
+            beacon_max_delay=beacon_max_delay,
+            multicast_group=multicast_group,
+            multicast_ttl=multicast_ttl,
+            peer_udp_port=peer_udp_port,
+            peer_tcp_port=peer_tcp_port,
+            max_peer_uploads=max_peer_uploads,
+            max_concurrent_commands=max_concurrent_commands,
+            compression_enabled=compression == "deflate",
+            compression_dictionary_path=compression_dictionary_path,
+            artifact_store_path=artifact_store_path,
+            applications_path=applications_path,
+            health_check_interval=health_check_interval,
+            health_check_timeout=health_check_timeout,
+            max_concurrent_health_checks=max_concurrent_health_checks,
+            health_report_interval=health_report_interval,
+            telemetry_disk_path=telemetry_disk_path,
+            telemetry_report_interval=telemetry_report_interval,
+            telemetry_max_report_interval=telemetry_max_report_interval
         )
         self.write_config(config)
         return config
@@ -86,7 +262,33 @@ class ClientConfigLoader:
             },
             "NETWORK": {
                 "UDPBroadcastPort": str(config.udp_broadcast_port),
-                "TCPServerPort": str(config.tcp_server_port)
+                "TCPServerPort": str(config.tcp_server_port),
+                "MaxServerSessions": str(config.max_server_sessions),
+                "BeaconInitialDelay": str(config.beacon_initial_delay),
+                "BeaconMaxDelay": str(config.beacon_max_delay),
+                "MulticastGroup": config.multicast_group or "",
+                "MulticastTTL": str(config.multicast_ttl),
+                "PeerUDPPort": str(config.peer_udp_port),
+                "PeerTCPPort": str(config.peer_tcp_port),
+                "MaxPeerUploads": str(config.max_peer_uploads),
+                "MaxConcurrentCommands": str(config.max_concurrent_commands),
+                "Compression": "deflate" if config.compression_enabled else "none",
+                "CompressionDictionaryPath": str(config.compression_dictionary_path or "")
+            },
+            "ARTIFACTS": {
+                "StorePath": str(config.artifact_store_path)
+            },
+            "APPLICATIONS": {
+                "Path": str(config.applications_path),
+                "HealthCheckInterval": str(config.health_check_interval),
+                "HealthCheckTimeout": str(config.health_check_timeout),
+                "MaxConcurrentHealthChecks": str(config.max_concurrent_health_checks),
+                "HealthReportInterval": str(config.health_report_interval)
+            },
+            "TELEMETRY": {
+                "DiskPath": str(config.telemetry_disk_path),
+                "ReportInterval": str(config.telemetry_report_interval),
+                "MaxReportInterval": str(config.telemetry_max_report_interval)
             },
             "APPLICATION": {
                 "ClientId": config.client_id,
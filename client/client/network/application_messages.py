@@ -0,0 +1,94 @@
+import struct
+from dataclasses import dataclass
+
+from client.network.message_codec import message, tag, encode_message, decode_message, InvalidMessageError
+
+# Channel the server deploys applications to hosts on and hosts report how they are doing on. Deployments are small
+# and rare, they go out behind commands but ahead of artifact transfers.
+APPLICATION_CHANNEL = 3
+APPLICATION_CHANNEL_PRIORITY = 5
+
+DEPLOYMENT = 1
+HEALTH_REPORT = 2
+
+# Application states a host reports.
+FETCHING = "fetching"
+INSTALLING = "installing"
+RUNNING = "running"
+RESTARTING = "restarting"
+FAILED = "failed"
+STOPPED = "stopped"
+
+# Details beyond this many characters are cut off, e.g. the output of a failing health check.
+MAX_DETAIL_LENGTH = 1024
+
+# Message kind, followed by the encoded message.
+_KIND = struct.Struct(">B")
+
+
+class InvalidApplicationMessageError(Exception):
+    """Error to raise if an application message can't be decoded."""
+
+
+@message
+@dataclass
+class ApplicationSpec:
+    instance_id: str = tag(1)
+    application_id: str = tag(2)
+    version: int = tag(3)
+    link: str = tag(4)
+    artifact_digest: str | None = tag(5)
+    post_download_command: list[str] = tag(6)
+    run_command: list[str] = tag(7)
+    healthcheck_command: list[str] = tag(8)
+    environment: dict[str, str] = tag(9)
+
+
+@message
+@dataclass
+class ApplicationDeployment:
+    """Every application instance the host should run, instances it runs that are missing are stopped."""
+    applications: list[ApplicationSpec] = tag(1)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(DEPLOYMENT) + encode_message(self)
+
+
+@message
+@dataclass
+class ApplicationHealth:
+    instance_id: str = tag(1)
+    state: str = tag(2)
+    # Unknown until the first health check completed, or if the application has no health check.
+    healthy: bool | None = tag(3)
+    restarts: int = tag(4)
+    # Unix time of the state change or health check this reports.
+    timestamp: float = tag(5)
+    detail: str | None = tag(6, default=None)
+
+
+@message
+@dataclass
+class ApplicationHealthReport:
+    """The latest health of every application instance that was checked or changed since the previous report."""
+    health: list[ApplicationHealth] = tag(1)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(HEALTH_REPORT) + encode_message(self)
+
+
+ApplicationMessage = ApplicationDeployment | ApplicationHealthReport
+
+
+def decode_application_message(payload: bytes) -> ApplicationMessage:
+    if not payload:
+        raise InvalidApplicationMessageError("Empty application message")
+    kind = payload[0]
+    try:
+        if kind == DEPLOYMENT:
+            return decode_message(ApplicationDeployment, payload, _KIND.size)
+        if kind == HEALTH_REPORT:
+            return decode_message(ApplicationHealthReport, payload, _KIND.size)
+    except InvalidMessageError as e:
+        raise InvalidApplicationMessageError("Invalid application message") from e
+    raise InvalidApplicationMessageError(f"Unknown application message kind {kind}")
@@ -0,0 +1,124 @@
+import struct
+from dataclasses import dataclass
+
+from client.network.message_codec import message, tag, encode_message, decode_message, InvalidMessageError
+
+# Channel hosts fetch artifacts on. Transfers are bulk, they go out behind commands and everything else.
+ARTIFACT_CHANNEL = 2
+ARTIFACT_CHANNEL_PRIORITY = 6
+ARTIFACT_CHUNK_SIZE = 256 * 1024
+
+FETCH_REQUEST = 1
+TRANSFER_START = 2
+TRANSFER_DATA = 3
+TRANSFER_END = 4
+MANIFEST_REQUEST = 5
+MANIFEST_RESPONSE = 6
+
+# Message kind, followed by the encoded message, or by the transfer id and the raw data for transfer data.
+_KIND = struct.Struct(">B")
+_TRANSFER_DATA = struct.Struct(">BI")
+
+
+class InvalidArtifactMessageError(Exception):
+    """Error to raise if an artifact message can't be decoded."""
+
+
+@message
+@dataclass
+class ArtifactFetchRequest:
+    transfer_id: int = tag(1)
+    digest: str = tag(2)
+    # Artifacts the host already holds, e.g. the previous version, the server may send the difference to one of them.
+    basis_digests: list[str] = tag(3)
+    # If set only this chunk of the artifact, as split by its manifest, is sent.
+    chunk_index: int | None = tag(4, default=None)
+    chunk_size: int | None = tag(5, default=None)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(FETCH_REQUEST) + encode_message(self)
+
+
+@message
+@dataclass
+class ArtifactTransferStart:
+    transfer_id: int = tag(1)
+    digest: str = tag(2)
+    size: int = tag(3)
+    # If set the data that follows is a delta from this artifact, otherwise it is the artifact itself.
+    basis_digest: str | None = tag(4, default=None)
+    block_size: int | None = tag(5, default=None)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(TRANSFER_START) + encode_message(self)
+
+
+@dataclass
+class ArtifactTransferData:
+    transfer_id: int
+    data: bytes
+
+    def encode(self) -> bytes:
+        return _TRANSFER_DATA.pack(TRANSFER_DATA, self.transfer_id) + self.data
+
+
+@message
+@dataclass
+class ArtifactTransferEnd:
+    transfer_id: int = tag(1)
+    error: str | None = tag(2, default=None)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(TRANSFER_END) + encode_message(self)
+
+
+@message
+@dataclass
+class ArtifactManifestRequest:
+    transfer_id: int = tag(1)
+    digest: str = tag(2)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(MANIFEST_REQUEST) + encode_message(self)
+
+
+@message
+@dataclass
+class ArtifactManifestResponse:
+    transfer_id: int = tag(1)
+    # The encoded manifest and the server's signature of it, unless there is an error.
+    manifest: bytes | None = tag(2, default=None)
+    signature: bytes | None = tag(3, default=None)
+    error: str | None = tag(4, default=None)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(MANIFEST_RESPONSE) + encode_message(self)
+
+
+ArtifactMessage = ArtifactFetchRequest | ArtifactTransferStart | ArtifactTransferData | ArtifactTransferEnd | \
+                  ArtifactManifestRequest | ArtifactManifestResponse
+
+_MESSAGES = {
+    FETCH_REQUEST: ArtifactFetchRequest,
+    TRANSFER_START: ArtifactTransferStart,
+    TRANSFER_END: ArtifactTransferEnd,
+    MANIFEST_REQUEST: ArtifactManifestRequest,
+    MANIFEST_RESPONSE: ArtifactManifestResponse
+}
+
+
+def decode_artifact_message(payload: bytes) -> ArtifactMessage:
+    if not payload:
+        raise InvalidArtifactMessageError("Empty artifact message")
+    kind = payload[0]
+    if kind == TRANSFER_DATA:
+        if len(payload) < _TRANSFER_DATA.size:
+            raise InvalidArtifactMessageError("Truncated artifact transfer data")
+        _, transfer_id = _TRANSFER_DATA.unpack_from(payload)
+        return ArtifactTransferData(transfer_id, payload[_TRANSFER_DATA.size:])
+    if not (message_type := _MESSAGES.get(kind)):
+        raise InvalidArtifactMessageError(f"Unknown artifact message kind {kind}")
+    try:
+        return decode_message(message_type, payload, _KIND.size)
+    except InvalidMessageError as e:
+        raise InvalidArtifactMessageError(f"Invalid {message_type.__name__}") from e
@@ -3,11 +3,16 @@ from dataclasses import dataclass
 from enum import Enum, auto
 
 from client.network.client_encryption_manager import ClientEncryptionManager
+from client.network.compression import CompressionOptions, SessionCompressor, split_selection
+from client.utils.crypto_executor import CryptoExecutorSaturatedError
+from client.utils.session_resumption import RESUMPTION_REQUEST, RESUMPTION_ACCEPTED, RESUMPTION_REJECTED
 
 
 class AuthenticationState(Enum):
     UNCONNECTED = auto()
+    RESUMPTION_REQUESTED = auto()
     CHALLENGE_ISSUED = auto()
+    AWAITING_SESSION_TICKET = auto()
     AUTHENTICATED = auto()
 
 
@@ -19,6 +24,12 @@ class RejectConnectionCommand(AuthenticationCommand):
     """Command issued when authentication has failed and server connection should be rejected."""
 
 
+@dataclass
+class RequestResumptionCommand(AuthenticationCommand):
+    """Command issued when a session ticket should be presented to the server to resume a previous session."""
+    resumption_request: bytes
+
+
 @dataclass
 class IssueChallengeCommand(AuthenticationCommand):
     """Command issued when the server should be challenged to prove its identity."""
@@ -27,8 +38,16 @@ class IssueChallengeCommand(AuthenticationCommand):
 
 @dataclass
 class AcceptChallengeCommand(AuthenticationCommand):
-    """Command issued when challenge is successful and client public key should be shared."""
-    client_public_key: bytes
+    """Command issued when challenge is successful and the signed key exchange should be sent to the server."""
+    key_exchange: bytes
+
+
+class AcceptResumptionCommand(AuthenticationCommand):
+    """Command issued when the server has resumed a previous session and is authenticated."""
+
+
+class AcceptSessionTicketCommand(AuthenticationCommand):
+    """Command issued when the server's session ticket has been stored and the handshake is complete."""
 
 
 class AcceptMessageCommand(AuthenticationCommand):
@@ -36,15 +55,48 @@ class AcceptMessageCommand(AuthenticationCommand):
 
 
 class ClientAuthenticationManager:
-    def __init__(self, client_encryption_manager: ClientEncryptionManager):
+    def __init__(self,
+                 client_encryption_manager: ClientEncryptionManager,
+                 compression_options: CompressionOptions | None = None
+                 ):
         self._state = AuthenticationState.UNCONNECTED
         self._client_encryption_manager = client_encryption_manager
+        self._compression_options = compression_options or CompressionOptions(enabled=False)
+        self._compressor: SessionCompressor | None = None
         # TODO blacklist manager
 
-    def authenticate_server_message(self, data: bytes) -> AuthenticationCommand:
+    async def authenticate_server_message(self, data: bytes) -> AuthenticationCommand:
+        try:
+            return await self._authenticate_server_message(data)
+        except CryptoExecutorSaturatedError:
+            return RejectConnectionCommand()
+
+    async def _authenticate_server_message(self, data: bytes) -> AuthenticationCommand:
         if self._state == AuthenticationState.UNCONNECTED:
-            # Challenge server
             if self._client_encryption_manager.is_valid_claimed_server_key(data):
+                # Skip the challenge if a previous session with this server can be resumed.
+                if resumption_request := self._client_encryption_manager.get_resumption_request():
+                    self._state = AuthenticationState.RESUMPTION_REQUESTED
+                    return RequestResumptionCommand(
+                        resumption_request=RESUMPTION_REQUEST + resumption_request +
+                        self._compression_options.encode_offer()
+                    )
+
+                # Challenge server
+                self._state = AuthenticationState.CHALLENGE_ISSUED
+                return IssueChallengeCommand(
+                    challenge=self._client_encryption_manager.get_server_challenge()
+                )
+
+        elif self._state == AuthenticationState.RESUMPTION_REQUESTED:
+            if data[:1] == RESUMPTION_ACCEPTED and \
+                    (session_ticket_message := self._client_encryption_manager.accept_resumption(data[1:])) and \
+                    self._accept_compression(session_ticket_message):
+                self._state = AuthenticationState.AUTHENTICATED
+                return AcceptResumptionCommand()
+
+            # Fall back to challenging the server if it could not resume the session.
+            if data == RESUMPTION_REJECTED:
                 self._state = AuthenticationState.CHALLENGE_ISSUED
                 return IssueChallengeCommand(
                     challenge=self._client_encryption_manager.get_server_challenge()
@@ -52,11 +104,20 @@ class ClientAuthenticationManager:
 
         elif self._state == AuthenticationState.CHALLENGE_ISSUED:
             # Validate challenge response
-            if self._client_encryption_manager.verify_server_challenge(data):
-                self._state = AuthenticationState.AUTHENTICATED
-                return AcceptChallengeCommand(
-                    self._client_encryption_manager.get_client_public_key().save_pkcs1()
+            if await self._client_encryption_manager.verify_server_challenge(data):
+                # The compression offer follows the key exchange, for servers that know about compression.
+                key_exchange = await self._client_encryption_manager.get_key_exchange(
+                    self._compression_options.encode_offer()
                 )
+                self._state = AuthenticationState.AWAITING_SESSION_TICKET
+                return AcceptChallengeCommand(key_exchange)
+
+        elif self._state == AuthenticationState.AWAITING_SESSION_TICKET:
+            # The first message sealed by the server after a full handshake is always its session ticket.
+            if (session_ticket_message := self._client_encryption_manager.accept_session_ticket(data)) and \
+                    self._accept_compression(session_ticket_message):
+                self._state = AuthenticationState.AUTHENTICATED
+                return AcceptSessionTicketCommand()
 
         elif self._state == AuthenticationState.AUTHENTICATED:
             # Once server is authenticated we keep treating it as such for the
@@ -66,8 +127,27 @@ class ClientAuthenticationManager:
         # Otherwise always reject.
         return RejectConnectionCommand()
 
+    def _accept_compression(self, session_ticket_message: bytes) -> bool:
+        # Servers that don't know about compression don't pick any.
+        _, compression = split_selection(session_ticket_message)
+        if compression is None:
+            return True
+        if not self._compression_options.is_supported(compression):
+            return False
+        self._compressor = self._compression_options.create_compressor(compression)
+        return True
+
+    def get_compressor(self) -> SessionCompressor | None:
+        """Get what compresses the messages of the session, once the handshake is complete and if it was agreed on."""
+        return self._compressor
+
     def is_server_authenticated(self) -> bool:
+        # Until the session ticket arrived the server may still pick a compression, nothing is sent before that.
+        return self._state == AuthenticationState.AUTHENTICATED
+
+    def is_handshake_complete(self) -> bool:
         return self._state == AuthenticationState.AUTHENTICATED
 
     def reset(self):
         self._state = AuthenticationState.UNCONNECTED
+        self._compressor = None
@@ -1,35 +1,115 @@
 import asyncio
+import logging
 
+from client.applications.application_supervisor import ApplicationSupervisor
+from client.artifacts.artifact_fetcher import ArtifactFetcher
+from client.commands.command_runner import CommandRunner
+from client.network.application_messages import APPLICATION_CHANNEL
+from client.network.client_session import ClientSession, NoServerConnectedError
+from client.network.artifact_messages import ARTIFACT_CHANNEL
 from client.network.client_tcp_server import ClientTCPServer
+from client.network.command_messages import COMMAND_CHANNEL, CommandRequest, CommandCancel, \
+    CommandStarted, InvalidCommandMessageError, decode_command_message
 from client.network.udp_broadcaster import UDPBroadcaster
+from client.telemetry.telemetry_sampler import TelemetrySampler
+from client.utils.service import Service
 
+LOGGER = logging.getLogger(__name__)
 
-class ClientConnectionManager:
-    def __init__(self, udp_broadcaster: UDPBroadcaster, client_tcp_server: ClientTCPServer):
+
+class ClientConnectionManager(Service):
+    def __init__(self, udp_broadcaster: UDPBroadcaster, client_tcp_server: ClientTCPServer,
+                 command_runner: CommandRunner, artifact_fetcher: ArtifactFetcher,
+                 application_supervisor: ApplicationSupervisor, telemetry_sampler: TelemetrySampler):
+        super().__init__()
         self._udp_broadcaster = udp_broadcaster
         self._client_tcp_server = client_tcp_server
+        self._command_runner = command_runner
+        self._artifact_fetcher = artifact_fetcher
+        self._application_supervisor = application_supervisor
+        self._telemetry_sampler = telemetry_sampler
+        # Commands that are running, by the session and id the server sent them with, so the server can cancel them.
+        self._command_tasks: dict[tuple[ClientSession, int], asyncio.Task] = {}
         # Register Callbacks
         self._client_tcp_server.register_connection_callback(self._on_server_connected_callback)
         self._client_tcp_server.register_disconnection_callback(self._on_server_disconnected_callback)
         self._client_tcp_server.register_on_data_received_callback(self._on_data_received_callback)
 
-    async def start(self):
+    async def _start(self):
         await self._client_tcp_server.start()
         await self._udp_broadcaster.start()
 
-    async def stop(self):
+    async def _stop(self):
         await self._udp_broadcaster.stop()
         await self._client_tcp_server.stop()
+        tasks = list(self._command_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-    def _on_server_connected_callback(self, transport):
-        # Stop UDP Broadcast if server found us
+    def _on_server_connected_callback(self, session: ClientSession):
+        self._application_supervisor.set_session(session)
+        self._telemetry_sampler.add_session(session)
+        # Stop UDP Broadcast once as many servers found us as can be connected.
+        if not self._client_tcp_server.is_full():
+            return
         loop = asyncio.get_event_loop()
         loop.create_task(self._udp_broadcaster.stop())
 
-    def _on_data_received_callback(self, payload: bytes):
-        pass
+    def _on_data_received_callback(self, session: ClientSession, channel_id: int, payload: bytes):
+        if channel_id == ARTIFACT_CHANNEL:
+            self._artifact_fetcher.handle_message(session, payload)
+            return
+        if channel_id == APPLICATION_CHANNEL:
+            self._application_supervisor.handle_message(session, payload)
+            return
+        if channel_id != COMMAND_CHANNEL:
+            return
+        try:
+            command_message = decode_command_message(payload)
+        except InvalidCommandMessageError:
+            LOGGER.warning(f"Dropping invalid command message in session {session.get_session_id()}.")
+            return
+        key = (session, command_message.command_id)
+        if isinstance(command_message, CommandCancel):
+            # The command may have completed while the cancel was on its way.
+            if task := self._command_tasks.get(key):
+                LOGGER.debug(f"Cancelling command {command_message.command_id} of session {session.get_session_id()}.")
+                task.cancel()
+            return
+        if not isinstance(command_message, CommandRequest) or key in self._command_tasks:
+            LOGGER.warning(f"Dropping unexpected command message in session {session.get_session_id()}.")
+            return
+        task = asyncio.get_running_loop().create_task(self._run_command(session, command_message))
+        self._command_tasks[key] = task
+        task.add_done_callback(lambda _: self._command_tasks.pop(key, None))
+
+    async def _run_command(self, session: ClientSession, command_request: CommandRequest):
+        command_result = await self._command_runner.run(
+            command_request,
+            on_started=lambda: self._send_command_started(session, command_request)
+        )
+        try:
+            # Command output may hold secrets next to whatever else the command printed.
+            session.write(command_result.encode(), COMMAND_CHANNEL, sensitive=True)
+        except NoServerConnectedError:
+            LOGGER.debug(f"Server of session {session.get_session_id()} left before command "
+                         f"{command_request.command_id} completed.")
+
+    @staticmethod
+    def _send_command_started(session: ClientSession, command_request: CommandRequest):
+        # The server counts the command's timeout from here, not from when it sent the command.
+        try:
+            session.write(CommandStarted(command_request.command_id).encode(), COMMAND_CHANNEL)
+        except NoServerConnectedError:
+            pass
 
-    def _on_server_disconnected_callback(self):
-        # Start broadcasting again if TCP Server was disconnected from.
+    def _on_server_disconnected_callback(self, session: ClientSession):
+        self._artifact_fetcher.handle_disconnect(session)
+        self._application_supervisor.handle_disconnect(session)
+        self._telemetry_sampler.handle_disconnect(session)
+        # Start broadcasting again if TCP Server was disconnected from, unless the connection manager is stopping.
+        if not self.is_running():
+            return
         loop = asyncio.get_event_loop()
         loop.create_task(self._udp_broadcaster.start())
@@ -1,11 +1,23 @@
+import os
 import random
 import string
+import struct
 
-from rsa import PublicKey, VerificationError, PrivateKey
+from rsa import PublicKey, PrivateKey
+from rsa.common import byte_size
 
-from client.utils.encryption_manager import EncryptionManager
+from client.network.compression import split_selection
+from client.network.session_ticket_cache import SessionTicketCache, SessionTicket
+from client.utils.crypto_executor import CryptoExecutor
+from client.utils.session_cipher import SessionCipher, SERVER_TO_CLIENT, CLIENT_TO_SERVER, SessionCipherError
+from client.utils.session_resumption import RESUMPTION_NONCE_LENGTH, SESSION_TICKET_HEADER, \
+    derive_resumed_session_key
 
 CHALLENGE_LENGTH = 500
+# Sent by the server along with the signed challenge, the client signs it in its key exchange.
+HANDSHAKE_NONCE_LENGTH = 32
+# The client's signature over its key exchange is prefixed with its length, which depends on the size of its key.
+KEY_EXCHANGE_SIGNATURE_HEADER = struct.Struct(">H")
 
 
 class ClientEncryptionManager:
@@ -13,15 +25,21 @@ class ClientEncryptionManager:
                  client_private_key: PrivateKey,
                  client_public_key: PublicKey,
                  server_public_key: PublicKey | None,
-                 encryption_manager: EncryptionManager
+                 crypto_executor: CryptoExecutor,
+                 session_ticket_cache: SessionTicketCache
                  ):
         self._client_private_key = client_private_key
         self._client_public_key = client_public_key
-        self._encryption_manager = encryption_manager
+        self._crypto_executor = crypto_executor
+        self._session_ticket_cache = session_ticket_cache
 
         self._expected_server_public_key = server_public_key
         self._claimed_server_public_key = None
         self._challenge = None
+        self._handshake_nonce = None
+        self._session_cipher = None
+        self._resumption_secret = None
+        self._resumption_client_nonce = None
 
     def is_valid_claimed_server_key(self, claimed_server_key: bytes) -> bool:
         try:
@@ -39,18 +57,89 @@ class ClientEncryptionManager:
         self._challenge = ''.join(random.choice(string.ascii_letters) for _ in range(CHALLENGE_LENGTH)).encode("UTF-8")
         return self._challenge
 
-    def verify_server_challenge(self, signed_challenge: bytes) -> bool:
-        try:
-            self._encryption_manager.verify(self._challenge, signed_challenge, self._claimed_server_public_key)
-        except VerificationError:
+    async def verify_server_challenge(self, challenge_response: bytes) -> bool:
+        """Verify the server signed the challenge, and keep the nonce it sent along for the key exchange."""
+        signature_length = byte_size(self._claimed_server_public_key.n)
+        handshake_nonce = challenge_response[signature_length:]
+        if len(handshake_nonce) != HANDSHAKE_NONCE_LENGTH or not await self._crypto_executor.verify(
+                self._challenge,
+                challenge_response[:signature_length],
+                self._claimed_server_public_key
+        ):
             return False
+
+        self._handshake_nonce = handshake_nonce
         return True
 
+    async def get_key_exchange(self, trailer: bytes = b"") -> bytes:
+        """Generate a key for this session and share it with the server, together with the client's public key.
+
+        The session key is encrypted so only the authenticated server can read it. The client signs the server's
+        handshake nonce together with everything it sends, the trailer included, to prove it holds the private key of
+        the public key it presents.
+        """
+        session_key = SessionCipher.generate_session_key()
+        self._session_cipher = SessionCipher(session_key, CLIENT_TO_SERVER, SERVER_TO_CLIENT)
+        self._resumption_secret = session_key
+        encrypted_session_key = await self._crypto_executor.encrypt(session_key, self._claimed_server_public_key)
+        client_public_key = self._client_public_key.save_pkcs1()
+        signature = await self._crypto_executor.sign(
+            self._handshake_nonce + encrypted_session_key + client_public_key + trailer,
+            self._client_private_key
+        )
+        return encrypted_session_key + KEY_EXCHANGE_SIGNATURE_HEADER.pack(len(signature)) + signature + \
+            client_public_key + trailer
+
+    def get_resumption_request(self) -> bytes | None:
+        """Get a request to resume a session with the claimed server, if a ticket from it is cached."""
+        session_ticket = self._session_ticket_cache.take(self._claimed_server_public_key)
+        if not session_ticket:
+            return None
+
+        self._resumption_secret = session_ticket.resumption_secret
+        self._resumption_client_nonce = os.urandom(RESUMPTION_NONCE_LENGTH)
+        return self._resumption_client_nonce + session_ticket.ticket
+
+    def accept_resumption(self, resumption_response: bytes) -> bytes | None:
+        """Derive the resumed session's key from the server nonce and open the fresh ticket that follows it.
+
+        Returns the opened session ticket message, or None if the session could not be resumed.
+        """
+        server_nonce = resumption_response[:RESUMPTION_NONCE_LENGTH]
+        if len(server_nonce) != RESUMPTION_NONCE_LENGTH:
+            return None
+
+        session_key = derive_resumed_session_key(self._resumption_secret, self._resumption_client_nonce, server_nonce)
+        self._session_cipher = SessionCipher(session_key, CLIENT_TO_SERVER, SERVER_TO_CLIENT)
+        # Only the server that issued the ticket could have sealed a new one with the derived key.
+        return self.accept_session_ticket(resumption_response[RESUMPTION_NONCE_LENGTH:])
+
+    def accept_session_ticket(self, session_ticket_message: bytes) -> bytes | None:
+        """Open a session ticket message and cache the ticket in it, returns the opened message or None if it isn't one.
+
+        The server may have put the compression it picked behind the ticket, which is split off before it is cached.
+        """
+        try:
+            opened_session_ticket_message = self._session_cipher.open(session_ticket_message)
+        except SessionCipherError:
+            return None
+        session_ticket_message, _ = split_selection(opened_session_ticket_message)
+        if len(session_ticket_message) <= SESSION_TICKET_HEADER.size:
+            return None
+
+        (expires_at,) = SESSION_TICKET_HEADER.unpack_from(session_ticket_message)
+        self._session_ticket_cache.put(self._claimed_server_public_key, SessionTicket(
+            ticket=session_ticket_message[SESSION_TICKET_HEADER.size:],
+            resumption_secret=self._resumption_secret,
+            expires_at=expires_at
+        ))
+        return opened_session_ticket_message
+
     def encrypt_payload_for_server(self, payload: bytes) -> bytes:
-        return self._encryption_manager.encrypt(payload, self._claimed_server_public_key)
+        return self._session_cipher.seal(payload)
 
     def decrypt_payload_from_server(self, payload: bytes) -> bytes:
-        return self._encryption_manager.decrypt(payload, self._client_private_key)
+        return self._session_cipher.open(payload)
 
     def get_client_public_key(self) -> PublicKey:
         return self._client_public_key
@@ -61,3 +150,7 @@ class ClientEncryptionManager:
     def reset(self) -> None:
         self._claimed_server_public_key = None
         self._challenge = None
+        self._handshake_nonce = None
+        self._session_cipher = None
+        self._resumption_secret = None
+        self._resumption_client_nonce = None
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from asyncio import BaseTransport
+from collections import deque
+from typing import Callable
+
+from rsa import PublicKey
+
+from client.network.channel_multiplexer import ChannelMultiplexer, ChannelError, CONTROL_CHANNEL, DEFAULT_PRIORITY
+from client.network.client_authentication_manager import ClientAuthenticationManager, RejectConnectionCommand, \
+    IssueChallengeCommand, AcceptChallengeCommand, AcceptMessageCommand, RequestResumptionCommand, \
+    AcceptResumptionCommand, AcceptSessionTicketCommand
+from client.network.client_encryption_manager import ClientEncryptionManager
+from client.network.compression import SessionCompressor, CompressionError
+from client.network.frame_codec import write_frame, write_frames
+from client.utils.session_cipher import SessionCipherError
+
+LOGGER = logging.getLogger(__name__)
+
+
+class NoServerConnectedError(Exception):
+    """Error to raise if attempt to access server is made before connection."""
+
+
+class ClientSession:
+    """A single connection from a server, with its own authentication and encryption state."""
+
+    def __init__(self,
+                 session_id: int,
+                 transport: BaseTransport,
+                 client_authentication_manager: ClientAuthenticationManager,
+                 client_encryption_manager: ClientEncryptionManager,
+                 on_authenticated: Callable[["ClientSession"], None],
+                 on_received: Callable[["ClientSession", int, bytes], None]
+                 ):
+        self._session_id = session_id
+        self._transport = transport
+        self._client_authentication_manager = client_authentication_manager
+        self._client_encryption_manager = client_encryption_manager
+        self._on_authenticated = on_authenticated
+        self._on_received = on_received
+        self._handshake_frames: deque[bytes] = deque()
+        self._handshake_task = None
+        self._closed = False
+        self._compressor: SessionCompressor | None = None
+        # Every message after the handshake belongs to a channel.
+        self._multiplexer = ChannelMultiplexer(self._write_sealed_frames)
+        self._multiplexer.register_on_message_callback(self._on_channel_message_received)
+
+    def get_session_id(self) -> int:
+        return self._session_id
+
+    def get_server_public_key(self) -> PublicKey | None:
+        return self._client_encryption_manager.get_server_public_key()
+
+    def get_peername(self) -> tuple[str, int]:
+        return self._transport.get_extra_info("peername")
+
+    def is_server_authenticated(self) -> bool:
+        return self._client_authentication_manager.is_server_authenticated()
+
+    def handle_frame(self, data: bytes) -> None:
+        # Once the handshake is done messages are handled inline. Until then the authentication manager needs to await
+        # crypto running off the event loop, so frames are queued and handled in order by a handshake task.
+        if not self._handshake_task and self._client_authentication_manager.is_handshake_complete():
+            self._handle_message(data)
+            return
+
+        # Nothing more is read until the frame is handled, frames after the handshake may exceed the handshake limit.
+        self._transport.pause_reading()
+        self._handshake_frames.append(data)
+        if not self._handshake_task:
+            self._handshake_task = asyncio.get_running_loop().create_task(self._process_handshake_frames())
+
+    async def _process_handshake_frames(self):
+        try:
+            while self._handshake_frames and not self._closed:
+                data = self._handshake_frames.popleft()
+                authentication_command = await self._client_authentication_manager.authenticate_server_message(data)
+                if self._closed:
+                    return
+
+                if isinstance(authentication_command, RejectConnectionCommand):
+                    self._handshake_frames.clear()
+                    self._transport.close()
+                    return
+
+                if isinstance(authentication_command, RequestResumptionCommand):
+                    write_frame(self._transport, authentication_command.resumption_request)
+                    continue
+
+                if isinstance(authentication_command, IssueChallengeCommand):
+                    write_frame(self._transport, authentication_command.challenge)
+                    continue
+
+                if isinstance(authentication_command, AcceptResumptionCommand):
+                    LOGGER.debug(f"Server session {self._session_id} resumed")
+                    self._compressor = self._client_authentication_manager.get_compressor()
+                    self._on_authenticated(self)
+                    continue
+
+                # Only notify connection callbacks on challenge success.
+                if isinstance(authentication_command, AcceptChallengeCommand):
+                    LOGGER.debug(f"Server of session {self._session_id} authenticated")
+                    # Send server the session key, encrypted with its public key, followed by the client's signature
+                    # over the exchange and the client's public key.
+                    write_frame(self._transport, authentication_command.key_exchange)
+                    continue
+
+                # Connection callbacks may write right away, which waits for the compression the server picked.
+                if isinstance(authentication_command, AcceptSessionTicketCommand):
+                    self._compressor = self._client_authentication_manager.get_compressor()
+                    self._on_authenticated(self)
+                    continue
+
+                if isinstance(authentication_command, AcceptMessageCommand):
+                    self._handle_message(data)
+        finally:
+            self._handshake_task = None
+            if not self._closed:
+                self._transport.resume_reading()
+
+    def _handle_message(self, data: bytes):
+        # Only notify data callbacks once authenticated.
+        try:
+            decrypted_data = self._client_encryption_manager.decrypt_payload_from_server(data)
+        except SessionCipherError:
+            LOGGER.warning(f"Could not decrypt payload in session {self._session_id}. Disconnecting...")
+            self._transport.close()
+            return
+        try:
+            self._multiplexer.feed(decrypted_data)
+        except ChannelError as e:
+            LOGGER.warning(f"{e} in session {self._session_id}. Disconnecting...")
+            self._transport.close()
+
+    def _on_channel_message_received(self, channel_id: int, payload: bytes):
+        if self._compressor:
+            try:
+                payload = self._compressor.decompress(channel_id, payload)
+            except CompressionError as e:
+                LOGGER.warning(f"{e} in session {self._session_id}. Disconnecting...")
+                self._transport.close()
+                return
+        self._on_received(self, channel_id, payload)
+
+    def open_channel(self, channel_id: int, priority: int = DEFAULT_PRIORITY) -> None:
+        """Set the priority of a channel, lower numbers are sent first. Channel 0 is reserved for control messages."""
+        self._multiplexer.open_channel(channel_id, priority)
+
+    def write(self, payload: bytes, channel_id: int = CONTROL_CHANNEL, sensitive: bool = False) -> None:
+        """Queue a payload on a channel, sensitive payloads hold secrets and are never compressed."""
+        if self._closed or not self.is_server_authenticated():
+            raise NoServerConnectedError("Data can't be written as the server is not authenticated yet.")
+        self._multiplexer.send(channel_id, self._compress(channel_id, payload, sensitive))
+
+    def write_many(self, payloads: list[bytes], channel_id: int = CONTROL_CHANNEL) -> None:
+        """Queue many payloads on a channel, they are written to the server together."""
+        if self._closed or not self.is_server_authenticated():
+            raise NoServerConnectedError("Data can't be written as the server is not authenticated yet.")
+        for payload in payloads:
+            self._multiplexer.send(channel_id, self._compress(channel_id, payload))
+
+    def _compress(self, channel_id: int, payload: bytes, sensitive: bool = False) -> bytes:
+        return self._compressor.compress(channel_id, payload, sensitive) if self._compressor else payload
+
+    async def drain(self, channel_id: int) -> None:
+        """Wait until the server can take more data on a channel, bulk writers should await this between writes."""
+        await self._multiplexer.drain(channel_id)
+
+    def get_queued_size(self, channel_id: int) -> int:
+        """Get the bytes written on a channel that were not sent yet, a backlog means the connection can't keep up."""
+        return self._multiplexer.get_queued_size(channel_id)
+
+    def pause_writing(self) -> None:
+        self._multiplexer.pause_writing()
+
+    def resume_writing(self) -> None:
+        self._multiplexer.resume_writing()
+
+    def _write_sealed_frames(self, frames: list[bytes]) -> None:
+        if not self._closed:
+            write_frames(
+                self._transport,
+                [self._client_encryption_manager.encrypt_payload_for_server(frame) for frame in frames]
+            )
+
+    def disconnect(self) -> None:
+        self._transport.close()
+
+    def close(self) -> None:
+        """Drop all state of the session once its connection is lost."""
+        self._closed = True
+        self._compressor = None
+        self._multiplexer.close()
+        self._handshake_frames.clear()
+        if self._handshake_task:
+            self._handshake_task.cancel()
+        self._client_encryption_manager.reset()
+        self._client_authentication_manager.reset()
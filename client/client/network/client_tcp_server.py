@@ -1,163 +1,188 @@
 import asyncio
+import itertools
 import logging
-from asyncio import Protocol, BaseTransport
+from asyncio import BufferedProtocol, BaseTransport
 from typing import Callable
 
-from client.network.client_authentication_manager import ClientAuthenticationManager, RejectConnectionCommand, \
-    IssueChallengeCommand, AcceptChallengeCommand, AcceptMessageCommand
+from client.network.client_authentication_manager import ClientAuthenticationManager
 from client.network.client_encryption_manager import ClientEncryptionManager
+from client.network.client_session import ClientSession
+from client.network.compression import CompressionOptions
+from client.network.frame_codec import FrameDecoder, FrameTooLargeError
+from client.utils.service import Service
 
 LOGGER = logging.getLogger(__name__)
 
-AUTHENTICATION_HANDSHAKE_TIMEOUT = 1
+DEFAULT_MAX_SESSIONS = 1
+# Connections still in their handshake don't count against the session limit, so a slow or dead server that hasn't
+# authenticated can't keep another server from connecting. Only this many can be handshaking at once.
+MAX_HANDSHAKING_SESSIONS = 4
 
 
-class NoServerConnectedError(Exception):
-    """Error to raise if attempt to access server is made before connection."""
+class ClientTCPServer(Service):
+    """Accepts connections from up to ``max_sessions`` authenticated servers at once.
 
+    Every connection is a separate ``ClientSession`` with its own authentication and encryption managers, created
+    with ``client_encryption_manager_factory``.
+    """
 
-class ClientTCPServer:
     def __init__(
             self,
-            client_authentication_manager: ClientAuthenticationManager,
-            client_encryption_manager: ClientEncryptionManager,
+            client_encryption_manager_factory: Callable[[], ClientEncryptionManager],
             port: int,
             host: str = "0.0.0.0",
-            authentication_timeout: int = 5
-
+            authentication_timeout: int = 5,
+            max_sessions: int = DEFAULT_MAX_SESSIONS,
+            compression_options: CompressionOptions | None = None
     ):
+        super().__init__()
         self._host = host
         self._port = port
+        self._authentication_timeout = authentication_timeout
+        self._max_sessions = max_sessions
+        self._compression_options = compression_options
 
-        self._client_authentication_manager = client_authentication_manager
-        self._client_encryption_manager = client_encryption_manager
+        self._client_encryption_manager_factory = client_encryption_manager_factory
         self._on_connected_callbacks = []
         self._on_disconnected_callbacks = []
         self._on_received_callbacks = []
-        self._task = None
         self._server = None
-        self._transport = None
-
-    async def start(self):
-        self._task = asyncio.create_task(self._start_server())
+        self._sessions: dict[int, ClientSession] = {}
+        self._session_ids = itertools.count()
 
-    async def _start_server(self):
+    async def _start(self):
         loop = asyncio.get_running_loop()
         LOGGER.debug(f"Starting TCP server on {self._host}:{self._port}")
         self._server = await loop.create_server(
             lambda: _TCPServerProtocol(
                 self._on_connect_wrapper,
-                self._on_disconnect_wrapper,
-                self._on_data_received_wrapper
+                self._on_disconnect_wrapper
             ),
             self._host,
             self._port)
         LOGGER.info(f"TCP Server started on {self._host}:{self._port}")
-        await self._server.serve_forever()
 
-    async def stop(self):
-        self._task.cancel()
+    async def _stop(self):
+        self._server.close()
+        for session in list(self._sessions.values()):
+            session.disconnect()
+        await self._server.wait_closed()
         LOGGER.info("TCP Server stopped.")
 
-    def _on_connect_wrapper(self, transport: BaseTransport):
+    def get_sessions(self) -> list[ClientSession]:
+        """Get the sessions with an authenticated server."""
+        return [session for session in self._sessions.values() if session.is_server_authenticated()]
+
+    def is_full(self) -> bool:
+        return len(self.get_sessions()) >= self._max_sessions
+
+    def _on_connect_wrapper(self, transport: BaseTransport) -> ClientSession | None:
         # Close the connection if no more connections are currently accepted
-        if self._transport:
+        if len(self._sessions) - len(self.get_sessions()) >= MAX_HANDSHAKING_SESSIONS or self.is_full():
             LOGGER.debug(f"Got TCP connection from {transport.get_extra_info('peername')} but was full.")
             transport.close()
-        else:
-            LOGGER.debug(f"Got new TCP connection from {transport.get_extra_info('peername')}.")
-            self._transport = transport
-
-            # Start an event loop that checks if server is verified after a timeout and prevent hanging DDOs attacks
-            # that never responds.
-            loop = asyncio.get_running_loop()
-            loop.call_later(5, self._handel_server_authentication_timeout)
-
-    def _handel_server_authentication_timeout(self):
-        if self._transport and not self._client_authentication_manager.is_server_authenticated():
-            LOGGER.debug("Authentication handshake not completed in time. Disconnecting...")
-            self._transport.close()
+            return None
+
+        LOGGER.debug(f"Got new TCP connection from {transport.get_extra_info('peername')}.")
+        client_encryption_manager = self._client_encryption_manager_factory()
+        session = ClientSession(
+            next(self._session_ids),
+            transport,
+            ClientAuthenticationManager(client_encryption_manager, self._compression_options),
+            client_encryption_manager,
+            self._on_session_authenticated,
+            self._on_data_received_wrapper
+        )
+        self._sessions[session.get_session_id()] = session
+
+        # Start an event loop that checks if server is verified after a timeout and prevent hanging DDOs attacks
+        # that never responds.
+        loop = asyncio.get_running_loop()
+        loop.call_later(self._authentication_timeout, self._handle_server_authentication_timeout, session)
+        return session
+
+    def _handle_server_authentication_timeout(self, session: ClientSession):
+        if session.get_session_id() in self._sessions and not session.is_server_authenticated():
+            LOGGER.debug(f"Authentication handshake of session {session.get_session_id()} not completed in time. "
+                         f"Disconnecting...")
+            session.disconnect()
+
+    def _on_session_authenticated(self, session: ClientSession):
+        # Several servers may finish their handshake at once, only the first ones up to the limit are kept.
+        if len(self.get_sessions()) > self._max_sessions:
+            LOGGER.debug(f"Server of session {session.get_session_id()} authenticated but was full. Disconnecting...")
+            # The connection callbacks never saw the session, so it is dropped before its disconnect could notify any.
+            self._sessions.pop(session.get_session_id(), None)
+            session.disconnect()
+            return
 
-    def _on_disconnect_wrapper(self):
-        LOGGER.debug("Peer disconnected.")
-        should_callback = self._client_authentication_manager.is_server_authenticated()
+        for callback in self._on_connected_callbacks:
+            callback(session)
 
-        self._transport = None
-        self._client_encryption_manager.reset()
-        self._client_authentication_manager.reset()
+    def _on_disconnect_wrapper(self, session: ClientSession):
+        LOGGER.debug(f"Peer of session {session.get_session_id()} disconnected.")
+        is_tracked = self._sessions.pop(session.get_session_id(), None) is not None
+        should_callback = is_tracked and session.is_server_authenticated()
+        session.close()
 
         if should_callback:
             for callback in self._on_disconnected_callbacks:
-                callback()
-
-    def _on_data_received_wrapper(self, data: bytes):
-        LOGGER.debug(f"Received data: {data}")
-
-        authentication_command = self._client_authentication_manager.authenticate_server_message(data)
-        if isinstance(authentication_command, RejectConnectionCommand):
-            self._transport.close()
-            return
-
-        if isinstance(authentication_command, IssueChallengeCommand):
-            self._transport.write(authentication_command.challenge)
-            return
-
-        # Only notify connection callbacks on challenge success.
-        if isinstance(authentication_command, AcceptChallengeCommand):
-            LOGGER.debug(f"Server Authenticated")
-            for callback in self._on_connected_callbacks:
-                callback(self._transport)
-
-            # Send server the client's public key, so it can encrypt future instructions to the
-            # client.
-            self._transport.write(authentication_command.client_public_key)
-            return
+                callback(session)
 
-        # Only notify data callbacks once authenticated.
-        if isinstance(authentication_command, AcceptMessageCommand):
-            decrypted_data = self._client_encryption_manager.decrypt_payload_from_server(data)
-            # Decrypt Payload
-            for callback in self._on_received_callbacks:
-                callback(decrypted_data)
+    def _on_data_received_wrapper(self, session: ClientSession, channel_id: int, data: bytes):
+        for callback in self._on_received_callbacks:
+            callback(session, channel_id, data)
 
-    def register_connection_callback(self, callback: Callable[[BaseTransport], None]):
+    def register_connection_callback(self, callback: Callable[[ClientSession], None]):
         self._on_connected_callbacks.append(callback)
 
-    def register_disconnection_callback(self, callback: Callable[[], None]):
+    def register_disconnection_callback(self, callback: Callable[[ClientSession], None]):
         self._on_disconnected_callbacks.append(callback)
 
-    def register_on_data_received_callback(self, callback: Callable[[bytes], None]):
+    def register_on_data_received_callback(self, callback: Callable[[ClientSession, int, bytes], None]):
         self._on_received_callbacks.append(callback)
 
-    def write(self, payload: bytes) -> None:
-        if not self._transport or not self._client_authentication_manager.is_server_authenticated():
-            raise NoServerConnectedError("Data can't be written as no server is connected yet.")
-        # TODO encrypt
-        self._transport.write(payload)
 
-    def disconnect(self) -> None:
-        if not self._transport or not self._client_authentication_manager.is_server_authenticated():
-            raise NoServerConnectedError("Can't disconnect from server is no server is connected yet.")
-        self._transport.close()
-
-
-class _TCPServerProtocol(Protocol):
+class _TCPServerProtocol(BufferedProtocol):
     def __init__(self,
-                 on_connected: Callable[[BaseTransport], None] | None,
-                 on_disconnected: Callable[[], None] | None,
-                 on_received: Callable[[bytes], None] | None):
+                 on_connected: Callable[[BaseTransport], ClientSession | None],
+                 on_disconnected: Callable[[ClientSession], None]):
         self._on_connected = on_connected
         self._on_disconnected = on_disconnected
-        self._on_received = on_received
+        self._frame_decoder = FrameDecoder(self._on_frame_received, handshake=True)
+        self._transport = None
+        self._session = None
 
     def connection_made(self, transport: BaseTransport) -> None:
-        if self._on_connected:
-            self._on_connected(transport)
+        self._transport = transport
+        self._session = self._on_connected(transport)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        # Reading is paused while a handshake frame is handled, so the limit is lifted before the next frame is read.
+        if self._frame_decoder.is_handshake() and self._session and self._session.is_server_authenticated():
+            self._frame_decoder.end_handshake()
+        return self._frame_decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        try:
+            self._frame_decoder.buffer_updated(nbytes)
+        except FrameTooLargeError as e:
+            LOGGER.warning(f"{e}. Disconnecting...")
+            self._transport.close()
+
+    def _on_frame_received(self, frame: bytes) -> None:
+        # Connections that were turned away have no session, anything they still send is dropped.
+        if self._session:
+            self._session.handle_frame(frame)
+
+    def pause_writing(self) -> None:
+        if self._session:
+            self._session.pause_writing()
 
-    def data_received(self, data: bytes) -> None:
-        if self._on_received:
-            self._on_received(data)
+    def resume_writing(self) -> None:
+        if self._session:
+            self._session.resume_writing()
 
     def connection_lost(self, exc: Exception | None) -> None:
-        if self._on_disconnected:
-            self._on_disconnected()
+        if self._session:
+            self._on_disconnected(self._session)
@@ -0,0 +1,43 @@
+import hashlib
+import struct
+from dataclasses import dataclass
+from uuid import UUID
+
+from rsa import PublicKey
+
+BEACON_MAGIC = b"PYOT"
+BEACON_VERSION = 1
+KEY_FINGERPRINT_LENGTH = 16
+
+# Magic, version, TCP port, client id and public key fingerprint. Later versions may only append fields, so any
+# version can be decoded by reading this prefix.
+_BEACON = struct.Struct(">4sBH16s16s")
+BEACON_SIZE = _BEACON.size
+
+
+class InvalidBeaconError(Exception):
+    """Error to raise if a datagram is not a discovery beacon."""
+
+
+def get_key_fingerprint(public_key: PublicKey) -> bytes:
+    return hashlib.sha256(public_key.save_pkcs1(format="DER")).digest()[:KEY_FINGERPRINT_LENGTH]
+
+
+@dataclass(frozen=True)
+class DiscoveryBeacon:
+    tcp_port: int
+    client_id: UUID
+    key_fingerprint: bytes
+
+    def encode(self) -> bytes:
+        return _BEACON.pack(BEACON_MAGIC, BEACON_VERSION, self.tcp_port, self.client_id.bytes, self.key_fingerprint)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "DiscoveryBeacon":
+        if len(data) < BEACON_SIZE:
+            raise InvalidBeaconError(f"Beacon must be at least {BEACON_SIZE} bytes")
+
+        magic, version, tcp_port, client_id, key_fingerprint = _BEACON.unpack_from(data)
+        if magic != BEACON_MAGIC or version < 1:
+            raise InvalidBeaconError("Datagram is not a discovery beacon")
+        return cls(tcp_port=tcp_port, client_id=UUID(bytes=client_id), key_fingerprint=key_fingerprint)
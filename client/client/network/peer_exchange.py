@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import os
+import socket
+from asyncio import DatagramTransport, StreamReader, StreamWriter
+from dataclasses import dataclass
+from ipaddress import ip_address
+from pathlib import Path
+from typing import Callable
+
+from client.artifacts.artifact_manifest import ArtifactManifest, InvalidManifestError
+from client.artifacts.artifact_store import ArtifactStore, InvalidDigestError
+from client.network.peer_messages import PEER_ID_LENGTH, CHUNK_AVAILABLE, CHUNK_UNAVAILABLE, CHUNK_REQUEST, \
+    CHUNK_RESPONSE, PeerQuery, PeerOffer, InvalidPeerMessageError, decode_peer_message
+from client.network.udp_broadcaster import BROADCAST_ADDRESS
+from client.utils.service import Service
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PEER_UDP_PORT = 53180
+DEFAULT_PEER_TCP_PORT = 52180
+DEFAULT_MAX_UPLOADS = 8
+DEFAULT_QUERY_WINDOW = 0.2
+DEFAULT_CHUNK_TIMEOUT = 30.0
+# Connections a peer doesn't ask anything on for this long are closed.
+IDLE_TIMEOUT = 30.0
+
+
+class PeerChunkError(Exception):
+    """Error to raise if a peer could not send a chunk."""
+
+
+@dataclass(frozen=True)
+class Peer:
+    address: str
+    tcp_port: int
+    chunk_indexes: frozenset[int]
+
+
+class PeerExchange(Service):
+    """Lets hosts on the same network hand each other chunks of artifacts they are fetching or hold.
+
+    A host looking for an artifact broadcasts a query on ``udp_port``, and every host taking part in that artifact
+    answers with the chunks it holds and the TCP port it serves them on. Only hosts that hold the artifact's manifest
+    answer, which they only store once the server's signature checked out.
+
+    Neither queries nor chunks are authenticated, anyone on the network can ask for an artifact by its digest and a peer
+    can send anything. Whoever takes a chunk from a peer has to verify it against the manifest.
+    """
+
+    def __init__(self,
+                 artifact_store: ArtifactStore,
+                 udp_port: int = DEFAULT_PEER_UDP_PORT,
+                 tcp_port: int = DEFAULT_PEER_TCP_PORT,
+                 max_uploads: int = DEFAULT_MAX_UPLOADS,
+                 query_window: float = DEFAULT_QUERY_WINDOW,
+                 chunk_timeout: float = DEFAULT_CHUNK_TIMEOUT
+                 ):
+        super().__init__()
+        self._artifact_store = artifact_store
+        self._udp_port = udp_port
+        self._tcp_port = tcp_port
+        self._upload_slots = asyncio.Semaphore(max_uploads)
+        self._query_window = query_window
+        self._chunk_timeout = chunk_timeout
+        # Queries a host sent itself, broadcasts included, are recognized by this id.
+        self._peer_id = os.urandom(PEER_ID_LENGTH)
+        self._manifests: dict[str, ArtifactManifest] = {}
+        self._transport: DatagramTransport | None = None
+        self._tcp_server: asyncio.Server | None = None
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        self._tcp_server = await asyncio.start_server(self._handle_connection, "0.0.0.0", self._tcp_port)
+        # Several hosts of a network may run on one machine, every one of them gets the broadcast queries.
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _QueryProtocol(self._on_query),
+            local_addr=("0.0.0.0", self._udp_port), reuse_port=True
+        )
+        LOGGER.info(f"Peer exchange started on UDP port {self._udp_port} and TCP port {self._tcp_port}.")
+
+    async def _stop(self):
+        self._transport.close()
+        self._tcp_server.close()
+        await self._tcp_server.wait_closed()
+        LOGGER.info("Stopped peer exchange.")
+
+    async def find_peers(self, manifest: ArtifactManifest) -> list[Peer]:
+        """Ask the network who takes part in an artifact, collecting answers for the query window."""
+        loop = asyncio.get_running_loop()
+        peers: dict[tuple[str, int], Peer] = {}
+
+        def on_offer(peer_offer: PeerOffer, address: str):
+            if peer_offer.digest == manifest.digest and peer_offer.chunk_count == manifest.get_chunk_count() and \
+                    peer_offer.peer_id != self._peer_id:
+                peers[address, peer_offer.tcp_port] = Peer(address, peer_offer.tcp_port, peer_offer.chunk_indexes)
+
+        # Answers go to a socket of the query's own, so they reach the host that asked even if several share a machine.
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _OfferProtocol(on_offer), local_addr=("0.0.0.0", 0)
+        )
+        try:
+            transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            transport.sendto(PeerQuery(self._peer_id, manifest.digest).encode(), (BROADCAST_ADDRESS, self._udp_port))
+            await asyncio.sleep(self._query_window)
+        finally:
+            transport.close()
+        return list(peers.values())
+
+    async def fetch_chunk(self, peer: Peer, manifest: ArtifactManifest, index: int) -> bytes:
+        """Fetch a chunk from a peer, it is verified against the manifest before it is returned."""
+        try:
+            return await asyncio.wait_for(self._fetch_chunk(peer, manifest, index), self._chunk_timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            raise PeerChunkError(f"Could not fetch chunk {index} from peer {peer.address}:{peer.tcp_port}") from e
+
+    async def _fetch_chunk(self, peer: Peer, manifest: ArtifactManifest, index: int) -> bytes:
+        reader, writer = await asyncio.open_connection(peer.address, peer.tcp_port)
+        try:
+            writer.write(CHUNK_REQUEST.pack(bytes.fromhex(manifest.digest), index))
+            status, length = CHUNK_RESPONSE.unpack(await reader.readexactly(CHUNK_RESPONSE.size))
+            if status != CHUNK_AVAILABLE:
+                raise PeerChunkError(f"Peer {peer.address}:{peer.tcp_port} doesn't have chunk {index}")
+            if length != manifest.get_chunk_length(index):
+                raise PeerChunkError(f"Peer {peer.address}:{peer.tcp_port} sent a chunk of the wrong length")
+            chunk = await reader.readexactly(length)
+        finally:
+            writer.close()
+        if not manifest.verify_chunk(index, chunk):
+            raise PeerChunkError(f"Peer {peer.address}:{peer.tcp_port} sent a chunk that doesn't match the manifest")
+        return chunk
+
+    def _on_query(self, peer_query: PeerQuery, address: tuple[str, int]):
+        if peer_query.peer_id == self._peer_id or not self.is_running():
+            return
+        # Offers are much larger than queries, they are never sent off the local network.
+        if not ip_address(address[0]).is_private:
+            return
+        if not (manifest := self._get_manifest(peer_query.digest)):
+            return
+        peer_offer = PeerOffer(
+            peer_id=self._peer_id,
+            digest=manifest.digest,
+            tcp_port=self._tcp_port,
+            chunk_count=manifest.get_chunk_count(),
+            chunk_indexes=frozenset(self._get_chunk_indexes(manifest))
+        )
+        self._transport.sendto(peer_offer.encode(), address)
+
+    def _get_manifest(self, digest: str) -> ArtifactManifest | None:
+        if manifest := self._manifests.get(digest):
+            return manifest
+        try:
+            manifest = ArtifactManifest.decode(self._artifact_store.get_manifest_path(digest).read_bytes())
+        except (InvalidDigestError, InvalidManifestError, OSError):
+            return None
+        self._manifests[digest] = manifest
+        return manifest
+
+    def _get_chunk_indexes(self, manifest: ArtifactManifest) -> set[int]:
+        if self._artifact_store.has(manifest.digest):
+            return set(range(manifest.get_chunk_count()))
+        return {index for index in self._artifact_store.get_chunk_indexes(manifest.digest)
+                if index < manifest.get_chunk_count()}
+
+    async def _handle_connection(self, reader: StreamReader, writer: StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(reader.readexactly(CHUNK_REQUEST.size), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    return
+                digest, index = CHUNK_REQUEST.unpack(request)
+                async with self._upload_slots:
+                    chunk = await self._read_chunk(digest.hex(), index)
+                    if chunk is None:
+                        writer.write(CHUNK_RESPONSE.pack(CHUNK_UNAVAILABLE, 0))
+                    else:
+                        writer.write(CHUNK_RESPONSE.pack(CHUNK_AVAILABLE, len(chunk)) + chunk)
+                    await writer.drain()
+        except OSError as e:
+            LOGGER.debug(f"Peer connection failed: {e}")
+        finally:
+            writer.close()
+
+    async def _read_chunk(self, digest: str, index: int) -> bytes | None:
+        if not (manifest := self._get_manifest(digest)) or index >= manifest.get_chunk_count():
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            if path := self._artifact_store.get_path(digest):
+                return await loop.run_in_executor(
+                    None, _read_range, path, index * manifest.chunk_size, manifest.get_chunk_length(index)
+                )
+            return await loop.run_in_executor(None, self._artifact_store.get_chunk_path(digest, index).read_bytes)
+        except OSError:
+            return None
+
+
+def _read_range(path: Path, offset: int, length: int) -> bytes:
+    with open(path, "rb") as file:
+        file.seek(offset)
+        return file.read(length)
+
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_query: Callable[[PeerQuery, tuple[str, int]], None]):
+        self._on_query = on_query
+
+    def datagram_received(self, data: bytes, address: tuple[str, int]):
+        try:
+            message = decode_peer_message(data)
+        except InvalidPeerMessageError:
+            return
+        if isinstance(message, PeerQuery):
+            self._on_query(message, address)
+
+
+class _OfferProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_offer: Callable[[PeerOffer, str], None]):
+        self._on_offer = on_offer
+
+    def datagram_received(self, data: bytes, address: tuple[str, int]):
+        try:
+            message = decode_peer_message(data)
+        except InvalidPeerMessageError:
+            return
+        if isinstance(message, PeerOffer):
+            self._on_offer(message, address[0])
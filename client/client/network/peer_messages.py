@@ -0,0 +1,77 @@
+import struct
+from dataclasses import dataclass
+
+PEER_MAGIC = b"PYOP"
+PEER_VERSION = 1
+PEER_ID_LENGTH = 8
+
+WANT = 1
+HAVE = 2
+
+CHUNK_AVAILABLE = 0
+CHUNK_UNAVAILABLE = 1
+
+# Magic, version, kind, id of the sending peer and the digest of the artifact. An offer is followed by the TCP port
+# chunks are served on, the number of chunks and a bitfield of the chunks the peer holds, first chunk in the high bit.
+_HEADER = struct.Struct(">4sBB8s32s")
+_OFFER = struct.Struct(">HI")
+# Chunks are asked for over TCP by artifact digest and chunk index, they come back behind a status and their length.
+CHUNK_REQUEST = struct.Struct(">32sI")
+CHUNK_RESPONSE = struct.Struct(">BI")
+
+
+class InvalidPeerMessageError(Exception):
+    """Error to raise if a datagram is not a peer query or offer."""
+
+
+@dataclass(frozen=True)
+class PeerQuery:
+    peer_id: bytes
+    digest: str
+
+    def encode(self) -> bytes:
+        return _HEADER.pack(PEER_MAGIC, PEER_VERSION, WANT, self.peer_id, bytes.fromhex(self.digest))
+
+
+@dataclass(frozen=True)
+class PeerOffer:
+    peer_id: bytes
+    digest: str
+    tcp_port: int
+    chunk_count: int
+    chunk_indexes: frozenset[int]
+
+    def encode(self) -> bytes:
+        bitfield = bytearray((self.chunk_count + 7) // 8)
+        for index in self.chunk_indexes:
+            bitfield[index // 8] |= 0x80 >> index % 8
+        return _HEADER.pack(PEER_MAGIC, PEER_VERSION, HAVE, self.peer_id, bytes.fromhex(self.digest)) + \
+            _OFFER.pack(self.tcp_port, self.chunk_count) + bitfield
+
+
+def decode_peer_message(data: bytes) -> PeerQuery | PeerOffer:
+    if len(data) < _HEADER.size:
+        raise InvalidPeerMessageError(f"Peer message must be at least {_HEADER.size} bytes")
+    magic, version, kind, peer_id, digest = _HEADER.unpack_from(data)
+    if magic != PEER_MAGIC or version < 1:
+        raise InvalidPeerMessageError("Datagram is not a peer message")
+    if kind == WANT:
+        return PeerQuery(peer_id=peer_id, digest=digest.hex())
+    if kind != HAVE:
+        raise InvalidPeerMessageError(f"Unknown peer message kind {kind}")
+
+    if len(data) < _HEADER.size + _OFFER.size:
+        raise InvalidPeerMessageError("Truncated peer offer")
+    tcp_port, chunk_count = _OFFER.unpack_from(data, _HEADER.size)
+    bitfield = data[_HEADER.size + _OFFER.size:]
+    if len(bitfield) != (chunk_count + 7) // 8:
+        raise InvalidPeerMessageError(f"Offer of {chunk_count} chunks has a bitfield of {len(bitfield)} bytes")
+    return PeerOffer(
+        peer_id=peer_id,
+        digest=digest.hex(),
+        tcp_port=tcp_port,
+        chunk_count=chunk_count,
+        chunk_indexes=frozenset(
+            index for index in range(chunk_count) if bitfield[index // 8] & 0x80 >> index % 8
+        )
+    )
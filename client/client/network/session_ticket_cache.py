@@ -0,0 +1,38 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from rsa import PublicKey
+
+DEFAULT_MAX_SIZE = 16
+
+
+@dataclass
+class SessionTicket:
+    ticket: bytes
+    resumption_secret: bytes
+    expires_at: int
+
+
+class SessionTicketCache:
+    """Bounded LRU cache of the latest session ticket issued by each server.
+
+    Tickets are single use, so a ticket is removed from the cache when it is taken to resume a session. The server
+    sends a fresh one once the session is resumed.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self._max_size = max_size
+        self._tickets: OrderedDict[PublicKey, SessionTicket] = OrderedDict()
+
+    def put(self, server_public_key: PublicKey, session_ticket: SessionTicket) -> None:
+        self._tickets[server_public_key] = session_ticket
+        self._tickets.move_to_end(server_public_key)
+        while len(self._tickets) > self._max_size:
+            self._tickets.popitem(last=False)
+
+    def take(self, server_public_key: PublicKey) -> SessionTicket | None:
+        session_ticket = self._tickets.pop(server_public_key, None)
+        if session_ticket and session_ticket.expires_at <= time.time():
+            return None
+        return session_ticket
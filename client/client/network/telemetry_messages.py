@@ -0,0 +1,152 @@
+import struct
+from dataclasses import dataclass
+
+from client.network.message_codec import message, tag, encode_message, decode_message, InvalidMessageError, \
+    write_varint, read_varint, zigzag, unzigzag
+
+# Channel hosts stream telemetry to the server on. Telemetry is worth the least of everything a host sends, it waits
+# behind artifact transfers.
+TELEMETRY_CHANNEL = 4
+TELEMETRY_CHANNEL_PRIORITY = 7
+
+HOST_INFO = 1
+SAMPLE = 2
+
+# Samples carry these fields in this order, as integers in the unit their name ends in. Counters count from whenever
+# the host booted, rates are up to whoever reads them.
+TELEMETRY_FIELDS = (
+    "cpu_usage_percent",
+    "memory_total_mib",
+    "memory_available_mib",
+    "disk_total_mib",
+    "disk_used_mib",
+    "disk_read_kib",
+    "disk_written_kib",
+    "network_received_kib",
+    "network_sent_kib",
+)
+# Fields that only ever grow, until the host reboots.
+TELEMETRY_COUNTERS = frozenset({"disk_read_kib", "disk_written_kib", "network_received_kib", "network_sent_kib"})
+
+# A keyframe carries its timestamp and every field as they are. Any other sample carries the milliseconds since the
+# previous sample and only the fields that changed, as their difference to the previous sample.
+KEYFRAME = 0x01
+
+# Message kind and flags. A sample goes on with its timestamp, a bitmask of the fields it carries, lowest field in the
+# lowest bit, and a value for every one of them, all as zigzag encoded varints. A host info is followed by the encoded
+# message. Samples keep their own encoding, the difference to the previous sample is smaller than any field by field
+# encoding of the sample itself.
+_HEADER = struct.Struct(">BB")
+
+
+class InvalidTelemetryMessageError(Exception):
+    """Error to raise if a telemetry message can't be decoded."""
+
+
+@message
+@dataclass
+class HostInfo:
+    """What a host is, sent once whenever a server connects."""
+    os: str = tag(1)
+    # Bytes of memory.
+    memory: int = tag(2)
+    cpu_cores: int = tag(3)
+
+    def encode(self) -> bytes:
+        return _HEADER.pack(HOST_INFO, 0) + encode_message(self)
+
+
+@dataclass
+class TelemetrySample:
+    # Unix time in milliseconds.
+    timestamp: int
+    # A value for every one of the telemetry fields.
+    values: list[int]
+
+
+class TelemetryEncoder:
+    """Encodes the samples a host sends to a single server, relative to the sample it sent before.
+
+    The server has to decode every sample the encoder encoded, in order. Whenever that can't be relied on any more, e.g.
+    the server reconnected, the encoder has to be reset so it starts over with a keyframe.
+    """
+
+    def __init__(self):
+        self._previous: TelemetrySample | None = None
+
+    def reset(self) -> None:
+        self._previous = None
+
+    def encode(self, sample: TelemetrySample, force: bool = False) -> bytes | None:
+        """Encode a sample, or get None if no field changed since the previous one unless it is forced."""
+        if len(sample.values) != len(TELEMETRY_FIELDS):
+            raise ValueError(f"Sample has {len(sample.values)} values for {len(TELEMETRY_FIELDS)} fields")
+        if previous := self._previous:
+            flags = 0
+            timestamp = sample.timestamp - previous.timestamp
+            previous_values = previous.values
+        else:
+            flags = KEYFRAME
+            timestamp = sample.timestamp
+            previous_values = [0] * len(TELEMETRY_FIELDS)
+
+        mask = 0
+        deltas = []
+        for field, (value, previous_value) in enumerate(zip(sample.values, previous_values)):
+            if value != previous_value or flags & KEYFRAME:
+                mask |= 1 << field
+                deltas.append(value - previous_value)
+        if not mask and not force:
+            return None
+
+        payload = bytearray(_HEADER.pack(SAMPLE, flags))
+        write_varint(payload, zigzag(timestamp))
+        write_varint(payload, mask)
+        for delta in deltas:
+            write_varint(payload, zigzag(delta))
+        self._previous = TelemetrySample(sample.timestamp, list(sample.values))
+        return bytes(payload)
+
+
+class TelemetryDecoder:
+    """Decodes the telemetry messages of a single host, every sample in the order it was encoded."""
+
+    def __init__(self):
+        self._previous: TelemetrySample | None = None
+
+    def decode(self, payload: bytes) -> HostInfo | TelemetrySample:
+        if len(payload) < _HEADER.size:
+            raise InvalidTelemetryMessageError("Truncated telemetry message")
+        kind, flags = _HEADER.unpack_from(payload)
+        if kind == HOST_INFO:
+            try:
+                return decode_message(HostInfo, payload, _HEADER.size)
+            except InvalidMessageError as e:
+                raise InvalidTelemetryMessageError("Invalid host info") from e
+        if kind != SAMPLE:
+            raise InvalidTelemetryMessageError(f"Unknown telemetry message kind {kind}")
+
+        if flags & KEYFRAME:
+            previous = TelemetrySample(0, [0] * len(TELEMETRY_FIELDS))
+        elif not (previous := self._previous):
+            raise InvalidTelemetryMessageError("Sample before the first keyframe")
+        values = list(previous.values)
+        try:
+            timestamp, offset = read_varint(payload, _HEADER.size, len(payload))
+            mask, offset = read_varint(payload, offset, len(payload))
+            field = 0
+            while mask >> field:
+                if mask >> field & 1:
+                    delta, offset = read_varint(payload, offset, len(payload))
+                    # Fields of hosts newer than the server are skipped.
+                    if field < len(values):
+                        values[field] += unzigzag(delta)
+                field += 1
+        except InvalidMessageError as e:
+            raise InvalidTelemetryMessageError(f"Invalid sample: {e}") from e
+        if offset != len(payload):
+            raise InvalidTelemetryMessageError(f"{len(payload) - offset} bytes left over after sample")
+
+        self._previous = TelemetrySample(previous.timestamp + unzigzag(timestamp), values)
+        return self._previous
+
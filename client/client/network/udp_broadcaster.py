@@ -1,65 +1,162 @@
 import asyncio
 import logging
+import random
 import socket
 from asyncio import DatagramTransport
 
+from client.utils.service import Service
+
 LOGGER = logging.getLogger(__name__)
 
+DEFAULT_INITIAL_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_MULTICAST_TTL = 1
+BACKOFF_FACTOR = 2
+# Every delay is stretched or shrunk by up to this fraction, so clients that started together drift apart.
+BACKOFF_JITTER = 0.2
+# How often to look for a changed network, independent of the current beacon delay.
+NETWORK_CHECK_INTERVAL = 5.0
+BROADCAST_ADDRESS = "255.255.255.255"
+
+
+def _get_network_signature(destination: str) -> tuple[tuple[str, ...], str | None]:
+    """Interfaces and the local address a beacon to ``destination`` would be sent from.
+
+    Either changes when an interface comes up or goes down, or when the client moves to another network. Connecting
+    a UDP socket only looks up the route, nothing is sent.
+    """
+    try:
+        interfaces = tuple(name for _, name in socket.if_nameindex())
+    except OSError:
+        interfaces = ()
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        try:
+            sock.connect((destination, 9))
+            local_address = sock.getsockname()[0]
+        except OSError:
+            local_address = None
+    return interfaces, local_address
+
+
+class UDPBroadcaster(Service):
+    """Sends the discovery beacon until a server connects.
 
-class UDPBroadcaster:
-    def __init__(self, port: int, message: bytes):
+    Beacons are sent quickly at first and then back off exponentially up to ``max_delay``, so a fleet of unconnected
+    clients doesn't flood the network. The delay is reset when the network changes. With a ``multicast_group`` the
+    beacon is sent to that group instead of broadcast, and only reaches servers that joined it.
+    """
+
+    def __init__(self,
+                 port: int,
+                 message: bytes,
+                 initial_delay: float = DEFAULT_INITIAL_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY,
+                 multicast_group: str | None = None,
+                 multicast_ttl: int = DEFAULT_MULTICAST_TTL
+                 ):
+        super().__init__()
         self._port = port
-        self._task = None
         self._message = message
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._multicast_group = multicast_group
+        self._multicast_ttl = multicast_ttl
         self._protocol = None
         self._transport = None
 
-    async def start(self):
-        self._task = asyncio.create_task(self._start_broadcast_server())
-
-    async def _start_broadcast_server(self):
+    async def _start(self):
         loop = asyncio.get_running_loop()
 
         LOGGER.debug("Starting UDP Broadcast server.")
-        self._protocol = _BroadcastProtocol(self._port, message=self._message)
+        self._protocol = _BroadcastProtocol(
+            self._port,
+            message=self._message,
+            initial_delay=self._initial_delay,
+            max_delay=self._max_delay,
+            multicast_group=self._multicast_group,
+            multicast_ttl=self._multicast_ttl
+        )
         self._transport, _ = await loop.create_datagram_endpoint(
             lambda: self._protocol,
             local_addr=('0.0.0.0', self._port), reuse_port=True)
-        LOGGER.info(f"UDP Broadcast started on port {self._port}")
-        while True:
-            await asyncio.sleep(0)
-
-    async def stop(self):
-        if self._protocol:
-            self._protocol.stop_broadcast()
-        if self._transport:
-            self._transport.close()
-        self._task.cancel()
+        if self._multicast_group:
+            LOGGER.info(f"UDP Multicast started to {self._multicast_group}:{self._port}")
+        else:
+            LOGGER.info(f"UDP Broadcast started on port {self._port}")
+
+    async def _stop(self):
+        self._protocol.stop_broadcast()
+        self._transport.close()
         LOGGER.info("Stopped UDP Broadcast server.")
 
 
 class _BroadcastProtocol(asyncio.DatagramProtocol):
 
-    def __init__(self, port: int, message: bytes, delay: int = 5, loop: asyncio.AbstractEventLoop = None):
-        self._port = port
+    def __init__(self,
+                 port: int,
+                 message: bytes,
+                 initial_delay: float = DEFAULT_INITIAL_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY,
+                 multicast_group: str | None = None,
+                 multicast_ttl: int = DEFAULT_MULTICAST_TTL,
+                 loop: asyncio.AbstractEventLoop = None
+                 ):
         self._loop = asyncio.get_event_loop() if loop is None else loop
         self._message = message
-        self._delay = delay
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._multicast_group = multicast_group
+        self._multicast_ttl = multicast_ttl
+        self._destination = (multicast_group or BROADCAST_ADDRESS, port)
+        self._delay = initial_delay
+        self._network_signature = None
         self._transport = None
-        self._should_broadcast = True
+        self._broadcast_handle = None
+        self._network_check_handle = None
 
     def stop_broadcast(self):
-        self._should_broadcast = False
+        if self._broadcast_handle:
+            self._broadcast_handle.cancel()
+            self._broadcast_handle = None
+        if self._network_check_handle:
+            self._network_check_handle.cancel()
+            self._network_check_handle = None
 
     def connection_made(self, transport: DatagramTransport):
         self._transport = transport
         sock = transport.get_extra_info("socket")
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        if self._multicast_group:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self._multicast_ttl)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         LOGGER.debug("Started sending broadcast.")
-        self._broadcast()
+        self._network_signature = _get_network_signature(self._destination[0])
+        self._network_check_handle = self._loop.call_later(NETWORK_CHECK_INTERVAL, self._check_network)
+        # Clients that power up together, e.g. after an outage, would otherwise send their first beacons in lockstep.
+        self._schedule_broadcast(random.uniform(0, self._initial_delay))
+
+    def _schedule_broadcast(self, delay: float):
+        if self._broadcast_handle:
+            self._broadcast_handle.cancel()
+        self._broadcast_handle = self._loop.call_later(delay, self._broadcast)
 
     def _broadcast(self):
-        if self._should_broadcast:
-            LOGGER.debug("Broadcasting...")
-            self._transport.sendto(self._message, ("<broadcast>", self._port))
-            self._loop.call_later(self._delay, self._broadcast)
+        LOGGER.debug("Broadcasting...")
+        self._transport.sendto(self._message, self._destination)
+        delay = self._delay * random.uniform(1 - BACKOFF_JITTER, 1 + BACKOFF_JITTER)
+        self._delay = min(self._delay * BACKOFF_FACTOR, self._max_delay)
+        self._schedule_broadcast(delay)
+
+    def _check_network(self):
+        network_signature = _get_network_signature(self._destination[0])
+        if network_signature != self._network_signature:
+            LOGGER.info("Network changed, resetting beacon delay.")
+            self._network_signature = network_signature
+            self._delay = self._initial_delay
+            self._schedule_broadcast(random.uniform(0, self._initial_delay))
+        self._network_check_handle = self._loop.call_later(NETWORK_CHECK_INTERVAL, self._check_network)
+
+    def connection_lost(self, exc: Exception | None):
+        self.stop_broadcast()
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import platform
+import time
+from pathlib import Path
+
+from client.network.client_session import ClientSession, NoServerConnectedError
+from client.network.telemetry_messages import TELEMETRY_CHANNEL, TELEMETRY_CHANNEL_PRIORITY, TELEMETRY_FIELDS, \
+    HostInfo, TelemetryEncoder, TelemetrySample
+from client.utils.service import Service
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DISK_PATH = Path("/")
+DEFAULT_REPORT_INTERVAL = 10.0
+DEFAULT_MAX_REPORT_INTERVAL = 60.0
+_MIB = 1024 * 1024
+# Sizes in /proc/diskstats are in sectors of this many bytes, whatever the sector size of the disk.
+_SECTOR_SIZE = 512
+
+
+class _Stream:
+    def __init__(self, report_interval: float):
+        self.encoder = TelemetryEncoder()
+        self.report_interval = report_interval
+        self.next_report = 0.0
+        self.last_report = 0.0
+
+
+class TelemetrySampler(Service):
+    """Samples how busy the host is and streams it to every connected server.
+
+    Every server gets a keyframe when it connects and then only the fields that changed since the sample it got before,
+    at most once per report interval. A host that has nothing new to report still reports once per max report interval,
+    so servers can tell it from one that stopped sampling. Reports back off towards the max report interval for as long
+    as the previous one to a server is still waiting to be sent, and speed up again once the connection keeps up.
+    """
+
+    def __init__(self,
+                 disk_path: Path = DEFAULT_DISK_PATH,
+                 report_interval: float = DEFAULT_REPORT_INTERVAL,
+                 max_report_interval: float = DEFAULT_MAX_REPORT_INTERVAL
+                 ):
+        super().__init__()
+        self._disk_path = disk_path
+        self._report_interval = report_interval
+        self._max_report_interval = max(max_report_interval, report_interval)
+        self._streams: dict[ClientSession, _Stream] = {}
+        self._cpu_times: tuple[int, int] | None = None
+        self._sample_task: asyncio.Task | None = None
+
+    async def _start(self):
+        self._sample_task = asyncio.get_running_loop().create_task(self._sample_periodically())
+
+    async def _stop(self):
+        self._sample_task.cancel()
+        try:
+            await self._sample_task
+        except asyncio.CancelledError:
+            pass
+
+    def add_session(self, session: ClientSession) -> None:
+        """Start streaming to the server of a session, a server that just connected gets what the host is first."""
+        stream = _Stream(self._report_interval)
+        self._streams[session] = stream
+        try:
+            session.open_channel(TELEMETRY_CHANNEL, TELEMETRY_CHANNEL_PRIORITY)
+            session.write(self._get_host_info().encode(), TELEMETRY_CHANNEL)
+        except NoServerConnectedError:
+            self._streams.pop(session, None)
+
+    def handle_disconnect(self, session: ClientSession) -> None:
+        self._streams.pop(session, None)
+
+    async def _sample_periodically(self):
+        while True:
+            if self._streams:
+                self._report(self.sample())
+            await asyncio.sleep(self._report_interval)
+
+    def _report(self, sample: TelemetrySample):
+        now = time.monotonic()
+        for session, stream in list(self._streams.items()):
+            if now < stream.next_report:
+                continue
+            # Whatever is still queued for the server has to go out first, more would only pile up behind it.
+            if session.get_queued_size(TELEMETRY_CHANNEL):
+                stream.report_interval = min(stream.report_interval * 2, self._max_report_interval)
+                stream.next_report = now + stream.report_interval
+                LOGGER.debug(f"Telemetry of session {session.get_session_id()} is backed up, reporting every "
+                             f"{stream.report_interval}s.")
+                continue
+            stream.report_interval = max(stream.report_interval / 2, self._report_interval)
+            stream.next_report = now + stream.report_interval
+            payload = stream.encoder.encode(sample, force=now - stream.last_report >= self._max_report_interval)
+            if payload is None:
+                continue
+            try:
+                session.write(payload, TELEMETRY_CHANNEL)
+            except NoServerConnectedError:
+                self._streams.pop(session, None)
+                continue
+            stream.last_report = now
+
+    def sample(self) -> TelemetrySample:
+        """Sample every telemetry field, fields the host doesn't know are 0."""
+        values = dict.fromkeys(TELEMETRY_FIELDS, 0)
+        for read in (self._read_cpu, self._read_memory, self._read_disk, self._read_disk_io, self._read_network):
+            try:
+                values.update(read())
+            except (OSError, ValueError, IndexError, KeyError) as e:
+                LOGGER.debug(f"Could not sample {read.__name__.removeprefix('_read_')}: {e}")
+        return TelemetrySample(timestamp=time.time_ns() // 1_000_000, values=list(values.values()))
+
+    def _read_cpu(self) -> dict[str, int]:
+        # Time spent in user, nice, system, idle, iowait, irq, softirq and steal over all cores.
+        times = [int(time_spent) for time_spent in Path("/proc/stat").read_text().split("\n", 1)[0].split()[1:9]]
+        total, idle = sum(times), times[3] + times[4]
+        # The first sample covers everything since the host booted.
+        previous_total, previous_idle = self._cpu_times or (0, 0)
+        self._cpu_times = total, idle
+        if total == previous_total:
+            return {}
+        return {"cpu_usage_percent": round(100 * (1 - (idle - previous_idle) / (total - previous_total)))}
+
+    @staticmethod
+    def _read_memory() -> dict[str, int]:
+        meminfo = _read_meminfo()
+        return {
+            "memory_total_mib": meminfo["MemTotal"] // 1024,
+            "memory_available_mib": meminfo["MemAvailable"] // 1024
+        }
+
+    def _read_disk(self) -> dict[str, int]:
+        stat = os.statvfs(self._disk_path)
+        return {
+            "disk_total_mib": stat.f_blocks * stat.f_frsize // _MIB,
+            "disk_used_mib": (stat.f_blocks - stat.f_bfree) * stat.f_frsize // _MIB
+        }
+
+    @staticmethod
+    def _read_disk_io() -> dict[str, int]:
+        read = written = 0
+        for line in Path("/proc/diskstats").read_text().splitlines():
+            columns = line.split()
+            # Partitions, loop devices and device mapper devices would count what goes to a disk again.
+            if not os.path.exists(f"/sys/block/{columns[2]}/device"):
+                continue
+            read += int(columns[5])
+            written += int(columns[9])
+        return {
+            "disk_read_kib": read * _SECTOR_SIZE // 1024,
+            "disk_written_kib": written * _SECTOR_SIZE // 1024
+        }
+
+    @staticmethod
+    def _read_network() -> dict[str, int]:
+        received = sent = 0
+        # Two header lines, then an interface per line with 8 receive counters followed by 8 transmit counters.
+        for line in Path("/proc/net/dev").read_text().splitlines()[2:]:
+            interface, counters = line.split(":", 1)
+            if interface.strip() == "lo":
+                continue
+            counters = counters.split()
+            received += int(counters[0])
+            sent += int(counters[8])
+        return {"network_received_kib": received // 1024, "network_sent_kib": sent // 1024}
+
+    @staticmethod
+    def _get_host_info() -> HostInfo:
+        try:
+            memory = _read_meminfo()["MemTotal"] * 1024
+        except (OSError, ValueError, KeyError):
+            memory = 0
+        return HostInfo(os=platform.platform(), memory=memory, cpu_cores=os.cpu_count() or 0)
+
+
+def _read_meminfo() -> dict[str, int]:
+    # Lines like "MemTotal:       16318404 kB".
+    meminfo = {}
+    for line in Path("/proc/meminfo").read_text().splitlines():
+        name, value = line.split(":", 1)
+        meminfo[name] = int(value.split()[0])
+    return meminfo
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from rsa import PublicKey, PrivateKey, VerificationError
+
+from client.utils.encryption_manager import EncryptionManager
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 256
+
+T = TypeVar("T")
+
+
+class CryptoExecutorSaturatedError(Exception):
+    """Error to raise if too many crypto operations are already queued."""
+
+
+class CryptoExecutor:
+    """Runs the pure Python RSA operations on a worker pool, so they don't stall the event loop.
+
+    A process pool sidesteps the GIL entirely and should be used where many handshakes can happen at once. A thread
+    pool is cheaper to start and enough where crypto is rare. At most ``max_pending`` operations are queued or running
+    at once, beyond that calls fail fast instead of piling up behind the workers.
+    """
+
+    def __init__(self,
+                 encryption_manager: EncryptionManager,
+                 workers: int | None = None,
+                 use_processes: bool = False,
+                 max_pending: int = DEFAULT_MAX_PENDING
+                 ):
+        self._encryption_manager = encryption_manager
+        self._max_pending = max_pending
+        self._pending = 0
+        workers = workers or os.cpu_count() or 1
+        if use_processes:
+            self._executor: Executor = ProcessPoolExecutor(workers)
+            # Forked workers inherit every open file descriptor, sockets included, and would keep closed connections
+            # alive. Start them all now, so the executor has to be created before any connection is opened.
+            for future in [self._executor.submit(os.getpid) for _ in range(workers)]:
+                future.result()
+        else:
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix="crypto")
+        LOGGER.debug(f"Started crypto executor with {workers} {'processes' if use_processes else 'threads'}.")
+
+    async def generate_key_pair(self) -> tuple[PublicKey, PrivateKey]:
+        return await self._run(self._encryption_manager.generate_key_pair)
+
+    async def encrypt(self, message: bytes, public_key: PublicKey) -> bytes:
+        return await self._run(self._encryption_manager.encrypt, message, public_key)
+
+    async def decrypt(self, cypher_text: bytes, private_key: PrivateKey) -> bytes:
+        return await self._run(self._encryption_manager.decrypt, cypher_text, private_key)
+
+    async def sign(self, message: bytes, private_key: PrivateKey) -> bytes:
+        return await self._run(self._encryption_manager.sign, message, private_key)
+
+    async def verify(self, message: bytes, signature: bytes, public_key: PublicKey) -> bool:
+        try:
+            await self._run(self._encryption_manager.verify, message, signature, public_key)
+        except VerificationError:
+            return False
+        return True
+
+    def get_pending_count(self) -> int:
+        return self._pending
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, function: Callable[..., T], *args) -> T:
+        if self._pending >= self._max_pending:
+            raise CryptoExecutorSaturatedError(f"{self._pending} crypto operations already pending")
+
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self._pending -= 1
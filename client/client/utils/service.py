@@ -0,0 +1,44 @@
+import asyncio
+from abc import ABC, abstractmethod
+
+
+class Service(ABC):
+    """Lifecycle of a long-running network component.
+
+    ``start`` returns once the service is up and ``stop`` once it is torn down. ``wait_closed`` blocks until the service
+    is stopped, without polling, so an idle service doesn't cost any CPU. Starting a running service or stopping a
+    stopped one does nothing, and concurrent calls are applied in order.
+    """
+
+    def __init__(self):
+        self._lifecycle_lock = asyncio.Lock()
+        self._closed = asyncio.Event()
+        self._closed.set()
+
+    async def start(self) -> None:
+        async with self._lifecycle_lock:
+            if not self._closed.is_set():
+                return
+            await self._start()
+            self._closed.clear()
+
+    async def stop(self) -> None:
+        async with self._lifecycle_lock:
+            if self._closed.is_set():
+                return
+            await self._stop()
+            self._closed.set()
+
+    async def wait_closed(self) -> None:
+        await self._closed.wait()
+
+    def is_running(self) -> bool:
+        return not self._closed.is_set()
+
+    @abstractmethod
+    async def _start(self) -> None:
+        """Bring the service up."""
+
+    @abstractmethod
+    async def _stop(self) -> None:
+        """Tear the service down."""
@@ -0,0 +1,51 @@
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+
+SESSION_KEY_LENGTH = 32
+
+# Each direction of a session gets its own nonce space, so both peers can count from zero with the same key.
+SERVER_TO_CLIENT = 1
+CLIENT_TO_SERVER = 2
+
+_NONCE = struct.Struct(">IQ")
+
+
+class SessionCipherError(Exception):
+    """Error to raise if a sealed payload can't be opened."""
+
+
+class SessionCipher:
+    """Symmetric AEAD channel for a session, keyed during the authentication handshake.
+
+    Nonces are derived from a per-direction message counter instead of being sent on the wire. TCP delivers messages
+    in order, so a replayed, dropped or reordered message fails authentication.
+    """
+
+    def __init__(self, session_key: bytes, sending_direction: int, receiving_direction: int):
+        if len(session_key) != SESSION_KEY_LENGTH:
+            raise ValueError(f"Session key must be {SESSION_KEY_LENGTH} bytes")
+        self._aead = ChaCha20Poly1305(session_key)
+        self._sending_direction = sending_direction
+        self._receiving_direction = receiving_direction
+        self._send_counter = 0
+        self._receive_counter = 0
+
+    @staticmethod
+    def generate_session_key() -> bytes:
+        return ChaCha20Poly1305.generate_key()
+
+    def seal(self, payload: bytes) -> bytes:
+        nonce = _NONCE.pack(self._sending_direction, self._send_counter)
+        self._send_counter += 1
+        return self._aead.encrypt(nonce, payload, None)
+
+    def open(self, sealed_payload: bytes) -> bytes:
+        nonce = _NONCE.pack(self._receiving_direction, self._receive_counter)
+        try:
+            payload = self._aead.decrypt(nonce, sealed_payload, None)
+        except InvalidTag as e:
+            raise SessionCipherError("Sealed payload failed authentication") from e
+        self._receive_counter += 1
+        return payload
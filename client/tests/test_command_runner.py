@@ -0,0 +1,42 @@
+import asyncio
+import sys
+import time
+
+from client.commands.command_runner import CommandRunner
+from client.network.command_messages import CommandRequest
+
+
+def test_command_waiting_for_a_slot_is_only_reported_started_once_it_runs():
+    async def run():
+        command_runner = CommandRunner(max_concurrent=1)
+        started = []
+        first = asyncio.create_task(command_runner.run(
+            CommandRequest(0, [sys.executable, "-c", "import time; time.sleep(0.3)"], 5),
+            on_started=lambda: started.append(0)
+        ))
+        second = asyncio.create_task(command_runner.run(
+            CommandRequest(1, [sys.executable, "-c", "print('second')"], 5),
+            on_started=lambda: started.append(1)
+        ))
+
+        await asyncio.sleep(0.1)
+        assert started == [0]
+        await first
+        assert (await second).stdout.strip() == "second"
+        assert started == [0, 1]
+
+    asyncio.run(run())
+
+
+def test_command_is_killed_once_its_timeout_passes():
+    async def run():
+        started_at = time.monotonic()
+
+        command_result = await CommandRunner().run(
+            CommandRequest(0, [sys.executable, "-c", "import time; time.sleep(10)"], 0.2)
+        )
+
+        assert command_result.timed_out
+        assert time.monotonic() - started_at < 5
+
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+import asyncio
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from client.applications.application_supervisor import ApplicationSupervisor
+from client.artifacts.artifact_fetcher import ArtifactFetcher
+from client.artifacts.artifact_store import ArtifactStore
+from client.artifacts.artifact_swarm import ArtifactSwarm
+from client.commands.command_runner import CommandRunner
+from client.network.client_connection_manager import ClientConnectionManager
+from client.network.client_encryption_manager import ClientEncryptionManager
+from client.network.client_tcp_server import ClientTCPServer
+from client.network.peer_exchange import PeerExchange
+from client.network.session_ticket_cache import SessionTicketCache
+from client.network.udp_broadcaster import UDPBroadcaster
+from client.telemetry.telemetry_sampler import TelemetrySampler
+from client.utils.crypto_executor import CryptoExecutor
+from client.utils.encryption_manager import EncryptionManager
+
+IDLE_SECONDS = 2
+MAX_CPU_SHARE = 0.02
+
+
+def test_client_waiting_to_be_discovered_uses_next_to_no_cpu():
+    async def run(directory: Path) -> float:
+        encryption_manager = EncryptionManager()
+        public_key, private_key = encryption_manager.generate_key_pair()
+        crypto_executor = CryptoExecutor(encryption_manager, workers=1)
+        client_encryption_manager_factory = partial(ClientEncryptionManager, private_key, public_key, None,
+                                                    crypto_executor, SessionTicketCache())
+        artifact_store = ArtifactStore(directory / "artifacts")
+        artifact_fetcher = ArtifactFetcher(artifact_store, crypto_executor)
+        peer_exchange = PeerExchange(artifact_store, udp_port=0, tcp_port=0)
+        application_supervisor = ApplicationSupervisor(
+            artifact_store,
+            ArtifactSwarm(artifact_store, artifact_fetcher, peer_exchange),
+            directory / "applications"
+        )
+        telemetry_sampler = TelemetrySampler()
+        # Every service an idle client runs, from the beacon broadcasts to the telemetry sampler.
+        connection_manager = ClientConnectionManager(
+            UDPBroadcaster(0, b"idle"),
+            ClientTCPServer(client_encryption_manager_factory, port=0, host="127.0.0.1"),
+            CommandRunner(),
+            artifact_fetcher,
+            application_supervisor,
+            telemetry_sampler
+        )
+        await peer_exchange.start()
+        await application_supervisor.start()
+        await telemetry_sampler.start()
+        await connection_manager.start()
+        try:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            await asyncio.sleep(IDLE_SECONDS)
+            return (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+        finally:
+            await connection_manager.stop()
+            await telemetry_sampler.stop()
+            await application_supervisor.stop()
+            await peer_exchange.stop()
+
+    with tempfile.TemporaryDirectory() as directory:
+        assert asyncio.run(run(Path(directory))) <= MAX_CPU_SHARE
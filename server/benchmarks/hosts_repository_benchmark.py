@@ -0,0 +1,104 @@
+"""Measure how long loading hosts with their application instances takes, joined versus a query per host.
+
+Run from the server directory with ``PYTHONPATH=server python -m benchmarks.hosts_repository_benchmark``.
+"""
+import asyncio
+import json
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from sqlite3 import Connection
+from uuid import uuid4
+
+from domain.host import Host, HostAttributes, ApplicationInstance
+from migrations.migration_client import MigrationClient
+from repositories.hosts_repository import SQLiteHostsRepository
+from repositories.sqlite_connection_pool import SQLiteConnectionPool
+
+HOST_COUNTS = (10_000, 100_000)
+APPLICATIONS_PER_HOST = 2
+LOOKUP_COUNT = 10_000
+
+
+def _fill(connection: Connection, host_count: int) -> list[str]:
+    host_ids = [str(uuid4()) for _ in range(host_count)]
+    last_seen = datetime.now(timezone.utc).isoformat()
+    with connection:
+        connection.executemany(
+            "INSERT INTO hosts(id, label, last_known_host, last_seen, os, memory, cpu_cores) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(host_id, None, "192.0.2.1", last_seen, "linux", 4096, 4) for host_id in host_ids]
+        )
+        connection.executemany(
+            """
+            INSERT INTO application_instances(id, host_id, application_id, version, environment, secrets)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (str(uuid4()), host_id, str(uuid4()), 1, json.dumps({"LOG_LEVEL": "INFO"}), json.dumps({}))
+                for host_id in host_ids for _ in range(APPLICATIONS_PER_HOST)
+            ]
+        )
+    return host_ids
+
+
+def _get_all_per_host(connection: Connection) -> list[Host]:
+    """Hydrates hosts the way the repository's TODO had it, with a query for the applications of every host."""
+    hosts = []
+    for host_id, label, last_known_host, last_seen, os, memory, cpu_cores in connection.execute(
+            "SELECT id, label, last_known_host, last_seen, os, memory, cpu_cores FROM hosts ORDER BY id"):
+        applications = [
+            ApplicationInstance(
+                id=application_instance_id,
+                application_id=application_id,
+                version=version,
+                environment=json.loads(environment),
+                secrets=json.loads(secrets)
+            )
+            for application_instance_id, application_id, version, environment, secrets in connection.execute(
+                """
+                SELECT id, application_id, version, environment, secrets
+                FROM application_instances WHERE host_id = ?
+                """,
+                (host_id,)
+            )
+        ]
+        hosts.append(Host(
+            id=host_id,
+            label=label,
+            last_known_host=last_known_host,
+            last_seen=last_seen,
+            attributes=HostAttributes(os=os, memory=memory, cpu_cores=cpu_cores),
+            applications=applications
+        ))
+    return hosts
+
+
+async def _measure(name: str, coroutine, count: int = 1, unit: str = "hosts"):
+    start = time.perf_counter()
+    result = await coroutine
+    elapsed = time.perf_counter() - start
+    count = count if count > 1 else len(result)
+    print(f"{name:<48} {elapsed:>8.2f}s {count / elapsed:>12,.0f} {unit}/s")
+
+
+async def main():
+    for host_count in HOST_COUNTS:
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / "benchmark.db")
+            MigrationClient(f"sqlite:///{path}").run_migrations()
+            connection_pool = SQLiteConnectionPool(path)
+            repository = SQLiteHostsRepository(connection_pool)
+            host_ids = await connection_pool.run(_fill, host_count)
+
+            print(f"{host_count:,} hosts with {APPLICATIONS_PER_HOST} application instances each")
+            await _measure("  get_all, joined", repository.get_all())
+            await _measure("  get_all, a query per host", connection_pool.run(_get_all_per_host))
+            lookups = [repository.get_host(host_ids[i % host_count]) for i in range(LOOKUP_COUNT)]
+            await _measure("  concurrent get_host", asyncio.gather(*lookups), LOOKUP_COUNT, "lookups")
+
+            connection_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Compare encoding and decoding protocol messages with the message codec against the JSON they used to be sent as.
+
+Run from the server directory with ``python -m benchmarks.message_codec_benchmark``.
+"""
+import json
+import time
+from dataclasses import asdict
+
+from server.network.application_messages import ApplicationHealthReport, ApplicationHealth, RUNNING, \
+    decode_application_message
+from server.network.command_messages import CommandRequest, CommandResult, decode_command_message
+from server.network.telemetry_messages import HostInfo, TelemetryDecoder
+
+ITERATIONS = 100_000
+
+MESSAGES = [
+    (
+        "command request",
+        CommandRequest(42, ["systemctl", "restart", "nginx"], 30.0),
+        decode_command_message,
+        lambda data: CommandRequest(**json.loads(data))
+    ),
+    (
+        "command result",
+        CommandResult(42, 0, "Linux host-17 6.1.0-18-amd64 #1 SMP x86_64 GNU/Linux\n", ""),
+        decode_command_message,
+        lambda data: CommandResult(**json.loads(data))
+    ),
+    (
+        "health report",
+        ApplicationHealthReport([
+            ApplicationHealth(f"instance-{index}", RUNNING, True, 0, 1_700_000_000.0 + index) for index in range(4)
+        ]),
+        decode_application_message,
+        lambda data: ApplicationHealthReport([ApplicationHealth(**health) for health in json.loads(data)["health"]])
+    ),
+    (
+        "host info",
+        HostInfo("Linux-6.1.0-18-amd64-x86_64-with-glibc2.36", 16 * 1024 ** 3, 8),
+        lambda data: TelemetryDecoder().decode(data),
+        lambda data: HostInfo(**json.loads(data))
+    ),
+]
+
+
+def _measure(function, argument) -> float:
+    """Microseconds per call."""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        function(argument)
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def _encode_json(message) -> bytes:
+    return json.dumps(asdict(message)).encode("UTF-8")
+
+
+def main():
+    print(f"{'message':<18} {'format':<8} {'bytes':>6} {'encode us':>10} {'decode us':>10}")
+    for name, message, decode, decode_json in MESSAGES:
+        for format_name, encode, format_decode in (
+                ("json", _encode_json, decode_json),
+                ("codec", lambda message_: message_.encode(), decode)
+        ):
+            data = encode(message)
+            if format_decode(data) != message:
+                raise AssertionError(f"{name} did not survive {format_name}")
+            encode_time = _measure(encode, message)
+            decode_time = _measure(format_decode, data)
+            print(f"{name:<18} {format_name:<8} {len(data):>6} {encode_time:>10.2f} {decode_time:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measure how many discovery datagrams per second the UDP listener handles.
+
+Run from the server directory with ``python -m benchmarks.udp_listener_benchmark``.
+"""
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from server.config.config_loader import ServerConfigLoader
+from server.network.connection_admission_controller import ConnectionAdmissionController
+from server.network.discovery_beacon import DiscoveryBeacon
+from server.network.server_connection_manager import ServerConnectionManager
+from server.network.session_ticket_manager import SessionTicketManager
+from server.network.udp_listener import UDPListener
+from server.utils.crypto_executor import CryptoExecutor
+from server.utils.encryption_manager import EncryptionManager
+
+DATAGRAM_COUNT = 200_000
+ADDR = ("192.0.2.1", 53179)
+
+
+def _measure(name: str, handle, datagrams: list[bytes]):
+    start = time.perf_counter()
+    for datagram in datagrams:
+        handle(datagram, ADDR)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {len(datagrams) / elapsed:>14,.0f} datagrams/s")
+
+
+async def main():
+    encryption_manager = EncryptionManager()
+    with tempfile.TemporaryDirectory() as directory:
+        config = ServerConfigLoader(encryption_manager, Path(directory) / "config.cfg").load_config()
+
+    udp_listener = UDPListener(config.udp_listening_port)
+    # The admission controller is never started, so admitted beacons stay queued instead of being connected to.
+    connection_manager = ServerConnectionManager(
+        udp_listener,
+        CryptoExecutor(encryption_manager, workers=1),
+        SessionTicketManager(),
+        ConnectionAdmissionController(max_queued=DATAGRAM_COUNT, rate_per_source=0, burst_per_source=DATAGRAM_COUNT),
+        config
+    )
+    handle = udp_listener._on_data_received_wrapper
+
+    known_beacon = DiscoveryBeacon(52179, uuid4(), bytes(16)).encode()
+    connection_manager.blacklist_client(DiscoveryBeacon.decode(known_beacon).client_id)
+    _measure("Known client beacons (fast path)", handle, [known_beacon] * DATAGRAM_COUNT)
+
+    new_beacons = [DiscoveryBeacon(52179, uuid4(), bytes(16)).encode() for _ in range(DATAGRAM_COUNT)]
+    _measure("New client beacons (decode and admit)", handle, new_beacons)
+
+    _measure("Garbage datagrams", handle, [b"x" * 64] * DATAGRAM_COUNT)
+
+    json_beacon = json.dumps({"port": 52179}).encode("utf-8")
+    _measure("JSON decode of previous beacon format", lambda data, _: json.loads(data.decode("utf-8")),
+             [json_beacon] * DATAGRAM_COUNT)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
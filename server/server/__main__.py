@@ -1,14 +1,39 @@
 import asyncio
 import logging
+import time
+from datetime import datetime, timezone
+from functools import partial
+from uuid import uuid4, UUID
 
 from uvicorn import Config, Server
 
 from api import api
+from domain.host import HostStatusUpdate, HostAttributes
+from domain.host_event import HostEvent, HostEventType
 from migrations.migration_client import MigrationClient
+from repositories.cached_hosts_repository import CachedHostsRepository
+from repositories.client_keys_repository import SQLiteClientKeysRepository
+from repositories.host_metrics_store import HostMetricsStore
+from repositories.hosts_repository import SQLiteHostsRepository
+from repositories.sqlite_connection_pool import SQLiteConnectionPool
+from server.artifacts.artifact_store import ArtifactStore
 from server.config.config_loader import ServerConfigLoader
+from server.network.application_monitor import ApplicationMonitor
+from server.network.client_key_registry import ClientKeyRegistry
+from server.network.artifact_server import ArtifactServer
+from server.network.command_dispatcher import CommandDispatcher
+from server.network.compression import CompressionOptions, load_dictionaries
+from server.network.connection_admission_controller import ConnectionAdmissionController
 from server.network.server_connection_manager import ServerConnectionManager
+from server.network.session_ticket_manager import SessionTicketManager
+from server.network.shard_membership import ShardMembership, get_shard_secret
+from server.network.telemetry_messages import TELEMETRY_FIELDS, TELEMETRY_COUNTERS, HostInfo, TelemetrySample
+from server.network.telemetry_receiver import TelemetryReceiver
 from server.network.udp_listener import UDPListener
+from server.utils.crypto_executor import CryptoExecutor
 from server.utils.encryption_manager import EncryptionManager
+from use_cases.handle_host_status_update import HandleHostStatusUpdate
+from use_cases.stream_host_events import StreamHostEvents
 
 
 async def main():
@@ -22,14 +47,151 @@ async def main():
 
     logging.basicConfig(encoding='utf-8', level=config.log_level)
 
-    udp_listener = UDPListener(config.udp_listening_port)
+    crypto_executor = CryptoExecutor(
+        encryption_manager,
+        workers=config.crypto_workers,
+        use_processes=config.crypto_use_processes,
+        max_pending=config.crypto_max_pending
+    )
+    session_ticket_manager = SessionTicketManager(config.session_ticket_lifetime, config.session_ticket_cache_size)
+    admission_controller = ConnectionAdmissionController(
+        max_concurrent=config.max_concurrent_handshakes,
+        max_queued=config.max_queued_handshakes,
+        rate_per_source=config.handshake_rate_per_source,
+        burst_per_source=config.handshake_burst_per_source
+    )
+    udp_listener = UDPListener(config.udp_listening_port, multicast_group=config.multicast_group)
+    shard_membership = None
+    if config.shard_port:
+        # Without a configured id a shard joins at a new place on the ring every time it starts.
+        shard_membership = ShardMembership(
+            config.shard_id or uuid4(),
+            config.shard_port,
+            get_shard_secret(config.private_key),
+            heartbeat_interval=config.shard_heartbeat_interval,
+            member_timeout=config.shard_timeout,
+            peers=config.shard_peers,
+            multicast_group=config.shard_multicast_group,
+            multicast_ttl=config.shard_multicast_ttl
+        )
+    connection_pool = SQLiteConnectionPool("pyot-server.db", size=config.database_pool_size)
+    client_keys_repository = SQLiteClientKeysRepository(connection_pool)
+    client_key_registry = ClientKeyRegistry(await client_keys_repository.get_client_keys())
+    # Bindings are written behind, connections are checked against the registry.
+    client_key_registry.register_bound_callback(
+        lambda client_id, key_fingerprint: asyncio.get_running_loop().create_task(
+            client_keys_repository.bind_client_key(client_id, key_fingerprint)
+        )
+    )
+    client_key_registry.register_released_callback(
+        lambda client_id: asyncio.get_running_loop().create_task(client_keys_repository.release_client_key(client_id))
+    )
     # TODO tcp client factory
     connection_manager = ServerConnectionManager(
         udp_listener,
-        encryption_manager,
-        config
+        crypto_executor,
+        session_ticket_manager,
+        admission_controller,
+        config,
+        shard_membership,
+        CompressionOptions(
+            enabled=config.compression_enabled,
+            dictionaries=load_dictionaries(config.compression_dictionary_path)
+        ),
+        client_key_registry
+    )
+    hosts_cache = CachedHostsRepository(
+        SQLiteHostsRepository(connection_pool),
+        max_size=config.host_cache_size,
+        ttl=config.host_cache_ttl
+    )
+    handle_host_status_update = HandleHostStatusUpdate(
+        hosts_cache,
+        max_batch_size=config.status_batch_size,
+        flush_interval=config.status_flush_interval,
+        max_buffered=config.status_max_buffered
+    )
+    stream_host_events = StreamHostEvents(
+        queue_size=config.event_queue_size,
+        max_subscribers=config.max_event_subscribers
     )
+    await handle_host_status_update.start()
+
+    def on_client_seen(event_type: HostEventType, client_id: UUID, host: str):
+        host_status_update = HostStatusUpdate(id=client_id, last_known_host=host, last_seen=datetime.now(timezone.utc))
+        # Cached hosts are current right away, the database once the update is written behind.
+        hosts_cache.refresh_host_status(host_status_update)
+        handle_host_status_update.handle(host_status_update)
+        stream_host_events.publish(HostEvent(
+            type=event_type,
+            timestamp=host_status_update.last_seen,
+            host_id=client_id,
+            last_known_host=host
+        ))
+
+    def on_host_statuses_flushed(host_status_updates: list[HostStatusUpdate]):
+        for host_status_update in host_status_updates:
+            stream_host_events.publish(HostEvent(
+                type=HostEventType.STATUS,
+                timestamp=host_status_update.last_seen,
+                host_id=host_status_update.id,
+                last_known_host=host_status_update.last_known_host,
+                attributes=host_status_update.attributes
+            ))
+
+    def on_host_info(client_id: UUID, host: str, host_info: HostInfo):
+        host_status_update = HostStatusUpdate(
+            id=client_id,
+            last_known_host=host,
+            last_seen=datetime.now(timezone.utc),
+            attributes=HostAttributes(
+                os=host_info.os,
+                memory=host_info.memory or None,
+                cpu_cores=host_info.cpu_cores or None
+            )
+        )
+        hosts_cache.refresh_host_status(host_status_update)
+        handle_host_status_update.handle(host_status_update)
+
+    connection_manager.register_client_connected_callback(partial(on_client_seen, HostEventType.CONNECTED))
+    connection_manager.register_client_disconnected_callback(partial(on_client_seen, HostEventType.DISCONNECTED))
+    handle_host_status_update.register_flushed_callback(on_host_statuses_flushed)
+    telemetry_receiver = TelemetryReceiver(connection_manager)
+    telemetry_receiver.register_host_info_callback(on_host_info)
+    host_metrics_store = HostMetricsStore(TELEMETRY_FIELDS, TELEMETRY_COUNTERS, max_hosts=config.metrics_max_hosts)
+
+    def on_telemetry_sample(client_id: UUID, sample: TelemetrySample):
+        # Samples are kept by when they arrived, the clocks of hosts may be off.
+        host_metrics_store.add(client_id, time.time(), sample.values)
+
+    telemetry_receiver.register_sample_callback(on_telemetry_sample)
+    artifact_store = ArtifactStore(config.artifact_store_path)
+    artifact_server = ArtifactServer(
+        connection_manager,
+        artifact_store,
+        crypto_executor,
+        config.private_key,
+        max_transfers=config.artifact_max_transfers,
+        chunk_size=config.artifact_chunk_size
+    )
+    await artifact_server.start()
     await connection_manager.start()
+    api.state.admission_controller = admission_controller
+    api.state.client_key_registry = client_key_registry
+    api.state.artifact_store = artifact_store
+    api.state.artifact_server = artifact_server
+    api.state.application_monitor = ApplicationMonitor(connection_manager)
+    api.state.hosts_repository = hosts_cache
+    api.state.hosts_cache = hosts_cache
+    api.state.handle_host_status_update = handle_host_status_update
+    api.state.host_metrics_store = host_metrics_store
+    api.state.telemetry_receiver = telemetry_receiver
+    api.state.stream_host_events = stream_host_events
+    api.state.command_dispatcher = CommandDispatcher(
+        connection_manager,
+        max_concurrency=config.command_concurrency,
+        default_timeout=config.command_timeout
+    )
 
     loop = asyncio.get_event_loop()
     # TODO api configurable
@@ -37,7 +199,11 @@ async def main():
     api_server = Server(api_server_config)
     loop.create_task(api_server.serve())
 
-    await loop.create_future()
+    await connection_manager.wait_closed()
+    await artifact_server.stop()
+    await handle_host_status_update.stop()
+    stream_host_events.close()
+    connection_pool.close()
 
 
 asyncio.run(main())
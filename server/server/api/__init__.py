@@ -2,8 +2,22 @@ from fastapi import FastAPI, APIRouter
 
 from api.v1 import v1_router
 
+DESCRIPTION = """
+Manages the hosts connected to this server.
+
+When servers run as shards, every shard serves this API for the hosts it owns, there is no API across shards:
+
+- Commands, application deployments and health only reach hosts connected to this shard. Others are reported as not
+  connected.
+- Host events, telemetry and metrics are those of this shard's hosts.
+- Host listings come from this shard's database and cache. They include hosts that moved to another shard, with the
+  last status this shard saw, until they move back or are deleted here.
+
+Callers that need the whole fleet have to query every shard, and send a host's commands to the shard that owns it.
+"""
+
 api_router = APIRouter(prefix="/api")
 api_router.include_router(v1_router)
 
-api = FastAPI()
+api = FastAPI(description=DESCRIPTION)
 api.include_router(api_router)
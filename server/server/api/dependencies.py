@@ -0,0 +1,67 @@
+from fastapi import Request
+
+from repositories.cached_hosts_repository import CachedHostsRepository
+from repositories.host_metrics_store import HostMetricsStore
+from repositories.hosts_repository import HostsRepository
+from server.artifacts.artifact_store import ArtifactStore
+from server.network.application_monitor import ApplicationMonitor
+from server.network.artifact_server import ArtifactServer
+from server.network.command_dispatcher import CommandDispatcher
+from server.network.connection_admission_controller import ConnectionAdmissionController
+from server.network.telemetry_receiver import TelemetryReceiver
+from use_cases.delete_host import DeleteHost
+from use_cases.handle_host_status_update import HandleHostStatusUpdate
+from use_cases.stream_host_events import StreamHostEvents
+from use_cases.update_host_label import UpdateHostLabel
+
+
+def get_command_dispatcher(request: Request) -> CommandDispatcher:
+    return request.app.state.command_dispatcher
+
+
+def get_hosts_repository(request: Request) -> HostsRepository:
+    return request.app.state.hosts_repository
+
+
+def get_hosts_cache(request: Request) -> CachedHostsRepository:
+    return request.app.state.hosts_cache
+
+
+def get_update_host_label(request: Request) -> UpdateHostLabel:
+    return UpdateHostLabel(request.app.state.hosts_repository)
+
+
+def get_delete_host(request: Request) -> DeleteHost:
+    return DeleteHost(request.app.state.hosts_repository, request.app.state.client_key_registry)
+
+
+def get_stream_host_events(request: Request) -> StreamHostEvents:
+    return request.app.state.stream_host_events
+
+
+def get_artifact_store(request: Request) -> ArtifactStore:
+    return request.app.state.artifact_store
+
+
+def get_application_monitor(request: Request) -> ApplicationMonitor:
+    return request.app.state.application_monitor
+
+
+def get_host_metrics_store(request: Request) -> HostMetricsStore:
+    return request.app.state.host_metrics_store
+
+
+def get_admission_controller(request: Request) -> ConnectionAdmissionController:
+    return request.app.state.admission_controller
+
+
+def get_handle_host_status_update(request: Request) -> HandleHostStatusUpdate:
+    return request.app.state.handle_host_status_update
+
+
+def get_artifact_server(request: Request) -> ArtifactServer:
+    return request.app.state.artifact_server
+
+
+def get_telemetry_receiver(request: Request) -> TelemetryReceiver:
+    return request.app.state.telemetry_receiver
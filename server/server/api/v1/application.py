@@ -1,9 +1,37 @@
-from fastapi import APIRouter
+import asyncio
+
+from fastapi import APIRouter, Depends, Request
 from pydantic import UUID4
 
+from api.dependencies import get_artifact_store, get_artifact_server
+from domain.artifact import StoredArtifact
+from server.artifacts.artifact_store import ArtifactStore
+from server.network.artifact_server import ArtifactServer, ArtifactServerMetrics
+
 applications_router = APIRouter(prefix="/application")
 
 
+@applications_router.post("/artifact")
+async def upload_artifact(request: Request,
+                          artifact_store: ArtifactStore = Depends(get_artifact_store)) -> StoredArtifact:
+    """Store the request body as an artifact hosts can fetch from the server, uploading it again stores nothing new."""
+    loop = asyncio.get_running_loop()
+    artifact_writer = await loop.run_in_executor(None, artifact_store.create_writer)
+    try:
+        async for chunk in request.stream():
+            await loop.run_in_executor(None, artifact_writer.write, chunk)
+    except BaseException:
+        await loop.run_in_executor(None, artifact_writer.abort)
+        raise
+    digest = await loop.run_in_executor(None, artifact_writer.commit)
+    return StoredArtifact(digest=digest, size=artifact_writer.get_size())
+
+
+@applications_router.get("/artifact/metrics")
+async def get_artifact_metrics(artifact_server: ArtifactServer = Depends(get_artifact_server)) -> ArtifactServerMetrics:
+    return artifact_server.get_metrics()
+
+
 @applications_router.get("/{application_id}")
 async def get_application(application_id: UUID4):
     return []
@@ -1,17 +1,144 @@
-from fastapi import APIRouter
+import asyncio
+import math
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import UUID4
 
+from api.dependencies import get_command_dispatcher, get_hosts_repository, get_hosts_cache, get_update_host_label, \
+    get_delete_host, get_stream_host_events, get_application_monitor, get_host_metrics_store, \
+    get_admission_controller, get_handle_host_status_update, get_telemetry_receiver
+from domain.application_deployment import ApplicationInstanceDeployment, ApplicationInstanceHealth
+from domain.host import Host, HostUpdate
+from domain.host_command import HostCommand, HostCommandResultResponse
+from domain.host_query import HostFilter, HostOrder, HostPage
+from repositories.cached_hosts_repository import CachedHostsRepository, HostCacheMetrics
+from repositories.host_metrics_store import HostMetricsStore, UnknownMetricError, InvalidRangeError, \
+    HostMetricsStoreMetrics
+from repositories.hosts_repository import HostsRepository, InvalidCursorError
+from server.network.application_messages import ApplicationDeployment, ApplicationSpec
+from server.network.application_monitor import ApplicationMonitor
+from server.network.command_dispatcher import CommandDispatcher
+from server.network.connection_admission_controller import ConnectionAdmissionController, AdmissionMetrics
+from server.network.telemetry_receiver import TelemetryReceiver, TelemetryReceiverMetrics
+from use_cases.delete_host import DeleteHost
+from use_cases.handle_host_status_update import HandleHostStatusUpdate, HostStatusUpdateMetrics
+from use_cases.stream_host_events import StreamHostEvents, TooManySubscribersError, HostEventStreamMetrics
+from use_cases.update_host_label import UpdateHostLabel
+
 hosts_router = APIRouter(prefix="/host")
 
+# Seconds without events after which a comment is sent, so proxies don't time the stream out.
+EVENT_STREAM_KEEPALIVE_INTERVAL = 15
+# Seconds of metrics returned if no start is given.
+DEFAULT_METRICS_RANGE = 60 * 60
+
+
+@hosts_router.get("/events")
+async def get_host_events(stream_host_events: StreamHostEvents = Depends(get_stream_host_events)):
+    """Stream host connects, disconnects and status changes as server-sent events, instead of polling the hosts."""
+    try:
+        subscription = stream_host_events.subscribe()
+    except TooManySubscribersError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def stream_events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), EVENT_STREAM_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                except StopAsyncIteration:
+                    return
+                yield f"event: {event.type.value}\ndata: {event.model_dump_json()}\n\n"
+        finally:
+            stream_host_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@hosts_router.get("/cache/metrics")
+async def get_host_cache_metrics(hosts_cache: CachedHostsRepository = Depends(get_hosts_cache)) -> HostCacheMetrics:
+    return hosts_cache.get_metrics()
+
+
+@hosts_router.get("/admission/metrics")
+async def get_host_admission_metrics(
+        admission_controller: ConnectionAdmissionController = Depends(get_admission_controller)
+) -> AdmissionMetrics:
+    """Get how many hosts are waiting to be connected to, and how many connection attempts were dropped."""
+    return admission_controller.get_metrics()
+
+
+@hosts_router.get("/events/metrics")
+async def get_host_events_metrics(
+        stream_host_events: StreamHostEvents = Depends(get_stream_host_events)
+) -> HostEventStreamMetrics:
+    return stream_host_events.get_metrics()
+
+
+@hosts_router.get("/status/metrics")
+async def get_host_status_metrics(
+        handle_host_status_update: HandleHostStatusUpdate = Depends(get_handle_host_status_update)
+) -> HostStatusUpdateMetrics:
+    return handle_host_status_update.get_metrics()
+
+
+@hosts_router.get("/telemetry/metrics")
+async def get_host_telemetry_metrics(
+        telemetry_receiver: TelemetryReceiver = Depends(get_telemetry_receiver)
+) -> TelemetryReceiverMetrics:
+    return telemetry_receiver.get_metrics()
+
+
+@hosts_router.get("/metrics-store/metrics")
+async def get_host_metrics_store_metrics(
+        host_metrics_store: HostMetricsStore = Depends(get_host_metrics_store)
+) -> HostMetricsStoreMetrics:
+    return host_metrics_store.get_metrics()
+
 
 @hosts_router.get("/{host_id}")
-async def get_host(host_id: UUID4):
-    return []
+async def get_host(host_id: UUID4, hosts_repository: HostsRepository = Depends(get_hosts_repository)) -> Host:
+    host = await hosts_repository.get_host(host_id)
+    if host is None:
+        raise HTTPException(status_code=404, detail="Host not found")
+    return host
 
 
 @hosts_router.get("")
-async def get_hosts():
-    return []
+async def get_hosts(order: HostOrder = HostOrder.LAST_SEEN,
+                    limit: int = Query(default=100, ge=1, le=1000),
+                    cursor: str | None = None,
+                    os: str | None = None,
+                    min_memory: int | None = None,
+                    max_memory: int | None = None,
+                    min_cpu_cores: int | None = None,
+                    max_cpu_cores: int | None = None,
+                    label_prefix: str | None = Query(default=None, min_length=1),
+                    seen_within: float | None = Query(default=None, gt=0),
+                    hosts_repository: HostsRepository = Depends(get_hosts_repository)) -> HostPage:
+    """Get a page of hosts, pass the returned cursor to get the next one."""
+    host_filter = HostFilter(
+        os=os,
+        min_memory=min_memory,
+        max_memory=max_memory,
+        min_cpu_cores=min_cpu_cores,
+        max_cpu_cores=max_cpu_cores,
+        label_prefix=label_prefix,
+        seen_within=seen_within
+    )
+    try:
+        return await hosts_repository.get_page(host_filter, order, limit, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @hosts_router.post("")
@@ -19,14 +146,125 @@ async def create_host():
     return
 
 
-@hosts_router.patch("")
-async def update_host():
-    return
+@hosts_router.patch("/{host_id}")
+async def update_host(host_id: UUID4,
+                      host_update: HostUpdate,
+                      update_host_label: UpdateHostLabel = Depends(get_update_host_label)):
+    if not await update_host_label.handle(host_id, host_update.label):
+        raise HTTPException(status_code=404, detail="Host not found")
 
 
 @hosts_router.delete("/{host_id}")
-async def delete_host(host_id: UUID4):
-    return
+async def delete_host(host_id: UUID4, delete_host_use_case: DeleteHost = Depends(get_delete_host)):
+    if not await delete_host_use_case.handle(host_id):
+        raise HTTPException(status_code=404, detail="Host not found")
+
+
+@hosts_router.put("/{host_id}/applications", status_code=202)
+async def deploy_host_applications(host_id: UUID4,
+                                   deployments: list[ApplicationInstanceDeployment],
+                                   application_monitor: ApplicationMonitor = Depends(get_application_monitor)):
+    """Deploy application instances to a connected host, instances it runs that are not in the list are stopped."""
+    deployment = ApplicationDeployment([
+        ApplicationSpec(
+            instance_id=str(instance.id),
+            application_id=str(instance.application_id),
+            version=instance.version,
+            link=str(instance.config.link),
+            artifact_digest=instance.config.artifact_digest,
+            post_download_command=instance.config.post_download_command,
+            run_command=instance.config.run_command,
+            healthcheck_command=instance.config.healthcheck_command,
+            environment=instance.environment | instance.secrets
+        )
+        for instance in deployments
+    ])
+    if not application_monitor.deploy(host_id, deployment):
+        raise HTTPException(status_code=404, detail="Host not connected")
+
+
+@hosts_router.get("/{host_id}/applications/health")
+async def get_host_application_health(host_id: UUID4,
+                                      application_monitor: ApplicationMonitor = Depends(get_application_monitor)
+                                      ) -> list[ApplicationInstanceHealth]:
+    """Get the health a connected host last reported for each of its application instances."""
+    if (health := application_monitor.get_health(host_id)) is None:
+        raise HTTPException(status_code=404, detail="Host not connected")
+    return [
+        ApplicationInstanceHealth(
+            instance_id=application_health.instance_id,
+            state=application_health.state,
+            healthy=application_health.healthy,
+            restarts=application_health.restarts,
+            timestamp=application_health.timestamp,
+            detail=application_health.detail
+        )
+        for application_health in health
+    ]
+
+
+@hosts_router.get("/{host_id}/metrics")
+async def get_host_metrics(host_id: UUID4,
+                           start: float | None = None,
+                           end: float | None = None,
+                           metric: list[str] | None = Query(default=None),
+                           resolution: int | None = Query(default=None, ge=1),
+                           host_metrics_store: HostMetricsStore = Depends(get_host_metrics_store)) -> JSONResponse:
+    """Get metrics of a host between two unix times, the last hour and every metric unless asked for otherwise.
+
+    Every metric comes as a column of values, the nth value of each covers ``resolution`` seconds from ``start`` plus n
+    times the resolution. Gauges are averaged over that time, counters are rates per second. Values are null for times
+    the host reported nothing.
+    """
+    end = time.time() if end is None else end
+    start = end - DEFAULT_METRICS_RANGE if start is None else start
+    if not (math.isfinite(start) and math.isfinite(end)):
+        raise HTTPException(status_code=400, detail="Start and end must be finite")
+    if start > end:
+        raise HTTPException(status_code=400, detail="Start must not be after end")
+    try:
+        metrics_range = host_metrics_store.get_range(host_id, start, end, metric, resolution)
+    except (UnknownMetricError, InvalidRangeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if metrics_range is None:
+        raise HTTPException(status_code=404, detail="No metrics for host")
+    # Columns go out as they are, a model per value would cost more than the whole store.
+    return JSONResponse({
+        "host_id": str(host_id),
+        "resolution": metrics_range.resolution,
+        "start": metrics_range.start,
+        "metrics": {
+            name: [None if math.isnan(value) else round(value, 3) for value in values]
+            for name, values in metrics_range.values.items()
+        }
+    })
+
+
+@hosts_router.post("/command")
+async def run_host_command(host_command: HostCommand,
+                           command_dispatcher: CommandDispatcher = Depends(get_command_dispatcher)):
+    """Run a command on many hosts, streaming a JSON line per host as each one completes."""
+    if host_command.selector.all_connected:
+        host_ids = command_dispatcher.get_connected_host_ids()
+    else:
+        host_ids = host_command.selector.host_ids
+
+    async def stream_results():
+        async for host_result in command_dispatcher.dispatch(
+                host_ids, host_command.command, host_command.timeout, host_command.concurrency):
+            response = HostCommandResultResponse(
+                host_id=host_result.host_id,
+                status=host_result.status.value,
+                duration=host_result.duration
+            )
+            if result := host_result.result:
+                response.exit_code = result.exit_code
+                response.stdout = result.stdout
+                response.stderr = result.stderr
+                response.error = result.error
+            yield response.model_dump_json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 
 @hosts_router.post("/{host_id}/application")
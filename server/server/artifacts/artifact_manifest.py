@@ -0,0 +1,73 @@
+import hashlib
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Digest of the artifact, its size and the chunk size, followed by the SHA-256 digest of every chunk.
+_HEADER = struct.Struct(">32sQI")
+_CHUNK_DIGEST_SIZE = 32
+
+
+class InvalidManifestError(Exception):
+    """Error to raise if a manifest can't be decoded or doesn't describe the artifact it is used for."""
+
+
+@dataclass
+class ArtifactManifest:
+    """Splits an artifact into chunks of a fixed size, every one of which can be verified on its own.
+
+    Hosts can take chunks from anyone once they hold a manifest the server signed, as a chunk that doesn't match its
+    digest is simply dropped.
+    """
+    digest: str
+    size: int
+    chunk_size: int
+    chunk_digests: list[bytes]
+
+    def get_chunk_count(self) -> int:
+        return len(self.chunk_digests)
+
+    def get_chunk_length(self, index: int) -> int:
+        """Every chunk is ``chunk_size`` bytes long, except for the last one."""
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def verify_chunk(self, index: int, data: bytes) -> bool:
+        return len(data) == self.get_chunk_length(index) and \
+            hashlib.sha256(data).digest() == self.chunk_digests[index]
+
+    def encode(self) -> bytes:
+        return _HEADER.pack(bytes.fromhex(self.digest), self.size, self.chunk_size) + b"".join(self.chunk_digests)
+
+    @staticmethod
+    def decode(data: bytes) -> "ArtifactManifest":
+        if len(data) < _HEADER.size:
+            raise InvalidManifestError("Truncated artifact manifest")
+        digest, size, chunk_size = _HEADER.unpack_from(data)
+        if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+            raise InvalidManifestError(f"Chunk size of {chunk_size} bytes is out of bounds")
+        chunk_digests = data[_HEADER.size:]
+        chunk_count = -(-size // chunk_size)
+        if len(chunk_digests) != chunk_count * _CHUNK_DIGEST_SIZE:
+            raise InvalidManifestError(f"Manifest of {size} bytes must have {chunk_count} chunk digests")
+        return ArtifactManifest(
+            digest=digest.hex(),
+            size=size,
+            chunk_size=chunk_size,
+            chunk_digests=[chunk_digests[offset:offset + _CHUNK_DIGEST_SIZE]
+                           for offset in range(0, len(chunk_digests), _CHUNK_DIGEST_SIZE)]
+        )
+
+
+def build_manifest(path: Path, digest: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> ArtifactManifest:
+    """Hash every chunk of the artifact at the given path, reading it once."""
+    chunk_digests = []
+    size = 0
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            chunk_digests.append(hashlib.sha256(chunk).digest())
+            size += len(chunk)
+    return ArtifactManifest(digest=digest, size=size, chunk_size=chunk_size, chunk_digests=chunk_digests)
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+from server.artifacts.delta import DEFAULT_BLOCK_SIZE, compute_signatures, compute_delta
+
+_DIGEST_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class InvalidDigestError(Exception):
+    """Error to raise if a digest is not a lowercase hex SHA-256 digest."""
+
+
+class ArtifactCorruptedError(Exception):
+    """Error to raise if the content written for an artifact doesn't match the digest it is stored under."""
+
+
+def check_digest(digest: str) -> str:
+    # Digests name files in the store, so anything else could point outside it.
+    if not _DIGEST_PATTERN.fullmatch(digest):
+        raise InvalidDigestError(f"{digest!r} is not a SHA-256 digest")
+    return digest
+
+
+class ArtifactWriter:
+    """Writes an artifact to a temporary file, it is only added to the store once committed."""
+
+    def __init__(self, store: "ArtifactStore"):
+        self._store = store
+        self._file = tempfile.NamedTemporaryFile(dir=store.get_temporary_path(), delete=False)
+        self._hash = hashlib.sha256()
+        self._size = 0
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._hash.update(data)
+        self._size += len(data)
+
+    def get_size(self) -> int:
+        return self._size
+
+    def commit(self, expected_digest: str | None = None) -> str:
+        """Add the artifact to the store and return its digest, content that is already stored is not kept twice."""
+        self._file.close()
+        digest = self._hash.hexdigest()
+        if expected_digest is not None and digest != expected_digest:
+            os.unlink(self._file.name)
+            raise ArtifactCorruptedError(f"Artifact has digest {digest}, expected {expected_digest}")
+        path = self._store.get_object_path(digest)
+        if path.exists():
+            os.unlink(self._file.name)
+        else:
+            path.parent.mkdir(exist_ok=True)
+            os.replace(self._file.name, path)
+        return digest
+
+    def abort(self) -> None:
+        self._file.close()
+        os.unlink(self._file.name)
+
+
+def write_file(path: Path, data: bytes) -> None:
+    """Write a file so that it is either complete or not there at all, even if the process dies halfway."""
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+        file.write(data)
+    os.replace(file.name, path)
+
+
+class ArtifactStore:
+    """Keeps artifacts on disk under the SHA-256 digest of their content.
+
+    The same content is only stored once, however many application versions refer to it. Deltas between two artifacts
+    are kept next to them, so they are computed once and then sent to every host upgrading between those two. Chunks of
+    an artifact that is still being put together from several sources are kept apart until it is complete.
+    """
+
+    def __init__(self, root: Path):
+        self._root = root
+        for directory in ("objects", "deltas", "manifests", "chunks", "tmp"):
+            (self._root / directory).mkdir(parents=True, exist_ok=True)
+
+    def has(self, digest: str) -> bool:
+        return self.get_object_path(digest).exists()
+
+    def get_path(self, digest: str) -> Path | None:
+        path = self.get_object_path(digest)
+        return path if path.exists() else None
+
+    def create_writer(self) -> ArtifactWriter:
+        return ArtifactWriter(self)
+
+    def get_object_path(self, digest: str) -> Path:
+        check_digest(digest)
+        return self._root / "objects" / digest[:2] / digest
+
+    def get_delta_path(self, basis_digest: str, target_digest: str, block_size: int = DEFAULT_BLOCK_SIZE) -> Path:
+        check_digest(basis_digest)
+        check_digest(target_digest)
+        return self._root / "deltas" / f"{basis_digest}-{target_digest}-{block_size}"
+
+    def get_manifest_path(self, digest: str) -> Path:
+        check_digest(digest)
+        return self._root / "manifests" / digest
+
+    def get_manifest_signature_path(self, digest: str) -> Path:
+        check_digest(digest)
+        return self._root / "manifests" / f"{digest}.sig"
+
+    def get_chunk_path(self, digest: str, index: int) -> Path:
+        check_digest(digest)
+        return self._root / "chunks" / digest / str(index)
+
+    def get_chunk_indexes(self, digest: str) -> set[int]:
+        check_digest(digest)
+        directory = self._root / "chunks" / digest
+        if not directory.exists():
+            return set()
+        return {int(path.name) for path in directory.iterdir() if path.name.isdigit()}
+
+    def remove_chunks(self, digest: str) -> None:
+        check_digest(digest)
+        shutil.rmtree(self._root / "chunks" / digest, ignore_errors=True)
+
+    def get_temporary_path(self) -> Path:
+        return self._root / "tmp"
+
+
+def build_delta(basis_path: Path, target_path: Path, delta_path: Path, block_size: int = DEFAULT_BLOCK_SIZE) -> int:
+    """Write the delta from the basis to the target, returns its size.
+
+    Runs for as long as the rolling checksum takes to scan the target, so it is best run in a process of its own.
+    """
+    with open(basis_path, "rb") as basis:
+        signatures = compute_signatures(basis, block_size)
+    with open(target_path, "rb") as target, \
+            tempfile.NamedTemporaryFile(dir=delta_path.parent, delete=False) as delta:
+        compute_delta(signatures, target, delta.write, block_size)
+    os.replace(delta.name, delta_path)
+    return delta_path.stat().st_size
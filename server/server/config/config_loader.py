@@ -1,9 +1,12 @@
 from configparser import ConfigParser
 from dataclasses import dataclass
+from ipaddress import ip_address
 from pathlib import Path
+from uuid import UUID
 
 from rsa import PublicKey, PrivateKey
 
+from server.artifacts.artifact_manifest import DEFAULT_CHUNK_SIZE, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE
 from server.utils.encryption_manager import EncryptionManager
 
 
@@ -13,6 +16,41 @@ class ServerConfig:
     private_key: PrivateKey
     public_key: PublicKey
     udp_listening_port: int
+    multicast_group: str | None
+    shard_port: int | None
+    shard_id: UUID | None
+    shard_heartbeat_interval: float
+    shard_timeout: float
+    shard_peers: list[tuple[str, int]]
+    shard_multicast_group: str | None
+    shard_multicast_ttl: int
+    command_concurrency: int
+    command_timeout: float
+    status_batch_size: int
+    status_flush_interval: float
+    status_max_buffered: int
+    database_pool_size: int
+    host_cache_size: int
+    host_cache_ttl: float
+    event_queue_size: int
+    max_event_subscribers: int
+    metrics_max_hosts: int
+    artifact_store_path: Path
+    artifact_max_transfers: int
+    artifact_chunk_size: int
+    crypto_workers: int | None
+    crypto_use_processes: bool
+    crypto_max_pending: int
+    session_ticket_lifetime: int
+    session_ticket_cache_size: int
+    max_concurrent_handshakes: int
+    max_queued_handshakes: int
+    handshake_rate_per_source: float
+    handshake_burst_per_source: int
+    handshake_timeout: float
+    compression_enabled: bool
+    compression_dictionary_path: Path | None
+    blacklisted_client_ids: list[UUID]
 
 
 class ServerConfigError(Exception):
@@ -21,6 +59,33 @@ class ServerConfigError(Exception):
 
 class ServerConfigLoader:
     DEFAULT_UDP_PORT = 53179
+    DEFAULT_CRYPTO_EXECUTOR = "process"
+    DEFAULT_CRYPTO_MAX_PENDING = 256
+    DEFAULT_SESSION_TICKET_LIFETIME = 24 * 60 * 60
+    DEFAULT_SESSION_TICKET_CACHE_SIZE = 10_000
+    DEFAULT_MAX_CONCURRENT_HANDSHAKES = 64
+    DEFAULT_MAX_QUEUED_HANDSHAKES = 4096
+    DEFAULT_HANDSHAKE_RATE_PER_SOURCE = 1.0
+    DEFAULT_HANDSHAKE_BURST_PER_SOURCE = 3
+    DEFAULT_HANDSHAKE_TIMEOUT = 10.0
+    DEFAULT_COMPRESSION = "deflate"
+    DEFAULT_SHARD_HEARTBEAT_INTERVAL = 1.0
+    DEFAULT_SHARD_TIMEOUT = 5.0
+    DEFAULT_SHARD_MULTICAST_TTL = 1
+    DEFAULT_COMMAND_CONCURRENCY = 256
+    DEFAULT_COMMAND_TIMEOUT = 30.0
+    DEFAULT_STATUS_BATCH_SIZE = 1000
+    DEFAULT_STATUS_FLUSH_INTERVAL = 1.0
+    DEFAULT_STATUS_MAX_BUFFERED = 10_000
+    DEFAULT_DATABASE_POOL_SIZE = 4
+    DEFAULT_HOST_CACHE_SIZE = 10_000
+    DEFAULT_HOST_CACHE_TTL = 60.0
+    DEFAULT_EVENT_QUEUE_SIZE = 1000
+    DEFAULT_MAX_EVENT_SUBSCRIBERS = 100
+    DEFAULT_METRICS_MAX_HOSTS = 10_000
+    DEFAULT_ARTIFACT_STORE_PATH = "artifacts"
+    DEFAULT_ARTIFACT_MAX_TRANSFERS = 64
+    DEFAULT_ARTIFACT_CHUNK_SIZE = DEFAULT_CHUNK_SIZE
 
     def __init__(self, encryption_manager: EncryptionManager, path: Path = Path("config.cfg")):
         self._encryption_manager = encryption_manager
@@ -45,24 +110,297 @@ class ServerConfigLoader:
         except ValueError as e:
             raise ServerConfigError("Ports must be valid integers") from e
 
+        multicast_group = self._config.get("NETWORK", "MulticastGroup", fallback=None) or None
+        if multicast_group:
+            try:
+                is_multicast = ip_address(multicast_group).is_multicast
+            except ValueError as e:
+                raise ServerConfigError("Multicast group must be a valid IP address") from e
+            if not is_multicast:
+                raise ServerConfigError("Multicast group must be a multicast address")
+
+        try:
+            shard_port = self._config.get("NETWORK", "ShardPort", fallback=None)
+            shard_port = int(shard_port) if shard_port else None
+            shard_heartbeat_interval = self._config.get("NETWORK", "ShardHeartbeatInterval",
+                                                        fallback=None) or self.DEFAULT_SHARD_HEARTBEAT_INTERVAL
+            shard_heartbeat_interval = float(shard_heartbeat_interval)
+            shard_timeout = self._config.get("NETWORK", "ShardTimeout", fallback=None) or self.DEFAULT_SHARD_TIMEOUT
+            shard_timeout = float(shard_timeout)
+        except ValueError as e:
+            raise ServerConfigError("Shard port, heartbeat interval and timeout must be valid numbers") from e
+        if shard_timeout <= shard_heartbeat_interval:
+            raise ServerConfigError("Shard timeout must be longer than the shard heartbeat interval")
+        try:
+            shard_id = self._config.get("NETWORK", "ShardId", fallback=None)
+            shard_id = UUID(shard_id) if shard_id else None
+        except ValueError as e:
+            raise ServerConfigError("Shard id must be a valid UUID") from e
+        shard_peers = self._get_shard_peers(shard_port)
+        shard_multicast_group = self._config.get("NETWORK", "ShardMulticastGroup", fallback=None) or None
+        if shard_multicast_group:
+            try:
+                is_multicast = ip_address(shard_multicast_group).is_multicast
+            except ValueError as e:
+                raise ServerConfigError("Shard multicast group must be a valid IP address") from e
+            if not is_multicast:
+                raise ServerConfigError("Shard multicast group must be a multicast address")
+        try:
+            shard_multicast_ttl = self._config.get("NETWORK", "ShardMulticastTTL",
+                                                   fallback=None) or self.DEFAULT_SHARD_MULTICAST_TTL
+            shard_multicast_ttl = int(shard_multicast_ttl)
+        except ValueError as e:
+            raise ServerConfigError("Shard multicast TTL must be a valid integer") from e
+
+        try:
+            command_concurrency = self._config.get("NETWORK", "CommandConcurrency",
+                                                   fallback=None) or self.DEFAULT_COMMAND_CONCURRENCY
+            command_concurrency = int(command_concurrency)
+            command_timeout = self._config.get("NETWORK", "CommandTimeout",
+                                               fallback=None) or self.DEFAULT_COMMAND_TIMEOUT
+            command_timeout = float(command_timeout)
+        except ValueError as e:
+            raise ServerConfigError("Command concurrency and timeout must be valid numbers") from e
+
+        try:
+            status_batch_size = self._config.get("DATABASE", "StatusBatchSize",
+                                                 fallback=None) or self.DEFAULT_STATUS_BATCH_SIZE
+            status_batch_size = int(status_batch_size)
+            status_flush_interval = self._config.get("DATABASE", "StatusFlushInterval",
+                                                     fallback=None) or self.DEFAULT_STATUS_FLUSH_INTERVAL
+            status_flush_interval = float(status_flush_interval)
+            status_max_buffered = self._config.get("DATABASE", "StatusMaxBuffered",
+                                                   fallback=None) or self.DEFAULT_STATUS_MAX_BUFFERED
+            status_max_buffered = int(status_max_buffered)
+        except ValueError as e:
+            raise ServerConfigError("Status batch size, flush interval and max buffered must be valid numbers") from e
+
+        try:
+            database_pool_size = self._config.get("DATABASE", "PoolSize",
+                                                  fallback=None) or self.DEFAULT_DATABASE_POOL_SIZE
+            database_pool_size = int(database_pool_size)
+        except ValueError as e:
+            raise ServerConfigError("Database pool size must be a valid number") from e
+        if database_pool_size < 1:
+            raise ServerConfigError("Database pool size must be at least 1")
+
+        try:
+            host_cache_size = self._config.get("DATABASE", "HostCacheSize",
+                                               fallback=None) or self.DEFAULT_HOST_CACHE_SIZE
+            host_cache_size = int(host_cache_size)
+            host_cache_ttl = self._config.get("DATABASE", "HostCacheTTL",
+                                              fallback=None) or self.DEFAULT_HOST_CACHE_TTL
+            host_cache_ttl = float(host_cache_ttl)
+        except ValueError as e:
+            raise ServerConfigError("Host cache size and TTL must be valid numbers") from e
+
+        try:
+            event_queue_size = self._config.get("API", "EventQueueSize", fallback=None) or self.DEFAULT_EVENT_QUEUE_SIZE
+            event_queue_size = int(event_queue_size)
+            max_event_subscribers = self._config.get("API", "MaxEventSubscribers",
+                                                     fallback=None) or self.DEFAULT_MAX_EVENT_SUBSCRIBERS
+            max_event_subscribers = int(max_event_subscribers)
+        except ValueError as e:
+            raise ServerConfigError("Event queue size and max event subscribers must be valid numbers") from e
+        if event_queue_size < 1:
+            raise ServerConfigError("Event queue size must be at least 1")
+
+        try:
+            metrics_max_hosts = self._config.get("METRICS", "MaxHosts", fallback=None) or self.DEFAULT_METRICS_MAX_HOSTS
+            metrics_max_hosts = int(metrics_max_hosts)
+        except ValueError as e:
+            raise ServerConfigError("Metrics max hosts must be a valid integer") from e
+        if metrics_max_hosts < 1:
+            raise ServerConfigError("Metrics max hosts must be at least 1")
+
+        artifact_store_path = Path(
+            self._config.get("ARTIFACTS", "StorePath", fallback=None) or self.DEFAULT_ARTIFACT_STORE_PATH
+        )
+        try:
+            artifact_max_transfers = self._config.get("ARTIFACTS", "MaxTransfers",
+                                                      fallback=None) or self.DEFAULT_ARTIFACT_MAX_TRANSFERS
+            artifact_max_transfers = int(artifact_max_transfers)
+        except ValueError as e:
+            raise ServerConfigError("Artifact max transfers must be a valid integer") from e
+        if artifact_max_transfers < 1:
+            raise ServerConfigError("Artifact max transfers must be at least 1")
+        try:
+            artifact_chunk_size = self._config.get("ARTIFACTS", "ChunkSize",
+                                                   fallback=None) or self.DEFAULT_ARTIFACT_CHUNK_SIZE
+            artifact_chunk_size = int(artifact_chunk_size)
+        except ValueError as e:
+            raise ServerConfigError("Artifact chunk size must be a valid integer") from e
+        if not MIN_CHUNK_SIZE <= artifact_chunk_size <= MAX_CHUNK_SIZE:
+            raise ServerConfigError(f"Artifact chunk size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes")
+
+        try:
+            max_concurrent_handshakes = self._config.get("NETWORK", "MaxConcurrentHandshakes",
+                                                         fallback=None) or self.DEFAULT_MAX_CONCURRENT_HANDSHAKES
+            max_concurrent_handshakes = int(max_concurrent_handshakes)
+            max_queued_handshakes = self._config.get("NETWORK", "MaxQueuedHandshakes",
+                                                     fallback=None) or self.DEFAULT_MAX_QUEUED_HANDSHAKES
+            max_queued_handshakes = int(max_queued_handshakes)
+            handshake_rate_per_source = self._config.get("NETWORK", "HandshakeRatePerSource",
+                                                         fallback=None) or self.DEFAULT_HANDSHAKE_RATE_PER_SOURCE
+            handshake_rate_per_source = float(handshake_rate_per_source)
+            handshake_burst_per_source = self._config.get("NETWORK", "HandshakeBurstPerSource",
+                                                          fallback=None) or self.DEFAULT_HANDSHAKE_BURST_PER_SOURCE
+            handshake_burst_per_source = int(handshake_burst_per_source)
+            handshake_timeout = self._config.get("NETWORK", "HandshakeTimeout",
+                                                 fallback=None) or self.DEFAULT_HANDSHAKE_TIMEOUT
+            handshake_timeout = float(handshake_timeout)
+        except ValueError as e:
+            raise ServerConfigError("Handshake admission settings must be valid numbers") from e
+
+        compression = self._config.get("NETWORK", "Compression", fallback=None) or self.DEFAULT_COMPRESSION
+        if compression not in ("deflate", "none"):
+            raise ServerConfigError("Compression must be either 'deflate' or 'none'")
+        compression_dictionary_path = self._config.get("NETWORK", "CompressionDictionaryPath", fallback=None)
+        compression_dictionary_path = Path(compression_dictionary_path) if compression_dictionary_path else None
+
+        try:
+            blacklisted_client_ids = self._config.get("SECURITY", "BlacklistedClientIds", fallback=None) or ""
+            blacklisted_client_ids = [UUID(client_id.strip()) for client_id in blacklisted_client_ids.split(",")
+                                      if client_id.strip()]
+        except ValueError as e:
+            raise ServerConfigError("Blacklisted client ids must be valid UUIDs") from e
+
+        crypto_executor = self._config.get("SECURITY", "CryptoExecutor", fallback=None) or self.DEFAULT_CRYPTO_EXECUTOR
+        if crypto_executor not in ("process", "thread"):
+            raise ServerConfigError("Crypto executor must be either 'process' or 'thread'")
+        try:
+            crypto_workers = self._config.get("SECURITY", "CryptoWorkers", fallback=None)
+            crypto_workers = int(crypto_workers) if crypto_workers else None
+            crypto_max_pending = self._config.get("SECURITY", "CryptoMaxPending",
+                                                  fallback=None) or self.DEFAULT_CRYPTO_MAX_PENDING
+            crypto_max_pending = int(crypto_max_pending)
+        except ValueError as e:
+            raise ServerConfigError("Crypto workers and max pending must be valid integers") from e
+
+        try:
+            session_ticket_lifetime = self._config.get("SECURITY", "SessionTicketLifetime",
+                                                       fallback=None) or self.DEFAULT_SESSION_TICKET_LIFETIME
+            session_ticket_lifetime = int(session_ticket_lifetime)
+            session_ticket_cache_size = self._config.get("SECURITY", "SessionTicketCacheSize",
+                                                         fallback=None) or self.DEFAULT_SESSION_TICKET_CACHE_SIZE
+            session_ticket_cache_size = int(session_ticket_cache_size)
+        except ValueError as e:
+            raise ServerConfigError("Session ticket lifetime and cache size must be valid integers") from e
+
         config = ServerConfig(
             log_level=log_level,
             private_key=private_key,
             public_key=public_key,
             udp_listening_port=udp_listening_port,
+            multicast_group=multicast_group,
+            shard_port=shard_port,
+            shard_id=shard_id,
+            shard_heartbeat_interval=shard_heartbeat_interval,
+            shard_timeout=shard_timeout,
+            shard_peers=shard_peers,
+            shard_multicast_group=shard_multicast_group,
+            shard_multicast_ttl=shard_multicast_ttl,
+            command_concurrency=command_concurrency,
+            command_timeout=command_timeout,
+            status_batch_size=status_batch_size,
+            status_flush_interval=status_flush_interval,
+            status_max_buffered=status_max_buffered,
+            database_pool_size=database_pool_size,
+            host_cache_size=host_cache_size,
+            host_cache_ttl=host_cache_ttl,
+            event_queue_size=event_queue_size,
+            max_event_subscribers=max_event_subscribers,
+            metrics_max_hosts=metrics_max_hosts,
+            artifact_store_path=artifact_store_path,
+            artifact_max_transfers=artifact_max_transfers,
+            artifact_chunk_size=artifact_chunk_size,
+            crypto_workers=crypto_workers,
+            crypto_use_processes=crypto_executor == "process",
+            crypto_max_pending=crypto_max_pending,
+            session_ticket_lifetime=session_ticket_lifetime,
+            session_ticket_cache_size=session_ticket_cache_size,
+            max_concurrent_handshakes=max_concurrent_handshakes,
+            max_queued_handshakes=max_queued_handshakes,
+            handshake_rate_per_source=handshake_rate_per_source,
+            handshake_burst_per_source=handshake_burst_per_source,
+            handshake_timeout=handshake_timeout,
+            compression_enabled=compression == "deflate",
+            compression_dictionary_path=compression_dictionary_path,
+            blacklisted_client_ids=blacklisted_client_ids,
         )
         self.write_config(config)
         return config
 
+    def _get_shard_peers(self, shard_port: int | None) -> list[tuple[str, int]]:
+        # Comma separated addresses, with a port or on the shard port.
+        shard_peers = []
+        for shard_peer in (self._config.get("NETWORK", "ShardPeers", fallback=None) or "").split(","):
+            if not (shard_peer := shard_peer.strip()):
+                continue
+            host, _, port = shard_peer.partition(":")
+            try:
+                # Only addresses, host names would be resolved on the event loop for every heartbeat.
+                ip_address(host)
+                port = int(port) if port else shard_port
+            except ValueError as e:
+                raise ServerConfigError("Shard peers must be IP addresses, optionally with a valid port") from e
+            if port is None:
+                raise ServerConfigError("Shard peers without a port need a shard port")
+            shard_peers.append((host, port))
+        return shard_peers
+
     def write_config(self, config: ServerConfig) -> None:
         self._config.read_dict(
             {
                 "SECURITY": {
                     "PublicKey": config.public_key.save_pkcs1().decode('UTF-8'),
-                    "PrivateKey": config.private_key.save_pkcs1().decode('UTF-8')
+                    "PrivateKey": config.private_key.save_pkcs1().decode('UTF-8'),
+                    "CryptoExecutor": "process" if config.crypto_use_processes else "thread",
+                    "CryptoWorkers": str(config.crypto_workers or ""),
+                    "CryptoMaxPending": str(config.crypto_max_pending),
+                    "SessionTicketLifetime": str(config.session_ticket_lifetime),
+                    "SessionTicketCacheSize": str(config.session_ticket_cache_size),
+                    "BlacklistedClientIds": ",".join(str(client_id) for client_id in config.blacklisted_client_ids)
                 },
                 "NETWORK": {
                     "UDPListeningPort": str(config.udp_listening_port),
+                    "MulticastGroup": config.multicast_group or "",
+                    "ShardPort": str(config.shard_port or ""),
+                    "ShardId": str(config.shard_id or ""),
+                    "ShardHeartbeatInterval": str(config.shard_heartbeat_interval),
+                    "ShardTimeout": str(config.shard_timeout),
+                    "ShardPeers": ",".join(f"{host}:{port}" for host, port in config.shard_peers),
+                    "ShardMulticastGroup": config.shard_multicast_group or "",
+                    "ShardMulticastTTL": str(config.shard_multicast_ttl),
+                    "CommandConcurrency": str(config.command_concurrency),
+                    "CommandTimeout": str(config.command_timeout),
+                    "MaxConcurrentHandshakes": str(config.max_concurrent_handshakes),
+                    "MaxQueuedHandshakes": str(config.max_queued_handshakes),
+                    "HandshakeRatePerSource": str(config.handshake_rate_per_source),
+                    "HandshakeBurstPerSource": str(config.handshake_burst_per_source),
+                    "HandshakeTimeout": str(config.handshake_timeout),
+                    "Compression": "deflate" if config.compression_enabled else "none",
+                    "CompressionDictionaryPath": str(config.compression_dictionary_path or ""),
+                },
+                "DATABASE": {
+                    "StatusBatchSize": str(config.status_batch_size),
+                    "StatusFlushInterval": str(config.status_flush_interval),
+                    "StatusMaxBuffered": str(config.status_max_buffered),
+                    "PoolSize": str(config.database_pool_size),
+                    "HostCacheSize": str(config.host_cache_size),
+                    "HostCacheTTL": str(config.host_cache_ttl),
+                },
+                "API": {
+                    "EventQueueSize": str(config.event_queue_size),
+                    "MaxEventSubscribers": str(config.max_event_subscribers),
+                },
+                "METRICS": {
+                    "MaxHosts": str(config.metrics_max_hosts),
+                },
+                "ARTIFACTS": {
+                    "StorePath": str(config.artifact_store_path),
+                    "MaxTransfers": str(config.artifact_max_transfers),
+                    "ChunkSize": str(config.artifact_chunk_size),
                 },
                 "APPLICATION": {
                     "LogLevel": config.log_level
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from pydantic import BaseModel, UUID4
+
+from domain.downloadable_application_config import DownloadableApplicationConfig
+
+
+class ApplicationInstanceDeployment(BaseModel):
+    id: UUID4
+    application_id: UUID4
+    version: int
+    config: DownloadableApplicationConfig
+    environment: dict[str, str] = {}
+    # Passed to the application like its environment, over the encrypted connection only.
+    secrets: dict[str, str] = {}
+
+
+class ApplicationInstanceHealth(BaseModel):
+    instance_id: str
+    state: str
+    healthy: bool | None
+    restarts: int
+    timestamp: datetime
+    detail: str | None = None
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class StoredArtifact(BaseModel):
+    # SHA-256 of the content, refer to the artifact by it in application versions.
+    digest: str
+    size: int
@@ -1,9 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic_core import Url
 
 
 class DownloadableApplicationConfig(BaseModel):
     link: Url
+    # Hosts fetch the artifact from the server instead of the link if it was uploaded to the server's artifact store.
+    artifact_digest: str | None = Field(default=None, pattern=r"^[0-9a-f]{64}$")
     post_download_command: list[str]
     run_command: list[str]
     healthcheck_command: list[str]
\ No newline at end of file
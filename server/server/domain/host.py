@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from pydantic import BaseModel, UUID4, IPvAnyAddress
+from pydantic import BaseModel, UUID4, IPvAnyAddress, Field
 
 
 class ApplicationInstance(BaseModel):
@@ -22,5 +22,17 @@ class Host(BaseModel):
     label: str | None
     last_known_host: IPvAnyAddress
     last_seen: datetime
-    attributes: HostAttributes
+    # Unknown until the host reports them.
+    attributes: HostAttributes | None
     applications: list[ApplicationInstance]
+
+
+class HostStatusUpdate(BaseModel):
+    id: UUID4
+    last_known_host: IPvAnyAddress
+    last_seen: datetime
+    attributes: HostAttributes | None = None
+
+
+class HostUpdate(BaseModel):
+    label: str | None = Field(max_length=255)
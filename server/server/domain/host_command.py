@@ -0,0 +1,29 @@
+from pydantic import BaseModel, UUID4, Field, model_validator
+
+
+class HostSelector(BaseModel):
+    host_ids: list[UUID4] = []
+    all_connected: bool = False
+
+    @model_validator(mode="after")
+    def check_selects_hosts(self) -> "HostSelector":
+        if not self.host_ids and not self.all_connected:
+            raise ValueError("Select hosts by id or select all connected hosts")
+        return self
+
+
+class HostCommand(BaseModel):
+    selector: HostSelector
+    command: list[str] = Field(min_length=1)
+    timeout: float | None = Field(default=None, gt=0)
+    concurrency: int | None = Field(default=None, ge=1)
+
+
+class HostCommandResultResponse(BaseModel):
+    host_id: UUID4
+    status: str
+    duration: float
+    exit_code: int | None = None
+    stdout: str | None = None
+    stderr: str | None = None
+    error: str | None = None
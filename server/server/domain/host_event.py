@@ -0,0 +1,24 @@
+from datetime import datetime
+from enum import Enum
+
+from pydantic import BaseModel, UUID4, IPvAnyAddress
+
+from domain.host import HostAttributes
+
+
+class HostEventType(str, Enum):
+    CONNECTED = "connected"
+    DISCONNECTED = "disconnected"
+    # The status of a host was written to the database.
+    STATUS = "status"
+    # The subscriber fell behind and missed events, re-read the hosts to catch up.
+    EVENTS_DROPPED = "events_dropped"
+
+
+class HostEvent(BaseModel):
+    type: HostEventType
+    timestamp: datetime
+    host_id: UUID4 | None = None
+    last_known_host: IPvAnyAddress | None = None
+    attributes: HostAttributes | None = None
+    dropped: int | None = None
@@ -0,0 +1,28 @@
+from enum import Enum
+
+from pydantic import BaseModel, Field
+
+from domain.host import Host
+
+
+class HostOrder(str, Enum):
+    # Most recently seen hosts first.
+    LAST_SEEN = "last_seen"
+    ID = "id"
+
+
+class HostFilter(BaseModel):
+    os: str | None = None
+    min_memory: int | None = None
+    max_memory: int | None = None
+    min_cpu_cores: int | None = None
+    max_cpu_cores: int | None = None
+    label_prefix: str | None = Field(default=None, min_length=1)
+    # Seconds
+    seen_within: float | None = Field(default=None, gt=0)
+
+
+class HostPage(BaseModel):
+    hosts: list[Host]
+    # Pass to get the next page, None on the last page.
+    next_cursor: str | None
@@ -0,0 +1,31 @@
+from yoyo import step
+
+__depends__ = {"0001_create_tables"}
+
+steps = [
+    step(
+        """
+        CREATE TABLE application_instances (
+            id VARCHAR(36),
+            host_id VARCHAR(36) NOT NULL,
+            application_id VARCHAR(36) NOT NULL,
+            version INT NOT NULL,
+            environment TEXT NOT NULL,
+            secrets TEXT NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY (host_id) REFERENCES hosts (id) ON DELETE CASCADE
+        )
+        """,
+        """
+        DROP TABLE application_instances
+        """
+    ),
+    step(
+        """
+        CREATE INDEX application_instances_host_id ON application_instances (host_id)
+        """,
+        """
+        DROP INDEX application_instances_host_id
+        """
+    )
+]
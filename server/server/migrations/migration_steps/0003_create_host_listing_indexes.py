@@ -0,0 +1,30 @@
+from yoyo import step
+
+__depends__ = {"0002_create_application_instances"}
+
+steps = [
+    step(
+        """
+        CREATE INDEX hosts_last_seen ON hosts (last_seen, id)
+        """,
+        """
+        DROP INDEX hosts_last_seen
+        """
+    ),
+    step(
+        """
+        CREATE INDEX hosts_os_last_seen ON hosts (os, last_seen, id)
+        """,
+        """
+        DROP INDEX hosts_os_last_seen
+        """
+    ),
+    step(
+        """
+        CREATE INDEX hosts_label ON hosts (label)
+        """,
+        """
+        DROP INDEX hosts_label
+        """
+    )
+]
@@ -0,0 +1,18 @@
+from yoyo import step
+
+__depends__ = {"0003_create_host_listing_indexes"}
+
+steps = [
+    step(
+        """
+        CREATE TABLE client_keys (
+            client_id VARCHAR(36),
+            key_fingerprint BLOB NOT NULL UNIQUE,
+            PRIMARY KEY (client_id)
+        )
+        """,
+        """
+        DROP TABLE client_keys
+        """
+    )
+]
@@ -0,0 +1,59 @@
+import logging
+from uuid import UUID
+
+from server.network.application_messages import APPLICATION_CHANNEL, APPLICATION_CHANNEL_PRIORITY, STOPPED, \
+    ApplicationDeployment, ApplicationHealth, ApplicationHealthReport, InvalidApplicationMessageError, \
+    decode_application_message
+from server.network.server_connection_manager import ServerConnectionManager
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ApplicationMonitor:
+    """Deploys application instances to connected hosts and keeps the health they last reported.
+
+    Hosts report in batches, one message per interval covers every instance that was checked or changed since the last
+    one. Health is only known while a host is connected, it sends all of it again when it reconnects.
+    """
+
+    def __init__(self, connection_manager: ServerConnectionManager):
+        self._connection_manager = connection_manager
+        self._health: dict[UUID, dict[str, ApplicationHealth]] = {}
+        self._connection_manager.register_client_message_callback(self._on_client_message)
+        self._connection_manager.register_client_disconnected_callback(self._on_client_disconnected)
+
+    def deploy(self, client_id: UUID, deployment: ApplicationDeployment) -> bool:
+        """Send a deployment to a host, returns whether the host is connected to take it."""
+        if not (client := self._connection_manager.get_client(client_id)):
+            return False
+        client.open_channel(APPLICATION_CHANNEL, APPLICATION_CHANNEL_PRIORITY)
+        # Deployments carry the secrets of the applications.
+        client.write(deployment.encode(), APPLICATION_CHANNEL, sensitive=True)
+        return True
+
+    def get_health(self, client_id: UUID) -> list[ApplicationHealth] | None:
+        """Get the health of every application instance of a host, or None if the host is not connected."""
+        if not self._connection_manager.get_client(client_id):
+            return None
+        return list(self._health.get(client_id, {}).values())
+
+    def _on_client_message(self, client_id: UUID, channel_id: int, payload: bytes):
+        if channel_id != APPLICATION_CHANNEL:
+            return
+        try:
+            message = decode_application_message(payload)
+        except InvalidApplicationMessageError as e:
+            LOGGER.warning(f"Dropping invalid application message from client {client_id}: {e}")
+            return
+        if not isinstance(message, ApplicationHealthReport):
+            LOGGER.warning(f"Dropping unexpected {type(message).__name__} from client {client_id}.")
+            return
+        health = self._health.setdefault(client_id, {})
+        for application_health in message.health:
+            if application_health.state == STOPPED:
+                health.pop(application_health.instance_id, None)
+            else:
+                health[application_health.instance_id] = application_health
+
+    def _on_client_disconnected(self, client_id: UUID, host: str):
+        self._health.pop(client_id, None)
@@ -0,0 +1,293 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import UUID
+
+from rsa import PrivateKey
+
+from server.artifacts.artifact_manifest import DEFAULT_CHUNK_SIZE, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, build_manifest
+from server.artifacts.artifact_store import ArtifactStore, InvalidDigestError, build_delta, write_file
+from server.artifacts.delta import DEFAULT_BLOCK_SIZE
+from server.network.artifact_messages import ARTIFACT_CHANNEL, ARTIFACT_CHANNEL_PRIORITY, ARTIFACT_CHUNK_SIZE, \
+    ArtifactFetchRequest, ArtifactTransferStart, ArtifactTransferData, ArtifactTransferEnd, ArtifactManifestRequest, \
+    ArtifactManifestResponse, InvalidArtifactMessageError, decode_artifact_message
+from server.network.server_connection_manager import ServerConnectionManager
+from server.network.tcp_client import TCPClient
+from server.utils.crypto_executor import CryptoExecutor, CryptoExecutorSaturatedError
+from server.utils.service import Service
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_TRANSFERS = 64
+# Bounds the deltas a single fetch can have the server look for or build.
+MAX_BASIS_DIGESTS = 8
+
+
+@dataclass
+class ArtifactServerMetrics:
+    active_transfers: int
+    full_transfers: int
+    delta_transfers: int
+    bytes_sent: int
+    # Bytes the hosts would have been sent without deltas.
+    bytes_saved: int
+    deltas_built: int
+    chunk_transfers: int
+    manifests_signed: int
+
+
+class ArtifactServer(Service):
+    """Serves artifacts from the store to hosts that fetch them over their connection.
+
+    A host upgrading names the artifacts it already holds, and if the server has one of them it sends the delta from it
+    instead of the whole artifact. Deltas are built once per pair of artifacts, in a process of their own as the
+    rolling checksum is CPU bound, and kept in the store for every other host making the same upgrade. At most
+    ``max_transfers`` artifacts are sent at once, each one paced by the flow control of its host's connection.
+
+    Hosts that share a network can also swap chunks of an artifact among themselves. The server then signs the manifest
+    they verify those chunks with and sends single chunks, ideally each one only once per network.
+    """
+
+    def __init__(self,
+                 connection_manager: ServerConnectionManager,
+                 artifact_store: ArtifactStore,
+                 crypto_executor: CryptoExecutor,
+                 private_key: PrivateKey,
+                 max_transfers: int = DEFAULT_MAX_TRANSFERS,
+                 block_size: int = DEFAULT_BLOCK_SIZE,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE
+                 ):
+        super().__init__()
+        self._connection_manager = connection_manager
+        self._artifact_store = artifact_store
+        self._crypto_executor = crypto_executor
+        self._private_key = private_key
+        self._transfer_slots = asyncio.Semaphore(max_transfers)
+        self._block_size = block_size
+        self._chunk_size = chunk_size
+        self._delta_executor = None
+        # Deltas being built, hosts asking for the same one meanwhile wait for it instead of building it again.
+        self._delta_builds: dict[Path, asyncio.Future] = {}
+        # Likewise for manifests being hashed and signed, by artifact digest.
+        self._manifest_builds: dict[str, asyncio.Future] = {}
+        self._transfer_tasks: set[asyncio.Task] = set()
+        self._connection_manager.register_client_message_callback(self._on_client_message)
+
+        self._active_transfers = 0
+        self._full_transfers = 0
+        self._delta_transfers = 0
+        self._bytes_sent = 0
+        self._bytes_saved = 0
+        self._deltas_built = 0
+        self._chunk_transfers = 0
+        self._manifests_signed = 0
+
+    async def _start(self):
+        self._delta_executor = ProcessPoolExecutor(1)
+
+    async def _stop(self):
+        for task in list(self._transfer_tasks):
+            task.cancel()
+        await asyncio.gather(*self._transfer_tasks, return_exceptions=True)
+        self._delta_executor.shutdown(cancel_futures=True)
+        self._delta_executor = None
+
+    def get_metrics(self) -> ArtifactServerMetrics:
+        return ArtifactServerMetrics(
+            active_transfers=self._active_transfers,
+            full_transfers=self._full_transfers,
+            delta_transfers=self._delta_transfers,
+            bytes_sent=self._bytes_sent,
+            bytes_saved=self._bytes_saved,
+            deltas_built=self._deltas_built,
+            chunk_transfers=self._chunk_transfers,
+            manifests_signed=self._manifests_signed
+        )
+
+    def _on_client_message(self, client_id: UUID, channel_id: int, payload: bytes):
+        if channel_id != ARTIFACT_CHANNEL or not self.is_running():
+            return
+        try:
+            message = decode_artifact_message(payload)
+        except InvalidArtifactMessageError as e:
+            LOGGER.warning(f"Dropping invalid artifact message from client {client_id}: {e}")
+            return
+        if isinstance(message, ArtifactFetchRequest):
+            serve = self._serve(client_id, message)
+        elif isinstance(message, ArtifactManifestRequest):
+            serve = self._serve_manifest(client_id, message)
+        else:
+            LOGGER.warning(f"Dropping unexpected {type(message).__name__} from client {client_id}.")
+            return
+        task = asyncio.get_running_loop().create_task(serve)
+        self._transfer_tasks.add(task)
+        task.add_done_callback(self._transfer_tasks.discard)
+
+    async def _serve(self, client_id: UUID, fetch_request: ArtifactFetchRequest):
+        async with self._transfer_slots:
+            if not (client := self._connection_manager.get_client(client_id)):
+                return
+            client.open_channel(ARTIFACT_CHANNEL, ARTIFACT_CHANNEL_PRIORITY)
+            try:
+                target_path = self._artifact_store.get_path(fetch_request.digest)
+            except InvalidDigestError:
+                target_path = None
+            if target_path is None:
+                client.write(ArtifactTransferEnd(fetch_request.transfer_id, "Unknown artifact").encode(),
+                             ARTIFACT_CHANNEL)
+                return
+
+            target_size = target_path.stat().st_size
+            if fetch_request.chunk_index is not None:
+                await self._serve_chunk(client, fetch_request, target_path, target_size)
+                return
+
+            transfer_start = ArtifactTransferStart(fetch_request.transfer_id, fetch_request.digest, target_size)
+            path = target_path
+            if delta := await self._get_delta(fetch_request.basis_digests, fetch_request.digest, target_size):
+                transfer_start.basis_digest, path = delta
+                transfer_start.block_size = self._block_size
+
+            self._active_transfers += 1
+            try:
+                if (sent := await self._send(client, transfer_start, path)) is None:
+                    return
+            finally:
+                self._active_transfers -= 1
+            if transfer_start.basis_digest:
+                self._delta_transfers += 1
+                self._bytes_saved += target_size - sent
+            else:
+                self._full_transfers += 1
+
+    async def _serve_chunk(self,
+                           client: TCPClient,
+                           fetch_request: ArtifactFetchRequest,
+                           target_path: Path,
+                           target_size: int
+                           ):
+        chunk_index = fetch_request.chunk_index
+        chunk_size = fetch_request.chunk_size
+        if not isinstance(chunk_index, int) or not isinstance(chunk_size, int) or \
+                not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE or not 0 <= chunk_index * chunk_size < target_size:
+            client.write(ArtifactTransferEnd(fetch_request.transfer_id, "Invalid chunk").encode(), ARTIFACT_CHANNEL)
+            return
+        offset = chunk_index * chunk_size
+        length = min(chunk_size, target_size - offset)
+        transfer_start = ArtifactTransferStart(fetch_request.transfer_id, fetch_request.digest, length)
+        self._active_transfers += 1
+        try:
+            if await self._send(client, transfer_start, target_path, offset, length) is None:
+                return
+        finally:
+            self._active_transfers -= 1
+        self._chunk_transfers += 1
+
+    async def _send(self,
+                    client: TCPClient,
+                    transfer_start: ArtifactTransferStart,
+                    path: Path,
+                    offset: int = 0,
+                    length: int | None = None
+                    ) -> int | None:
+        """Send ``length`` bytes of the file from the offset on, or all of it, returns how many unless cut off."""
+        loop = asyncio.get_running_loop()
+        # Writes after a disconnect would be queued forever.
+        if not client.is_client_authenticated():
+            return None
+        client.write(transfer_start.encode(), ARTIFACT_CHANNEL)
+        sent = 0
+        with open(path, "rb") as file:
+            file.seek(offset)
+            while length is None or sent < length:
+                size = ARTIFACT_CHUNK_SIZE if length is None else min(length - sent, ARTIFACT_CHUNK_SIZE)
+                if not (chunk := await loop.run_in_executor(None, file.read, size)):
+                    break
+                if not client.is_client_authenticated():
+                    return None
+                client.write(ArtifactTransferData(transfer_start.transfer_id, chunk).encode(), ARTIFACT_CHANNEL)
+                sent += len(chunk)
+                self._bytes_sent += len(chunk)
+                await client.drain(ARTIFACT_CHANNEL)
+        if not client.is_client_authenticated():
+            return None
+        client.write(ArtifactTransferEnd(transfer_start.transfer_id).encode(), ARTIFACT_CHANNEL)
+        return sent
+
+    async def _get_delta(self,
+                         basis_digests: list[str],
+                         target_digest: str,
+                         target_size: int
+                         ) -> tuple[str, Path] | None:
+        """Find or build a delta to the target from one of the given artifacts, if it is smaller than the target."""
+        for basis_digest in basis_digests[:MAX_BASIS_DIGESTS]:
+            try:
+                if basis_digest == target_digest or not (basis_path := self._artifact_store.get_path(basis_digest)):
+                    continue
+            except InvalidDigestError:
+                continue
+            delta_path = self._artifact_store.get_delta_path(basis_digest, target_digest, self._block_size)
+            if not delta_path.exists():
+                if not (delta_build := self._delta_builds.get(delta_path)):
+                    delta_build = asyncio.get_running_loop().run_in_executor(
+                        self._delta_executor, build_delta,
+                        basis_path, self._artifact_store.get_object_path(target_digest), delta_path, self._block_size
+                    )
+                    self._delta_builds[delta_path] = delta_build
+                    delta_build.add_done_callback(lambda _, path=delta_path: self._delta_builds.pop(path, None))
+                    self._deltas_built += 1
+                try:
+                    await asyncio.shield(delta_build)
+                except Exception:
+                    LOGGER.exception(f"Failed to build delta from {basis_digest} to {target_digest}.")
+                    continue
+            # Sending artifacts that have little in common as a delta would only add overhead.
+            if delta_path.stat().st_size < target_size:
+                return basis_digest, delta_path
+        return None
+
+    async def _serve_manifest(self, client_id: UUID, manifest_request: ArtifactManifestRequest):
+        try:
+            manifest, signature = await self._get_manifest(manifest_request.digest)
+            response = ArtifactManifestResponse(
+                manifest_request.transfer_id,
+                manifest=manifest,
+                signature=signature
+            )
+        except (InvalidDigestError, FileNotFoundError):
+            response = ArtifactManifestResponse(manifest_request.transfer_id, error="Unknown artifact")
+        except CryptoExecutorSaturatedError:
+            response = ArtifactManifestResponse(manifest_request.transfer_id, error="Server busy")
+        except Exception:
+            LOGGER.exception(f"Failed to build manifest of artifact {manifest_request.digest}.")
+            response = ArtifactManifestResponse(manifest_request.transfer_id, error="Manifest unavailable")
+        if (client := self._connection_manager.get_client(client_id)) and client.is_client_authenticated():
+            client.open_channel(ARTIFACT_CHANNEL, ARTIFACT_CHANNEL_PRIORITY)
+            client.write(response.encode(), ARTIFACT_CHANNEL)
+
+    async def _get_manifest(self, digest: str) -> tuple[bytes, bytes]:
+        """Get the signed manifest of an artifact, hashing and signing it the first time it is asked for."""
+        manifest_path = self._artifact_store.get_manifest_path(digest)
+        signature_path = self._artifact_store.get_manifest_signature_path(digest)
+        if signature_path.exists():
+            return manifest_path.read_bytes(), signature_path.read_bytes()
+        if not (manifest_build := self._manifest_builds.get(digest)):
+            manifest_build = asyncio.get_running_loop().create_task(self._build_manifest(digest))
+            self._manifest_builds[digest] = manifest_build
+            manifest_build.add_done_callback(lambda _: self._manifest_builds.pop(digest, None))
+        return await asyncio.shield(manifest_build)
+
+    async def _build_manifest(self, digest: str) -> tuple[bytes, bytes]:
+        if not (path := self._artifact_store.get_path(digest)):
+            raise FileNotFoundError(f"Artifact {digest} is not stored")
+        loop = asyncio.get_running_loop()
+        manifest = await loop.run_in_executor(None, build_manifest, path, digest, self._chunk_size)
+        manifest = manifest.encode()
+        signature = await self._crypto_executor.sign(manifest, self._private_key)
+        # The signature is written last, a manifest without one is built again.
+        write_file(self._artifact_store.get_manifest_path(digest), manifest)
+        write_file(self._artifact_store.get_manifest_signature_path(digest), signature)
+        self._manifests_signed += 1
+        return manifest, signature
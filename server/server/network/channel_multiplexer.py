@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import struct
+from collections import deque
+from typing import Callable
+
+LOGGER = logging.getLogger(__name__)
+
+# Channel 0 always exists and carries heartbeats and control messages ahead of everything else.
+CONTROL_CHANNEL = 0
+HIGHEST_PRIORITY = 0
+DEFAULT_PRIORITY = 4
+LOWEST_PRIORITY = 7
+
+DEFAULT_WINDOW_SIZE = 256 * 1024
+DEFAULT_CHUNK_SIZE = 16 * 1024
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+# Bounds the memory a peer can make this side spend on channels and partly received messages.
+MAX_CHANNELS = 256
+MAX_INCOMING_SIZE = 64 * 1024 * 1024
+# At most this many bytes are written per event loop iteration, so messages queued meanwhile on a more urgent channel
+# don't have to wait for a whole bulk transfer.
+FLUSH_BUDGET = 64 * 1024
+
+DATA = 0
+WINDOW_UPDATE = 1
+END_OF_MESSAGE = 0x01
+
+# Frame type, flags and channel id, followed by a chunk of a message or a window increment.
+_CHANNEL_HEADER = struct.Struct(">BBH")
+_WINDOW_INCREMENT = struct.Struct(">I")
+
+
+class ChannelError(Exception):
+    """Error to raise if the peer breaks the channel protocol."""
+
+
+class _Channel:
+    def __init__(self, priority: int, window_size: int):
+        self.priority = priority
+        self.send_window = window_size
+        self.outgoing: deque[memoryview] = deque()
+        self.outgoing_offset = 0
+        self.outgoing_size = 0
+        self.incoming: list[bytes] = []
+        self.incoming_size = 0
+        # Bytes received since the peer's window was last extended.
+        self.unacknowledged = 0
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+    def is_sendable(self) -> bool:
+        # Empty messages don't use up any window.
+        return bool(self.outgoing) and (self.send_window > 0 or not self.outgoing[0])
+
+
+class ChannelMultiplexer:
+    """Multiplexes logical channels over a single connection.
+
+    Messages are split into chunks and every write picks the next chunk from the most urgent channel that has data,
+    round robin between channels of the same priority. So a small control message only waits for the chunk in flight,
+    not for a bulk transfer to finish. Each channel also has its own flow control window, the peer extends it as it
+    takes data off the wire, so one busy channel can't use up the buffers of the others.
+
+    Frames are handed to ``write_many``, which is expected to seal and frame them. The connection should call
+    ``pause_writing`` and ``resume_writing`` from its transport's flow control, so chunks queue here, where they can
+    still be reordered, and not in the transport's buffer.
+    """
+
+    def __init__(self,
+                 write_many: Callable[[list[bytes]], None],
+                 window_size: int = DEFAULT_WINDOW_SIZE,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE
+                 ):
+        self._write_many = write_many
+        self._window_size = window_size
+        self._chunk_size = chunk_size
+        self._on_message_callbacks = []
+        self._channels: dict[int, _Channel] = {CONTROL_CHANNEL: _Channel(HIGHEST_PRIORITY, window_size)}
+        self._window_updates: list[bytes] = []
+        self._incoming_size = 0
+        self._paused = False
+        self._closed = False
+        self._flush_handle = None
+
+    def open_channel(self, channel_id: int, priority: int = DEFAULT_PRIORITY) -> None:
+        """Set the priority of the messages sent on a channel, channels are otherwise opened on first use."""
+        if not HIGHEST_PRIORITY <= priority <= LOWEST_PRIORITY:
+            raise ValueError(f"Priority must be between {HIGHEST_PRIORITY} and {LOWEST_PRIORITY}")
+        self._get_channel(channel_id).priority = priority
+
+    def send(self, channel_id: int, payload: bytes) -> None:
+        if len(payload) > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message of {len(payload)} bytes exceeds maximum of {MAX_MESSAGE_SIZE}")
+        channel = self._get_channel(channel_id)
+        channel.outgoing.append(memoryview(payload))
+        channel.outgoing_size += len(payload)
+        if channel.outgoing_size > self._window_size:
+            channel.drained.clear()
+        self._schedule_flush()
+
+    async def drain(self, channel_id: int) -> None:
+        """Wait until at most a window worth of data is queued on a channel."""
+        await self._get_channel(channel_id).drained.wait()
+
+    def get_queued_size(self, channel_id: int) -> int:
+        channel = self._channels.get(channel_id)
+        return channel.outgoing_size if channel else 0
+
+    def register_on_message_callback(self, callback: Callable[[int, bytes], None]):
+        self._on_message_callbacks.append(callback)
+
+    def feed(self, frame: bytes) -> None:
+        """Handle a frame received from the peer."""
+        if len(frame) < _CHANNEL_HEADER.size:
+            raise ChannelError("Frame is too short for a channel header")
+        frame_type, flags, channel_id = _CHANNEL_HEADER.unpack_from(frame)
+        if channel_id not in self._channels and len(self._channels) >= MAX_CHANNELS:
+            raise ChannelError(f"Peer opened more than {MAX_CHANNELS} channels")
+
+        if frame_type == WINDOW_UPDATE:
+            if len(frame) != _CHANNEL_HEADER.size + _WINDOW_INCREMENT.size:
+                raise ChannelError("Window update has an invalid size")
+            (increment,) = _WINDOW_INCREMENT.unpack_from(frame, _CHANNEL_HEADER.size)
+            self._get_channel(channel_id).send_window += increment
+            self._schedule_flush()
+            return
+
+        if frame_type != DATA:
+            raise ChannelError(f"Unknown frame type {frame_type}")
+
+        channel = self._get_channel(channel_id)
+        chunk = frame[_CHANNEL_HEADER.size:]
+        channel.unacknowledged += len(chunk)
+        if channel.unacknowledged > self._window_size:
+            raise ChannelError(f"Peer overran the window of channel {channel_id}")
+        channel.incoming_size += len(chunk)
+        self._incoming_size += len(chunk)
+        if channel.incoming_size > MAX_MESSAGE_SIZE:
+            raise ChannelError(f"Message on channel {channel_id} exceeds maximum of {MAX_MESSAGE_SIZE}")
+        if self._incoming_size > MAX_INCOMING_SIZE:
+            raise ChannelError(f"Partly received messages exceed maximum of {MAX_INCOMING_SIZE}")
+
+        if flags & END_OF_MESSAGE:
+            if channel.incoming:
+                channel.incoming.append(chunk)
+                chunk = b"".join(channel.incoming)
+                channel.incoming = []
+            self._incoming_size -= channel.incoming_size
+            channel.incoming_size = 0
+            for callback in self._on_message_callbacks:
+                callback(channel_id, chunk)
+        else:
+            channel.incoming.append(chunk)
+
+        # Extend the peer's window in batches, not for every chunk.
+        if channel.unacknowledged >= self._window_size // 2:
+            self._window_updates.append(
+                _CHANNEL_HEADER.pack(WINDOW_UPDATE, 0, channel_id) + _WINDOW_INCREMENT.pack(channel.unacknowledged)
+            )
+            channel.unacknowledged = 0
+            self._schedule_flush()
+
+    def pause_writing(self) -> None:
+        self._paused = True
+
+    def resume_writing(self) -> None:
+        self._paused = False
+        self._schedule_flush()
+
+    def close(self) -> None:
+        self._closed = True
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for channel in self._channels.values():
+            channel.outgoing.clear()
+            channel.outgoing_size = 0
+            channel.drained.set()
+
+    def _get_channel(self, channel_id: int) -> _Channel:
+        if not (channel := self._channels.get(channel_id)):
+            if not 0 <= channel_id <= 0xFFFF:
+                raise ValueError(f"Invalid channel id {channel_id}")
+            channel = self._channels[channel_id] = _Channel(DEFAULT_PRIORITY, self._window_size)
+        return channel
+
+    def _schedule_flush(self) -> None:
+        if not self._flush_handle and not self._closed:
+            self._flush_handle = asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        # Window updates are tiny and must go out even while paused, otherwise both sides could wait on each other.
+        frames = self._window_updates
+        self._window_updates = []
+        budget = FLUSH_BUDGET
+        while budget > 0 and not self._paused:
+            channel_id = self._get_next_channel_id()
+            if channel_id is None:
+                break
+            frame = self._take_chunk(channel_id)
+            budget -= len(frame)
+            frames.append(frame)
+
+        if frames:
+            self._write_many(frames)
+        if not self._paused and self._get_next_channel_id() is not None:
+            self._schedule_flush()
+
+    def _get_next_channel_id(self) -> int | None:
+        next_channel_id = None
+        next_priority = LOWEST_PRIORITY + 1
+        for channel_id, channel in self._channels.items():
+            if channel.priority < next_priority and channel.is_sendable():
+                next_channel_id, next_priority = channel_id, channel.priority
+        return next_channel_id
+
+    def _take_chunk(self, channel_id: int) -> bytes:
+        channel = self._channels[channel_id]
+        message = channel.outgoing[0]
+        start = channel.outgoing_offset
+        end = min(len(message), start + self._chunk_size, start + channel.send_window)
+        flags = 0
+        if end == len(message):
+            channel.outgoing.popleft()
+            channel.outgoing_offset = 0
+            flags = END_OF_MESSAGE
+        else:
+            channel.outgoing_offset = end
+
+        channel.send_window -= end - start
+        channel.outgoing_size -= end - start
+        if channel.outgoing_size <= self._window_size:
+            channel.drained.set()
+        # Move the channel behind the others, so channels of the same priority take turns.
+        del self._channels[channel_id]
+        self._channels[channel_id] = channel
+        return _CHANNEL_HEADER.pack(DATA, flags, channel_id) + message[start:end]
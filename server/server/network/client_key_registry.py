@@ -0,0 +1,58 @@
+import logging
+from typing import Callable
+from uuid import UUID
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ClientKeyRegistry:
+    """Binds every client id to the fingerprint of the public key it first authenticated with.
+
+    Beacons are unauthenticated, so a host can claim any client id in them. The first host to prove it holds the key
+    its beacon names gets the client id, from then on the id and the key belong to each other: a host claiming the id
+    with another key, or the key under another id, is turned away. Bindings only go away when released, e.g. when the
+    host is deleted, after which the next host to authenticate under the id gets it.
+    """
+
+    def __init__(self, bindings: dict[UUID, bytes] | None = None):
+        self._key_fingerprints: dict[UUID, bytes] = dict(bindings or {})
+        self._client_ids: dict[bytes, UUID] = {
+            key_fingerprint: client_id for client_id, key_fingerprint in self._key_fingerprints.items()
+        }
+        self._on_bound_callbacks = []
+        self._on_released_callbacks = []
+
+    def register_bound_callback(self, callback: Callable[[UUID, bytes], None]):
+        """Register a callback for when a client id is bound, with the client id and its key fingerprint."""
+        self._on_bound_callbacks.append(callback)
+
+    def register_released_callback(self, callback: Callable[[UUID], None]):
+        """Register a callback for when the binding of a client id is released, with the client id."""
+        self._on_released_callbacks.append(callback)
+
+    def get_client_id(self, key_fingerprint: bytes) -> UUID | None:
+        return self._client_ids.get(key_fingerprint)
+
+    def matches(self, client_id: UUID, key_fingerprint: bytes) -> bool:
+        """Whether a client may claim the id with the key, either both are bound to each other or neither is bound."""
+        return self._key_fingerprints.get(client_id, key_fingerprint) == key_fingerprint and \
+            self._client_ids.get(key_fingerprint, client_id) == client_id
+
+    def bind(self, client_id: UUID, key_fingerprint: bytes) -> bool:
+        """Bind a client id to a key it proved it holds, returns whether the client may use the id with the key."""
+        if not self.matches(client_id, key_fingerprint):
+            return False
+        if client_id not in self._key_fingerprints:
+            LOGGER.debug(f"Binding client {client_id} to its key.")
+            self._key_fingerprints[client_id] = key_fingerprint
+            self._client_ids[key_fingerprint] = client_id
+            for callback in self._on_bound_callbacks:
+                callback(client_id, key_fingerprint)
+        return True
+
+    def release(self, client_id: UUID) -> None:
+        if (key_fingerprint := self._key_fingerprints.pop(client_id, None)) is None:
+            return
+        del self._client_ids[key_fingerprint]
+        for callback in self._on_released_callbacks:
+            callback(client_id)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import AsyncIterator
+from uuid import UUID
+
+from server.network.command_messages import CommandResult
+from server.network.server_connection_manager import ServerConnectionManager
+from server.network.tcp_client import ClientDisconnectedError
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 256
+DEFAULT_TIMEOUT = 30.0
+
+
+class CommandStatus(str, Enum):
+    COMPLETED = "completed"
+    TIMED_OUT = "timed_out"
+    NOT_CONNECTED = "not_connected"
+    FAILED = "failed"
+
+
+@dataclass
+class HostCommandResult:
+    host_id: UUID
+    status: CommandStatus
+    duration: float
+    result: CommandResult | None = None
+
+
+class CommandDispatcher:
+    """Fans a command out to many connected hosts.
+
+    At most ``concurrency`` hosts run the command at once. Results are yielded as soon as each host answers, so a
+    caller can stream them back while slow hosts are still running.
+    """
+
+    def __init__(self,
+                 connection_manager: ServerConnectionManager,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 default_timeout: float = DEFAULT_TIMEOUT
+                 ):
+        self._connection_manager = connection_manager
+        self._max_concurrency = max_concurrency
+        self._default_timeout = default_timeout
+
+    def get_connected_host_ids(self) -> list[UUID]:
+        return self._connection_manager.get_connected_client_ids()
+
+    async def dispatch(self,
+                       host_ids: list[UUID],
+                       command: list[str],
+                       timeout: float | None = None,
+                       concurrency: int | None = None
+                       ) -> AsyncIterator[HostCommandResult]:
+        timeout = timeout or self._default_timeout
+        concurrency = min(concurrency or self._max_concurrency, self._max_concurrency)
+        pending_host_ids = iter(dict.fromkeys(host_ids))
+        # Workers wait for the caller to take results, so a slow reader doesn't make results pile up in memory.
+        results: asyncio.Queue[HostCommandResult | None] = asyncio.Queue(concurrency)
+
+        async def run_worker():
+            for host_id in pending_host_ids:
+                await results.put(await self._run_on_host(host_id, command, timeout))
+            await results.put(None)
+
+        workers = [asyncio.create_task(run_worker()) for _ in range(min(concurrency, len(host_ids)))]
+        running_workers = len(workers)
+        try:
+            while running_workers:
+                if (result := await results.get()) is None:
+                    running_workers -= 1
+                    continue
+                yield result
+        finally:
+            # Stop dispatching if the caller goes away, e.g. when the HTTP client disconnects.
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _run_on_host(self, host_id: UUID, command: list[str], timeout: float) -> HostCommandResult:
+        started_at = time.monotonic()
+        if not (client := self._connection_manager.get_client(host_id)):
+            return HostCommandResult(host_id, CommandStatus.NOT_CONNECTED, 0.0)
+
+        try:
+            result = await client.send_command(command, timeout)
+        except asyncio.TimeoutError:
+            return HostCommandResult(host_id, CommandStatus.TIMED_OUT, time.monotonic() - started_at)
+        except ClientDisconnectedError:
+            return HostCommandResult(host_id, CommandStatus.NOT_CONNECTED, time.monotonic() - started_at)
+        except Exception:
+            LOGGER.exception(f"Failed to run command on {host_id}.")
+            return HostCommandResult(host_id, CommandStatus.FAILED, time.monotonic() - started_at)
+
+        if result.timed_out:
+            status = CommandStatus.TIMED_OUT
+        elif result.error:
+            status = CommandStatus.FAILED
+        else:
+            status = CommandStatus.COMPLETED
+        return HostCommandResult(host_id, status, time.monotonic() - started_at, result)
@@ -0,0 +1,88 @@
+import struct
+from dataclasses import dataclass
+
+from server.network.message_codec import message, tag, encode_message, decode_message, InvalidMessageError
+
+# Channel the server sends commands on and the client answers them on.
+COMMAND_CHANNEL = 1
+# Output beyond this many bytes per stream is dropped by the client, so fanning out to a large fleet stays bounded.
+MAX_COMMAND_OUTPUT_SIZE = 64 * 1024
+
+COMMAND_REQUEST = 1
+COMMAND_RESULT = 2
+COMMAND_CANCEL = 3
+COMMAND_STARTED = 4
+
+# Message kind, followed by the encoded message.
+_KIND = struct.Struct(">B")
+
+
+class InvalidCommandMessageError(Exception):
+    """Error to raise if a command message can't be decoded."""
+
+
+@message
+@dataclass
+class CommandRequest:
+    # Unique per connection, the result of the command carries the same id.
+    command_id: int = tag(1)
+    command: list[str] = tag(2)
+    timeout: float = tag(3)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(COMMAND_REQUEST) + encode_message(self)
+
+
+@message
+@dataclass
+class CommandResult:
+    command_id: int = tag(1)
+    exit_code: int | None = tag(2)
+    stdout: str = tag(3)
+    stderr: str = tag(4)
+    timed_out: bool = tag(5, default=False)
+    error: str | None = tag(6, default=None)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(COMMAND_RESULT) + encode_message(self)
+
+
+@message
+@dataclass
+class CommandCancel:
+    """Sent when the server no longer waits for the result of a command, the client kills it if it is still running."""
+    command_id: int = tag(1)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(COMMAND_CANCEL) + encode_message(self)
+
+
+@message
+@dataclass
+class CommandStarted:
+    """Sent when the client starts running a command, which may have waited for others to complete first."""
+    command_id: int = tag(1)
+
+    def encode(self) -> bytes:
+        return _KIND.pack(COMMAND_STARTED) + encode_message(self)
+
+
+CommandMessage = CommandRequest | CommandResult | CommandCancel | CommandStarted
+
+_MESSAGES = {
+    COMMAND_REQUEST: CommandRequest,
+    COMMAND_RESULT: CommandResult,
+    COMMAND_CANCEL: CommandCancel,
+    COMMAND_STARTED: CommandStarted
+}
+
+
+def decode_command_message(payload: bytes) -> CommandMessage:
+    if not payload:
+        raise InvalidCommandMessageError("Empty command message")
+    if not (message_type := _MESSAGES.get(payload[0])):
+        raise InvalidCommandMessageError(f"Unknown command message kind {payload[0]}")
+    try:
+        return decode_message(message_type, payload, _KIND.size)
+    except InvalidMessageError as e:
+        raise InvalidCommandMessageError(f"Invalid {message_type.__name__}") from e
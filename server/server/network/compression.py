@@ -0,0 +1,293 @@
+import hashlib
+import heapq
+import struct
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+from server.network.artifact_messages import ARTIFACT_CHANNEL
+from server.network.channel_multiplexer import MAX_MESSAGE_SIZE
+
+NO_COMPRESSION = 0
+DEFLATE = 1
+
+DEFAULT_DICTIONARY_SIZE = 16 * 1024
+# Deflate can't look back further than this, only the end of a longer dictionary would be used.
+MAX_DICTIONARY_SIZE = 32 * 1024
+# Dictionaries are files named after their version, e.g. 3.zdict.
+DICTIONARY_SUFFIX = ".zdict"
+MAX_DICTIONARY_VERSION = 0xFFFF
+# Messages shorter than this aren't worth deflating, not even against a dictionary.
+MIN_COMPRESSED_SIZE = 32
+# Channels large transfers go over. Their messages are deflated as one stream per channel, so every message is
+# compressed against the ones before it instead of on its own.
+STREAM_CHANNELS = frozenset({ARTIFACT_CHANNEL})
+# A stream that saves less than this on a message sends the next backoff worth of messages as they are, what goes over
+# it is likely compressed already.
+MIN_STREAM_SAVINGS = 0.1
+STREAM_BACKOFF = 4 * 1024 * 1024
+_MESSAGE_LEVEL = 6
+_STREAM_LEVEL = 1
+
+# Once compression is negotiated every message is sent behind one of these.
+_RAW = 0
+_DEFLATED = 1
+_STREAMED = 2
+_MESSAGE_KIND = struct.Struct(">B")
+
+COMPRESSION_MAGIC = b"PYOZ"
+# A client offers what it can decompress behind the last handshake message it sends, where servers that don't know
+# about compression don't read. An offer is a count of entries and the entries, followed by its length and the magic.
+# Every entry is an algorithm, the version of a dictionary, 0 for none, and the start of the dictionary's SHA-256.
+_OFFER_COUNT = struct.Struct(">B")
+_OFFER_ENTRY = struct.Struct(">BH4s")
+_OFFER_TRAILER = struct.Struct(">H4s")
+# The server answers an offer at the end of its sealed session ticket message, with the algorithm and dictionary version
+# it picked followed by the magic. Picking no compression at all is an answer as well.
+_SELECTION = struct.Struct(">BH4s")
+
+# Dictionaries are trained on strings of this many bytes, in segments of this many bytes.
+_TRAINING_STRING_LENGTH = 8
+_TRAINING_SEGMENT_LENGTH = 48
+
+
+class CompressionError(Exception):
+    """Error to raise if a message can't be decompressed."""
+
+
+@dataclass(frozen=True)
+class Compression:
+    """What the messages of a session are compressed with."""
+    algorithm: int = NO_COMPRESSION
+    dictionary_version: int = 0
+
+    def encode(self) -> bytes:
+        return _SELECTION.pack(self.algorithm, self.dictionary_version, COMPRESSION_MAGIC)
+
+
+class CompressionOptions:
+    """The compression a host supports, with the dictionaries it holds by version.
+
+    Dictionaries have to be the same on both ends of a session, they are only agreed on if their digests match. Versions
+    of a dictionary should never be reused for another one, a newer dictionary gets a higher version.
+    """
+
+    def __init__(self, enabled: bool = True, dictionaries: dict[int, bytes] | None = None):
+        self._enabled = enabled
+        self._dictionaries = dictionaries or {}
+        for version, dictionary in self._dictionaries.items():
+            if not 0 < version <= MAX_DICTIONARY_VERSION:
+                raise ValueError(f"Dictionary version must be between 1 and {MAX_DICTIONARY_VERSION}")
+            if len(dictionary) > MAX_DICTIONARY_SIZE:
+                raise ValueError(f"Dictionary {version} is larger than {MAX_DICTIONARY_SIZE} bytes")
+
+    def encode_offer(self) -> bytes:
+        """Get the offer to append to a handshake message, nothing if compression is disabled."""
+        if not self._enabled:
+            return b""
+        entries = [(DEFLATE, 0, bytes(4))] + [
+            (DEFLATE, version, _get_digest(dictionary)) for version, dictionary in sorted(self._dictionaries.items())
+        ]
+        offer = _OFFER_COUNT.pack(len(entries)) + b"".join(_OFFER_ENTRY.pack(*entry) for entry in entries)
+        return offer + _OFFER_TRAILER.pack(len(offer), COMPRESSION_MAGIC)
+
+    def select(self, offer: bytes | None) -> Compression:
+        """Pick the best compression of an offer this host supports as well, none if there was no offer."""
+        if not self._enabled or offer is None:
+            return Compression()
+        best = Compression()
+        (count,) = _OFFER_COUNT.unpack_from(offer)
+        for index in range(count):
+            algorithm, version, digest = _OFFER_ENTRY.unpack_from(offer, _OFFER_COUNT.size + index * _OFFER_ENTRY.size)
+            if algorithm != DEFLATE:
+                continue
+            dictionary = self._dictionaries.get(version)
+            if version and (dictionary is None or _get_digest(dictionary) != digest):
+                continue
+            if best.algorithm == NO_COMPRESSION or version > best.dictionary_version:
+                best = Compression(algorithm, version)
+        return best
+
+    def is_supported(self, compression: Compression) -> bool:
+        if compression.algorithm == NO_COMPRESSION:
+            return True
+        return self._enabled and compression.algorithm == DEFLATE and \
+            (not compression.dictionary_version or compression.dictionary_version in self._dictionaries)
+
+    def create_compressor(self, compression: Compression) -> "SessionCompressor | None":
+        if compression.algorithm == NO_COMPRESSION:
+            return None
+        return SessionCompressor(self._dictionaries.get(compression.dictionary_version, b""))
+
+
+def split_offer(data: bytes) -> tuple[bytes, bytes | None]:
+    """Split a handshake message from the compression offer behind it, if there is one."""
+    if len(data) < _OFFER_TRAILER.size:
+        return data, None
+    length, magic = _OFFER_TRAILER.unpack_from(data, len(data) - _OFFER_TRAILER.size)
+    end = len(data) - _OFFER_TRAILER.size
+    if magic != COMPRESSION_MAGIC or length > end or length < _OFFER_COUNT.size:
+        return data, None
+    offer = data[end - length:end]
+    if length != _OFFER_COUNT.size + offer[0] * _OFFER_ENTRY.size:
+        return data, None
+    return data[:end - length], offer
+
+
+def split_selection(data: bytes) -> tuple[bytes, Compression | None]:
+    """Split a session ticket message from the compression the server picked behind it, if it picked any."""
+    if len(data) < _SELECTION.size:
+        return data, None
+    algorithm, version, magic = _SELECTION.unpack_from(data, len(data) - _SELECTION.size)
+    if magic != COMPRESSION_MAGIC:
+        return data, None
+    return data[:-_SELECTION.size], Compression(algorithm, version)
+
+
+class _OutgoingStream:
+    def __init__(self):
+        self.compressor = zlib.compressobj(_STREAM_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+        # Bytes to send as they are before trying to compress again.
+        self.backoff = 0
+
+
+class SessionCompressor:
+    """Compresses the messages a session sends and decompresses the ones it receives.
+
+    Messages on most channels are small and have little in them to compress on their own. They are deflated one by one
+    against the dictionary, so whatever they have in common with the traffic it was trained on is shared. Messages on
+    stream channels are deflated as a stream per channel and direction instead, flushed after every message so each
+    one can be decompressed as soon as it arrives. Anything that doesn't get smaller is sent as it is.
+
+    Sensitive messages, which hold secrets such as command arguments or application secrets next to data a peer may
+    influence, are never compressed. How well they compress would show in the length of the sealed message, and leak
+    the secrets to anyone watching the connection.
+    """
+
+    def __init__(self, dictionary: bytes = b""):
+        self._dictionary = dictionary
+        self._outgoing_streams: dict[int, _OutgoingStream] = {}
+        # Decompressors of the streams of the other end, by channel.
+        self._incoming_streams = {}
+
+    def compress(self, channel_id: int, payload: bytes, sensitive: bool = False) -> bytes:
+        if sensitive:
+            return _MESSAGE_KIND.pack(_RAW) + payload
+        if channel_id in STREAM_CHANNELS:
+            return self._compress_streamed(channel_id, payload)
+        if len(payload) >= MIN_COMPRESSED_SIZE:
+            compressor = zlib.compressobj(
+                _MESSAGE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=self._dictionary
+            ) if self._dictionary else zlib.compressobj(_MESSAGE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+            compressed = compressor.compress(payload) + compressor.flush()
+            if len(compressed) < len(payload):
+                return _MESSAGE_KIND.pack(_DEFLATED) + compressed
+        return _MESSAGE_KIND.pack(_RAW) + payload
+
+    def _compress_streamed(self, channel_id: int, payload: bytes) -> bytes:
+        stream = self._outgoing_streams.get(channel_id)
+        if not stream:
+            stream = self._outgoing_streams[channel_id] = _OutgoingStream()
+        if stream.backoff > 0 or len(payload) < MIN_COMPRESSED_SIZE:
+            stream.backoff -= len(payload)
+            return _MESSAGE_KIND.pack(_RAW) + payload
+        compressed = stream.compressor.compress(payload) + stream.compressor.flush(zlib.Z_SYNC_FLUSH)
+        if len(compressed) > len(payload) * (1 - MIN_STREAM_SAVINGS):
+            stream.backoff = STREAM_BACKOFF
+        # Once in the stream, the message has to be sent deflated, the other end needs it to decompress what follows.
+        return _MESSAGE_KIND.pack(_STREAMED) + compressed
+
+    def decompress(self, channel_id: int, payload: bytes) -> bytes:
+        if not payload:
+            raise CompressionError(f"Empty message on channel {channel_id}")
+        kind = payload[0]
+        if kind == _RAW:
+            return payload[_MESSAGE_KIND.size:]
+        if kind == _DEFLATED:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=self._dictionary) \
+                if self._dictionary else zlib.decompressobj(-zlib.MAX_WBITS)
+        elif kind == _STREAMED:
+            decompressor = self._incoming_streams.get(channel_id)
+            if not decompressor:
+                decompressor = self._incoming_streams[channel_id] = zlib.decompressobj(-zlib.MAX_WBITS)
+        else:
+            raise CompressionError(f"Unknown compression {kind} on channel {channel_id}")
+        try:
+            # Nothing may decompress to more than a message can hold.
+            decompressed = decompressor.decompress(payload[_MESSAGE_KIND.size:], MAX_MESSAGE_SIZE)
+        except zlib.error as e:
+            raise CompressionError(f"Could not decompress message on channel {channel_id}: {e}") from e
+        if decompressor.unconsumed_tail:
+            raise CompressionError(f"Message on channel {channel_id} decompresses to over {MAX_MESSAGE_SIZE} bytes")
+        if kind == _DEFLATED and not decompressor.eof:
+            raise CompressionError(f"Truncated message on channel {channel_id}")
+        return decompressed
+
+
+def load_dictionaries(path: Path | None) -> dict[int, bytes]:
+    """Load every dictionary in a directory, by the version in its name. Without a directory there are none."""
+    dictionaries = {}
+    if path is None:
+        return dictionaries
+    for dictionary_path in path.glob(f"*{DICTIONARY_SUFFIX}"):
+        try:
+            version = int(dictionary_path.stem)
+        except ValueError:
+            raise ValueError(f"Dictionary {dictionary_path.name} is not named after its version")
+        dictionaries[version] = dictionary_path.read_bytes()
+    return dictionaries
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = DEFAULT_DICTIONARY_SIZE) -> bytes:
+    """Train a dictionary on samples of messages, e.g. command results and health reports captured from real traffic.
+
+    The dictionary is made of the segments of the samples with the most strings in common with the others. Every string
+    counts once, for the first segment picked that has it. The most common segments go at the end of the dictionary,
+    where deflate reaches them over the shortest distances.
+    """
+    size = min(size, MAX_DICTIONARY_SIZE)
+    samples = [bytes(sample) for sample in samples]
+    # How many of the samples every string is in, strings only in one of them have nothing to share.
+    frequencies = Counter()
+    for sample in samples:
+        frequencies.update({sample[start:start + _TRAINING_STRING_LENGTH]
+                            for start in range(len(sample) - _TRAINING_STRING_LENGTH + 1)})
+
+    def get_score(segment: bytes) -> int:
+        return sum(frequencies[string] for string in _get_strings(segment) if frequencies[string] > 1)
+
+    # Segments overlap by half, so whatever a sample has in common with the others is within one of them.
+    segments = {
+        sample[start:start + _TRAINING_SEGMENT_LENGTH]
+        for sample in samples
+        for start in range(0, max(len(sample) - _TRAINING_SEGMENT_LENGTH, 0) + 1, _TRAINING_SEGMENT_LENGTH // 2)
+    }
+    candidates = [(-get_score(segment), segment) for segment in segments]
+    heapq.heapify(candidates)
+    picked = []
+    picked_size = 0
+    while candidates and picked_size < size:
+        negative_score, segment = heapq.heappop(candidates)
+        # Scores only go down as strings are taken, a segment that still beats the next best one is the best.
+        score = get_score(segment)
+        if not score:
+            break
+        if candidates and score < -candidates[0][0]:
+            heapq.heappush(candidates, (-score, segment))
+            continue
+        picked.append(segment)
+        picked_size += len(segment)
+        for string in _get_strings(segment):
+            frequencies[string] = 0
+    return b"".join(reversed(picked))[-size:]
+
+
+def _get_strings(segment: bytes) -> set[bytes]:
+    return {segment[start:start + _TRAINING_STRING_LENGTH]
+            for start in range(len(segment) - _TRAINING_STRING_LENGTH + 1)}
+
+
+def _get_digest(dictionary: bytes) -> bytes:
+    return hashlib.sha256(dictionary).digest()[:4]
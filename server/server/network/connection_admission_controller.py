@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Hashable
+
+from server.utils.service import Service
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 64
+DEFAULT_MAX_QUEUED = 4096
+DEFAULT_RATE_PER_SOURCE = 1.0
+DEFAULT_BURST_PER_SOURCE = 3
+# Bounds the memory spent on rate limiting when beacons come from many different sources.
+MAX_TRACKED_SOURCES = 65536
+
+
+@dataclass
+class AdmissionMetrics:
+    queue_depth: int
+    in_flight: int
+    admitted: int
+    deduplicated: int
+    rate_limited: int
+    queue_full: int
+    mean_wait_time: float
+    max_wait_time: float
+
+
+@dataclass
+class _AdmissionRequest:
+    key: Hashable
+    establish: Callable[[], Awaitable[None]]
+    queued_at: float
+
+
+class _TokenBucket:
+    def __init__(self, burst: int, now: float):
+        self.tokens = float(burst)
+        self.updated_at = now
+
+
+class ConnectionAdmissionController(Service):
+    """Bounds how many connections are being established at once.
+
+    Connection attempts are queued and run by a fixed number of workers. Attempts for a key that is already queued or
+    in flight are dropped, and each source is rate limited with a token bucket. Once the queue is full new attempts
+    are dropped as well, the clients will broadcast again.
+    """
+
+    def __init__(self,
+                 max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+                 max_queued: int = DEFAULT_MAX_QUEUED,
+                 rate_per_source: float = DEFAULT_RATE_PER_SOURCE,
+                 burst_per_source: int = DEFAULT_BURST_PER_SOURCE
+                 ):
+        super().__init__()
+        self._max_concurrent = max_concurrent
+        self._rate_per_source = rate_per_source
+        self._burst_per_source = burst_per_source
+        self._queue: asyncio.Queue[_AdmissionRequest] = asyncio.Queue(max_queued)
+        self._pending_keys: set[Hashable] = set()
+        self._token_buckets: OrderedDict[Hashable, _TokenBucket] = OrderedDict()
+        self._workers: list[asyncio.Task] = []
+
+        self._in_flight = 0
+        self._admitted = 0
+        self._deduplicated = 0
+        self._rate_limited = 0
+        self._queue_full = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    async def _start(self):
+        self._workers = [asyncio.create_task(self._run_worker()) for _ in range(self._max_concurrent)]
+
+    async def _stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, key: Hashable, source: Hashable, establish: Callable[[], Awaitable[None]]) -> bool:
+        """Queue a connection attempt, returns whether it was admitted to the queue."""
+        if key in self._pending_keys:
+            self._deduplicated += 1
+            return False
+
+        if not self._take_token(source):
+            self._rate_limited += 1
+            return False
+
+        try:
+            self._queue.put_nowait(_AdmissionRequest(key, establish, time.monotonic()))
+        except asyncio.QueueFull:
+            self._queue_full += 1
+            return False
+
+        self._pending_keys.add(key)
+        return True
+
+    def is_pending(self, key: Hashable) -> bool:
+        return key in self._pending_keys
+
+    def get_metrics(self) -> AdmissionMetrics:
+        return AdmissionMetrics(
+            queue_depth=self._queue.qsize(),
+            in_flight=self._in_flight,
+            admitted=self._admitted,
+            deduplicated=self._deduplicated,
+            rate_limited=self._rate_limited,
+            queue_full=self._queue_full,
+            mean_wait_time=self._total_wait_time / self._admitted if self._admitted else 0.0,
+            max_wait_time=self._max_wait_time
+        )
+
+    def _take_token(self, source: Hashable) -> bool:
+        now = time.monotonic()
+        bucket = self._token_buckets.get(source)
+        if bucket:
+            self._token_buckets.move_to_end(source)
+            bucket.tokens = min(self._burst_per_source,
+                                bucket.tokens + (now - bucket.updated_at) * self._rate_per_source)
+            bucket.updated_at = now
+        else:
+            bucket = self._token_buckets[source] = _TokenBucket(self._burst_per_source, now)
+            if len(self._token_buckets) > MAX_TRACKED_SOURCES:
+                self._token_buckets.popitem(last=False)
+
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    async def _run_worker(self):
+        while True:
+            request = await self._queue.get()
+            wait_time = time.monotonic() - request.queued_at
+            self._admitted += 1
+            self._total_wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+
+            self._in_flight += 1
+            try:
+                await request.establish()
+            except Exception:
+                LOGGER.exception(f"Failed to establish connection for {request.key}.")
+            finally:
+                self._in_flight -= 1
+                self._pending_keys.discard(request.key)
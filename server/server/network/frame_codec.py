@@ -0,0 +1,117 @@
+import struct
+from asyncio import WriteTransport
+from typing import Callable, Iterable
+
+# Every frame on the wire is a 4 byte big endian payload length followed by the payload.
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Limit until the peer has authenticated, enough for the keys, challenges and tickets of the handshake. An
+# unauthenticated peer can't make the receiver allocate a buffer for a huge frame it announces.
+MAX_HANDSHAKE_FRAME_SIZE = 64 * 1024
+
+_MIN_READ_SIZE = 64 * 1024
+
+
+class FrameTooLargeError(Exception):
+    """Error to raise if a peer announces a frame larger than the maximum frame size."""
+
+
+def write_frame(transport: WriteTransport, payload: bytes) -> None:
+    transport.writelines((FRAME_HEADER.pack(len(payload)), payload))
+
+
+def write_frames(transport: WriteTransport, payloads: Iterable[bytes]) -> None:
+    """Write many frames to the transport with a single writelines call."""
+    chunks = []
+    for payload in payloads:
+        chunks.append(FRAME_HEADER.pack(len(payload)))
+        chunks.append(payload)
+    if chunks:
+        transport.writelines(chunks)
+
+
+class FrameDecoder:
+    """Reassembles length prefixed frames from a TCP byte stream.
+
+    Designed to back an ``asyncio.BufferedProtocol``: the transport reads straight into the free tail of a reusable
+    buffer, and complete frames are sliced out of it. Bytes are only moved when a partial frame has to be shifted to
+    the front of the buffer to make room, never once per read.
+
+    A decoder created with ``handshake`` set accepts frames up to ``MAX_HANDSHAKE_FRAME_SIZE`` and never reads past the
+    end of the current frame, so the owner can pause reading while it handles a handshake frame and nothing of the
+    next frame is checked against the handshake limit after the peer authenticated. ``end_handshake`` lifts both.
+    """
+
+    def __init__(self,
+                 on_frame: Callable[[bytes], None],
+                 max_frame_size: int = MAX_FRAME_SIZE,
+                 handshake: bool = False):
+        self._on_frame = on_frame
+        self._handshake = handshake
+        self._max_frame_size = MAX_HANDSHAKE_FRAME_SIZE if handshake else max_frame_size
+        self._max_frame_size_after_handshake = max_frame_size
+        self._buffer = bytearray(_MIN_READ_SIZE)
+        self._start = 0
+        self._end = 0
+        # Size of the frame at the front of the buffer including its header, once its header has been read.
+        self._pending_frame_size = 0
+
+    def is_handshake(self) -> bool:
+        return self._handshake
+
+    def end_handshake(self) -> None:
+        self._handshake = False
+        self._max_frame_size = self._max_frame_size_after_handshake
+
+    def get_buffer(self, size_hint: int) -> memoryview:
+        if self._handshake:
+            return self._get_frame_remainder_buffer()
+        required_free = max(size_hint, _MIN_READ_SIZE, self._pending_frame_size - (self._end - self._start))
+        if len(self._buffer) - self._end < required_free:
+            self._make_room(required_free)
+        return memoryview(self._buffer)[self._end:]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self._end += nbytes
+        self._decode_frames()
+
+    def _get_frame_remainder_buffer(self) -> memoryview:
+        # Only whole frames are decoded, so the buffer holds at most the start of the current frame.
+        remaining = (self._pending_frame_size or FRAME_HEADER.size) - (self._end - self._start)
+        if len(self._buffer) - self._end < remaining:
+            self._make_room(remaining)
+        return memoryview(self._buffer)[self._end:self._end + remaining]
+
+    def _decode_frames(self) -> None:
+        buffer = self._buffer
+        while (available := self._end - self._start) >= FRAME_HEADER.size:
+            (frame_length,) = FRAME_HEADER.unpack_from(buffer, self._start)
+            if frame_length > self._max_frame_size:
+                raise FrameTooLargeError(f"Frame of {frame_length} bytes exceeds maximum of {self._max_frame_size}")
+
+            frame_size = FRAME_HEADER.size + frame_length
+            if available < frame_size:
+                self._pending_frame_size = frame_size
+                break
+
+            payload_start = self._start + FRAME_HEADER.size
+            frame = bytes(buffer[payload_start:payload_start + frame_length])
+            self._start += frame_size
+            self._pending_frame_size = 0
+            self._on_frame(frame)
+
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def _make_room(self, required_free: int) -> None:
+        unread = self._end - self._start
+        if len(self._buffer) - unread >= required_free:
+            # Shift the partial frame to the front. The slice assignment keeps the buffer size unchanged, which is
+            # allowed while the transport still holds a view of it.
+            self._buffer[:unread] = self._buffer[self._start:self._end]
+        else:
+            buffer = bytearray(unread + required_free)
+            buffer[:unread] = self._buffer[self._start:self._end]
+            self._buffer = buffer
+        self._start = 0
+        self._end = unread
@@ -0,0 +1,373 @@
+import struct
+import types
+import typing
+from dataclasses import MISSING, field, fields, is_dataclass
+from typing import Any, Callable, TypeVar
+
+# Every encoded message starts with the version of the wire format. Messages evolve within a format by adding fields
+# under new tags, which older releases skip, and by giving every added field a default, which newer releases use when
+# an older one leaves the field out. Tags are never reused for another field or type. Only a change to the encoding
+# itself takes a new format version.
+MESSAGE_FORMAT_VERSION = 1
+
+# Wire types, the lowest 3 bits of every field's key. The rest of the key is the field's tag.
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+
+MAX_TAG = (1 << 28) - 1
+# Values of a map field are encoded as a repeated entry with the key under tag 1 and the value under tag 2.
+_MAP_KEY_TAG = 1
+_MAP_VALUE_TAG = 2
+
+_TAG = "message_codec_tag"
+_DOUBLE = struct.Struct("<d")
+_UNSET = object()
+
+T = TypeVar("T")
+
+
+class InvalidMessageError(Exception):
+    """Error to raise if a message can't be decoded."""
+
+
+class MessageSchemaError(Exception):
+    """Error to raise if a message class can't be encoded, e.g. a field has no tag or a type that isn't supported."""
+
+
+def tag(number: int, default: Any = MISSING, default_factory: Callable[[], Any] = MISSING) -> Any:
+    """Declare the tag a message field is encoded under, for use as the field's default in a message dataclass."""
+    return field(default=default, default_factory=default_factory, metadata={_TAG: number})
+
+
+def message(cls: type[T]) -> type[T]:
+    """Generate the encoder and decoder of a dataclass from its fields' tags and types.
+
+    Fields may be ``int``, ``bool``, ``float``, ``str``, ``bytes`` or another message, optional as ``X | None``,
+    repeated as ``list[X]`` or a ``dict`` of them. Optional fields that are None are left out, repeated fields that are
+    empty take no space at all.
+    """
+    if not is_dataclass(cls):
+        raise MessageSchemaError(f"{cls.__name__} must be a dataclass")
+    hints = typing.get_type_hints(cls)
+    schema = []
+    tags = set()
+    for message_field in fields(cls):
+        if (number := message_field.metadata.get(_TAG)) is None:
+            raise MessageSchemaError(f"Field {cls.__name__}.{message_field.name} has no tag")
+        if not 0 < number <= MAX_TAG or number in tags:
+            raise MessageSchemaError(f"Field {cls.__name__}.{message_field.name} has an invalid or duplicate tag")
+        tags.add(number)
+        schema.append(_Field(message_field.name, number, _resolve(hints[message_field.name]), message_field))
+
+    namespace = {
+        "_DOUBLE": _DOUBLE,
+        "_UNSET": _UNSET,
+        "_write_varint": write_varint,
+        "_read_varint": read_varint,
+        "_skip": _skip,
+        "InvalidMessageError": InvalidMessageError,
+        "cls": cls,
+    }
+    source = _generate_encoder(schema, namespace) + _generate_decoder(cls, schema, namespace)
+    exec(compile(source, f"<message codec of {cls.__qualname__}>", "exec"), namespace)
+    cls._encode_fields = staticmethod(namespace["encode_fields"])
+    cls._decode_fields = staticmethod(namespace["decode_fields"])
+    return cls
+
+
+def encode_message(message_: Any) -> bytes:
+    payload = bytearray((MESSAGE_FORMAT_VERSION,))
+    message_._encode_fields(message_, payload)
+    return bytes(payload)
+
+
+def decode_message(cls: type[T], data: bytes, offset: int = 0) -> T:
+    """Decode a message of a class from the data that starts at an offset and runs to the end."""
+    if offset >= len(data):
+        raise InvalidMessageError("Empty message")
+    if data[offset] != MESSAGE_FORMAT_VERSION:
+        raise InvalidMessageError(f"Unsupported message format version {data[offset]}")
+    try:
+        return cls._decode_fields(data, offset + 1, len(data))
+    except (UnicodeDecodeError, struct.error) as e:
+        raise InvalidMessageError(f"Invalid {cls.__name__}") from e
+
+
+def write_varint(payload: bytearray, value: int) -> None:
+    while value > 0x7F:
+        payload.append(value & 0x7F | 0x80)
+        value >>= 7
+    payload.append(value)
+
+
+def read_varint(data: bytes, offset: int, end: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        if offset >= end:
+            raise InvalidMessageError("Truncated varint")
+        # Nothing is encoded with more than 64 bits.
+        if shift > 63:
+            raise InvalidMessageError("Varint too long")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _skip(data: bytes, offset: int, end: int, wire_type: int) -> int:
+    """Skip the value of a field this release doesn't know."""
+    if wire_type == VARINT:
+        _, offset = read_varint(data, offset, end)
+    elif wire_type == FIXED64:
+        offset += 8
+    elif wire_type == LENGTH_DELIMITED:
+        length, offset = read_varint(data, offset, end)
+        offset += length
+    else:
+        raise InvalidMessageError(f"Unknown wire type {wire_type}")
+    if offset > end:
+        raise InvalidMessageError("Truncated field")
+    return offset
+
+
+class _Type:
+    def __init__(self, scalar: type, optional: bool = False, repeated: bool = False, key: "_Type | None" = None):
+        self.scalar = scalar
+        self.optional = optional
+        self.repeated = repeated
+        # Set for maps, with the scalar as the type of their values.
+        self.key = key
+
+    def get_wire_type(self) -> int:
+        if self.key is not None or self.scalar in (str, bytes) or hasattr(self.scalar, "_decode_fields"):
+            return LENGTH_DELIMITED
+        return FIXED64 if self.scalar is float else VARINT
+
+
+class _Field:
+    def __init__(self, name: str, number: int, field_type: _Type, dataclass_field):
+        self.name = name
+        self.type = field_type
+        self.key = number << 3 | field_type.get_wire_type()
+        self.dataclass_field = dataclass_field
+
+
+def _resolve(hint, allow_containers: bool = True) -> _Type:
+    origin = typing.get_origin(hint)
+    arguments = typing.get_args(hint)
+    if origin in (typing.Union, types.UnionType):
+        inner = [argument for argument in arguments if argument is not type(None)]
+        if len(inner) != 1 or len(arguments) != 2:
+            raise MessageSchemaError(f"Unions other than optional fields are not supported: {hint}")
+        resolved = _resolve(inner[0], allow_containers)
+        resolved.optional = True
+        return resolved
+    if origin is list and allow_containers:
+        return _Type(_resolve(arguments[0], False).scalar, repeated=True)
+    if origin is dict and allow_containers:
+        return _Type(_resolve(arguments[1], False).scalar, key=_resolve(arguments[0], False))
+    if hint in (int, bool, float, str, bytes) or hasattr(hint, "_decode_fields"):
+        return _Type(hint)
+    raise MessageSchemaError(f"Type {hint} is not supported in messages")
+
+
+def _get_key_literal(key: int) -> str:
+    encoded_key = bytearray()
+    write_varint(encoded_key, key)
+    return repr(bytes(encoded_key))
+
+
+def _generate_encode_value(scalar: type, key: int, value: str, out: str, namespace: dict) -> list[str]:
+    key_literal = _get_key_literal(key)
+    if scalar is bool:
+        return [f"{out} += {key_literal}", f"{out}.append(1 if {value} else 0)"]
+    if scalar is int:
+        return [
+            f"{out} += {key_literal}",
+            f"z = {value} << 1 if {value} >= 0 else (-{value} << 1) - 1",
+            f"if z < 0x80:",
+            f"    {out}.append(z)",
+            f"else:",
+            f"    _write_varint({out}, z)",
+        ]
+    if scalar is float:
+        return [f"{out} += {key_literal}", f"{out} += _DOUBLE.pack({value})"]
+    if scalar is str or scalar is bytes:
+        encoded = f"{value}.encode('UTF-8')" if scalar is str else value
+        return [
+            f"b = {encoded}",
+            f"{out} += {key_literal}",
+            f"_write_varint({out}, len(b))",
+            f"{out} += b",
+        ]
+    # Another message, encoded on its own first to know its length.
+    nested = f"_{scalar.__name__}"
+    namespace[nested] = scalar
+    return [
+        f"nested = bytearray()",
+        f"{nested}._encode_fields({value}, nested)",
+        f"{out} += {key_literal}",
+        f"_write_varint({out}, len(nested))",
+        f"{out} += nested",
+    ]
+
+
+def _generate_encoder(schema: list[_Field], namespace: dict) -> str:
+    lines = ["def encode_fields(message, out):"]
+    for message_field in schema:
+        field_type = message_field.type
+        value = f"message.{message_field.name}"
+        if field_type.key is not None:
+            key_key = _MAP_KEY_TAG << 3 | field_type.key.get_wire_type()
+            value_key = _MAP_VALUE_TAG << 3 | _Type(field_type.scalar).get_wire_type()
+            body = [
+                "entry = bytearray()",
+                *_generate_encode_value(field_type.key.scalar, key_key, "k", "entry", namespace),
+                *_generate_encode_value(field_type.scalar, value_key, "v", "entry", namespace),
+                f"out += {_get_key_literal(message_field.key)}",
+                "_write_varint(out, len(entry))",
+                "out += entry",
+            ]
+            lines += [f"    for k, v in {value}.items():"] + [f"        {line}" for line in body]
+        elif field_type.repeated:
+            body = _generate_encode_value(field_type.scalar, message_field.key, "item", "out", namespace)
+            lines += [f"    for item in {value}:"] + [f"        {line}" for line in body]
+        else:
+            body = _generate_encode_value(field_type.scalar, message_field.key, "value", "out", namespace)
+            lines.append(f"    value = {value}")
+            if field_type.optional:
+                lines += ["    if value is not None:"] + [f"        {line}" for line in body]
+            else:
+                lines += [f"    {line}" for line in body]
+    lines.append("    return out")
+    return "\n".join(lines) + "\n"
+
+
+# Reads a varint into z, most values of most fields fit into a single byte.
+_READ_VARINT = [
+    "if offset < end and data[offset] < 0x80:",
+    "    z = data[offset]",
+    "    offset += 1",
+    "else:",
+    "    z, offset = _read_varint(data, offset, end)",
+]
+# Reads the length of a length delimited value, which runs from the offset to stop.
+_READ_LENGTH = _READ_VARINT + [
+    "stop = offset + z",
+    "if stop > end:",
+    "    raise InvalidMessageError('Truncated field')",
+]
+
+
+def _generate_decode_value(scalar: type, target: str, namespace: dict) -> list[str]:
+    """Lines that read a value the key of which was just read, into a target, and move the offset past it."""
+    if scalar is bool:
+        return _READ_VARINT + [f"{target} = z != 0"]
+    if scalar is int:
+        return _READ_VARINT + [f"{target} = z >> 1 if not z & 1 else -((z + 1) >> 1)"]
+    if scalar is float:
+        return [
+            "if offset + 8 > end:",
+            "    raise InvalidMessageError('Truncated field')",
+            f"({target},) = _DOUBLE.unpack_from(data, offset)",
+            "offset += 8",
+        ]
+    lines = list(_READ_LENGTH)
+    if scalar is str:
+        lines.append(f"{target} = str(data[offset:stop], 'UTF-8')")
+    elif scalar is bytes:
+        lines.append(f"{target} = bytes(data[offset:stop])")
+    else:
+        nested = f"_{scalar.__name__}"
+        namespace[nested] = scalar
+        lines.append(f"{target} = {nested}._decode_fields(data, offset, stop)")
+    return lines + ["offset = stop"]
+
+
+def _generate_dispatch(branches: list[tuple[int, list[str]]], indent: str) -> list[str]:
+    """Lines that read a key and run the branch for it, or skip the field if there is none."""
+    lines = [
+        f"{indent}key = data[offset]",
+        f"{indent}offset += 1",
+        f"{indent}if key > 0x7F:",
+        f"{indent}    key, offset = _read_varint(data, offset - 1, end)",
+    ]
+    if not branches:
+        return lines + [f"{indent}offset = _skip(data, offset, end, key & 7)"]
+    keyword = "if"
+    for key, body in branches:
+        lines.append(f"{indent}{keyword} key == {key}:")
+        lines += [f"{indent}    {line}" for line in body]
+        keyword = "elif"
+    return lines + [f"{indent}else:", f"{indent}    offset = _skip(data, offset, end, key & 7)"]
+
+
+def _generate_decoder(cls: type, schema: list[_Field], namespace: dict) -> str:
+    lines = []
+    branches = []
+    arguments = []
+    checks = []
+    for index, message_field in enumerate(schema):
+        field_type = message_field.type
+        local = f"f{index}"
+        dataclass_field = message_field.dataclass_field
+        if field_type.key is not None:
+            # Map entries get a decoder of their own, as if they were a message with a key and a value field.
+            entry_decoder = f"decode_entry_{index}"
+            key_type = field_type.key
+            value_type = _Type(field_type.scalar)
+            entry_lines = [f"def {entry_decoder}(data, offset, end):", "    k = v = _UNSET", "    while offset < end:"]
+            entry_lines += _generate_dispatch([
+                (_MAP_KEY_TAG << 3 | key_type.get_wire_type(), _generate_decode_value(key_type.scalar, "k", namespace)),
+                (_MAP_VALUE_TAG << 3 | value_type.get_wire_type(),
+                 _generate_decode_value(value_type.scalar, "v", namespace)),
+            ], "        ")
+            entry_lines += [
+                "    if k is _UNSET or v is _UNSET:",
+                "        raise InvalidMessageError('Incomplete map entry')",
+                "    return k, v",
+            ]
+            lines += entry_lines
+            initial = "{}"
+            body = _READ_LENGTH + [f"k, v = {entry_decoder}(data, offset, stop)", f"{local}[k] = v", "offset = stop"]
+        elif field_type.repeated:
+            initial = "[]"
+            body = _generate_decode_value(field_type.scalar, "item", namespace) + [f"{local}.append(item)"]
+        else:
+            if dataclass_field.default is not MISSING:
+                namespace[f"_default_{index}"] = dataclass_field.default
+                initial = f"_default_{index}"
+            elif dataclass_field.default_factory is not MISSING:
+                namespace[f"_default_factory_{index}"] = dataclass_field.default_factory
+                initial = f"_default_factory_{index}()"
+            elif field_type.optional:
+                initial = "None"
+            else:
+                initial = "_UNSET"
+                checks += [
+                    f"    if {local} is _UNSET:",
+                    f"        raise InvalidMessageError('{cls.__name__} is missing {message_field.name}')",
+                ]
+            body = _generate_decode_value(field_type.scalar, local, namespace)
+        branches.append((message_field.key, body))
+        arguments.append((local, initial))
+
+    lines.append("def decode_fields(data, offset, end):")
+    lines += [f"    {local} = {initial}" for local, initial in arguments]
+    lines.append("    while offset < end:")
+    lines += _generate_dispatch(branches, "        ")
+    lines += checks
+    lines.append(f"    return cls({', '.join(local for local, _ in arguments)})")
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,17 @@
+import logging
 from abc import ABC
 from dataclasses import dataclass
 from enum import Enum, auto
+from uuid import UUID
 
+from server.network.client_key_registry import ClientKeyRegistry
+from server.network.compression import CompressionOptions, SessionCompressor, Compression, split_offer
+from server.network.discovery_beacon import get_key_fingerprint
 from server.network.server_encryption_manager import ServerEncryptionManager
+from server.utils.crypto_executor import CryptoExecutorSaturatedError
+from server.utils.session_resumption import RESUMPTION_REQUEST, RESUMPTION_ACCEPTED, RESUMPTION_REJECTED
+
+LOGGER = logging.getLogger(__name__)
 
 
 class AuthenticationState(Enum):
@@ -26,9 +35,16 @@ class RespondToChallengeCommand(AuthenticationCommand):
     signed_challenge: bytes
 
 
+@dataclass
+class RejectResumptionCommand(AuthenticationCommand):
+    """Command issued when a session can't be resumed and the client should fall back to a full handshake."""
+    response: bytes = RESUMPTION_REJECTED
+
+
 @dataclass
 class MarkClientAsAuthenticatedCommand(AuthenticationCommand):
-    """Command issued when authentication flow is complete."""
+    """Command issued when authentication flow is complete and the final handshake response should be sent."""
+    response: bytes
 
 
 class AcceptMessageCommand(AuthenticationCommand):
@@ -36,9 +52,22 @@ class AcceptMessageCommand(AuthenticationCommand):
 
 
 class ServerAuthenticationManager:
-    def __init__(self, server_encryption_manager: ServerEncryptionManager):
+    def __init__(self,
+                 server_encryption_manager: ServerEncryptionManager,
+                 compression_options: CompressionOptions | None = None,
+                 expected_key_fingerprint: bytes | None = None,
+                 client_id: UUID | None = None,
+                 client_key_registry: ClientKeyRegistry | None = None
+                 ):
         self._state = AuthenticationState.INITIAL
         self._server_encryption_manager = server_encryption_manager
+        self._compression_options = compression_options or CompressionOptions(enabled=False)
+        # Fingerprint of the key the client announced in its beacon, a client holding another key is rejected.
+        self._expected_key_fingerprint = expected_key_fingerprint
+        # The client id its beacon claims, only granted if it isn't bound to another key.
+        self._client_id = client_id
+        self._client_key_registry = client_key_registry
+        self._compressor: SessionCompressor | None = None
 
     def mark_public_key_as_shared(self):
         if self._state != AuthenticationState.INITIAL:
@@ -46,23 +75,56 @@ class ServerAuthenticationManager:
 
         self._state = AuthenticationState.PUBLIC_KEY_SHARED
 
-    def authenticate_server_message(self, data: bytes) -> AuthenticationCommand:
+    async def authenticate_server_message(self, data: bytes) -> AuthenticationCommand:
+        try:
+            return await self._authenticate_server_message(data)
+        except CryptoExecutorSaturatedError:
+            # Shed load instead of queueing handshakes indefinitely, the client will broadcast again.
+            return RejectConnectionCommand()
+
+    async def _authenticate_server_message(self, data: bytes) -> AuthenticationCommand:
         if self._state == AuthenticationState.INITIAL:
             # We first need to send the client the server's public key. So this means the client does not adhere to the
             # handshake protocol. Reject the connection.
             return RejectConnectionCommand()
 
         elif self._state == AuthenticationState.PUBLIC_KEY_SHARED:
+            # Resume a previous session if the client presents a session ticket instead of a challenge.
+            if data[:1] == RESUMPTION_REQUEST:
+                resumption_request, offer = split_offer(data[1:])
+                compression = self._compression_options.select(offer)
+                if response := self._server_encryption_manager.resume_session(
+                        resumption_request,
+                        self._get_selection(offer, compression)
+                ):
+                    if not self._is_expected_client_key():
+                        return RejectConnectionCommand()
+                    self._compressor = self._compression_options.create_compressor(compression)
+                    self._state = AuthenticationState.AUTHENTICATED
+                    return MarkClientAsAuthenticatedCommand(response=RESUMPTION_ACCEPTED + response)
+                # Stay in the same state, the client will follow up with a challenge.
+                return RejectResumptionCommand()
+
             # Respond to Challenge
-            signed_challenge = self._server_encryption_manager.sign_client_challenge(data)
+            signed_challenge = await self._server_encryption_manager.sign_client_challenge(data)
             self._state = AuthenticationState.CHALLENGE_ANSWERED
             return RespondToChallengeCommand(signed_challenge=signed_challenge)
 
         elif self._state == AuthenticationState.CHALLENGE_ANSWERED:
-            # Got client public key after successfully responding to challenge.
-            self._state = AuthenticationState.AUTHENTICATED
-            self._server_encryption_manager.set_client_public_key(data)
-            return MarkClientAsAuthenticatedCommand()
+            # Got session key and client public key after successfully responding to challenge.
+            key_exchange, offer = split_offer(data)
+            if await self._server_encryption_manager.accept_client_key_exchange(
+                    key_exchange,
+                    data[len(key_exchange):]
+            ) and self._is_expected_client_key():
+                compression = self._compression_options.select(offer)
+                self._compressor = self._compression_options.create_compressor(compression)
+                self._state = AuthenticationState.AUTHENTICATED
+                return MarkClientAsAuthenticatedCommand(
+                    response=self._server_encryption_manager.get_session_ticket_message(
+                        trailer=self._get_selection(offer, compression)
+                    )
+                )
 
         elif self._state == AuthenticationState.AUTHENTICATED:
             # Once server is authenticated we keep treating it as such for the
@@ -72,5 +134,25 @@ class ServerAuthenticationManager:
         # Otherwise always reject.
         return RejectConnectionCommand()
 
+    def _is_expected_client_key(self) -> bool:
+        key_fingerprint = get_key_fingerprint(self._server_encryption_manager.get_client_public_key())
+        if self._expected_key_fingerprint is not None and key_fingerprint != self._expected_key_fingerprint:
+            LOGGER.warning("Client does not hold the key its beacon claims.")
+            return False
+        # Binding happens here, once the client proved it holds the key, and before it is told it is authenticated.
+        if self._client_key_registry and not self._client_key_registry.bind(self._client_id, key_fingerprint):
+            LOGGER.warning(f"Client claims id {self._client_id}, which belongs to another key.")
+            return False
+        return True
+
+    @staticmethod
+    def _get_selection(offer: bytes | None, compression: Compression) -> bytes:
+        # Clients that don't know about compression didn't offer any and wouldn't expect what was picked.
+        return compression.encode() if offer is not None else b""
+
+    def get_compressor(self) -> SessionCompressor | None:
+        """Get what compresses the messages of the session, once the client is authenticated and if it was agreed on."""
+        return self._compressor
+
     def is_client_authenticated(self) -> bool:
         return self._state == AuthenticationState.AUTHENTICATED
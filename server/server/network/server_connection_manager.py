@@ -1,58 +1,197 @@
 import asyncio
-import json
 import logging
 from functools import partial
-from json import JSONDecodeError
+from typing import Callable
+from uuid import UUID
 
 from server.config.config_loader import ServerConfig
+from server.network.client_key_registry import ClientKeyRegistry
+from server.network.compression import CompressionOptions
+from server.network.connection_admission_controller import ConnectionAdmissionController
+from server.network.discovery_beacon import DiscoveryBeacon, InvalidBeaconError
 from server.network.server_authentication_manager import ServerAuthenticationManager
 from server.network.server_encryption_manager import ServerEncryptionManager
-from server.network.tcp_client import TCPClient
+from server.network.session_ticket_manager import SessionTicketManager
+from server.network.shard_membership import ShardMembership
+from server.network.tcp_client import TCPClient, HandshakeFailedError
 from server.network.udp_listener import UDPListener
-from server.utils.encryption_manager import EncryptionManager
+from server.utils.crypto_executor import CryptoExecutor
+from server.utils.service import Service
 
 LOGGER = logging.getLogger(__name__)
 
+# Bounds the memory spent remembering beacons from blacklisted clients.
+MAX_IGNORED_BLACKLISTED_BEACONS = 4096
 
-class ServerConnectionManager:
 
-    def __init__(self, udp_listener: UDPListener, encryption_manager: EncryptionManager, config: ServerConfig):
+class ServerConnectionManager(Service):
+
+    def __init__(self, udp_listener: UDPListener, crypto_executor: CryptoExecutor,
+                 session_ticket_manager: SessionTicketManager, admission_controller: ConnectionAdmissionController,
+                 config: ServerConfig, shard_membership: ShardMembership | None = None,
+                 compression_options: CompressionOptions | None = None,
+                 client_key_registry: ClientKeyRegistry | None = None):
+        super().__init__()
         self._udp_listener = udp_listener
-        self._encryption_manager = encryption_manager
+        self._crypto_executor = crypto_executor
+        self._session_ticket_manager = session_ticket_manager
+        self._admission_controller = admission_controller
         self._config = config
+        self._shard_membership = shard_membership
+        self._compression_options = compression_options
+        self._client_key_registry = client_key_registry or ClientKeyRegistry()
+        if self._shard_membership:
+            self._shard_membership.register_rebalance_callback(self._on_rebalance_callback)
         self._udp_listener.register_on_data_received_callback(self._udp_broadcast_received_callback)
-        self._connections: dict[tuple[str, int], TCPClient] = {}
+        self._on_client_connected_callbacks = []
+        self._on_client_disconnected_callbacks = []
+        self._on_client_message_callbacks = []
+        self._connections: dict[UUID, TCPClient] = {}
+        self._blacklisted_client_ids: set[UUID] = set(config.blacklisted_client_ids)
+        # Raw beacons of connected and blacklisted clients, mapped to their client id. A client's beacon never
+        # changes, so these can be dropped with a single lookup before anything is decoded.
+        self._ignored_beacons: dict[bytes, UUID] = {}
+        self._ignored_blacklisted_beacon_count = 0
 
-    async def start(self):
+    async def _start(self):
+        if self._shard_membership:
+            await self._shard_membership.start()
+        await self._admission_controller.start()
         await self._udp_listener.start()
 
-    async def stop(self):
+    async def _stop(self):
         await self._udp_listener.stop()
-        for client in self._connections.values():
+        await self._admission_controller.stop()
+        if self._shard_membership:
+            await self._shard_membership.stop()
+        # Clients remove themselves from the connections once disconnected.
+        for client in list(self._connections.values()):
             await client.stop()
 
+    def get_connected_client_ids(self) -> list[UUID]:
+        return [client_id for client_id, client in self._connections.items() if client.is_client_authenticated()]
+
+    def get_client(self, client_id: UUID) -> TCPClient | None:
+        """Get the connection to a client, if it is connected and authenticated."""
+        client = self._connections.get(client_id)
+        return client if client and client.is_client_authenticated() else None
+
+    def register_client_connected_callback(self, callback: Callable[[UUID, str], None]):
+        """Register a callback for when a client is connected and verified, with the client id and its address."""
+        self._on_client_connected_callbacks.append(callback)
+
+    def register_client_disconnected_callback(self, callback: Callable[[UUID, str], None]):
+        """Register a callback for when a connected client disconnects, with the client id and its address."""
+        self._on_client_disconnected_callbacks.append(callback)
+
+    def register_client_message_callback(self, callback: Callable[[UUID, int, bytes], None]):
+        """Register a callback for messages from clients, with the client id, the channel id and the message."""
+        self._on_client_message_callbacks.append(callback)
+
+    def blacklist_client(self, client_id: UUID) -> None:
+        """Ignore beacons from a client, under its id or its key, from now on and disconnect it if it is connected."""
+        self._blacklisted_client_ids.add(client_id)
+        if client := self._connections.get(client_id):
+            asyncio.get_running_loop().create_task(client.stop())
+
     def _udp_broadcast_received_callback(self, data: bytes, addr: tuple[str, int]):
-        if addr in self._connections:
+        if data in self._ignored_beacons:
+            return
+
+        try:
+            beacon = DiscoveryBeacon.decode(data)
+        except InvalidBeaconError:
+            return
+
+        if self._is_blacklisted(beacon):
+            self._ignore_blacklisted_beacon(data, beacon.client_id)
             return
+        if beacon.client_id in self._connections:
+            return
+        # Claims of a client id with another key than the one it is bound to, or of a key under another id.
+        if not self._client_key_registry.matches(beacon.client_id, beacon.key_fingerprint):
+            return
+        if self._shard_membership and not self._is_owned(beacon.client_id):
+            return
+
+        # Repeat beacons from a host that is already queued or mid-handshake are dropped by the admission controller.
+        # Attempts are told apart by key as well, so a host claiming an unbound client id can't hold up its owner.
+        self._admission_controller.submit(
+            (beacon.client_id, beacon.key_fingerprint),
+            addr[0],
+            partial(self._establish_connection, data, beacon, addr[0])
+        )
 
+    async def _establish_connection(self, data: bytes, beacon: DiscoveryBeacon, host: str):
+        server_encryption_manager = ServerEncryptionManager(self._config.private_key, self._config.public_key,
+                                                            self._crypto_executor, self._session_ticket_manager)
+        # The beacon is unauthenticated, the handshake only succeeds if the client proves it holds the key the beacon
+        # names and the client id is bound to that key. Only then is its client id trusted.
+        server_authentication_manager = ServerAuthenticationManager(server_encryption_manager,
+                                                                    self._compression_options,
+                                                                    beacon.key_fingerprint,
+                                                                    beacon.client_id,
+                                                                    self._client_key_registry)
+        client = TCPClient(host, beacon.tcp_port, server_authentication_manager, server_encryption_manager)
+        client.register_connection_callback(
+            partial(self._on_client_authenticated, beacon.client_id, data, host, client)
+        )
         try:
-            payload = json.loads(data.decode("utf-8"))
-            tcp_port = payload["port"]
-            server_encryption_manager = ServerEncryptionManager(self._config.private_key, self._config.public_key,
-                                                                self._encryption_manager)
-            server_authentication_manager = ServerAuthenticationManager(server_encryption_manager)
-            client = TCPClient(addr[0], tcp_port, server_authentication_manager, server_encryption_manager)
-            client.register_disconnection_callback(partial(self._handle_tcp_disconnection, addr))
-            loop = asyncio.get_event_loop()
-            loop.create_task(client.start())
-            self._connections[addr] = client
-        except (JSONDecodeError, KeyError) as e:
-            pass
-
-    # TODO, perhaps wait for authentication/abstract connection to complete?
-    def _handle_successful_tcp_connection(self):
-        pass
-
-    def _handle_tcp_disconnection(self, addr: tuple[str, int]):
-        LOGGER.debug(f"Removing {addr} from connections.")
-        self._connections.pop(addr)
+            await asyncio.wait_for(client.start(), self._config.handshake_timeout)
+        except (OSError, HandshakeFailedError, asyncio.TimeoutError) as e:
+            LOGGER.debug(f"Could not connect to {host}:{beacon.tcp_port}: {e!r}")
+            await client.stop()
+            return
+        except asyncio.CancelledError:
+            # Handshaking clients aren't in the connections yet, so stopping the server doesn't close them.
+            await client.stop()
+            raise
+
+        # Ownership may have moved to another shard during the handshake.
+        if self._shard_membership and not self._is_owned(beacon.client_id):
+            await client.stop()
+            return
+
+        if beacon.client_id in self._connections:
+            self._ignored_beacons[data] = beacon.client_id
+            for callback in self._on_client_connected_callbacks:
+                callback(beacon.client_id, host)
+
+    def _on_client_authenticated(self, client_id: UUID, data: bytes, host: str, client: TCPClient, _):
+        # Runs right after the session ticket is sent, before the client can send anything else.
+        client.register_disconnection_callback(partial(self._handle_tcp_disconnection, client_id, data, host))
+        client.register_on_data_received_callback(partial(self._handle_client_message, client_id))
+        self._connections[client_id] = client
+
+    def _is_blacklisted(self, beacon: DiscoveryBeacon) -> bool:
+        # A blacklisted client can't come back under a new client id with the same key.
+        return beacon.client_id in self._blacklisted_client_ids or \
+            self._client_key_registry.get_client_id(beacon.key_fingerprint) in self._blacklisted_client_ids
+
+    def _is_owned(self, client_id: UUID) -> bool:
+        return self._shard_membership.is_settled() and self._shard_membership.owns(client_id)
+
+    def _on_rebalance_callback(self):
+        # Hand clients owned by another shard over by disconnecting them, they start broadcasting again and are picked
+        # up by their new owner.
+        for client_id, client in list(self._connections.items()):
+            if not self._shard_membership.owns(client_id):
+                LOGGER.debug(f"Client {client_id} moved to another shard. Disconnecting...")
+                asyncio.get_running_loop().create_task(client.stop())
+
+    def _ignore_blacklisted_beacon(self, data: bytes, client_id: UUID):
+        if self._ignored_blacklisted_beacon_count >= MAX_IGNORED_BLACKLISTED_BEACONS:
+            return
+        self._ignored_beacons[data] = client_id
+        self._ignored_blacklisted_beacon_count += 1
+
+    def _handle_client_message(self, client_id: UUID, channel_id: int, payload: bytes):
+        for callback in self._on_client_message_callbacks:
+            callback(client_id, channel_id, payload)
+
+    def _handle_tcp_disconnection(self, client_id: UUID, data: bytes, host: str):
+        LOGGER.debug(f"Removing {client_id} from connections.")
+        self._connections.pop(client_id, None)
+        if self._ignored_beacons.pop(data, None):
+            for callback in self._on_client_disconnected_callbacks:
+                callback(client_id, host)
@@ -1,31 +1,121 @@
-from rsa import PublicKey, PrivateKey
+import os
+import struct
 
-from server.utils.encryption_manager import EncryptionManager
+from rsa import PublicKey, PrivateKey, DecryptionError
+from rsa.common import byte_size
+
+from server.network.session_ticket_manager import SessionTicketManager
+from server.utils.crypto_executor import CryptoExecutor
+from server.utils.session_cipher import SessionCipher, SERVER_TO_CLIENT, CLIENT_TO_SERVER, SESSION_KEY_LENGTH
+from server.utils.session_resumption import RESUMPTION_NONCE_LENGTH, SESSION_TICKET_HEADER, \
+    derive_resumed_session_key
+
+# Sent along with the signed challenge, the client signs it in its key exchange so the exchange can't be replayed.
+HANDSHAKE_NONCE_LENGTH = 32
+# The client's signature over its key exchange is prefixed with its length, which depends on the size of its key.
+KEY_EXCHANGE_SIGNATURE_HEADER = struct.Struct(">H")
 
 
 class ServerEncryptionManager:
     def __init__(self,
                  server_private_key: PrivateKey,
                  server_public_key: PublicKey,
-                 encryption_manager: EncryptionManager
+                 crypto_executor: CryptoExecutor,
+                 session_ticket_manager: SessionTicketManager
                  ):
         self._server_private_key = server_private_key
         self._server_public_key = server_public_key
-        self._encryption_manager = encryption_manager
+        self._crypto_executor = crypto_executor
+        self._session_ticket_manager = session_ticket_manager
 
         self._client_public_key = None
+        self._handshake_nonce = None
+        self._session_cipher = None
+        self._resumption_secret = None
 
     def get_server_public_key(self) -> PublicKey:
         return self._server_public_key
 
-    def sign_client_challenge(self, challenge: bytes) -> bytes:
-        return self._encryption_manager.sign(challenge, self._server_private_key)
+    async def sign_client_challenge(self, challenge: bytes) -> bytes:
+        """Sign the client's challenge, followed by a fresh nonce the client has to sign in its key exchange."""
+        self._handshake_nonce = os.urandom(HANDSHAKE_NONCE_LENGTH)
+        return await self._crypto_executor.sign(challenge, self._server_private_key) + self._handshake_nonce
+
+    def get_client_public_key(self) -> PublicKey:
+        return self._client_public_key
 
     def set_client_public_key(self, key: bytes) -> None:
         self._client_public_key = PublicKey.load_pkcs1(key)
 
+    async def accept_client_key_exchange(self, key_exchange: bytes, trailer: bytes = b"") -> bool:
+        """Accept the session key and public key of a client, if the client proved it holds the matching private key.
+
+        The session key is encrypted with the server's public key, followed by the client's signature and its public
+        key. The signature covers the handshake nonce and every other byte the client sent, the trailer included, so
+        the public key can't be swapped for one whose private key the sender doesn't hold.
+        """
+        encrypted_session_key_length = byte_size(self._server_public_key.n)
+        signature_start = encrypted_session_key_length + KEY_EXCHANGE_SIGNATURE_HEADER.size
+        if self._handshake_nonce is None or len(key_exchange) < signature_start:
+            return False
+
+        encrypted_session_key = key_exchange[:encrypted_session_key_length]
+        (signature_length,) = KEY_EXCHANGE_SIGNATURE_HEADER.unpack_from(key_exchange, encrypted_session_key_length)
+        signature = key_exchange[signature_start:signature_start + signature_length]
+        client_public_key = key_exchange[signature_start + signature_length:]
+        try:
+            public_key = PublicKey.load_pkcs1(client_public_key)
+        except ValueError:
+            return False
+
+        if not await self._crypto_executor.verify(
+                self._handshake_nonce + encrypted_session_key + client_public_key + trailer,
+                signature,
+                public_key
+        ):
+            return False
+
+        try:
+            session_key = await self._crypto_executor.decrypt(encrypted_session_key, self._server_private_key)
+        except DecryptionError:
+            return False
+
+        if len(session_key) != SESSION_KEY_LENGTH:
+            return False
+
+        self._client_public_key = public_key
+        self._session_cipher = SessionCipher(session_key, SERVER_TO_CLIENT, CLIENT_TO_SERVER)
+        self._resumption_secret = session_key
+        return True
+
+    def get_session_ticket_message(self, expires_at: int | None = None, trailer: bytes = b"") -> bytes:
+        """Issue a ticket the client can use to resume this session, sealed for the client together with a trailer."""
+        expires_at, ticket = self._session_ticket_manager.issue(
+            self._resumption_secret,
+            self._client_public_key.save_pkcs1(),
+            expires_at
+        )
+        return self._session_cipher.seal(SESSION_TICKET_HEADER.pack(expires_at) + ticket + trailer)
+
+    def resume_session(self, resumption_request: bytes, trailer: bytes = b"") -> bytes | None:
+        """Restore a session from the client nonce and ticket in a resumption request.
+
+        Returns the server nonce followed by a fresh session ticket, or None if the ticket can't be redeemed.
+        """
+        client_nonce = resumption_request[:RESUMPTION_NONCE_LENGTH]
+        redeemed_ticket = self._session_ticket_manager.redeem(resumption_request[RESUMPTION_NONCE_LENGTH:])
+        if len(client_nonce) != RESUMPTION_NONCE_LENGTH or not redeemed_ticket:
+            return None
+
+        server_nonce = os.urandom(RESUMPTION_NONCE_LENGTH)
+        session_key = derive_resumed_session_key(redeemed_ticket.resumption_secret, client_nonce, server_nonce)
+        self._session_cipher = SessionCipher(session_key, SERVER_TO_CLIENT, CLIENT_TO_SERVER)
+        self._resumption_secret = redeemed_ticket.resumption_secret
+        self.set_client_public_key(redeemed_ticket.client_public_key)
+        return server_nonce + self.get_session_ticket_message(redeemed_ticket.expires_at, trailer)
+
     def encrypt_payload_for_client(self, payload: bytes) -> bytes:
-        return self._encryption_manager.encrypt(payload, self._client_public_key)
+        return self._session_cipher.seal(payload)
 
     def decrypt_payload_from_client(self, payload: bytes) -> bytes:
-        return self._encryption_manager.decrypt(payload, self._server_private_key)
+        return self._session_cipher.open(payload)
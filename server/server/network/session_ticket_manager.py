@@ -0,0 +1,78 @@
+import os
+import struct
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+
+DEFAULT_TICKET_LIFETIME = 24 * 60 * 60
+DEFAULT_CACHE_SIZE = 10_000
+
+_TICKET_ID_LENGTH = 16
+_TICKET_NONCE_LENGTH = 12
+# Ticket id, expiry as a unix timestamp and resumption secret, followed by the client's public key.
+_TICKET_CONTENTS = struct.Struct(">16sQ32s")
+
+
+@dataclass
+class RedeemedSessionTicket:
+    resumption_secret: bytes
+    client_public_key: bytes
+    expires_at: int
+
+
+class SessionTicketManager:
+    """Issues and redeems the tickets clients present to resume a session.
+
+    Tickets are sealed with a key that never leaves this process, so they are opaque to clients and can only be
+    redeemed by the server that issued them. The ids of outstanding tickets are kept in a bounded cache: a ticket can
+    only be redeemed once, and the oldest tickets are evicted once the cache is full.
+    """
+
+    def __init__(self, lifetime: int = DEFAULT_TICKET_LIFETIME, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._lifetime = lifetime
+        self._cache_size = cache_size
+        self._aead = ChaCha20Poly1305(ChaCha20Poly1305.generate_key())
+        self._outstanding_tickets: OrderedDict[bytes, int] = OrderedDict()
+
+    def issue(self, resumption_secret: bytes, client_public_key: bytes,
+              expires_at: int | None = None) -> tuple[int, bytes]:
+        """Issue a ticket and return its expiry alongside it.
+
+        Tickets reissued on resumption keep the expiry of the original, so a client still does a full handshake
+        once per lifetime.
+        """
+        if expires_at is None:
+            expires_at = int(time.time()) + self._lifetime
+
+        ticket_id = os.urandom(_TICKET_ID_LENGTH)
+        nonce = os.urandom(_TICKET_NONCE_LENGTH)
+        contents = _TICKET_CONTENTS.pack(ticket_id, expires_at, resumption_secret) + client_public_key
+        ticket = nonce + self._aead.encrypt(nonce, contents, None)
+
+        self._outstanding_tickets[ticket_id] = expires_at
+        while len(self._outstanding_tickets) > self._cache_size:
+            self._outstanding_tickets.popitem(last=False)
+        return expires_at, ticket
+
+    def redeem(self, ticket: bytes) -> RedeemedSessionTicket | None:
+        nonce, sealed_contents = ticket[:_TICKET_NONCE_LENGTH], ticket[_TICKET_NONCE_LENGTH:]
+        try:
+            contents = self._aead.decrypt(nonce, sealed_contents, None)
+        except (InvalidTag, ValueError):
+            return None
+        if len(contents) < _TICKET_CONTENTS.size:
+            return None
+
+        ticket_id, expires_at, resumption_secret = _TICKET_CONTENTS.unpack_from(contents)
+        # Unknown ids were either redeemed already or evicted.
+        if self._outstanding_tickets.pop(ticket_id, None) is None or expires_at <= time.time():
+            return None
+
+        return RedeemedSessionTicket(
+            resumption_secret=resumption_secret,
+            client_public_key=contents[_TICKET_CONTENTS.size:],
+            expires_at=expires_at
+        )
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import socket
+import struct
+import time
+from asyncio import DatagramTransport
+from typing import Callable
+from uuid import UUID
+
+from rsa import PrivateKey
+
+from server.utils.hash_ring import HashRing, DEFAULT_VIRTUAL_NODES
+from server.utils.service import Service
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_HEARTBEAT_INTERVAL = 1.0
+DEFAULT_MEMBER_TIMEOUT = 5.0
+
+HEARTBEAT_MAGIC = b"PYSH"
+HEARTBEAT_VERSION = 2
+HEARTBEAT_ALIVE = 1
+HEARTBEAT_LEAVING = 2
+HEARTBEAT_TAG_LENGTH = 16
+BROADCAST_ADDRESS = "255.255.255.255"
+DEFAULT_MULTICAST_TTL = 1
+
+# Magic, version, kind, shard id and the sender's sequence number, followed by a truncated HMAC-SHA256 tag.
+_HEARTBEAT = struct.Struct(">4sBB16sQ")
+HEARTBEAT_SIZE = _HEARTBEAT.size + HEARTBEAT_TAG_LENGTH
+
+
+def get_shard_secret(private_key: PrivateKey) -> bytes:
+    """Derive the key heartbeats are authenticated with from the server key, which every shard of a fleet shares."""
+    return hashlib.sha256(b"pyot-shard-heartbeat" + private_key.save_pkcs1(format="DER")).digest()
+
+
+class ShardMembership(Service):
+    """Tracks which server shards are alive, and which clients this shard owns.
+
+    Shards send an authenticated heartbeat every ``heartbeat_interval`` seconds, to the ``peers``, to the
+    ``multicast_group``, or broadcast if neither is given. Broadcasts don't leave the local network, shards on other
+    subnets have to be listed as peers or share a multicast group routed between them. Shards on the same host share
+    the port, a heartbeat sent to one of them reaches only one, so they have to find each other by broadcast or
+    multicast. A shard that hasn't been heard
+    from for ``member_timeout`` seconds, by this shard's own clock, or that announced it is leaving, is removed. Clients
+    are assigned to the live shards by consistent hashing of their client id, so a shard joining or leaving only moves
+    its share of them.
+
+    Heartbeats carry a sequence number instead of a timestamp, so shards don't need synchronised clocks. A heartbeat
+    is only accepted if its number is higher than the last one from the same shard, which stops replays of captured
+    heartbeats from keeping a dead shard alive on shards that heard from it. A restarted shard numbers its heartbeats
+    on from its wall clock in milliseconds, which is ahead of any number it sent before.
+    """
+
+    def __init__(self,
+                 shard_id: UUID,
+                 port: int,
+                 secret: bytes,
+                 heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+                 member_timeout: float = DEFAULT_MEMBER_TIMEOUT,
+                 virtual_nodes: int = DEFAULT_VIRTUAL_NODES,
+                 peers: list[tuple[str, int]] | None = None,
+                 multicast_group: str | None = None,
+                 multicast_ttl: int = DEFAULT_MULTICAST_TTL
+                 ):
+        super().__init__()
+        self._shard_id = shard_id
+        self._port = port
+        self._secret = secret
+        self._heartbeat_interval = heartbeat_interval
+        self._member_timeout = member_timeout
+        self._virtual_nodes = virtual_nodes
+        self._multicast_group = multicast_group
+        self._multicast_ttl = multicast_ttl
+        self._destinations = list(peers or [])
+        if multicast_group:
+            self._destinations.append((multicast_group, port))
+        if not self._destinations:
+            self._destinations.append((BROADCAST_ADDRESS, port))
+
+        self._on_rebalance_callbacks = []
+        self._members: dict[UUID, float] = {}
+        # Highest sequence number accepted from every shard heard from, including those that left since.
+        self._sequence_numbers: dict[UUID, int] = {}
+        self._sequence_number = 0
+        self._ring = HashRing([shard_id], virtual_nodes)
+        self._transport = None
+        self._heartbeat_handle = None
+        self._settled_at = 0.0
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _ShardHeartbeatProtocol(self._on_heartbeat_received),
+            local_addr=("0.0.0.0", self._port), reuse_port=True)
+        if self._multicast_group:
+            self._join_multicast_group()
+        self._members = {}
+        self._sequence_number = int(time.time() * 1000)
+        self._ring = HashRing([self._shard_id], self._virtual_nodes)
+        # Until the other shards have been heard from, this shard would claim every client only to hand most of them
+        # over again.
+        self._settled_at = time.monotonic() + 2 * self._heartbeat_interval
+        self._send_heartbeat()
+        LOGGER.info(f"Shard {self._shard_id} joined on port {self._port}")
+
+    async def _stop(self):
+        if self._heartbeat_handle:
+            self._heartbeat_handle.cancel()
+            self._heartbeat_handle = None
+        # Let the other shards take over this shard's clients right away, instead of after the member timeout.
+        self._send(HEARTBEAT_LEAVING)
+        self._transport.close()
+        LOGGER.info(f"Shard {self._shard_id} left.")
+
+    def is_settled(self) -> bool:
+        return time.monotonic() >= self._settled_at
+
+    def owns(self, client_id: UUID) -> bool:
+        return self._ring.get_node(client_id.bytes) == self._shard_id
+
+    def get_shard_ids(self) -> frozenset[UUID]:
+        return self._ring.get_nodes()
+
+    def register_rebalance_callback(self, callback: Callable[[], None]):
+        self._on_rebalance_callbacks.append(callback)
+
+    def _send_heartbeat(self):
+        self._send(HEARTBEAT_ALIVE)
+        now = time.monotonic()
+        expired = [shard_id for shard_id, last_seen in self._members.items() if now - last_seen > self._member_timeout]
+        for shard_id in expired:
+            LOGGER.info(f"Shard {shard_id} timed out.")
+            del self._members[shard_id]
+        if expired:
+            self._rebalance()
+        self._heartbeat_handle = asyncio.get_running_loop().call_later(self._heartbeat_interval, self._send_heartbeat)
+
+    def _join_multicast_group(self):
+        sock = self._transport.get_extra_info("socket")
+        membership = struct.pack("4s4s", socket.inet_aton(self._multicast_group), socket.inet_aton("0.0.0.0"))
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self._multicast_ttl)
+        except OSError:
+            self._transport.close()
+            raise
+        LOGGER.info(f"Joined shard multicast group {self._multicast_group}")
+
+    def _send(self, kind: int):
+        self._sequence_number += 1
+        heartbeat = _HEARTBEAT.pack(HEARTBEAT_MAGIC, HEARTBEAT_VERSION, kind, self._shard_id.bytes,
+                                    self._sequence_number)
+        heartbeat += self._get_tag(heartbeat)
+        for destination in self._destinations:
+            self._transport.sendto(heartbeat, destination)
+
+    def _get_tag(self, heartbeat: bytes) -> bytes:
+        return hmac.new(self._secret, heartbeat, hashlib.sha256).digest()[:HEARTBEAT_TAG_LENGTH]
+
+    def _on_heartbeat_received(self, data: bytes):
+        if len(data) != HEARTBEAT_SIZE:
+            return
+        heartbeat, tag = data[:_HEARTBEAT.size], data[_HEARTBEAT.size:]
+        magic, version, kind, shard_id, sequence_number = _HEARTBEAT.unpack(heartbeat)
+        if magic != HEARTBEAT_MAGIC or version != HEARTBEAT_VERSION:
+            return
+        if not hmac.compare_digest(tag, self._get_tag(heartbeat)):
+            LOGGER.debug("Dropping shard heartbeat with an invalid tag.")
+            return
+
+        shard_id = UUID(bytes=shard_id)
+        if shard_id == self._shard_id:
+            return
+        # Replayed heartbeats could keep a dead shard on the ring, so only newer ones are accepted.
+        if sequence_number <= self._sequence_numbers.get(shard_id, -1):
+            return
+        self._sequence_numbers[shard_id] = sequence_number
+
+        if kind == HEARTBEAT_LEAVING:
+            if self._members.pop(shard_id, None) is not None:
+                LOGGER.info(f"Shard {shard_id} left.")
+                self._rebalance()
+            return
+
+        is_new = shard_id not in self._members
+        self._members[shard_id] = time.monotonic()
+        if is_new:
+            LOGGER.info(f"Shard {shard_id} joined.")
+            self._rebalance()
+
+    def _rebalance(self):
+        self._ring = HashRing([self._shard_id, *self._members], self._virtual_nodes)
+        LOGGER.info(f"Rebalancing clients across {len(self._members) + 1} shards.")
+        for callback in self._on_rebalance_callbacks:
+            callback()
+
+
+class _ShardHeartbeatProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, on_received: Callable[[bytes], None]):
+        self._on_received = on_received
+
+    def connection_made(self, transport: DatagramTransport):
+        sock = transport.get_extra_info("socket")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        self._on_received(data)
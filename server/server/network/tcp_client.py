@@ -1,14 +1,42 @@
 import asyncio
+import itertools
 import logging
-from asyncio import Protocol, BaseTransport
+from asyncio import BufferedProtocol, BaseTransport
+from collections import deque
+from functools import partial
 from typing import Callable
 
 from server.network.server_authentication_manager import ServerAuthenticationManager, RejectConnectionCommand, \
-    AcceptMessageCommand, MarkClientAsAuthenticatedCommand, RespondToChallengeCommand
+    AcceptMessageCommand, MarkClientAsAuthenticatedCommand, RespondToChallengeCommand, RejectResumptionCommand
+from server.network.channel_multiplexer import ChannelMultiplexer, ChannelError, CONTROL_CHANNEL, DEFAULT_PRIORITY
+from server.network.command_messages import COMMAND_CHANNEL, CommandRequest, CommandResult, CommandCancel, \
+    CommandStarted, InvalidCommandMessageError, decode_command_message
+from server.network.compression import SessionCompressor, CompressionError
+from server.network.frame_codec import FrameDecoder, FrameTooLargeError, write_frame, write_frames
 from server.network.server_encryption_manager import ServerEncryptionManager
+from server.utils.session_cipher import SessionCipherError
 
 LOGGER = logging.getLogger(__name__)
 
+# Extra time given to the client to report back on a command that ran into its own timeout.
+COMMAND_TIMEOUT_GRACE = 2.0
+
+
+class HandshakeFailedError(Exception):
+    """Error to raise if the connection closes before the authentication handshake completes."""
+
+
+class ClientDisconnectedError(Exception):
+    """Error to raise if the client is not connected or disconnects before answering a command."""
+
+
+class _PendingCommand:
+    def __init__(self, future: asyncio.Future[CommandResult], timeout: float):
+        self.future = future
+        self.timeout = timeout
+        # Armed once the client started the command, time spent waiting behind the client's other commands is free.
+        self.deadline: asyncio.TimerHandle | None = None
+
 
 class TCPClient:
     def __init__(self, host: str, port: int, server_authentication_manager: ServerAuthenticationManager,
@@ -22,14 +50,30 @@ class TCPClient:
         self._on_disconnected_callbacks = []
         self._on_received_callbacks = []
         self._transport = None
+        self._handshake_frames: deque[bytes] = deque()
+        self._handshake_task = None
+        self._handshake_complete = None
+        self._compressor: SessionCompressor | None = None
+        # Every message after the handshake belongs to a channel.
+        self._multiplexer = ChannelMultiplexer(self._write_sealed_frames)
+        self._multiplexer.register_on_message_callback(self._on_channel_message_received)
+        self._command_ids = itertools.count()
+        # Commands in flight by their id, results are matched to them in whatever order they arrive.
+        self._pending_commands: dict[int, _PendingCommand] = {}
 
     async def start(self):
+        """Connect to the client and wait for the authentication handshake to complete."""
         loop = asyncio.get_running_loop()
+        self._handshake_complete = loop.create_future()
         self._transport, _ = await loop.create_connection(lambda: _TCPClientProtocol(
             self._on_connect_wrapper,
             self._on_disconnect_wrapper,
-            self._on_data_received_wrapper
+            self._on_data_received_wrapper,
+            self._multiplexer.pause_writing,
+            self._multiplexer.resume_writing,
+            self._server_authentication_manager.is_client_authenticated
         ), self._host, self._port)
+        await self._handshake_complete
 
     async def stop(self):
         self._transport: BaseTransport
@@ -39,12 +83,21 @@ class TCPClient:
     def _on_connect_wrapper(self, transport: BaseTransport):
         # Send client the server's public key, to start the authentication handshake.
         self._transport = transport
-        self._transport.write(self._server_encryption_manager.get_server_public_key().save_pkcs1())
+        write_frame(self._transport, self._server_encryption_manager.get_server_public_key().save_pkcs1())
         self._server_authentication_manager.mark_public_key_as_shared()
 
     def _on_disconnect_wrapper(self):
         LOGGER.debug("Peer disconnected.")
         self._transport = None
+        self._multiplexer.close()
+        self._handshake_frames.clear()
+        if self._handshake_task:
+            self._handshake_task.cancel()
+        if self._handshake_complete and not self._handshake_complete.done():
+            self._handshake_complete.set_exception(HandshakeFailedError("Disconnected during authentication handshake"))
+        for pending_command in list(self._pending_commands.values()):
+            if not pending_command.future.done():
+                pending_command.future.set_exception(ClientDisconnectedError("Disconnected before answering command"))
 
         if self._server_authentication_manager.is_client_authenticated():
             for callback in self._on_disconnected_callbacks:
@@ -53,28 +106,151 @@ class TCPClient:
     def _on_data_received_wrapper(self, data: bytes):
         LOGGER.debug(f"Received data: {data}")
 
-        authentication_command = self._server_authentication_manager.authenticate_server_message(data)
-        if isinstance(authentication_command, RejectConnectionCommand):
+        # Once the handshake is done messages are handled inline. Until then the authentication manager needs to await
+        # crypto running off the event loop, so frames are queued and handled in order by a handshake task.
+        if not self._handshake_task and self._server_authentication_manager.is_client_authenticated():
+            self._handle_message(data)
+            return
+
+        # Nothing more is read until the frame is handled, frames after the handshake may exceed the handshake limit.
+        self._transport.pause_reading()
+        self._handshake_frames.append(data)
+        if not self._handshake_task:
+            self._handshake_task = asyncio.get_running_loop().create_task(self._process_handshake_frames())
+
+    async def _process_handshake_frames(self):
+        try:
+            while self._handshake_frames and self._transport:
+                data = self._handshake_frames.popleft()
+                authentication_command = await self._server_authentication_manager.authenticate_server_message(data)
+                if not self._transport:
+                    return
+
+                if isinstance(authentication_command, RejectConnectionCommand):
+                    self._handshake_frames.clear()
+                    self._transport.close()
+                    return
+
+                if isinstance(authentication_command, RespondToChallengeCommand):
+                    write_frame(self._transport, authentication_command.signed_challenge)
+                    continue
+
+                if isinstance(authentication_command, RejectResumptionCommand):
+                    write_frame(self._transport, authentication_command.response)
+                    continue
+
+                # Only notify connection callbacks on challenge success.
+                if isinstance(authentication_command, MarkClientAsAuthenticatedCommand):
+                    LOGGER.debug(f"Client Authenticated")
+                    self._compressor = self._server_authentication_manager.get_compressor()
+                    # Send the client a session ticket, so it can resume the session after a reconnect.
+                    write_frame(self._transport, authentication_command.response)
+                    if not self._handshake_complete.done():
+                        self._handshake_complete.set_result(None)
+                    for callback in self._on_connected_callbacks:
+                        callback(self._transport)
+                    continue
+
+                if isinstance(authentication_command, AcceptMessageCommand):
+                    self._handle_message(data)
+        finally:
+            self._handshake_task = None
+            if self._transport:
+                self._transport.resume_reading()
+
+    def _handle_message(self, data: bytes):
+        # Only notify data callbacks once authenticated.
+        try:
+            decrypted_data = self._server_encryption_manager.decrypt_payload_from_client(data)
+        except SessionCipherError:
+            LOGGER.warning("Could not decrypt payload from client. Disconnecting...")
             self._transport.close()
             return
+        try:
+            self._multiplexer.feed(decrypted_data)
+        except ChannelError as e:
+            LOGGER.warning(f"{e}. Disconnecting...")
+            self._transport.close()
 
-        if isinstance(authentication_command, RespondToChallengeCommand):
-            self._transport.write(authentication_command.signed_challenge)
+    def _on_channel_message_received(self, channel_id: int, payload: bytes):
+        if self._compressor:
+            try:
+                payload = self._compressor.decompress(channel_id, payload)
+            except CompressionError as e:
+                LOGGER.warning(f"{e}. Disconnecting...")
+                self._transport.close()
+                return
+        if channel_id == COMMAND_CHANNEL:
+            self._handle_command_message(payload)
             return
+        for callback in self._on_received_callbacks:
+            callback(channel_id, payload)
 
-        # Only notify connection callbacks on challenge success.
-        if isinstance(authentication_command, MarkClientAsAuthenticatedCommand):
-            LOGGER.debug(f"Client Authenticated")
-            for callback in self._on_connected_callbacks:
-                callback(self._transport)
+    def _handle_command_message(self, payload: bytes):
+        try:
+            command_message = decode_command_message(payload)
+        except InvalidCommandMessageError:
+            LOGGER.warning("Dropping invalid command message from client.")
+            return
+        if not isinstance(command_message, (CommandStarted, CommandResult)):
+            LOGGER.warning(f"Dropping unexpected {type(command_message).__name__} from client.")
             return
+        # Messages about commands that were already given up on are dropped.
+        if not (pending_command := self._pending_commands.get(command_message.command_id)) or \
+                pending_command.future.done():
+            return
+        if isinstance(command_message, CommandResult):
+            pending_command.future.set_result(command_message)
+        elif not pending_command.deadline:
+            pending_command.deadline = asyncio.get_running_loop().call_later(
+                pending_command.timeout + COMMAND_TIMEOUT_GRACE,
+                self._expire_command,
+                command_message.command_id
+            )
 
-        # Only notify data callbacks once authenticated.
-        if isinstance(authentication_command, AcceptMessageCommand):
-            decrypted_data = self._server_encryption_manager.decrypt_payload_from_client(data)
-            # Decrypt Payload
-            for callback in self._on_received_callbacks:
-                callback(decrypted_data)
+    def is_client_authenticated(self) -> bool:
+        return self._transport is not None and self._server_authentication_manager.is_client_authenticated()
+
+    async def send_command(self, command: list[str], timeout: float) -> CommandResult:
+        """Run a command on the client and wait for its result.
+
+        The client kills the command ``timeout`` seconds after it started it. Commands to the same client don't wait
+        for each other, any number of them may be in flight at once. The client runs a limited number at a time and
+        starts the others as those complete.
+        """
+        return await self.start_command(command, timeout)
+
+    def start_command(self, command: list[str], timeout: float) -> asyncio.Future[CommandResult]:
+        """Send a command to the client and get a future of its result, without waiting for the commands before it.
+
+        The future fails with a timeout error if no result arrived shortly after the client should have killed the
+        command, counted from when the client reported it started the command, or with a client disconnected error if
+        the client leaves first. Cancelling the future, or a timeout, cancels the command on the client as well.
+        """
+        if not self.is_client_authenticated():
+            raise ClientDisconnectedError("Client is not connected")
+
+        loop = asyncio.get_running_loop()
+        command_id = next(self._command_ids)
+        future = loop.create_future()
+        self._pending_commands[command_id] = _PendingCommand(future, timeout)
+        future.add_done_callback(partial(self._on_command_done, command_id))
+        self._send(COMMAND_CHANNEL, CommandRequest(command_id, command, timeout).encode(), sensitive=True)
+        return future
+
+    def _expire_command(self, command_id: int):
+        if (pending_command := self._pending_commands.get(command_id)) and not pending_command.future.done():
+            pending_command.future.set_exception(
+                asyncio.TimeoutError(f"Client did not answer command {command_id} in time")
+            )
+
+    def _on_command_done(self, command_id: int, future: asyncio.Future[CommandResult]):
+        if (pending_command := self._pending_commands.pop(command_id, None)) and pending_command.deadline:
+            pending_command.deadline.cancel()
+        # Nobody waits for the result any more, so the client may as well stop running the command.
+        if (future.cancelled() or isinstance(future.exception(), asyncio.TimeoutError)) and \
+                self.is_client_authenticated():
+            self._send(COMMAND_CHANNEL, CommandCancel(command_id).encode())
 
     def register_connection_callback(self, callback: Callable[[BaseTransport], None]):
         self._on_connected_callbacks.append(callback)
@@ -82,29 +258,85 @@ class TCPClient:
     def register_disconnection_callback(self, callback: Callable[[], None]):
         self._on_disconnected_callbacks.append(callback)
 
-    def register_on_data_received_callback(self, callback: Callable[[bytes], None]):
+    def register_on_data_received_callback(self, callback: Callable[[int, bytes], None]):
         self._on_received_callbacks.append(callback)
 
-    def write(self, message: bytes):
-        self._transport.write(message)
+    def open_channel(self, channel_id: int, priority: int = DEFAULT_PRIORITY):
+        """Set the priority of a channel, lower numbers are sent first. Channel 0 is reserved for control messages."""
+        self._multiplexer.open_channel(channel_id, priority)
+
+    def write(self, message: bytes, channel_id: int = CONTROL_CHANNEL, sensitive: bool = False):
+        """Queue a message on a channel, sensitive messages hold secrets and are never compressed."""
+        self._send(channel_id, message, sensitive)
+
+    def write_many(self, messages: list[bytes], channel_id: int = CONTROL_CHANNEL):
+        """Queue many messages on a channel, they are written to the client together."""
+        for message in messages:
+            self._send(channel_id, message)
 
+    def _send(self, channel_id: int, message: bytes, sensitive: bool = False):
+        if self._compressor:
+            message = self._compressor.compress(channel_id, message, sensitive)
+        self._multiplexer.send(channel_id, message)
 
-class _TCPClientProtocol(Protocol):
+    async def drain(self, channel_id: int):
+        """Wait until the client can take more data on a channel, bulk writers should await this between writes."""
+        await self._multiplexer.drain(channel_id)
+
+    def _write_sealed_frames(self, frames: list[bytes]):
+        if self._transport:
+            write_frames(
+                self._transport,
+                [self._server_encryption_manager.encrypt_payload_for_client(frame) for frame in frames]
+            )
+
+
+class _TCPClientProtocol(BufferedProtocol):
     def __init__(self,
                  on_connected: Callable[[BaseTransport], None] | None,
                  on_disconnected: Callable[[], None] | None,
-                 on_received: Callable[[bytes], None] | None):
+                 on_received: Callable[[bytes], None] | None,
+                 on_pause_writing: Callable[[], None] | None = None,
+                 on_resume_writing: Callable[[], None] | None = None,
+                 is_authenticated: Callable[[], bool] | None = None):
         self._on_connected = on_connected
         self._on_disconnected = on_disconnected
         self._on_received = on_received
+        self._on_pause_writing = on_pause_writing
+        self._on_resume_writing = on_resume_writing
+        self._is_authenticated = is_authenticated
+        self._frame_decoder = FrameDecoder(self._on_frame_received, handshake=True)
+        self._transport = None
 
     def connection_made(self, transport: BaseTransport) -> None:
+        self._transport = transport
         if self._on_connected:
             self._on_connected(transport)
 
-    def data_received(self, data: bytes) -> None:
+    def get_buffer(self, sizehint: int) -> memoryview:
+        # Reading is paused while a handshake frame is handled, so the limit is lifted before the next frame is read.
+        if self._frame_decoder.is_handshake() and self._is_authenticated and self._is_authenticated():
+            self._frame_decoder.end_handshake()
+        return self._frame_decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        try:
+            self._frame_decoder.buffer_updated(nbytes)
+        except FrameTooLargeError as e:
+            LOGGER.warning(f"{e}. Disconnecting...")
+            self._transport.close()
+
+    def _on_frame_received(self, frame: bytes) -> None:
         if self._on_received:
-            self._on_received(data)
+            self._on_received(frame)
+
+    def pause_writing(self) -> None:
+        if self._on_pause_writing:
+            self._on_pause_writing()
+
+    def resume_writing(self) -> None:
+        if self._on_resume_writing:
+            self._on_resume_writing()
 
     def connection_lost(self, exc: Exception | None) -> None:
         if self._on_disconnected:
@@ -0,0 +1,98 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable
+from uuid import UUID
+
+from server.network.server_connection_manager import ServerConnectionManager
+from server.network.telemetry_messages import TELEMETRY_CHANNEL, HostInfo, TelemetryDecoder, TelemetrySample, \
+    InvalidTelemetryMessageError
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class TelemetryReceiverMetrics:
+    hosts: int
+    samples: int
+    bytes_received: int
+    invalid: int
+
+
+class TelemetryReceiver:
+    """Decodes the telemetry connected hosts stream and hands it on to whoever registered for it.
+
+    Samples of a host only decode relative to the ones before, a host that sent anything that doesn't decode is ignored
+    until it reconnects and starts over with a keyframe.
+    """
+
+    def __init__(self, connection_manager: ServerConnectionManager):
+        self._connection_manager = connection_manager
+        self._decoders: dict[UUID, TelemetryDecoder] = {}
+        # Hosts that sent something that didn't decode.
+        self._ignored: set[UUID] = set()
+        self._hosts: dict[UUID, str] = {}
+        # A host says what it is as soon as it is authenticated, which may be before it is known to be connected.
+        self._pending_host_infos: dict[UUID, HostInfo] = {}
+        self._on_host_info_callbacks = []
+        self._on_sample_callbacks = []
+        self._samples = 0
+        self._bytes_received = 0
+        self._invalid = 0
+        self._connection_manager.register_client_connected_callback(self._on_client_connected)
+        self._connection_manager.register_client_message_callback(self._on_client_message)
+        self._connection_manager.register_client_disconnected_callback(self._on_client_disconnected)
+
+    def register_host_info_callback(self, callback: Callable[[UUID, str, HostInfo], None]):
+        """Register a callback for when a host said what it is, with its id, address and info."""
+        self._on_host_info_callbacks.append(callback)
+
+    def register_sample_callback(self, callback: Callable[[UUID, TelemetrySample], None]):
+        """Register a callback for every telemetry sample of a host, with its id and the sample."""
+        self._on_sample_callbacks.append(callback)
+
+    def get_metrics(self) -> TelemetryReceiverMetrics:
+        return TelemetryReceiverMetrics(
+            hosts=len(self._decoders),
+            samples=self._samples,
+            bytes_received=self._bytes_received,
+            invalid=self._invalid
+        )
+
+    def _on_client_connected(self, client_id: UUID, host: str):
+        self._hosts[client_id] = host
+        if host_info := self._pending_host_infos.pop(client_id, None):
+            self._notify_host_info(client_id, host, host_info)
+
+    def _on_client_message(self, client_id: UUID, channel_id: int, payload: bytes):
+        if channel_id != TELEMETRY_CHANNEL or client_id in self._ignored:
+            return
+        self._bytes_received += len(payload)
+        decoder = self._decoders.setdefault(client_id, TelemetryDecoder())
+        try:
+            message = decoder.decode(payload)
+        except InvalidTelemetryMessageError as e:
+            LOGGER.warning(f"Ignoring telemetry of client {client_id} until it reconnects: {e}")
+            self._ignored.add(client_id)
+            self._decoders.pop(client_id, None)
+            self._invalid += 1
+            return
+
+        if isinstance(message, HostInfo):
+            if host := self._hosts.get(client_id):
+                self._notify_host_info(client_id, host, message)
+            else:
+                self._pending_host_infos[client_id] = message
+            return
+        self._samples += 1
+        for callback in self._on_sample_callbacks:
+            callback(client_id, message)
+
+    def _notify_host_info(self, client_id: UUID, host: str, host_info: HostInfo):
+        for callback in self._on_host_info_callbacks:
+            callback(client_id, host, host_info)
+
+    def _on_client_disconnected(self, client_id: UUID, host: str):
+        self._decoders.pop(client_id, None)
+        self._ignored.discard(client_id)
+        self._hosts.pop(client_id, None)
+        self._pending_host_infos.pop(client_id, None)
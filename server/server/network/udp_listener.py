@@ -1,41 +1,52 @@
 import asyncio
 import logging
 import socket
+import struct
 from asyncio import DatagramTransport
 from typing import Callable
 
+from server.utils.service import Service
+
 LOGGER = logging.getLogger(__name__)
 
 
-class UDPListener:
-    def __init__(self, port: int, host: str = "0.0.0.0"):
+class UDPListener(Service):
+    """Receives discovery beacons, both broadcast and, if a ``multicast_group`` is given, sent to that group."""
+
+    def __init__(self, port: int, host: str = "0.0.0.0", multicast_group: str | None = None):
+        super().__init__()
         self._host = host
         self._port = port
+        self._multicast_group = multicast_group
         self._on_connected_callbacks = []
         self._on_received_callbacks = []
-        self._task = None
         self._transport = None
 
-    async def start(self):
-        self._task = asyncio.create_task(self._start_broadcast_listener())
-
-    async def _start_broadcast_listener(self):
+    async def _start(self):
         loop = asyncio.get_running_loop()
 
         LOGGER.debug("Starting UDP Broadcast listener.")
         self._transport, _ = await loop.create_datagram_endpoint(
             lambda: _BroadcastListenerProtocol(self._on_connect_wrapper, self._on_data_received_wrapper),
             local_addr=(self._host, self._port), reuse_port=True)
+        if self._multicast_group:
+            self._join_multicast_group()
         LOGGER.info(f"Started UDP Broadcast listener on {self._host}:{self._port}")
 
-        while True:
-            await asyncio.sleep(0)
+    async def _stop(self):
+        self._transport.close()
+        LOGGER.info("Stopped UDP Listener.")
 
-    async def stop(self):
-        if self._transport:
+    def _join_multicast_group(self):
+        sock = self._transport.get_extra_info("socket")
+        interface = "0.0.0.0" if self._host in ("", "0.0.0.0") else self._host
+        membership = struct.pack("4s4s", socket.inet_aton(self._multicast_group), socket.inet_aton(interface))
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        except OSError:
             self._transport.close()
-        self._task.cancel()
-        LOGGER.info("Stopped UDP Listener.")
+            raise
+        LOGGER.info(f"Joined multicast group {self._multicast_group}")
 
     def _on_connect_wrapper(self, transport: DatagramTransport):
         # Close the connection if no more connections are currently accepted
@@ -43,7 +54,8 @@ class UDPListener:
             callback(transport)
 
     def _on_data_received_wrapper(self, data: bytes, addr: tuple[str, int]):
-        LOGGER.debug(f"Got UDP Datagram from {addr[0]}:{addr[1]}")
+        # Lazily formatted, this runs for every datagram.
+        LOGGER.debug("Got UDP Datagram from %s:%s", addr[0], addr[1])
         for callback in self._on_received_callbacks:
             callback(data, addr)
 
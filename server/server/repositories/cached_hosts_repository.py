@@ -0,0 +1,161 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from pydantic import UUID4
+
+from domain.host import Host, HostStatusUpdate
+from domain.host_query import HostFilter, HostOrder, HostPage
+from repositories.hosts_repository import HostsRepository, SQLiteHostsRepository
+
+DEFAULT_MAX_SIZE = 10_000
+DEFAULT_TTL = 60.0
+
+
+@dataclass
+class HostCacheMetrics:
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+
+
+class CachedHostsRepository(HostsRepository):
+    """Read-through cache of hosts in front of the SQLite repository.
+
+    Holds up to ``max_size`` hosts, evicting the least recently used one when full, and for at most ``ttl`` seconds so
+    changes made to the database behind its back are picked up eventually. Writes going through it invalidate the
+    hosts they touch, and status updates are applied to cached hosts in place, so hosts that are polled a lot are read
+    from the database only once per ``ttl``.
+    """
+
+    def __init__(self,
+                 hosts_repository: SQLiteHostsRepository,
+                 max_size: int = DEFAULT_MAX_SIZE,
+                 ttl: float = DEFAULT_TTL
+                 ):
+        self._hosts_repository = hosts_repository
+        self._max_size = max_size
+        self._ttl = ttl
+        # Least recently used first, values are the host and when it expires.
+        self._hosts: OrderedDict[UUID4, tuple[Host, float]] = OrderedDict()
+        # Concurrent misses of the same host share a single read.
+        self._loading: dict[UUID4, asyncio.Task] = {}
+        # Hosts that changed while being read, what was read may be outdated and isn't cached.
+        self._stale_loading: set[UUID4] = set()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    async def get_all(self) -> list[Host]:
+        return await self._hosts_repository.get_all()
+
+    async def get_page(self,
+                       host_filter: HostFilter,
+                       order: HostOrder = HostOrder.LAST_SEEN,
+                       limit: int = 100,
+                       cursor: str | None = None
+                       ) -> HostPage:
+        # Pages depend on every host, they aren't worth caching.
+        return await self._hosts_repository.get_page(host_filter, order, limit, cursor)
+
+    async def get_host(self, host_id: UUID4) -> Host | None:
+        if entry := self._hosts.get(host_id):
+            host, expires_at = entry
+            if expires_at > time.monotonic():
+                self._hosts.move_to_end(host_id)
+                self._hits += 1
+                return host
+            del self._hosts[host_id]
+            self._expirations += 1
+
+        self._misses += 1
+        if not (loading := self._loading.get(host_id)):
+            loading = asyncio.get_running_loop().create_task(self._load_host(host_id))
+            self._loading[host_id] = loading
+        # A cancelled caller must not cancel the read others are waiting on.
+        return await asyncio.shield(loading)
+
+    async def create_host(self, host: Host):
+        await self._hosts_repository.create_host(host)
+        self.invalidate(host.id)
+
+    async def update_host_statuses(self, host_status_updates: list[HostStatusUpdate]):
+        await self._hosts_repository.update_host_statuses(host_status_updates)
+        for host_status_update in host_status_updates:
+            self.refresh_host_status(host_status_update)
+
+    async def update_host_label(self, host_id: UUID4, label: str | None) -> bool:
+        try:
+            return await self._hosts_repository.update_host_label(host_id, label)
+        finally:
+            self.invalidate(host_id)
+
+    async def delete_host(self, host_id: UUID4) -> bool:
+        try:
+            return await self._hosts_repository.delete_host(host_id)
+        finally:
+            self.invalidate(host_id)
+
+    def refresh_host_status(self, host_status_update: HostStatusUpdate) -> None:
+        """Apply a status update to the host if it is cached, e.g. when it connects, before it is written behind."""
+        self._mark_stale(host_status_update.id)
+        if not (entry := self._hosts.get(host_status_update.id)):
+            return
+        host, expires_at = entry
+        update = {
+            "last_known_host": host_status_update.last_known_host,
+            "last_seen": host_status_update.last_seen
+        }
+        if host_status_update.attributes is not None:
+            update["attributes"] = host_status_update.attributes
+        self._hosts[host_status_update.id] = (host.model_copy(update=update), expires_at)
+
+    def invalidate(self, host_id: UUID4) -> None:
+        self._mark_stale(host_id)
+        if self._hosts.pop(host_id, None):
+            self._invalidations += 1
+
+    def clear(self) -> None:
+        self._stale_loading.update(self._loading)
+        self._invalidations += len(self._hosts)
+        self._hosts.clear()
+
+    def get_metrics(self) -> HostCacheMetrics:
+        return HostCacheMetrics(
+            size=len(self._hosts),
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            expirations=self._expirations,
+            invalidations=self._invalidations
+        )
+
+    async def _load_host(self, host_id: UUID4) -> Host | None:
+        try:
+            host = await self._hosts_repository.get_host(host_id)
+        finally:
+            del self._loading[host_id]
+            stale = host_id in self._stale_loading
+            self._stale_loading.discard(host_id)
+        # Hosts that don't exist aren't cached, they may show up with their next status update.
+        if host is not None and not stale:
+            self._put(host)
+        return host
+
+    def _mark_stale(self, host_id: UUID4):
+        if host_id in self._loading:
+            self._stale_loading.add(host_id)
+
+    def _put(self, host: Host):
+        self._hosts[host.id] = (host, time.monotonic() + self._ttl)
+        self._hosts.move_to_end(host.id)
+        while len(self._hosts) > self._max_size:
+            self._hosts.popitem(last=False)
+            self._evictions += 1
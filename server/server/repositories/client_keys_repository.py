@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+from sqlite3 import Connection
+from uuid import UUID
+
+from repositories.sqlite_connection_pool import SQLiteConnectionPool
+
+
+class ClientKeysRepository(ABC):
+    """Repository of the key fingerprint every client id is bound to."""
+
+    @abstractmethod
+    async def get_client_keys(self) -> dict[UUID, bytes]:
+        """Get the key fingerprints of all bound client ids."""
+
+    @abstractmethod
+    async def bind_client_key(self, client_id: UUID, key_fingerprint: bytes):
+        """Bind a client id to a key fingerprint, unless either is bound already."""
+
+    @abstractmethod
+    async def release_client_key(self, client_id: UUID):
+        """Release the binding of a client id."""
+
+
+class SQLiteClientKeysRepository(ClientKeysRepository):
+    def __init__(self, connection_pool: SQLiteConnectionPool):
+        self._connection_pool = connection_pool
+
+    async def get_client_keys(self) -> dict[UUID, bytes]:
+        """Get the key fingerprints of all bound client ids."""
+        return await self._connection_pool.run(self._get_client_keys)
+
+    async def bind_client_key(self, client_id: UUID, key_fingerprint: bytes):
+        """Bind a client id to a key fingerprint, unless either is bound already."""
+        await self._connection_pool.run(self._bind_client_key, client_id, key_fingerprint)
+
+    async def release_client_key(self, client_id: UUID):
+        """Release the binding of a client id."""
+        await self._connection_pool.run(self._release_client_key, client_id)
+
+    @staticmethod
+    def _get_client_keys(connection: Connection) -> dict[UUID, bytes]:
+        return {
+            UUID(client_id): key_fingerprint
+            for client_id, key_fingerprint in connection.execute("SELECT client_id, key_fingerprint FROM client_keys")
+        }
+
+    @staticmethod
+    def _bind_client_key(connection: Connection, client_id: UUID, key_fingerprint: bytes):
+        with connection:
+            connection.execute(
+                "INSERT INTO client_keys(client_id, key_fingerprint) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                (str(client_id), key_fingerprint)
+            )
+
+    @staticmethod
+    def _release_client_key(connection: Connection, client_id: UUID):
+        with connection:
+            connection.execute("DELETE FROM client_keys WHERE client_id = ?", (str(client_id),))
@@ -0,0 +1,207 @@
+import math
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Sequence
+
+from pydantic import UUID4
+
+DEFAULT_MAX_HOSTS = 10_000
+# Seconds every value stands for and how many values are kept at that resolution, finest first. Every sample is added
+# at every resolution, the coarser ones keep history for longer: 15 minutes, 2 hours and a day by default.
+DEFAULT_RESOLUTIONS = ((10, 90), (60, 120), (600, 144))
+
+
+class UnknownMetricError(Exception):
+    """Error to raise if metrics are asked for that the store doesn't keep."""
+
+
+class InvalidRangeError(Exception):
+    """Error to raise if a range is asked for that isn't between two finite times, the start not after the end."""
+
+
+@dataclass
+class HostMetricsStoreMetrics:
+    hosts: int
+    samples: int
+    evictions: int
+
+
+@dataclass
+class HostMetricsRange:
+    # Seconds every value stands for.
+    resolution: int
+    # Unix time the first value starts at, every next one starts a resolution later.
+    start: int
+    # A column of values per metric, NaN where nothing was added.
+    values: dict[str, array]
+
+
+class _Series:
+    """The values of all metrics of a host at one resolution, in a ring of ``capacity`` buckets per metric."""
+
+    def __init__(self, resolution: int, capacity: int, metric_count: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        # Metric after metric, ``capacity`` values each. Bucket n of a metric is at n modulo the capacity.
+        self.values = array("f", [math.nan]) * (capacity * metric_count)
+        # Values are averaged per bucket, the latest bucket is still being added to and isn't in the ring yet.
+        self.bucket: int | None = None
+        self.sums = [0.0] * metric_count
+        self.counts = [0] * metric_count
+
+    def get_first_bucket(self) -> int:
+        return self.bucket - self.capacity + 1
+
+    def add(self, timestamp: float, values: Sequence[float]):
+        bucket = int(timestamp // self.resolution)
+        if self.bucket is None:
+            self.bucket = bucket
+        elif bucket > self.bucket:
+            self._close(bucket)
+        elif bucket < self.bucket:
+            # Whatever the latest bucket already held moved past it.
+            return
+        for metric, value in enumerate(values):
+            if not math.isnan(value):
+                self.sums[metric] += value
+                self.counts[metric] += 1
+
+    def _close(self, bucket: int):
+        # Buckets skipped on the way to the new one had nothing added, what the ring held for them is from a lap ago.
+        skipped = range(self.bucket + 1, self.bucket + 1 + min(bucket - self.bucket - 1, self.capacity))
+        for metric, (total, count) in enumerate(zip(self.sums, self.counts)):
+            column = metric * self.capacity
+            self.values[column + self.bucket % self.capacity] = total / count if count else math.nan
+            for skipped_bucket in skipped:
+                self.values[column + skipped_bucket % self.capacity] = math.nan
+        self.bucket = bucket
+        self.sums = [0.0] * len(self.sums)
+        self.counts = [0] * len(self.counts)
+
+    def get_range(self, first_bucket: int, last_bucket: int, metric: int) -> array:
+        values = array("f")
+        first_bucket = max(first_bucket, self.get_first_bucket())
+        # The latest bucket is taken from what was added to it so far.
+        last_closed_bucket = min(last_bucket, self.bucket - 1)
+        if first_bucket <= last_closed_bucket:
+            column = metric * self.capacity
+            start = column + first_bucket % self.capacity
+            end = column + last_closed_bucket % self.capacity + 1
+            if start < end:
+                values.extend(self.values[start:end])
+            else:
+                values.extend(self.values[start:column + self.capacity])
+                values.extend(self.values[column:end])
+        if first_bucket <= self.bucket <= last_bucket:
+            values.append(self.sums[metric] / self.counts[metric] if self.counts[metric] else math.nan)
+        return values
+
+
+class _HostSeries:
+    def __init__(self, resolutions: Sequence[tuple[int, int]], metric_count: int):
+        self.series = [_Series(resolution, capacity, metric_count) for resolution, capacity in resolutions]
+        # The previous sample, counters are kept as their rate since then.
+        self.timestamp: float | None = None
+        self.values: Sequence[float] = ()
+
+
+class HostMetricsStore:
+    """Keeps the recent history of every host's metrics in memory, in fixed size rings of floats.
+
+    Every metric of a host is kept at each of the ``resolutions``, as the average of what was added during each bucket
+    of that many seconds. Gauges are averaged as they are, counters as their rate per second. The finer resolutions only
+    cover the recent past, older history is only left at the coarser ones. Every host takes the same memory however
+    much was added for it. Up to ``max_hosts`` are kept, the least recently updated one is dropped to make room.
+    """
+
+    def __init__(self,
+                 metrics: Sequence[str],
+                 counters: Iterable[str] = (),
+                 resolutions: Sequence[tuple[int, int]] = DEFAULT_RESOLUTIONS,
+                 max_hosts: int = DEFAULT_MAX_HOSTS
+                 ):
+        if any(resolution <= previous for (previous, _), (resolution, _) in zip(resolutions, resolutions[1:])):
+            raise ValueError("Resolutions must go from finest to coarsest")
+        self._metrics = {metric: index for index, metric in enumerate(metrics)}
+        counters = set(counters)
+        self._counter_indexes = [index for metric, index in self._metrics.items() if metric in counters]
+        self._resolutions = resolutions
+        self._max_hosts = max_hosts
+        # Least recently updated first.
+        self._hosts: OrderedDict[UUID4, _HostSeries] = OrderedDict()
+        self._samples = 0
+        self._evictions = 0
+
+    def get_metric_names(self) -> list[str]:
+        return list(self._metrics)
+
+    def add(self, host_id: UUID4, timestamp: float, values: Sequence[float]) -> None:
+        """Add a sample of every metric of a host, in the order the metrics were given in."""
+        if len(values) != len(self._metrics):
+            raise ValueError(f"Sample has {len(values)} values for {len(self._metrics)} metrics")
+        if host_series := self._hosts.get(host_id):
+            self._hosts.move_to_end(host_id)
+        else:
+            host_series = self._hosts[host_id] = _HostSeries(self._resolutions, len(self._metrics))
+            if len(self._hosts) > self._max_hosts:
+                self._hosts.popitem(last=False)
+                self._evictions += 1
+
+        sample = list(map(float, values))
+        elapsed = timestamp - host_series.timestamp if host_series.timestamp is not None else 0
+        for index in self._counter_indexes:
+            increase = sample[index] - host_series.values[index] if elapsed > 0 else 0
+            # A counter that went back was reset, the host rebooted.
+            sample[index] = increase / elapsed if elapsed > 0 and increase >= 0 else math.nan
+        host_series.timestamp = timestamp
+        host_series.values = values
+        for series in host_series.series:
+            series.add(timestamp, sample)
+        self._samples += 1
+
+    def get_range(self,
+                  host_id: UUID4,
+                  start: float,
+                  end: float,
+                  metrics: Iterable[str] | None = None,
+                  resolution: int | None = None
+                  ) -> HostMetricsRange | None:
+        """Get the values of metrics of a host between two unix times, or None if nothing was added for the host.
+
+        Without a resolution the range comes at the finest one that reaches back to its start, otherwise at the finest
+        one at least as coarse as asked for.
+        """
+        if not (math.isfinite(start) and math.isfinite(end)) or start > end:
+            raise InvalidRangeError(f"Invalid range from {start} to {end}")
+        metrics = list(self._metrics) if metrics is None else list(metrics)
+        if unknown_metrics := [metric for metric in metrics if metric not in self._metrics]:
+            raise UnknownMetricError(f"Unknown metrics {', '.join(unknown_metrics)}")
+        if not (host_series := self._hosts.get(host_id)):
+            return None
+
+        if resolution is None:
+            series = next(
+                (series for series in host_series.series if series.get_first_bucket() * series.resolution <= start),
+                host_series.series[-1]
+            )
+        else:
+            series = next(
+                (series for series in host_series.series if series.resolution >= resolution),
+                host_series.series[-1]
+            )
+        first_bucket = max(int(start // series.resolution), series.get_first_bucket())
+        last_bucket = int(end // series.resolution)
+        return HostMetricsRange(
+            resolution=series.resolution,
+            start=first_bucket * series.resolution,
+            values={
+                metric: series.get_range(first_bucket, last_bucket, self._metrics[metric]) for metric in metrics
+            }
+        )
+
+    def remove(self, host_id: UUID4) -> None:
+        self._hosts.pop(host_id, None)
+
+    def get_metrics(self) -> HostMetricsStoreMetrics:
+        return HostMetricsStoreMetrics(hosts=len(self._hosts), samples=self._samples, evictions=self._evictions)
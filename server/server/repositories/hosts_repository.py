@@ -1,70 +1,319 @@
-from abc import ABC
-from sqlite3 import Cursor
+import base64
+import binascii
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone, timedelta
+from sqlite3 import Connection
+from uuid import UUID
 
 from pydantic import UUID4
 
-from domain.host import Host
+from domain.host import Host, HostStatusUpdate, HostAttributes, ApplicationInstance
+from domain.host_query import HostFilter, HostOrder, HostPage
+from repositories.sqlite_connection_pool import SQLiteConnectionPool
+
+# Hosts are joined with their application instances, so a host comes back as one row per application instance, or a
+# single row with empty application columns if it has none.
+_HOST_COLUMNS = """
+    hosts.id, hosts.label, hosts.last_known_host, hosts.last_seen, hosts.os, hosts.memory, hosts.cpu_cores,
+    application_instances.id, application_instances.application_id, application_instances.version,
+    application_instances.environment, application_instances.secrets
+"""
+_SELECT_HOSTS = f"""
+    SELECT {_HOST_COLUMNS}
+    FROM hosts
+    LEFT JOIN application_instances ON application_instances.host_id = hosts.id
+"""
+# The page of hosts is picked first, so the limit counts hosts rather than joined rows.
+_SELECT_HOST_PAGE = f"""
+    SELECT {_HOST_COLUMNS}
+    FROM (
+        SELECT id, label, last_known_host, last_seen, os, memory, cpu_cores FROM hosts {{where}}
+        ORDER BY {{order_by}} LIMIT ?
+    ) AS hosts
+    LEFT JOIN application_instances ON application_instances.host_id = hosts.id
+    ORDER BY {{order_by}}
+"""
+
+_ORDER_BY = {
+    HostOrder.LAST_SEEN: "hosts.last_seen DESC, hosts.id DESC",
+    HostOrder.ID: "hosts.id"
+}
+
+
+class InvalidCursorError(Exception):
+    """Error to raise if a page cursor wasn't handed out for the requested order."""
+
+
+def _format_timestamp(timestamp: datetime) -> str:
+    # Timestamps are compared as text, so they must all be stored in the same time zone and format.
+    return timestamp.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _encode_cursor(order: HostOrder, host: Host) -> str:
+    key = [str(host.id)] if order is HostOrder.ID else [_format_timestamp(host.last_seen), str(host.id)]
+    return base64.urlsafe_b64encode(json.dumps([order.value, *key]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(order: HostOrder, cursor: str) -> list[str]:
+    try:
+        cursor_order, *key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        # Only accept values that could have been handed out, they end up in the query.
+        UUID(key[-1])
+        if order is HostOrder.LAST_SEEN:
+            datetime.fromisoformat(key[0])
+    except (ValueError, TypeError, IndexError, UnicodeError, binascii.Error) as e:
+        raise InvalidCursorError("Cursor is malformed") from e
+    if cursor_order != order.value or len(key) != (1 if order is HostOrder.ID else 2):
+        raise InvalidCursorError(f"Cursor is not for hosts ordered by {order.value}")
+    return key
+
+
+def _get_filter_conditions(host_filter: HostFilter) -> tuple[list[str], list]:
+    conditions = []
+    parameters = []
+    if host_filter.os is not None:
+        conditions.append("os = ?")
+        parameters.append(host_filter.os)
+    if host_filter.min_memory is not None:
+        conditions.append("memory >= ?")
+        parameters.append(host_filter.min_memory)
+    if host_filter.max_memory is not None:
+        conditions.append("memory <= ?")
+        parameters.append(host_filter.max_memory)
+    if host_filter.min_cpu_cores is not None:
+        conditions.append("cpu_cores >= ?")
+        parameters.append(host_filter.min_cpu_cores)
+    if host_filter.max_cpu_cores is not None:
+        conditions.append("cpu_cores <= ?")
+        parameters.append(host_filter.max_cpu_cores)
+    if host_filter.label_prefix is not None:
+        # A range rather than LIKE, which is case insensitive and so can't use the index.
+        conditions.append("label >= ? AND label < ?")
+        parameters.append(host_filter.label_prefix)
+        parameters.append(host_filter.label_prefix[:-1] + chr(ord(host_filter.label_prefix[-1]) + 1))
+    if host_filter.seen_within is not None:
+        conditions.append("last_seen >= ?")
+        parameters.append(_format_timestamp(datetime.now(timezone.utc) - timedelta(seconds=host_filter.seen_within)))
+    return conditions, parameters
+
+
+def _map_hosts(rows: list[tuple]) -> list[Host]:
+    hosts = []
+    host = None
+    current_host_id = None
+    for row in rows:
+        host_id, label, last_known_host, last_seen, os, memory, cpu_cores = row[:7]
+        # Rows of the same host are adjacent, as they are ordered by host id.
+        if host_id != current_host_id:
+            current_host_id = host_id
+            host = Host(
+                id=host_id,
+                label=label,
+                last_known_host=last_known_host,
+                last_seen=last_seen,
+                attributes=HostAttributes(os=os, memory=memory, cpu_cores=cpu_cores) if os is not None else None,
+                applications=[]
+            )
+            hosts.append(host)
+
+        application_instance_id, application_id, version, environment, secrets = row[7:]
+        if application_instance_id is not None:
+            host.applications.append(ApplicationInstance(
+                id=application_instance_id,
+                application_id=application_id,
+                version=version,
+                environment=json.loads(environment),
+                secrets=json.loads(secrets)
+            ))
+    return hosts
 
 
 class HostsRepository(ABC):
     """Repository to handle CRUD operations on hosts"""
-    # TODO abstract methods
+
+    @abstractmethod
+    async def get_all(self) -> list[Host]:
+        """Get all hosts."""
+
+    @abstractmethod
+    async def get_page(self,
+                       host_filter: HostFilter,
+                       order: HostOrder = HostOrder.LAST_SEEN,
+                       limit: int = 100,
+                       cursor: str | None = None
+                       ) -> HostPage:
+        """Get a page of the hosts matching the filter."""
+
+    @abstractmethod
+    async def get_host(self, host_id: UUID4) -> Host | None:
+        """Get a host by id."""
+
+    @abstractmethod
+    async def create_host(self, host: Host):
+        """Create a host."""
+
+    @abstractmethod
+    async def update_host_statuses(self, host_status_updates: list[HostStatusUpdate]):
+        """Create or update the status of many hosts."""
+
+    @abstractmethod
+    async def update_host_label(self, host_id: UUID4, label: str | None) -> bool:
+        """Set the label of a host, returns whether the host exists."""
+
+    @abstractmethod
+    async def delete_host(self, host_id: UUID4) -> bool:
+        """Delete a host, returns whether the host existed."""
 
 
 class SQLiteHostsRepository(HostsRepository):
-    def __init__(self, sqlite_cursor: Cursor):
-        self._sqlite_cursor = sqlite_cursor
+    def __init__(self, connection_pool: SQLiteConnectionPool):
+        self._connection_pool = connection_pool
 
-    def get_all(self) -> list[Host]:
+    async def get_all(self) -> list[Host]:
         """Get all hosts."""
-        # TODO pagination
-        hosts_res = self._sqlite_cursor.execute(
-            """
-            SELECT id, label, last_known_host, last_seen, os, memory, cpu_cores
-            FROM hosts
-            """
-        )
-        hosts = []
-        for res_tuple in hosts_res.fetchall():
-            pass
-            # TODO map results to host
-        # TODO fetch applications for each host
-        return hosts
-
-    def get_host(self, host_id: UUID4) -> Host | None:
+        return await self._connection_pool.run(self._get_all)
+
+    async def get_page(self,
+                       host_filter: HostFilter,
+                       order: HostOrder = HostOrder.LAST_SEEN,
+                       limit: int = 100,
+                       cursor: str | None = None
+                       ) -> HostPage:
+        """Get a page of the hosts matching the filter.
+
+        Pages are keyed on the last host of the previous page rather than an offset, so a page only reads the rows it
+        returns, and hosts coming and going between requests don't shift later pages.
+        """
+        return await self._connection_pool.run(self._get_page, host_filter, order, limit, cursor)
+
+    async def get_host(self, host_id: UUID4) -> Host | None:
         """Get a host by id."""
-        host_res = self._sqlite_cursor.execute(
-            """
-            SELECT id, label, last_known_host, last_seen, os, memory, cpu_cores
-            FROM hosts
-            WHERE id = ?
-            """,
-            (str(host_id),)
-        )
-        host_res.fetchone()
-        # TODO fetch applications for host
-        return None
+        return await self._connection_pool.run(self._get_host, host_id)
 
-    def create_host(self, host: Host):
+    async def create_host(self, host: Host):
         """Create a host."""
-        create_res = self._sqlite_cursor.execute(
-            """
-            INSERT INTO hosts(id, label, last_known_host, last_seen, os, memory, cpu_cores)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                host.id,
-                host.label,
-                host.last_known_host,
-                host.last_seen,
-                host.attributes.os,
-                host.attributes.memory,
-                host.attributes.cpu_cores
-            )
-        )
+        await self._connection_pool.run(self._create_host, host)
 
-    def update_host(self, host: Host):
+    async def update_host_statuses(self, host_status_updates: list[HostStatusUpdate]):
+        """Create or update the status of many hosts in a single transaction.
+
+        Hosts keep their label, and their attributes if an update doesn't carry any.
+        """
+        await self._connection_pool.run(self._update_host_statuses, host_status_updates)
+
+    async def update_host(self, host: Host):
         """Update a host."""
 
-    def delete_host(self, host_id: UUID4):
-        """Delete a host."""
+    async def update_host_label(self, host_id: UUID4, label: str | None) -> bool:
+        """Set the label of a host, returns whether the host exists."""
+        return await self._connection_pool.run(self._update_host_label, host_id, label)
+
+    async def delete_host(self, host_id: UUID4) -> bool:
+        """Delete a host and its application instances, returns whether the host existed."""
+        return await self._connection_pool.run(self._delete_host, host_id)
+
+    @staticmethod
+    def _get_all(connection: Connection) -> list[Host]:
+        return _map_hosts(connection.execute(_SELECT_HOSTS + "ORDER BY hosts.id").fetchall())
+
+    @staticmethod
+    def _get_page(connection: Connection,
+                  host_filter: HostFilter,
+                  order: HostOrder,
+                  limit: int,
+                  cursor: str | None
+                  ) -> HostPage:
+        conditions, parameters = _get_filter_conditions(host_filter)
+        if cursor is not None:
+            key = _decode_cursor(order, cursor)
+            conditions.append("id > ?" if order is HostOrder.ID else "(last_seen, id) < (?, ?)")
+            parameters.extend(key)
+        query = _SELECT_HOST_PAGE.format(
+            where=f"WHERE {' AND '.join(conditions)}" if conditions else "",
+            order_by=_ORDER_BY[order]
+        )
+        # One host more than asked for tells whether there is a next page.
+        hosts = _map_hosts(connection.execute(query, (*parameters, limit + 1)).fetchall())
+        if len(hosts) <= limit:
+            return HostPage(hosts=hosts, next_cursor=None)
+        hosts.pop()
+        return HostPage(hosts=hosts, next_cursor=_encode_cursor(order, hosts[-1]))
+
+    @staticmethod
+    def _get_host(connection: Connection, host_id: UUID4) -> Host | None:
+        hosts = _map_hosts(connection.execute(_SELECT_HOSTS + "WHERE hosts.id = ?", (str(host_id),)).fetchall())
+        return hosts[0] if hosts else None
+
+    @staticmethod
+    def _create_host(connection: Connection, host: Host):
+        with connection:
+            connection.execute(
+                """
+                INSERT INTO hosts(id, label, last_known_host, last_seen, os, memory, cpu_cores)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    str(host.id),
+                    host.label,
+                    str(host.last_known_host),
+                    _format_timestamp(host.last_seen),
+                    host.attributes.os if host.attributes else None,
+                    host.attributes.memory if host.attributes else None,
+                    host.attributes.cpu_cores if host.attributes else None
+                )
+            )
+            connection.executemany(
+                """
+                INSERT INTO application_instances(id, host_id, application_id, version, environment, secrets)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        str(application_instance.id),
+                        str(host.id),
+                        str(application_instance.application_id),
+                        application_instance.version,
+                        json.dumps(application_instance.environment),
+                        json.dumps(application_instance.secrets)
+                    )
+                    for application_instance in host.applications
+                ]
+            )
+
+    @staticmethod
+    def _update_host_label(connection: Connection, host_id: UUID4, label: str | None) -> bool:
+        with connection:
+            return connection.execute("UPDATE hosts SET label = ? WHERE id = ?", (label, str(host_id))).rowcount > 0
+
+    @staticmethod
+    def _delete_host(connection: Connection, host_id: UUID4) -> bool:
+        with connection:
+            return connection.execute("DELETE FROM hosts WHERE id = ?", (str(host_id),)).rowcount > 0
+
+    @staticmethod
+    def _update_host_statuses(connection: Connection, host_status_updates: list[HostStatusUpdate]):
+        with connection:
+            connection.executemany(
+                """
+                INSERT INTO hosts(id, last_known_host, last_seen, os, memory, cpu_cores)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    last_known_host = excluded.last_known_host,
+                    last_seen = excluded.last_seen,
+                    os = COALESCE(excluded.os, hosts.os),
+                    memory = CASE WHEN excluded.os IS NULL THEN hosts.memory ELSE excluded.memory END,
+                    cpu_cores = CASE WHEN excluded.os IS NULL THEN hosts.cpu_cores ELSE excluded.cpu_cores END
+                """,
+                [
+                    (
+                        str(update.id),
+                        str(update.last_known_host),
+                        _format_timestamp(update.last_seen),
+                        update.attributes.os if update.attributes else None,
+                        update.attributes.memory if update.attributes else None,
+                        update.attributes.cpu_cores if update.attributes else None
+                    )
+                    for update in host_status_updates
+                ]
+            )
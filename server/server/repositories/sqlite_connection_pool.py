@@ -0,0 +1,51 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_BUSY_TIMEOUT = 5.0
+
+T = TypeVar("T")
+
+
+class SQLiteConnectionPool:
+    """Runs database work on a small pool of threads, each with a connection of its own.
+
+    Queries never run on the event loop. The database is switched to WAL mode, so readers don't block the writer or
+    each other, and concurrent writers wait up to ``busy_timeout`` seconds for each other instead of failing.
+    """
+
+    def __init__(self, path: str, size: int = DEFAULT_POOL_SIZE, busy_timeout: float = DEFAULT_BUSY_TIMEOUT):
+        self._path = path
+        self._busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(size, thread_name_prefix="sqlite", initializer=self._connect)
+
+    async def run(self, function: Callable[..., T], *args) -> T:
+        """Call ``function`` with a connection and ``args`` on one of the pool's threads."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, function, args)
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def _connect(self):
+        # Connections are only used by the thread that opened them, but closed from another one on shutdown.
+        connection = sqlite3.connect(self._path, timeout=self._busy_timeout, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL, a power loss may only lose the last transactions, never corrupt the database.
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        self._local.connection = connection
+        with self._connections_lock:
+            self._connections.append(connection)
+
+    def _call(self, function: Callable[..., T], args: tuple) -> T:
+        return function(self._local.connection, *args)
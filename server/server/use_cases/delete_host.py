@@ -0,0 +1,18 @@
+from pydantic import UUID4
+
+from repositories.hosts_repository import HostsRepository
+from server.network.client_key_registry import ClientKeyRegistry
+
+
+class DeleteHost:
+    def __init__(self, hosts_repository: HostsRepository, client_key_registry: ClientKeyRegistry):
+        self._hosts_repository = hosts_repository
+        self._client_key_registry = client_key_registry
+
+    async def handle(self, host_id: UUID4) -> bool:
+        """Delete a host with its application instances, returns whether the host existed.
+
+        The host's id is no longer bound to its key, so the host can come back with a new key, e.g. after a reinstall.
+        """
+        self._client_key_registry.release(host_id)
+        return await self._hosts_repository.delete_host(host_id)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from pydantic import UUID4
+
+from domain.host import HostStatusUpdate
+from repositories.hosts_repository import HostsRepository
+from server.utils.service import Service
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_BUFFERED = 10_000
+
+
+@dataclass
+class HostStatusUpdateMetrics:
+    buffered: int
+    flushed: int
+    coalesced: int
+    dropped: int
+    flush_count: int
+    last_flush_duration: float
+
+
+class HandleHostStatusUpdate(Service):
+    """Buffers host status updates and writes them behind, in batches.
+
+    Only the latest update of each host is kept, so a host reporting many times between flushes costs a single row
+    write. The buffer is flushed in one transaction once it holds ``max_batch_size`` hosts, or ``flush_interval``
+    seconds after the first update that went into it, and once more on stop. If the database falls behind and
+    ``max_buffered`` hosts are waiting, updates of further hosts are dropped until a flush completes, they report
+    again soon enough.
+    """
+
+    def __init__(self,
+                 hosts_repository: HostsRepository,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_buffered: int = DEFAULT_MAX_BUFFERED
+                 ):
+        super().__init__()
+        self._hosts_repository = hosts_repository
+        self._max_batch_size = max_batch_size
+        self._flush_interval = flush_interval
+        self._max_buffered = max(max_buffered, max_batch_size)
+        self._buffer: dict[UUID4, HostStatusUpdate] = {}
+        self._flush_handle = None
+        self._flush_task = None
+        self._on_flushed_callbacks = []
+
+        self._flushed = 0
+        self._coalesced = 0
+        self._dropped = 0
+        self._flush_count = 0
+        self._last_flush_duration = 0.0
+
+    async def _start(self):
+        pass
+
+    async def _stop(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task:
+            await self._flush_task
+        # Updates may have come in while the last flush was running.
+        if self._buffer:
+            await self._flush()
+        if self._buffer:
+            LOGGER.error(f"Dropping {len(self._buffer)} host status updates that could not be written.")
+
+    def handle(self, host_status_update: HostStatusUpdate) -> None:
+        if buffered_update := self._buffer.get(host_status_update.id):
+            self._coalesced += 1
+            # Updates without attributes, e.g. on reconnect, must not lose those of an earlier update.
+            if host_status_update.attributes is None and buffered_update.attributes is not None:
+                host_status_update = host_status_update.model_copy(update={"attributes": buffered_update.attributes})
+        elif len(self._buffer) >= self._max_buffered:
+            self._dropped += 1
+            return
+        self._buffer[host_status_update.id] = host_status_update
+
+        if len(self._buffer) >= self._max_batch_size:
+            self._start_flush()
+        elif not self._flush_handle and not self._flush_task:
+            self._flush_handle = asyncio.get_running_loop().call_later(self._flush_interval, self._start_flush)
+
+    def register_flushed_callback(self, callback: Callable[[list[HostStatusUpdate]], None]):
+        """Register a callback for when a batch of host status updates was written, with the updates."""
+        self._on_flushed_callbacks.append(callback)
+
+    def get_metrics(self) -> HostStatusUpdateMetrics:
+        return HostStatusUpdateMetrics(
+            buffered=len(self._buffer),
+            flushed=self._flushed,
+            coalesced=self._coalesced,
+            dropped=self._dropped,
+            flush_count=self._flush_count,
+            last_flush_duration=self._last_flush_duration
+        )
+
+    def _start_flush(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._flush_task and self.is_running():
+            self._flush_task = asyncio.get_running_loop().create_task(self._run_flushes())
+
+    async def _run_flushes(self):
+        try:
+            # Keep flushing full batches that built up while the previous one was written.
+            await self._flush()
+            while len(self._buffer) >= self._max_batch_size:
+                await self._flush()
+        finally:
+            self._flush_task = None
+        if self._buffer and self.is_running():
+            self._flush_handle = asyncio.get_running_loop().call_later(self._flush_interval, self._start_flush)
+
+    async def _flush(self):
+        batch = self._buffer
+        self._buffer = {}
+        started_at = time.monotonic()
+        try:
+            await self._hosts_repository.update_host_statuses(list(batch.values()))
+        except Exception:
+            LOGGER.exception(f"Failed to write {len(batch)} host status updates, retrying with the next flush.")
+            # Put the batch back, newer updates that came in meanwhile take precedence.
+            for host_id, host_status_update in batch.items():
+                if host_id not in self._buffer and len(self._buffer) < self._max_buffered:
+                    self._buffer[host_id] = host_status_update
+            if not self._buffer:
+                return
+            # Give the database a moment instead of retrying in a tight loop.
+            await asyncio.sleep(self._flush_interval)
+            return
+
+        self._last_flush_duration = time.monotonic() - started_at
+        self._flushed += len(batch)
+        self._flush_count += 1
+        for callback in self._on_flushed_callbacks:
+            callback(list(batch.values()))
@@ -0,0 +1,110 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from domain.host_event import HostEvent, HostEventType
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_MAX_SUBSCRIBERS = 100
+
+
+class TooManySubscribersError(Exception):
+    """Error to raise if a subscription would exceed the maximum number of subscribers."""
+
+
+@dataclass
+class HostEventStreamMetrics:
+    subscribers: int
+    published: int
+    dropped: int
+
+
+class HostEventSubscription:
+    """Events published since subscribing, up to ``queue_size`` of them.
+
+    When the subscriber doesn't keep up the oldest events are dropped, so memory stays bounded however slow it is. The
+    subscriber is told how many events it missed, in an event of its own, before the events that follow them.
+    """
+
+    def __init__(self, queue_size: int):
+        self._events: deque[HostEvent] = deque(maxlen=queue_size)
+        self._event_available = asyncio.Event()
+        self._dropped = 0
+        self._closed = False
+
+    def put(self, event: HostEvent) -> bool:
+        """Queue an event, returns False if the oldest queued event had to be dropped for it."""
+        dropping = len(self._events) == self._events.maxlen
+        if dropping:
+            self._dropped += 1
+        self._events.append(event)
+        self._event_available.set()
+        return not dropping
+
+    async def get(self) -> HostEvent:
+        while not self._events and not self._dropped:
+            if self._closed:
+                raise StopAsyncIteration
+            self._event_available.clear()
+            await self._event_available.wait()
+
+        if self._dropped:
+            dropped = self._dropped
+            self._dropped = 0
+            return HostEvent(type=HostEventType.EVENTS_DROPPED, timestamp=datetime.now(timezone.utc), dropped=dropped)
+        return self._events.popleft()
+
+    def close(self):
+        self._closed = True
+        self._event_available.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> HostEvent:
+        return await self.get()
+
+
+class StreamHostEvents:
+    """Fans host events out to subscribers, e.g. dashboards, so they don't have to poll the hosts.
+
+    Publishing never waits on a subscriber, each one has a bounded queue of its own.
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE, max_subscribers: int = DEFAULT_MAX_SUBSCRIBERS):
+        self._queue_size = queue_size
+        self._max_subscribers = max_subscribers
+        self._subscriptions: set[HostEventSubscription] = set()
+        self._published = 0
+        self._dropped = 0
+
+    def subscribe(self) -> HostEventSubscription:
+        if len(self._subscriptions) >= self._max_subscribers:
+            raise TooManySubscribersError(f"There are already {len(self._subscriptions)} subscribers")
+        subscription = HostEventSubscription(self._queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: HostEventSubscription) -> None:
+        self._subscriptions.discard(subscription)
+        subscription.close()
+
+    def publish(self, event: HostEvent) -> None:
+        self._published += 1
+        for subscription in self._subscriptions:
+            if not subscription.put(event):
+                self._dropped += 1
+
+    def close(self) -> None:
+        """End every subscription, once it has been read up to the last event."""
+        for subscription in self._subscriptions:
+            subscription.close()
+        self._subscriptions.clear()
+
+    def get_metrics(self) -> HostEventStreamMetrics:
+        return HostEventStreamMetrics(
+            subscribers=len(self._subscriptions),
+            published=self._published,
+            dropped=self._dropped
+        )
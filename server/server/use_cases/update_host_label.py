@@ -0,0 +1,12 @@
+from pydantic import UUID4
+
+from repositories.hosts_repository import HostsRepository
+
+
+class UpdateHostLabel:
+    def __init__(self, hosts_repository: HostsRepository):
+        self._hosts_repository = hosts_repository
+
+    async def handle(self, host_id: UUID4, label: str | None) -> bool:
+        """Set or clear the label of a host, returns whether the host exists."""
+        return await self._hosts_repository.update_host_label(host_id, label)
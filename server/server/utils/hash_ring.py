@@ -0,0 +1,37 @@
+import bisect
+import hashlib
+from typing import Iterable
+from uuid import UUID
+
+DEFAULT_VIRTUAL_NODES = 128
+
+
+def _hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring assigning keys to nodes.
+
+    Each node is placed on the ring ``virtual_nodes`` times, which evens out how many keys each node gets. Adding or
+    removing a node only moves the keys between it and its neighbours, about one in every node count keys.
+    """
+
+    def __init__(self, nodes: Iterable[UUID], virtual_nodes: int = DEFAULT_VIRTUAL_NODES):
+        self._nodes = frozenset(nodes)
+        points = sorted(
+            (_hash(node.bytes + index.to_bytes(4, "big")), node)
+            for node in self._nodes
+            for index in range(virtual_nodes)
+        )
+        self._hashes = [point_hash for point_hash, _ in points]
+        self._points = [node for _, node in points]
+
+    def get_nodes(self) -> frozenset[UUID]:
+        return self._nodes
+
+    def get_node(self, key: bytes) -> UUID | None:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key))
+        return self._points[index % len(self._points)]
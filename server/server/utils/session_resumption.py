@@ -0,0 +1,29 @@
+import struct
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from server.utils.session_cipher import SESSION_KEY_LENGTH
+
+# Handshake frames used to resume a session. A resumption request can't be mistaken for a challenge, as challenges
+# only contain ASCII letters.
+RESUMPTION_REQUEST = b"\x00"
+RESUMPTION_ACCEPTED = b"\x01"
+RESUMPTION_REJECTED = b"\x02"
+
+RESUMPTION_NONCE_LENGTH = 32
+
+# A session ticket message is the ticket's expiry as a unix timestamp followed by the opaque ticket.
+SESSION_TICKET_HEADER = struct.Struct(">Q")
+
+_RESUMED_SESSION_KEY_INFO = b"pyot session resumption"
+
+
+def derive_resumed_session_key(resumption_secret: bytes, client_nonce: bytes, server_nonce: bytes) -> bytes:
+    """Derive a fresh key for a resumed session, so the nonce counters of the new session can start from zero."""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=SESSION_KEY_LENGTH,
+        salt=client_nonce + server_nonce,
+        info=_RESUMED_SESSION_KEY_INFO,
+    ).derive(resumption_secret)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The server runs from within its package, where modules import each other as e.g. ``repositories.hosts_repository``.
+sys.path.append(str(Path(__file__).parent.parent / "server"))
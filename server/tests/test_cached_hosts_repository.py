@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from ipaddress import IPv4Address
+from pathlib import Path
+from uuid import uuid4
+
+from pydantic import UUID4
+
+from domain.host import Host, HostAttributes, HostStatusUpdate
+from migrations.migration_client import MigrationClient
+from repositories.cached_hosts_repository import CachedHostsRepository
+from repositories.hosts_repository import SQLiteHostsRepository
+from repositories.sqlite_connection_pool import SQLiteConnectionPool
+
+HOST = Host(
+    id=uuid4(),
+    label="host",
+    last_known_host=IPv4Address("192.168.0.2"),
+    last_seen=datetime.now(timezone.utc),
+    attributes=HostAttributes(os="Linux", memory=1024, cpu_cores=2),
+    applications=[]
+)
+
+
+def _create_connection_pool(path: Path) -> SQLiteConnectionPool:
+    database_path = path / "pyot-server.db"
+    MigrationClient(f"sqlite:///{database_path}").run_migrations()
+    return SQLiteConnectionPool(str(database_path))
+
+
+def test_host_is_read_once_until_a_write_invalidates_it(tmp_path: Path):
+    async def run():
+        connection_pool = _create_connection_pool(tmp_path)
+        hosts_cache = CachedHostsRepository(SQLiteHostsRepository(connection_pool))
+        await hosts_cache.create_host(HOST)
+
+        assert await hosts_cache.get_host(HOST.id) == HOST
+        assert await hosts_cache.get_host(HOST.id) == HOST
+        metrics = hosts_cache.get_metrics()
+        assert (metrics.misses, metrics.hits) == (1, 1)
+
+        assert await hosts_cache.update_host_label(HOST.id, "renamed")
+        assert (await hosts_cache.get_host(HOST.id)).label == "renamed"
+        assert await hosts_cache.delete_host(HOST.id)
+        assert await hosts_cache.get_host(HOST.id) is None
+        assert hosts_cache.get_metrics().invalidations == 2
+        connection_pool.close()
+
+    asyncio.run(run())
+
+
+def test_status_update_is_applied_to_the_cached_host(tmp_path: Path):
+    async def run():
+        connection_pool = _create_connection_pool(tmp_path)
+        hosts_cache = CachedHostsRepository(SQLiteHostsRepository(connection_pool))
+        await hosts_cache.create_host(HOST)
+        await hosts_cache.get_host(HOST.id)
+        host_status_update = HostStatusUpdate(
+            id=HOST.id, last_known_host=IPv4Address("192.168.0.3"), last_seen=HOST.last_seen + timedelta(seconds=1)
+        )
+
+        # Before it is written behind, the cache already has the new status but keeps the attributes.
+        hosts_cache.refresh_host_status(host_status_update)
+        host = await hosts_cache.get_host(HOST.id)
+        assert (host.last_known_host, host.last_seen, host.attributes) == \
+            (host_status_update.last_known_host, host_status_update.last_seen, HOST.attributes)
+        assert hosts_cache.get_metrics().misses == 1
+        connection_pool.close()
+
+    asyncio.run(run())
+
+
+class _HeldHostsRepository(SQLiteHostsRepository):
+    """Holds on to the hosts it read until released, as if the read took that long."""
+
+    def __init__(self, connection_pool: SQLiteConnectionPool):
+        super().__init__(connection_pool)
+        self.read = asyncio.Event()
+        self.released = asyncio.Event()
+
+    async def get_host(self, host_id: UUID4) -> Host | None:
+        host = await super().get_host(host_id)
+        self.read.set()
+        await self.released.wait()
+        return host
+
+
+def test_host_written_while_being_read_is_not_cached_outdated(tmp_path: Path):
+    async def run():
+        connection_pool = _create_connection_pool(tmp_path)
+        hosts_repository = _HeldHostsRepository(connection_pool)
+        hosts_cache = CachedHostsRepository(hosts_repository)
+        await hosts_cache.create_host(HOST)
+
+        reading = asyncio.create_task(hosts_cache.get_host(HOST.id))
+        await hosts_repository.read.wait()
+        await hosts_cache.update_host_label(HOST.id, "renamed")
+        hosts_repository.released.set()
+        assert (await reading).label == "host"
+
+        assert (await hosts_cache.get_host(HOST.id)).label == "renamed"
+        connection_pool.close()
+
+    asyncio.run(run())
+
+
+def test_expired_and_least_recently_used_hosts_are_read_again(tmp_path: Path):
+    async def run():
+        connection_pool = _create_connection_pool(tmp_path)
+        hosts_repository = SQLiteHostsRepository(connection_pool)
+        other_host = HOST.model_copy(update={"id": uuid4()})
+        await hosts_repository.create_host(HOST)
+        await hosts_repository.create_host(other_host)
+
+        hosts_cache = CachedHostsRepository(hosts_repository, ttl=0)
+        await hosts_cache.get_host(HOST.id)
+        await hosts_cache.get_host(HOST.id)
+        assert hosts_cache.get_metrics().expirations == 1
+
+        hosts_cache = CachedHostsRepository(hosts_repository, max_size=1)
+        await hosts_cache.get_host(HOST.id)
+        await hosts_cache.get_host(other_host.id)
+        await hosts_cache.get_host(HOST.id)
+        metrics = hosts_cache.get_metrics()
+        assert (metrics.size, metrics.misses, metrics.evictions) == (1, 3, 2)
+        connection_pool.close()
+
+    asyncio.run(run())
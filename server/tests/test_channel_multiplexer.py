@@ -0,0 +1,83 @@
+import asyncio
+import struct
+
+import pytest
+
+from server.network.channel_multiplexer import CONTROL_CHANNEL, LOWEST_PRIORITY, ChannelError, ChannelMultiplexer
+
+CHANNEL_HEADER = struct.Struct(">BBH")
+
+
+def _get_channel_ids(frames: list[bytes]) -> list[int]:
+    return [CHANNEL_HEADER.unpack_from(frame)[2] for frame in frames]
+
+
+def test_messages_are_reassembled_from_chunks_on_the_other_side():
+    async def run():
+        messages = []
+        receiver = ChannelMultiplexer(lambda frames: None, chunk_size=100)
+        receiver.register_on_message_callback(lambda channel_id, message: messages.append((channel_id, message)))
+        sender = ChannelMultiplexer(lambda frames: [receiver.feed(frame) for frame in frames], chunk_size=100)
+
+        sender.send(1, b"a" * 250)
+        sender.send(2, b"")
+        sender.send(1, b"b")
+        await asyncio.sleep(0)
+
+        assert sorted(messages) == [(1, b"a" * 250), (1, b"b"), (2, b"")]
+
+    asyncio.run(run())
+
+
+def test_sender_stops_at_the_end_of_the_window_until_the_receiver_extends_it():
+    async def run():
+        sent = []
+        receiver = ChannelMultiplexer(lambda frames: [sender.feed(frame) for frame in frames], window_size=1000)
+        sender = ChannelMultiplexer(sent.extend, window_size=1000, chunk_size=100)
+
+        sender.send(1, b"x" * 3000)
+        await asyncio.sleep(0)
+        assert sum(len(frame) - CHANNEL_HEADER.size for frame in sent) == 1000
+        assert sender.get_queued_size(1) == 2000
+
+        # The receiver extends the window once it took half a window off the wire.
+        for frame in sent[:4]:
+            receiver.feed(frame)
+        await asyncio.sleep(0)
+        assert sender.get_queued_size(1) == 2000
+        receiver.feed(sent[4])
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert sender.get_queued_size(1) == 1500
+
+    asyncio.run(run())
+
+
+def test_peer_overrunning_the_window_is_an_error():
+    async def run():
+        receiver = ChannelMultiplexer(lambda frames: None, window_size=1000)
+
+        receiver.feed(CHANNEL_HEADER.pack(0, 0, 1) + b"x" * 499)
+        with pytest.raises(ChannelError):
+            receiver.feed(CHANNEL_HEADER.pack(0, 0, 1) + b"x" * 502)
+
+    asyncio.run(run())
+
+
+def test_more_urgent_channels_are_sent_first_and_equal_ones_take_turns():
+    async def run():
+        sent = []
+        sender = ChannelMultiplexer(sent.extend, chunk_size=100)
+        sender.open_channel(1, LOWEST_PRIORITY)
+        sender.open_channel(2)
+        sender.open_channel(3)
+
+        sender.send(1, b"bulk" * 100)
+        sender.send(2, b"x" * 200)
+        sender.send(3, b"y" * 200)
+        sender.send(CONTROL_CHANNEL, b"heartbeat")
+        await asyncio.sleep(0)
+
+        assert _get_channel_ids(sent) == [CONTROL_CHANNEL, 2, 3, 2, 3, 1, 1, 1, 1]
+
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+from uuid import uuid4
+
+from server.network.client_key_registry import ClientKeyRegistry
+
+
+def test_client_id_is_bound_to_the_first_key_it_authenticates_with():
+    client_key_registry = ClientKeyRegistry()
+    bound = []
+    client_key_registry.register_bound_callback(lambda client_id, key_fingerprint: bound.append(client_id))
+    client_id = uuid4()
+
+    assert client_key_registry.bind(client_id, b"key")
+    assert client_key_registry.bind(client_id, b"key")
+    assert bound == [client_id]
+
+    assert not client_key_registry.matches(client_id, b"other key")
+    assert not client_key_registry.bind(client_id, b"other key")
+    # The key can't be claimed under another id either.
+    assert not client_key_registry.matches(uuid4(), b"key")
+    assert client_key_registry.get_client_id(b"key") == client_id
+
+
+def test_released_client_id_can_be_bound_to_a_new_key():
+    client_id = uuid4()
+    client_key_registry = ClientKeyRegistry({client_id: b"key"})
+    released = []
+    client_key_registry.register_released_callback(released.append)
+
+    client_key_registry.release(client_id)
+    client_key_registry.release(client_id)
+
+    assert released == [client_id]
+    assert client_key_registry.get_client_id(b"key") is None
+    assert client_key_registry.bind(client_id, b"new key")
@@ -0,0 +1,81 @@
+import pytest
+
+from server.network.command_messages import COMMAND_CHANNEL
+from server.network.compression import DEFLATE, NO_COMPRESSION, Compression, CompressionError, CompressionOptions, \
+    SessionCompressor, split_offer, split_selection
+
+SECRET = b"password=hunter2"
+
+
+def _get_sealed_length(compressor: SessionCompressor, guess: bytes, sensitive: bool) -> int:
+    # A peer influences part of the message, the rest holds a secret.
+    return len(compressor.compress(COMMAND_CHANNEL, SECRET + b" " + guess + b" " * 64, sensitive))
+
+
+def test_compressed_length_gives_away_a_secret_unless_the_message_is_sensitive():
+    compressor = SessionCompressor()
+
+    assert _get_sealed_length(compressor, b"password=hunter2", False) < \
+        _get_sealed_length(compressor, b"password=qwerty1", False)
+    assert _get_sealed_length(compressor, b"password=hunter2", True) == \
+        _get_sealed_length(compressor, b"password=qwerty1", True)
+
+
+def test_sensitive_messages_decompress_like_any_other():
+    compressor = SessionCompressor()
+    message = SECRET * 16
+
+    assert compressor.decompress(COMMAND_CHANNEL, compressor.compress(COMMAND_CHANNEL, message, sensitive=True)) == \
+        message
+
+
+def test_newest_dictionary_both_sides_hold_is_negotiated():
+    client_options = CompressionOptions(dictionaries={1: b"first dictionary", 2: b"second dictionary"})
+    server_options = CompressionOptions(dictionaries={1: b"first dictionary", 3: b"third dictionary"})
+
+    handshake_message, offer = split_offer(b"handshake" + client_options.encode_offer())
+    compression = server_options.select(offer)
+    ticket_message, selection = split_selection(b"ticket" + compression.encode())
+
+    assert handshake_message == b"handshake"
+    assert ticket_message == b"ticket"
+    assert selection == compression == Compression(DEFLATE, 1)
+    assert client_options.is_supported(selection)
+
+
+def test_dictionaries_that_differ_under_the_same_version_are_not_negotiated():
+    client_options = CompressionOptions(dictionaries={1: b"client dictionary"})
+    server_options = CompressionOptions(dictionaries={1: b"server dictionary"})
+
+    assert server_options.select(split_offer(client_options.encode_offer())[1]) == Compression(DEFLATE, 0)
+
+
+def test_no_compression_without_an_offer():
+    assert split_offer(b"handshake") == (b"handshake", None)
+    assert CompressionOptions().select(None) == Compression(NO_COMPRESSION)
+    assert CompressionOptions().select(split_offer(CompressionOptions(enabled=False).encode_offer())[1]) == \
+        Compression(NO_COMPRESSION)
+
+
+def test_unknown_dictionary_is_not_supported():
+    client_options = CompressionOptions(dictionaries={1: b"dictionary"})
+
+    assert not client_options.is_supported(Compression(DEFLATE, 2))
+    assert not CompressionOptions(enabled=False).is_supported(Compression(DEFLATE, 0))
+
+
+def test_messages_compressed_against_a_dictionary_need_it_to_decompress():
+    dictionary = b'{"status": "ok", "exit_code": 0, "stdout": ""}' * 4
+    compressor = SessionCompressor(dictionary)
+    message = b'{"status": "ok", "exit_code": 0, "stdout": "done"}'
+
+    compressed = compressor.compress(COMMAND_CHANNEL, message)
+    assert len(compressed) < len(SessionCompressor().compress(COMMAND_CHANNEL, message))
+    assert SessionCompressor(dictionary).decompress(COMMAND_CHANNEL, compressed) == message
+    with pytest.raises(CompressionError):
+        SessionCompressor().decompress(COMMAND_CHANNEL, compressed)
+
+
+def test_unknown_message_kind_is_rejected():
+    with pytest.raises(CompressionError):
+        SessionCompressor().decompress(COMMAND_CHANNEL, b"\xff" + b"message")
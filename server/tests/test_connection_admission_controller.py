@@ -0,0 +1,57 @@
+import asyncio
+
+from server.network.connection_admission_controller import ConnectionAdmissionController
+
+
+def test_metrics_count_queued_and_admitted_attempts():
+    async def run():
+        admission_controller = ConnectionAdmissionController(max_concurrent=1, rate_per_source=0, burst_per_source=1)
+        release = asyncio.Event()
+
+        async def establish():
+            await release.wait()
+
+        await admission_controller.start()
+        try:
+            for index in range(3):
+                assert admission_controller.submit(index, f"10.0.0.{index}", establish)
+            assert not admission_controller.submit(0, "10.0.0.0", establish)
+            assert not admission_controller.submit(3, "10.0.0.0", establish)
+            await asyncio.sleep(0.05)
+
+            metrics = admission_controller.get_metrics()
+            assert metrics.queue_depth == 2
+            assert metrics.in_flight == 1
+            assert metrics.admitted == 1
+            assert metrics.deduplicated == 1
+            assert metrics.rate_limited == 1
+            assert metrics.queue_full == 0
+
+            release.set()
+            await asyncio.sleep(0.05)
+
+            metrics = admission_controller.get_metrics()
+            assert metrics.queue_depth == 0
+            assert metrics.in_flight == 0
+            assert metrics.admitted == 3
+            assert metrics.max_wait_time >= 0.05
+            assert 0 < metrics.mean_wait_time <= metrics.max_wait_time
+        finally:
+            await admission_controller.stop()
+
+    asyncio.run(run())
+
+
+def test_metrics_count_attempts_dropped_when_queue_is_full():
+    admission_controller = ConnectionAdmissionController(max_queued=1)
+
+    async def establish():
+        pass
+
+    assert admission_controller.submit(0, "10.0.0.0", establish)
+    assert not admission_controller.submit(1, "10.0.0.1", establish)
+
+    metrics = admission_controller.get_metrics()
+    assert metrics.queue_depth == 1
+    assert metrics.queue_full == 1
+    assert metrics.admitted == 0
@@ -0,0 +1,60 @@
+import io
+import random
+import struct
+from pathlib import Path
+
+import pytest
+
+from server.artifacts.artifact_store import build_delta
+from server.artifacts.delta import COPY, LITERAL, DeltaApplier, InvalidDeltaError
+
+BLOCK_SIZE = 1024
+
+
+def _apply_delta(basis: bytes, delta: bytes, piece_size: int) -> bytes:
+    target = io.BytesIO()
+    delta_applier = DeltaApplier(io.BytesIO(basis), target.write, BLOCK_SIZE)
+    # The delta arrives in pieces that don't line up with its operations.
+    for offset in range(0, len(delta), piece_size):
+        delta_applier.feed(delta[offset:offset + piece_size])
+    delta_applier.close()
+    return target.getvalue()
+
+
+def test_target_is_rebuilt_from_the_basis_and_what_changed(tmp_path: Path):
+    randomness = random.Random(0)
+    basis = randomness.randbytes(64 * BLOCK_SIZE + 100)
+    # Data inserted off block boundaries, removed, moved around and appended.
+    target = basis[:10 * BLOCK_SIZE + 7] + b"inserted" + basis[10 * BLOCK_SIZE + 7:30 * BLOCK_SIZE] + \
+        basis[50 * BLOCK_SIZE:] + basis[40 * BLOCK_SIZE:45 * BLOCK_SIZE] + randomness.randbytes(3000)
+    (tmp_path / "basis").write_bytes(basis)
+    (tmp_path / "target").write_bytes(target)
+
+    delta_size = build_delta(tmp_path / "basis", tmp_path / "target", tmp_path / "delta", BLOCK_SIZE)
+
+    assert delta_size < 5 * BLOCK_SIZE
+    delta = (tmp_path / "delta").read_bytes()
+    for piece_size in (1, 7, len(delta)):
+        assert _apply_delta(basis, delta, piece_size) == target
+
+
+def test_delta_to_an_empty_or_unrelated_target_is_all_literal(tmp_path: Path):
+    basis = random.Random(0).randbytes(8 * BLOCK_SIZE)
+    for target in (b"", b"short", random.Random(1).randbytes(8 * BLOCK_SIZE)):
+        (tmp_path / "basis").write_bytes(basis)
+        (tmp_path / "target").write_bytes(target)
+
+        build_delta(tmp_path / "basis", tmp_path / "target", tmp_path / "delta", BLOCK_SIZE)
+
+        assert _apply_delta(basis, (tmp_path / "delta").read_bytes(), BLOCK_SIZE) == target
+
+
+def test_malformed_delta_is_rejected():
+    basis = bytes(4 * BLOCK_SIZE)
+
+    with pytest.raises(InvalidDeltaError):
+        _apply_delta(basis, struct.pack(">BII", COPY, 3, 2), BLOCK_SIZE)
+    with pytest.raises(InvalidDeltaError):
+        _apply_delta(basis, struct.pack(">BI", LITERAL, 10) + b"truncated", BLOCK_SIZE)
+    with pytest.raises(InvalidDeltaError):
+        _apply_delta(basis, b"\xff" * 8, BLOCK_SIZE)
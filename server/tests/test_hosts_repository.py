@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from ipaddress import IPv4Address
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+
+from domain.host import Host, HostAttributes
+from domain.host_query import HostFilter, HostOrder
+from migrations.migration_client import MigrationClient
+from repositories.hosts_repository import InvalidCursorError, SQLiteHostsRepository
+from repositories.sqlite_connection_pool import SQLiteConnectionPool
+
+NOW = datetime.now(timezone.utc)
+
+
+def _create_connection_pool(path: Path) -> SQLiteConnectionPool:
+    database_path = path / "pyot-server.db"
+    MigrationClient(f"sqlite:///{database_path}").run_migrations()
+    return SQLiteConnectionPool(str(database_path))
+
+
+def _create_host(seconds_ago: int, os: str = "Linux") -> Host:
+    return Host(
+        id=uuid4(),
+        label=None,
+        last_known_host=IPv4Address("192.168.0.2"),
+        last_seen=NOW - timedelta(seconds=seconds_ago),
+        attributes=HostAttributes(os=os, memory=1024, cpu_cores=2),
+        applications=[]
+    )
+
+
+async def _get_all_pages(hosts_repository: SQLiteHostsRepository,
+                         host_filter: HostFilter,
+                         order: HostOrder,
+                         limit: int
+                         ) -> list[list[Host]]:
+    pages = []
+    cursor = None
+    while True:
+        page = await hosts_repository.get_page(host_filter, order, limit, cursor)
+        pages.append(page.hosts)
+        if (cursor := page.next_cursor) is None:
+            return pages
+
+
+def test_pages_follow_each_other_without_gaps_or_repeats(tmp_path: Path):
+    async def run():
+        connection_pool = _create_connection_pool(tmp_path)
+        hosts_repository = SQLiteHostsRepository(connection_pool)
+        # Some hosts were last seen at the same time, ties are broken by their id.
+        hosts = [_create_host(seconds_ago) for seconds_ago in (5, 1, 3, 3, 3, 0, 4)]
+        hosts.append(_create_host(2, os="Windows"))
+        for host in hosts:
+            await hosts_repository.create_host(host)
+
+        pages = await _get_all_pages(hosts_repository, HostFilter(os="Linux"), HostOrder.LAST_SEEN, 3)
+        assert [len(page) for page in pages] == [3, 3, 1]
+        assert [host.id for page in pages for host in page] == [
+            host.id for host in sorted(hosts[:-1], key=lambda host: (host.last_seen, host.id), reverse=True)
+        ]
+
+        pages = await _get_all_pages(hosts_repository, HostFilter(), HostOrder.ID, 4)
+        assert [len(page) for page in pages] == [4, 4]
+        assert [host.id for page in pages for host in page] == sorted(host.id for host in hosts)
+        connection_pool.close()
+
+    asyncio.run(run())
+
+
+def test_hosts_added_between_pages_do_not_shift_later_pages(tmp_path: Path):
+    async def run():
+        connection_pool = _create_connection_pool(tmp_path)
+        hosts_repository = SQLiteHostsRepository(connection_pool)
+        hosts = [_create_host(seconds_ago) for seconds_ago in range(1, 5)]
+        for host in hosts:
+            await hosts_repository.create_host(host)
+
+        first_page = await hosts_repository.get_page(HostFilter(), limit=2)
+        await hosts_repository.create_host(_create_host(0))
+        second_page = await hosts_repository.get_page(HostFilter(), limit=2, cursor=first_page.next_cursor)
+
+        assert [host.id for host in first_page.hosts + second_page.hosts] == [host.id for host in hosts]
+        assert second_page.next_cursor is None
+        connection_pool.close()
+
+    asyncio.run(run())
+
+
+def test_cursor_of_another_order_or_malformed_cursor_is_rejected(tmp_path: Path):
+    async def run():
+        connection_pool = _create_connection_pool(tmp_path)
+        hosts_repository = SQLiteHostsRepository(connection_pool)
+        for seconds_ago in range(3):
+            await hosts_repository.create_host(_create_host(seconds_ago))
+        cursor = (await hosts_repository.get_page(HostFilter(), HostOrder.ID, 1)).next_cursor
+
+        with pytest.raises(InvalidCursorError):
+            await hosts_repository.get_page(HostFilter(), HostOrder.LAST_SEEN, 1, cursor)
+        for malformed_cursor in ("", "not base64!", cursor[:-4]):
+            with pytest.raises(InvalidCursorError):
+                await hosts_repository.get_page(HostFilter(), HostOrder.ID, 1, malformed_cursor)
+        connection_pool.close()
+
+    asyncio.run(run())
+
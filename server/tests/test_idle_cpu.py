@@ -0,0 +1,42 @@
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from server.config.config_loader import ServerConfigLoader
+from server.network.compression import CompressionOptions
+from server.network.connection_admission_controller import ConnectionAdmissionController
+from server.network.server_connection_manager import ServerConnectionManager
+from server.network.session_ticket_manager import SessionTicketManager
+from server.network.udp_listener import UDPListener
+from server.utils.crypto_executor import CryptoExecutor
+from server.utils.encryption_manager import EncryptionManager
+
+IDLE_SECONDS = 2
+MAX_CPU_SHARE = 0.02
+
+
+def test_idle_connection_manager_uses_next_to_no_cpu():
+    async def run() -> float:
+        encryption_manager = EncryptionManager()
+        with tempfile.TemporaryDirectory() as config_directory:
+            config = ServerConfigLoader(encryption_manager, Path(config_directory) / "config.cfg").load_config()
+        # Listens for broadcasts and runs the handshake admission workers, with nobody broadcasting.
+        connection_manager = ServerConnectionManager(
+            UDPListener(0, host="127.0.0.1"),
+            CryptoExecutor(encryption_manager, workers=1),
+            SessionTicketManager(),
+            ConnectionAdmissionController(),
+            config,
+            None,
+            CompressionOptions()
+        )
+        await connection_manager.start()
+        try:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            await asyncio.sleep(IDLE_SECONDS)
+            return (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+        finally:
+            await connection_manager.stop()
+
+    assert asyncio.run(run()) <= MAX_CPU_SHARE
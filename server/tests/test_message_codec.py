@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+
+import pytest
+
+from server.network.message_codec import InvalidMessageError, decode_message, encode_message, message, tag
+
+
+@message
+@dataclass
+class Inner:
+    name: str = tag(1)
+    weight: float = tag(2)
+
+
+@message
+@dataclass
+class Outer:
+    numbers: list[int] = tag(1)
+    flag: bool = tag(2)
+    data: bytes = tag(3)
+    inner: Inner = tag(4)
+    labels: dict[str, Inner] = tag(5)
+    note: str | None = tag(6)
+    # Last, so any prefix of an encoded message either cuts a field short or leaves it out.
+    sequence: int = tag(7)
+
+
+@message
+@dataclass
+class OlderOuter:
+    """Outer as a release that only knew some of its fields, and one that didn't exist yet."""
+    data: bytes = tag(3)
+    sequence: int = tag(7)
+    added: int = tag(8, default=-1)
+
+
+def _create_outer() -> Outer:
+    return Outer(
+        numbers=[0, 1, -1, 63, -64, 64, 2 ** 63 - 1, -2 ** 63],
+        flag=True,
+        data=b"\x00\xff" * 100,
+        inner=Inner("ünïcode", -0.5),
+        labels={"a": Inner("", 0.0), "b": Inner("b", float("inf"))},
+        note=None,
+        sequence=300
+    )
+
+
+def test_message_round_trips():
+    outer = _create_outer()
+
+    assert decode_message(Outer, encode_message(outer)) == outer
+    assert decode_message(Outer, b"prefix" + encode_message(outer), len(b"prefix")) == outer
+    empty_outer = Outer([], False, b"", Inner("", 0.0), {}, "", 0)
+    assert decode_message(Outer, encode_message(empty_outer)) == empty_outer
+
+
+def test_unknown_fields_are_skipped_and_missing_ones_defaulted():
+    outer = _create_outer()
+
+    older_outer = decode_message(OlderOuter, encode_message(outer))
+
+    assert older_outer == OlderOuter(outer.data, outer.sequence, -1)
+
+
+def test_truncated_message_is_rejected():
+    encoded = encode_message(_create_outer())
+
+    for length in range(len(encoded)):
+        with pytest.raises(InvalidMessageError):
+            decode_message(Outer, encoded[:length])
+
+
+def test_message_of_another_format_version_is_rejected():
+    encoded = encode_message(_create_outer())
+
+    with pytest.raises(InvalidMessageError):
+        decode_message(Outer, bytes((encoded[0] + 1,)) + encoded[1:])
@@ -0,0 +1,58 @@
+import os
+import time
+
+from server.network.session_ticket_manager import SessionTicketManager
+
+RESUMPTION_SECRET = os.urandom(32)
+CLIENT_PUBLIC_KEY = b"client public key"
+
+
+def test_ticket_is_redeemed_once():
+    session_ticket_manager = SessionTicketManager()
+    expires_at, ticket = session_ticket_manager.issue(RESUMPTION_SECRET, CLIENT_PUBLIC_KEY)
+
+    redeemed_ticket = session_ticket_manager.redeem(ticket)
+    assert redeemed_ticket.resumption_secret == RESUMPTION_SECRET
+    assert redeemed_ticket.client_public_key == CLIENT_PUBLIC_KEY
+    assert redeemed_ticket.expires_at == expires_at
+    # A replayed ticket doesn't resume a second session.
+    assert session_ticket_manager.redeem(ticket) is None
+
+
+def test_expired_ticket_is_not_redeemed():
+    session_ticket_manager = SessionTicketManager()
+    _, ticket = session_ticket_manager.issue(RESUMPTION_SECRET, CLIENT_PUBLIC_KEY, expires_at=int(time.time()) - 1)
+
+    assert session_ticket_manager.redeem(ticket) is None
+
+
+def test_reissued_ticket_keeps_the_original_expiry():
+    session_ticket_manager = SessionTicketManager(lifetime=60)
+    expires_at, ticket = session_ticket_manager.issue(RESUMPTION_SECRET, CLIENT_PUBLIC_KEY)
+    redeemed_ticket = session_ticket_manager.redeem(ticket)
+
+    reissued_expires_at, _ = session_ticket_manager.issue(
+        RESUMPTION_SECRET, CLIENT_PUBLIC_KEY, expires_at=redeemed_ticket.expires_at
+    )
+    assert reissued_expires_at == expires_at
+
+
+def test_tampered_or_foreign_ticket_is_not_redeemed():
+    session_ticket_manager = SessionTicketManager()
+    _, ticket = session_ticket_manager.issue(RESUMPTION_SECRET, CLIENT_PUBLIC_KEY)
+    tampered_ticket = ticket[:-1] + bytes([ticket[-1] ^ 1])
+
+    assert session_ticket_manager.redeem(tampered_ticket) is None
+    assert session_ticket_manager.redeem(ticket[:8]) is None
+    # Tickets are sealed with a key of the server that issued them.
+    assert SessionTicketManager().redeem(ticket) is None
+    assert session_ticket_manager.redeem(ticket) is not None
+
+
+def test_oldest_tickets_are_evicted_once_the_cache_is_full():
+    session_ticket_manager = SessionTicketManager(cache_size=2)
+    tickets = [session_ticket_manager.issue(RESUMPTION_SECRET, CLIENT_PUBLIC_KEY)[1] for _ in range(3)]
+
+    assert session_ticket_manager.redeem(tickets[0]) is None
+    assert session_ticket_manager.redeem(tickets[1]) is not None
+    assert session_ticket_manager.redeem(tickets[2]) is not None
@@ -0,0 +1,53 @@
+import asyncio
+import socket
+from uuid import uuid4
+
+from server.network.shard_membership import ShardMembership
+
+HEARTBEAT_INTERVAL = 0.05
+
+
+def _get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_shards_find_each_other_through_peers_and_ignore_replayed_heartbeats():
+    async def run():
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as eavesdropper:
+            eavesdropper.bind(("127.0.0.1", 0))
+            eavesdropper.setblocking(False)
+            first_id, second_id = uuid4(), uuid4()
+            first_port, second_port = _get_free_port(), _get_free_port()
+            first = ShardMembership(first_id, first_port, b"secret", heartbeat_interval=HEARTBEAT_INTERVAL,
+                                    member_timeout=4 * HEARTBEAT_INTERVAL, peers=[("127.0.0.1", second_port)])
+            second = ShardMembership(second_id, second_port, b"secret", heartbeat_interval=HEARTBEAT_INTERVAL,
+                                     member_timeout=4 * HEARTBEAT_INTERVAL,
+                                     peers=[("127.0.0.1", first_port), eavesdropper.getsockname()])
+            await first.start()
+            await second.start()
+            try:
+                await asyncio.sleep(5 * HEARTBEAT_INTERVAL)
+                assert first.get_shard_ids() == second.get_shard_ids() == {first_id, second_id}
+
+                await second.stop()
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                assert first.get_shard_ids() == {first_id}
+
+                # Captured heartbeats of the shard that left don't bring it back.
+                heartbeats = []
+                while True:
+                    try:
+                        heartbeats.append(eavesdropper.recv(1024))
+                    except BlockingIOError:
+                        break
+                # All but the last one, which announced the shard is leaving.
+                for heartbeat in heartbeats[:-1]:
+                    eavesdropper.sendto(heartbeat, ("127.0.0.1", first_port))
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                assert first.get_shard_ids() == {first_id}
+            finally:
+                await first.stop()
+
+    asyncio.run(run())
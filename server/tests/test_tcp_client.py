@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import pytest
+
+from server.network import tcp_client
+from server.network.channel_multiplexer import ChannelMultiplexer
+from server.network.command_messages import COMMAND_CHANNEL, CommandCancel, CommandRequest, CommandResult, \
+    CommandStarted, decode_command_message
+from server.network.frame_codec import FRAME_HEADER, write_frame, write_frames
+from server.network.server_authentication_manager import MarkClientAsAuthenticatedCommand
+from server.network.tcp_client import ClientDisconnectedError, TCPClient
+
+TIMEOUT = 0.2
+GRACE = 0.1
+
+
+class _FirstFrameAuthenticationManager:
+    """Takes the first frame the client sends as the end of the handshake."""
+
+    def __init__(self):
+        self._authenticated = False
+
+    def mark_public_key_as_shared(self):
+        pass
+
+    async def authenticate_server_message(self, data: bytes) -> MarkClientAsAuthenticatedCommand:
+        self._authenticated = True
+        return MarkClientAsAuthenticatedCommand(b"session ticket")
+
+    def get_compressor(self):
+        return None
+
+    def is_client_authenticated(self) -> bool:
+        return self._authenticated
+
+
+class _PublicKey:
+    def save_pkcs1(self) -> bytes:
+        return b"server public key"
+
+
+class _PlaintextEncryptionManager:
+    def get_server_public_key(self) -> _PublicKey:
+        return _PublicKey()
+
+    def encrypt_payload_for_client(self, payload: bytes) -> bytes:
+        return payload
+
+    def decrypt_payload_from_client(self, payload: bytes) -> bytes:
+        return payload
+
+
+class _Client:
+    """The client end of a connection, which only speaks the command protocol once the handshake is done."""
+
+    def __init__(self):
+        self.command_messages = asyncio.Queue()
+        self._writer: asyncio.StreamWriter | None = None
+        self._multiplexer = ChannelMultiplexer(lambda frames: write_frames(self._writer.transport, frames))
+        self._multiplexer.register_on_message_callback(
+            lambda channel_id, payload: self.command_messages.put_nowait(decode_command_message(payload))
+        )
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writer = writer
+        # The server's public key, then the frame that completes the handshake and the server's session ticket.
+        await _read_frame(reader)
+        write_frame(writer.transport, b"handshake")
+        await _read_frame(reader)
+        while (frame := await _read_frame(reader)) is not None:
+            self._multiplexer.feed(frame)
+
+    def send(self, message: bytes):
+        self._multiplexer.send(COMMAND_CHANNEL, message)
+
+    def disconnect(self):
+        self._writer.close()
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes | None:
+    try:
+        (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+async def _connect(client: _Client) -> tuple[TCPClient, asyncio.Server]:
+    server = await asyncio.start_server(client.handle_connection, "127.0.0.1", 0)
+    connection = TCPClient(
+        "127.0.0.1",
+        server.sockets[0].getsockname()[1],
+        _FirstFrameAuthenticationManager(),
+        _PlaintextEncryptionManager()
+    )
+    await connection.start()
+    return connection, server
+
+
+async def _close(connection: TCPClient, server: asyncio.Server):
+    await connection.stop()
+    server.close()
+    await server.wait_closed()
+
+
+def test_deadline_starts_when_the_client_starts_the_command(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(tcp_client, "COMMAND_TIMEOUT_GRACE", GRACE)
+
+    async def run():
+        client = _Client()
+        connection, server = await _connect(client)
+        result = connection.start_command(["sleep", "10"], TIMEOUT)
+        command_request = await client.command_messages.get()
+        assert isinstance(command_request, CommandRequest)
+
+        # Queued behind the client's other commands for longer than the command may run, which doesn't count.
+        await asyncio.sleep(2 * (TIMEOUT + GRACE))
+        assert not result.done()
+
+        started_at = time.monotonic()
+        client.send(CommandStarted(command_request.command_id).encode())
+        with pytest.raises(asyncio.TimeoutError):
+            await result
+        assert time.monotonic() - started_at >= TIMEOUT + GRACE
+        # Nobody waits for the result any more, the client is told to kill the command.
+        assert await client.command_messages.get() == CommandCancel(command_request.command_id)
+        await _close(connection, server)
+
+    asyncio.run(run())
+
+
+def test_results_are_matched_to_their_commands_in_any_order():
+    async def run():
+        client = _Client()
+        connection, server = await _connect(client)
+        results = [connection.start_command(["echo", str(index)], TIMEOUT) for index in range(3)]
+        command_requests = [await client.command_messages.get() for _ in results]
+
+        for command_request in reversed(command_requests):
+            client.send(CommandStarted(command_request.command_id).encode())
+            client.send(CommandResult(command_request.command_id, 0, command_request.command[1], "").encode())
+
+        assert [(await result).stdout for result in results] == ["0", "1", "2"]
+        # Answered commands aren't cancelled, the next message the client gets is the next command.
+        connection.start_command(["true"], TIMEOUT)
+        assert isinstance(await client.command_messages.get(), CommandRequest)
+        await _close(connection, server)
+
+    asyncio.run(run())
+
+
+def test_cancelled_command_is_cancelled_on_the_client():
+    async def run():
+        client = _Client()
+        connection, server = await _connect(client)
+        result = connection.start_command(["sleep", "10"], TIMEOUT)
+        command_request = await client.command_messages.get()
+
+        result.cancel()
+
+        assert await client.command_messages.get() == CommandCancel(command_request.command_id)
+        await _close(connection, server)
+
+    asyncio.run(run())
+
+
+def test_commands_in_flight_fail_when_the_client_disconnects():
+    async def run():
+        client = _Client()
+        connection, server = await _connect(client)
+        result = connection.start_command(["sleep", "10"], TIMEOUT)
+        await client.command_messages.get()
+
+        client.disconnect()
+
+        with pytest.raises(ClientDisconnectedError):
+            await result
+        with pytest.raises(ClientDisconnectedError):
+            connection.start_command(["true"], TIMEOUT)
+        await _close(connection, server)
+
+    asyncio.run(run())
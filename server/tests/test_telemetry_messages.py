@@ -0,0 +1,72 @@
+import pytest
+
+from server.network.message_codec import unzigzag, zigzag
+from server.network.telemetry_messages import KEYFRAME, TELEMETRY_FIELDS, HostInfo, InvalidTelemetryMessageError, \
+    TelemetryDecoder, TelemetryEncoder, TelemetrySample
+
+
+def _create_sample(timestamp: int, **values: int) -> TelemetrySample:
+    return TelemetrySample(timestamp, [values.get(field, 0) for field in TELEMETRY_FIELDS])
+
+
+def test_keyframe_is_followed_by_deltas_of_the_changed_fields():
+    encoder = TelemetryEncoder()
+    decoder = TelemetryDecoder()
+    samples = [
+        _create_sample(1_700_000_000_000, cpu_usage_percent=40, memory_total_mib=16384, network_sent_kib=10),
+        _create_sample(1_700_000_001_000, cpu_usage_percent=45, memory_total_mib=16384, network_sent_kib=12),
+        # Fields and timestamps may go down as well, e.g. counters after a reboot or a clock that was set back.
+        _create_sample(1_700_000_000_500, cpu_usage_percent=3, memory_total_mib=16384, network_sent_kib=0),
+    ]
+
+    encoded_samples = [encoder.encode(sample) for sample in samples]
+
+    assert encoded_samples[0][1] & KEYFRAME
+    assert not encoded_samples[1][1] & KEYFRAME
+    assert len(encoded_samples[1]) < len(encoded_samples[0])
+    assert [decoder.decode(encoded_sample) for encoded_sample in encoded_samples] == samples
+
+
+def test_unchanged_sample_is_only_sent_when_forced():
+    encoder = TelemetryEncoder()
+    decoder = TelemetryDecoder()
+    sample = _create_sample(1000, cpu_usage_percent=1)
+    decoder.decode(encoder.encode(sample))
+
+    assert encoder.encode(_create_sample(2000, cpu_usage_percent=1)) is None
+    assert decoder.decode(encoder.encode(_create_sample(3000, cpu_usage_percent=1), force=True)) == \
+        _create_sample(3000, cpu_usage_percent=1)
+
+
+def test_reset_encoder_starts_over_with_a_keyframe():
+    encoder = TelemetryEncoder()
+    encoder.encode(_create_sample(1000, cpu_usage_percent=1))
+    delta = encoder.encode(_create_sample(2000, cpu_usage_percent=2))
+
+    # A decoder that missed the keyframe, e.g. of a server that reconnected, can't make sense of a delta.
+    with pytest.raises(InvalidTelemetryMessageError):
+        TelemetryDecoder().decode(delta)
+
+    encoder.reset()
+    assert TelemetryDecoder().decode(encoder.encode(_create_sample(3000, cpu_usage_percent=2))) == \
+        _create_sample(3000, cpu_usage_percent=2)
+
+
+def test_zigzag_keeps_small_negative_numbers_small():
+    assert [zigzag(value) for value in (0, -1, 1, -2, 2)] == [0, 1, 2, 3, 4]
+    for value in (0, 1, -1, 63, -64, 2 ** 63 - 1, -2 ** 63):
+        assert unzigzag(zigzag(value)) == value
+
+
+def test_host_info_round_trips():
+    host_info = HostInfo("Linux", 8 * 1024 ** 3, 4)
+
+    assert TelemetryDecoder().decode(host_info.encode()) == host_info
+
+
+def test_truncated_sample_is_rejected():
+    encoded_sample = TelemetryEncoder().encode(_create_sample(1000, cpu_usage_percent=200))
+
+    for length in range(len(encoded_sample)):
+        with pytest.raises(InvalidTelemetryMessageError):
+            TelemetryDecoder().decode(encoded_sample[:length])